@@ -0,0 +1,372 @@
+"""Request parsing and response shaping shared by app.py and asgi_app.py.
+
+Both apps serve the same routes with the same settings. Everything but
+the I/O lives here: a route parses its request with one of the functions
+below, calls (or awaits) the manager, and shapes the response here too.
+Invalid requests raise BadRequest, which both apps answer with a 400.
+"""
+
+import atexit
+import logging
+import math
+from os import getenv
+from typing import Any, Callable, Mapping, NamedTuple
+
+import metrics
+import responses
+from dotenv import load_dotenv
+from es_client import UNAVAILABLE_ERRORS
+from facets import facet_query
+from result_cache import ResultCache, query_key
+from schema import normalize_document
+from search_builder import (
+    KNN_QUERY_FIELDS,
+    QUERY_FIELDS,
+    build_es_query_from_survey,
+    build_knn_query_from_survey,
+    near_location,
+)
+from suggest import normalize, suggest_size
+from write_buffer import SPOOL_PATH, WriteBuffer, WriteRejected, claim_spool
+
+load_dotenv()
+logger = logging.getLogger(__name__)
+
+# Read alias: bulk_add.py --reindex builds a new index and swaps it in
+INDEX_NAME = getenv("ELASTIC_INDEX", "nonprofits")
+
+# Upper bound on answer sets per /api/survey/batch request
+SURVEY_BATCH_LIMIT = int(getenv("SURVEY_BATCH_LIMIT", "50"))
+
+# SUGGEST_TRIE=1 answers /api/suggest from an in-process index of every
+# name, read from Elasticsearch in the background and rebuilt every
+# SUGGEST_TRIE_REFRESH seconds. Until it's built, the completion suggester
+# answers. (The local backend always suggests in-process.)
+SUGGEST_TRIE = getenv("SUGGEST_TRIE", "0") == "1"
+SUGGEST_TRIE_REFRESH = float(getenv("SUGGEST_TRIE_REFRESH", "3600"))
+
+# Header on responses answered from an expired result cache entry
+STALE_WARNING = '110 - "Response is Stale"'
+
+
+class BadRequest(ValueError):
+    """A request the routes answer with 400 {"error": message}"""
+
+
+def result_cache_from_env() -> ResultCache:
+    """The search results cache. Results up to RESULT_CACHE_STALE_TTL seconds
+    past their TTL are still served while Elasticsearch is unavailable. The
+    apps look up the index version every RESULT_CACHE_VERSION_CHECK seconds
+    (0 turns it off) to notice bulk_add.py loads and alias swaps."""
+    return ResultCache(
+        maxsize=int(getenv("RESULT_CACHE_SIZE", "1024")),
+        ttl=float(getenv("RESULT_CACHE_TTL", "300")),
+        stale_ttl=float(getenv("RESULT_CACHE_STALE_TTL", "3600")),
+        version_check=float(getenv("RESULT_CACHE_VERSION_CHECK", "5")),
+    )
+
+
+def mark_index_changed(cache: ResultCache, manager: Any):
+    """After a write to INDEX_NAME through a (sync) manager: drop cached
+    results, and answer /api/facets for the whole index from the aggregation
+    until bulk_add.py publishes fresh counts (see facets.py)"""
+    cache.invalidate()
+    try:
+        manager.mark_global_facets_stale(INDEX_NAME)
+    except UNAVAILABLE_ERRORS as e:
+        logger.warning("Could not mark the global facet counts stale: %s", e)
+
+
+def write_buffer_from_env(
+    manager: Any, on_flush: Callable[[], None]
+) -> WriteBuffer | None:
+    """WRITE_BUFFER=1 queues the single-organization writes (PUT/DELETE
+    /organizations/<id>, POST /organizations with an id) in a write-behind
+    buffer: repeated writes to an id coalesce, and a background worker sends
+    them through manager (a sync one) as _bulk batches of up to
+    WRITE_BUFFER_SIZE, at least every WRITE_BUFFER_INTERVAL seconds. Queued
+    writes are spooled until acknowledged, each process to the first of
+    WRITE_BUFFER_SPOOL, WRITE_BUFFER_SPOOL.1, ... no other process holds
+    (see write_buffer.py)."""
+    if getenv("WRITE_BUFFER", "0") != "1":
+        return None
+    write_buffer = WriteBuffer(
+        manager,
+        claim_spool(getenv("WRITE_BUFFER_SPOOL", SPOOL_PATH)),
+        max_batch=int(getenv("WRITE_BUFFER_SIZE", "500")),
+        flush_interval=float(getenv("WRITE_BUFFER_INTERVAL", "1.0")),
+        on_flush=on_flush,
+    )
+    atexit.register(write_buffer.close)
+    return write_buffer
+
+
+def survey_query(knn_search: bool) -> tuple[Callable, dict[str, str]]:
+    """(query builder, fields it needs) for /api/survey and /api/survey/batch.
+
+    SURVEY_QUERY=knn answers them with a single kNN query over CAUSE_VECTOR
+    (see search_builder.build_knn_query_from_survey) when the backend has
+    kNN search (the local one doesn't). /api/facets keeps counting by NTEE
+    prefix either way.
+    """
+    if getenv("SURVEY_QUERY", "terms") == "knn" and knn_search:
+        return build_knn_query_from_survey, KNN_QUERY_FIELDS
+    return build_es_query_from_survey, QUERY_FIELDS
+
+
+def error_body(e: Exception) -> dict[str, str]:
+    return {"error": str(e)}
+
+
+def unavailable_body(e: Exception) -> tuple[dict[str, str], dict[str, str]]:
+    """(body, headers) of the 503 for an unreachable cluster with nothing
+    cached to stand in"""
+    headers = {}
+    if hasattr(e, "retry_after"):
+        headers["Retry-After"] = str(max(1, math.ceil(e.retry_after)))
+    return {"error": f"Search is temporarily unavailable: {e}"}, headers
+
+
+def _format(args: Mapping[str, str]) -> str:
+    try:
+        return responses.response_format(args)
+    except ValueError as e:
+        raise BadRequest(str(e)) from None
+
+
+def search_key(query: dict[str, Any]) -> str:
+    """Result cache key of a search body"""
+    return query_key(query, INDEX_NAME)
+
+
+class SearchRequest(NamedTuple):
+    query: dict[str, Any]  # the search body (without from/size when paged)
+    fmt: str
+    paged: bool  # "cursor" was sent: page with search_page, uncached
+    cursor: Any
+    size: int
+
+
+def search_request(body: Any, args: Mapping[str, str]) -> SearchRequest:
+    """Parse /api/search: {query: {query: {...}}, from, size}, optionally
+    with "location" and "radius", or "cursor" (null for the first page)."""
+    if not isinstance(body, dict):
+        body = {}
+    es_query = body.get("query", {}).get("query", {"match_all": {}})
+    size = body.get("size", 10)
+    # Optional ?fields=A,B / ?exclude=C projection and ?format=compact
+    fmt = _format(args)
+    source = responses.source_filter(args, "search")
+
+    # Optional "location" (ZIP or city) and "radius" (default 15mi): only
+    # organizations within the radius, nearest first among equal scores
+    sort = None
+    if body.get("location"):
+        try:
+            es_query, sort = near_location(
+                es_query, body["location"], body.get("radius")
+            )
+        except ValueError as e:
+            raise BadRequest(str(e)) from None
+
+    # Cursor pagination: send "cursor": null for the first page, then the
+    # returned cursor for the next ones. Deep pages cost the same as page 1.
+    if "cursor" in body:
+        if body["cursor"] is not None and not isinstance(body["cursor"], str):
+            raise BadRequest("Invalid cursor: expected null or a string from a page")
+        query = {"query": es_query, **({"sort": sort} if sort else {})}
+        return SearchRequest(
+            responses.with_source(query, source), fmt, True, body["cursor"], size
+        )
+
+    query = {"query": es_query, "from": body.get("from", 0), "size": size}
+    if sort:
+        query["sort"] = sort
+    return SearchRequest(responses.with_source(query, source), fmt, False, None, size)
+
+
+def page_response(page: dict[str, Any], fmt: str) -> dict[str, Any]:
+    return {**page, "hits": responses.shape_hits(page["hits"], fmt)}
+
+
+def _build(build: Callable, answers: Any) -> dict[str, Any]:
+    try:
+        return build(answers)
+    except ValueError as e:
+        raise BadRequest(str(e)) from None
+
+
+def survey_request(
+    answers: Any, args: Mapping[str, str], build: Callable
+) -> tuple[dict[str, Any], dict[str, Any], str]:
+    """(query, search body, format) for /api/survey"""
+    fmt = _format(args)
+    source = responses.source_filter(args, "survey")
+    with metrics.QUERY_BUILD_SECONDS.time():
+        query = _build(build, answers or [])
+    return query, responses.with_source(query, source), fmt
+
+
+def survey_response(
+    query: dict[str, Any], hits: list[dict[str, Any]], fmt: str
+) -> dict[str, Any]:
+    return {"query": query, "results": responses.shape_hits(hits, fmt)}
+
+
+def survey_batch_request(
+    body: Any, args: Mapping[str, str], build: Callable
+) -> tuple[list[dict[str, Any] | BadRequest], list[dict[str, Any]], str]:
+    """(queries, search bodies, format) for /api/survey/batch.
+
+    Body: {"surveys": [answers, answers, ...]} (or the bare list). An
+    invalid answer set gets its BadRequest in place of a query and no
+    search body, so only the others are searched.
+    """
+    body = body or {}
+    surveys = body.get("surveys", []) if isinstance(body, dict) else body
+    if not isinstance(surveys, list) or len(surveys) > SURVEY_BATCH_LIMIT:
+        raise BadRequest(f"Expected a list of at most {SURVEY_BATCH_LIMIT} answer sets")
+    fmt = _format(args)
+    source = responses.source_filter(args, "survey")
+    queries = []
+    with metrics.QUERY_BUILD_SECONDS.time():
+        for answers in surveys:
+            try:
+                queries.append(_build(build, answers))
+            except BadRequest as e:
+                queries.append(e)
+    bodies = [
+        responses.with_source(query, source)
+        for query in queries
+        if not isinstance(query, BadRequest)
+    ]
+    return queries, bodies, fmt
+
+
+def survey_batch_response(
+    queries: list[dict[str, Any] | BadRequest],
+    items: list[dict[str, Any]],
+    fmt: str,
+) -> dict[str, Any]:
+    """Each result is {query, results} like /api/survey, {query, error} for
+    a search that failed, or {error, status: 400} for invalid answers"""
+    items = iter(items)  # one per valid query
+    results = []
+    for query in queries:
+        if isinstance(query, BadRequest):
+            results.append({**error_body(query), "status": 400})
+            continue
+        item = next(items)
+        if "hits" in item:
+            results.append(survey_response(query, item["hits"], fmt))
+        else:
+            results.append({"query": query, "error": item["error"]})
+    return {"results": results}
+
+
+def facets_request(answers: Any) -> dict[str, Any] | None:
+    """The facet query for /api/facets; None means the whole index"""
+    return facet_query(_build(build_es_query_from_survey, answers or []))
+
+
+def facets_key(query: dict[str, Any] | None) -> str:
+    return query_key({"facets": query}, INDEX_NAME)
+
+
+def suggest_request(args: Mapping[str, str]) -> tuple[str, int, str]:
+    """(prefix, size, format) for /api/suggest?q=&size="""
+    try:
+        size = suggest_size(args.get("size"))
+    except ValueError as e:
+        raise BadRequest(str(e)) from None
+    return args.get("q", ""), size, _format(args)
+
+
+def suggest_key(prefix: str, size: int) -> str:
+    return query_key({"suggest": normalize(prefix), "size": size}, INDEX_NAME)
+
+
+def hits_response(hits: list[dict[str, Any]], fmt: str) -> Any:
+    return responses.shape_hits(hits, fmt)
+
+
+def write_refresh(args: Mapping[str, str]) -> str | None:
+    """The ?refresh= of a write route: "wait_for" answers once the write is
+    searchable; without it a buffered write is answered when queued"""
+    refresh = args.get("refresh")
+    if refresh not in (None, "wait_for"):
+        raise BadRequest('refresh must be "wait_for"')
+    return refresh
+
+
+def write_status(buffered: bool, refresh: str | None) -> int:
+    """202 for a write only queued in the write buffer, else 200"""
+    return 202 if buffered and not refresh else 200
+
+
+def rejected_response(e: WriteRejected) -> tuple[dict[str, str], int]:
+    """A ?refresh=wait_for write the buffer could not apply: its 4xx, or 503"""
+    status = e.status if e.status and 400 <= e.status < 500 else 503
+    return error_body(e), status
+
+
+def index_request(body: Any) -> tuple[Any, Any]:
+    """(mappings, settings) for POST /indices/<name>"""
+    body = body or {}
+    return body.get("mappings"), body.get("settings")
+
+
+def organization_request(data: Any) -> tuple[str | None, dict[str, Any]]:
+    """(optional id, document) for POST /organizations"""
+    data = data or {}
+    doc_id = data.get("id")
+    return doc_id, normalize_document({k: v for k, v in data.items() if k != "id"})
+
+
+def bulk_request(body: Any) -> list[dict[str, Any]]:
+    """Documents for POST /organizations/bulk"""
+    return [normalize_document(doc) for doc in (body or {}).get("organizations", [])]
+
+
+def bulk_response(report: dict[str, Any]) -> dict[str, Any]:
+    return {"message": f"{report['success']} organizations added.", "report": report}
+
+
+class MsearchPlan:
+    def __init__(self, cache: ResultCache, queries: list[dict[str, Any]]):
+        """Result cache lookups for an _msearch: which queries hit the cache,
+        and which (each distinct one once) still need to be searched"""
+        self.cache = cache
+        self.generation = cache.generation
+        self.keys = [search_key(query) for query in queries]
+        self.items: dict[str, dict[str, Any]] = {}
+        for key in dict.fromkeys(self.keys):
+            hits = cache.get(key)
+            if hits is not None:
+                self.items[key] = {"hits": hits}
+        self.missing = {
+            key: query
+            for key, query in zip(self.keys, queries)
+            if key not in self.items
+        }
+        self.stale = False
+
+    def fetched(self, results: list[dict[str, Any]]) -> list[dict[str, Any]]:
+        """Cache and return the items, given the _msearch results of missing"""
+        for key, item in zip(self.missing, results):
+            self.items[key] = item
+            if "hits" in item:
+                self.cache.set(key, item["hits"], self.generation)
+        return [self.items[key] for key in self.keys]
+
+    def unavailable(self, e: Exception) -> list[dict[str, Any]]:
+        """The items while the cluster is unreachable: expired results where
+        there are any (setting stale), an error for the rest"""
+        for key in self.missing:
+            hits = self.cache.get_stale(key)
+            if hits is None:
+                self.items[key] = {"error": str(e), "status": 503}
+            else:
+                self.items[key] = {"hits": hits}
+                self.stale = True
+        return [self.items[key] for key in self.keys]
@@ -1,99 +1,435 @@
 # backend
 
+import json
+import logging
+import threading
+import time
 from os import getenv
 
-from dotenv import load_dotenv
-from es_manager import ElasticManager
-from flask import Flask, jsonify, request
+import api
+import metrics
+import orjson
+import responses
+from api import INDEX_NAME, SUGGEST_TRIE, SUGGEST_TRIE_REFRESH
+from es_client import UNAVAILABLE_ERRORS
+from es_manager import CursorExpiredError, ElasticManager
+from facets import facet_response
+from flask import Flask, Response, g, jsonify, request, stream_with_context
+from flask.json.provider import DefaultJSONProvider
 from flask_cors import CORS
-from search_builder import build_es_query_from_survey
+from schema import normalize_document, validate_index_fields
+from suggest import SUGGEST_FIELDS, SuggestIndex
+from write_buffer import WriteRejected
+
+
+class JSONProvider(DefaultJSONProvider):
+    """orjson-backed JSON provider that records how long serialization takes"""
+
+    def dumps(self, obj, **kwargs):
+        with metrics.SERIALIZE_SECONDS.time():
+            return responses.dumps(obj).decode("utf-8")
+
+    def loads(self, s, **kwargs):
+        return orjson.loads(s)
+
+    def response(self, *args, **kwargs):
+        obj = self._prepare_response_obj(args, kwargs)
+        with metrics.SERIALIZE_SECONDS.time():
+            data = responses.dumps(obj)
+        return self._app.response_class(data, mimetype="application/json")
+
 
 app = Flask(__name__)
+app.json = JSONProvider(app)
 CORS(app)  # This allows cross-origin requests
 
-load_dotenv()
+logging.basicConfig(level=getenv("LOG_LEVEL", "WARNING"))
+logger = logging.getLogger(__name__)
 
+# Settings shared with asgi_app.py (INDEX_NAME, SURVEY_QUERY, SUGGEST_TRIE,
+# RESULT_CACHE_*, ...) are read in api.py
 
-# Initialize Elastic Manager
+# Initialize Elastic Manager (SEARCH_BACKEND=local serves LOCAL_SEARCH_DATA
+# from memory instead, see local_search.py). ELASTIC_HOST may list several
+# nodes; nothing connects until the first request (see es_client.py)
 elastic_user = getenv("ELASTIC_USERNAME", "elastic")
 elastic_password = getenv("ELASTIC_PASSWORD", "password")
 elastic_host = getenv("ELASTIC_HOST", "http://localhost:9200")
-es_manager = ElasticManager(
-    host=elastic_host, credentials=(elastic_user, elastic_password)
+if getenv("SEARCH_BACKEND", "elasticsearch") == "local":
+    from local_search import LocalSearchManager
+
+    es_manager = LocalSearchManager.from_env(INDEX_NAME)
+else:
+    es_manager = ElasticManager(
+        host=elastic_host, credentials=(elastic_user, elastic_password)
+    )
+
+build_survey_query, SURVEY_QUERY_FIELDS = api.survey_query(
+    isinstance(es_manager, ElasticManager)
 )
-INDEX_NAME = "nonprofits"
+
+# Search results cache; every write route below invalidates it (buffered
+# writes once they are sent)
+result_cache = api.result_cache_from_env()
+
+
+def index_changed():
+    """After a write to INDEX_NAME (see api.mark_index_changed)"""
+    api.mark_index_changed(result_cache, es_manager)
+
+
+# WRITE_BUFFER=1: single-organization writes go through a write-behind
+# buffer (see api.write_buffer_from_env)
+write_buffer = api.write_buffer_from_env(es_manager, on_flush=index_changed)
+
+# Built in the background with SUGGEST_TRIE=1 (see api.py)
+suggest_index: SuggestIndex | None = None
+
+
+def refresh_suggest_index():
+    """Rebuild suggest_index from the live index, forever"""
+    global suggest_index
+    while True:
+        try:
+            started = time.perf_counter()
+            suggest_index = SuggestIndex.from_documents(
+                es_manager.iter_all_documents(INDEX_NAME, source=SUGGEST_FIELDS)
+            )
+            logger.info(
+                "Suggest index: %d organizations in %.1fs",
+                len(suggest_index),
+                time.perf_counter() - started,
+            )
+        except Exception:
+            logger.exception("Building the suggest index failed")
+        time.sleep(SUGGEST_TRIE_REFRESH)
+
+
+if SUGGEST_TRIE and isinstance(es_manager, ElasticManager):
+    threading.Thread(target=refresh_suggest_index, daemon=True).start()
+
+# Fail fast if the survey query would hit fields the live index doesn't map.
+# Checked before the first API request rather than at import, so starting
+# the app never waits on the cluster; while it is unreachable the check is
+# put off to the next request.
+schema_checked = False
+schema_lock = threading.Lock()
+
+
+def check_index_schema():
+    global schema_checked
+    with schema_lock:
+        if schema_checked:
+            return
+        try:
+            if es_manager.index_exists(INDEX_NAME):
+                validate_index_fields(
+                    es_manager.get_field_types(INDEX_NAME), SURVEY_QUERY_FIELDS
+                )
+            else:
+                logger.info(
+                    "Index '%s' does not exist yet; skipping schema check.", INDEX_NAME
+                )
+        except UNAVAILABLE_ERRORS as e:
+            logger.warning("Schema check put off, Elasticsearch unavailable: %s", e)
+            return
+        schema_checked = True
+
+
+def cached(key: str, compute):
+    """The result cache entry for key, computed on a miss. While Elasticsearch
+    is unavailable an expired entry stands in (flagged with a Warning header)."""
+    generation = result_cache.generation
+    value = result_cache.get(key)
+    if value is None:
+        try:
+            value = compute()
+        except UNAVAILABLE_ERRORS:
+            value = result_cache.get_stale(key)
+            if value is None:
+                raise
+            g.stale = True
+            return value
+        result_cache.set(key, value, generation)
+    return value
+
+
+def cached_search(query: dict) -> list[dict]:
+    """Run a search through the result cache."""
+    return cached(api.search_key(query), lambda: es_manager.search(query, INDEX_NAME))
+
+
+def cached_msearch(queries: list[dict]) -> list[dict]:
+    """Run several searches through the result cache, one _msearch for the misses."""
+    plan = api.MsearchPlan(result_cache, queries)
+    if not plan.missing:
+        return plan.fetched([])
+    try:
+        results = es_manager.msearch(list(plan.missing.values()), INDEX_NAME)
+    except UNAVAILABLE_ERRORS as e:
+        items = plan.unavailable(e)
+        g.stale = g.get("stale") or plan.stale
+        return items
+    return plan.fetched(results)
+
+
+def cached_facets(query: dict | None) -> dict:
+    """Facet counts through the result cache; query None means the whole index,
+    whose counts bulk_add.py publishes in the index _meta."""
+    if query is None:
+        return cached(
+            api.facets_key(None),
+            lambda: es_manager.get_global_facets(INDEX_NAME)
+            or es_manager.facets(INDEX_NAME),
+        )
+    return cached(api.facets_key(query), lambda: es_manager.facets(INDEX_NAME, query))
+
+
+@app.before_request
+def start_request_timer():
+    g.started = time.perf_counter()
+    g.route = request.url_rule.rule if request.url_rule else "unmatched"
+    metrics.REQUESTS_IN_FLIGHT.inc(route=g.route)
+
+
+@app.before_request
+def check_schema_once():
+    if not schema_checked and request.path.startswith("/api/"):
+        check_index_schema()
+
+
+@app.before_request
+def check_index_version():
+    """Drop cached results once another process reloads or swaps the index"""
+    if request.path.startswith("/api/") and result_cache.version_check_due():
+        try:
+            result_cache.note_version(es_manager.index_version(INDEX_NAME))
+        except UNAVAILABLE_ERRORS:
+            pass  # the route itself answers from the stale cache or 503s
+
+
+@app.after_request
+def remember_status(response):
+    g.status = response.status_code
+    return response
+
+
+@app.after_request
+def mark_stale(response):
+    if g.get("stale"):
+        response.headers["Warning"] = api.STALE_WARNING
+    return response
+
+
+def cluster_unavailable(e):
+    """503 when Elasticsearch can't be reached and no cached result stands in"""
+    body, headers = api.unavailable_body(e)
+    return jsonify(body), 503, headers
+
+
+for error in UNAVAILABLE_ERRORS:
+    app.register_error_handler(error, cluster_unavailable)
+
+
+@app.errorhandler(api.BadRequest)
+def bad_request(e):
+    return jsonify(api.error_body(e)), 400
+
+
+@app.errorhandler(CursorExpiredError)
+def cursor_expired(e):
+    """410 for a cursor whose point-in-time has expired (kept 2m between pages)"""
+    return jsonify(api.error_body(e)), 410
+
+
+@app.errorhandler(WriteRejected)
+def write_rejected(e):
+    """A ?refresh=wait_for write the buffer could not apply"""
+    body, status = api.rejected_response(e)
+    return jsonify(body), status
+
+
+@app.after_request
+def compress_response(response):
+    """gzip/br-compress JSON bodies for clients that accept it (not streams)"""
+    if response.direct_passthrough or response.is_streamed or (
+        "Content-Encoding" in response.headers
+    ):
+        return response
+    encoding = responses.choose_encoding(request.headers.get("Accept-Encoding", ""))
+    data = response.get_data()
+    if encoding and responses.should_compress(response.mimetype, len(data)):
+        response.set_data(responses.compress(data, encoding))
+        response.headers["Content-Encoding"] = encoding
+        response.vary.add("Accept-Encoding")
+    return response
+
+
+@app.teardown_request
+def record_request(exc):
+    if "started" not in g:
+        return
+    metrics.REQUESTS_IN_FLIGHT.dec(route=g.route)
+    metrics.REQUEST_SECONDS.observe(
+        time.perf_counter() - g.started,
+        route=g.route,
+        method=request.method,
+        status=g.get("status", 500),
+    )
 
 
 @app.route("/indices/<index_name>", methods=["POST"])
 def create_index(index_name):
-    mappings = request.json.get("mappings", None)
-    es_manager.create_index(index_name, mappings)
+    es_manager.create_index(index_name, *api.index_request(request.json))
+    result_cache.invalidate()
     return jsonify({"message": f"Index {index_name} created."})
 
 
 @app.route("/indices/<index_name>", methods=["DELETE"])
 def delete_index(index_name):
     es_manager.delete_index(index_name)
+    result_cache.invalidate()
     return jsonify({"message": f"Index {index_name} deleted."})
 
 
+def write_document(doc_id: str, document: dict | None, refresh: str | None) -> int:
+    """Index (or, with document None, delete) one organization, through the
+    write buffer when it is on; return the response status"""
+    if write_buffer is not None:
+        if document is None:
+            write_buffer.delete(doc_id, INDEX_NAME, refresh)
+        else:
+            write_buffer.index(doc_id, document, INDEX_NAME, refresh)
+        return api.write_status(True, refresh)
+    if document is None:
+        es_manager.delete_document(doc_id, INDEX_NAME, refresh)
+    else:
+        es_manager.add_document(doc_id, document, INDEX_NAME, refresh)
+    index_changed()
+    return api.write_status(False, refresh)
+
+
 @app.route("/organizations", methods=["POST"])
 def add_organization():
-    data = request.json
-    doc_id = data.get("id")  # optional
-    org_data = {k: v for k, v in data.items() if k != "id"}
-    es_manager.add_document(
-        doc_id, org_data, INDEX_NAME
-    ) if doc_id else es_manager.bulk_add([org_data], INDEX_NAME)
-    return jsonify({"message": "Organization added/updated."})
+    refresh = api.write_refresh(request.args)
+    doc_id, org_data = api.organization_request(request.json)
+    if not doc_id:
+        # Nothing to coalesce on, and a resend would duplicate it: direct
+        es_manager.bulk_add([org_data], INDEX_NAME, refresh=refresh)
+        index_changed()
+        return jsonify({"message": "Organization added/updated."})
+    status = write_document(doc_id, org_data, refresh)
+    return jsonify({"message": "Organization added/updated."}), status
 
 
 @app.route("/organizations/<org_id>", methods=["PUT"])
 def update_organization(org_id):
-    data = request.json
-    es_manager.add_document(org_id, data, INDEX_NAME)
-    return jsonify({"message": f"Organization {org_id} updated."})
+    refresh = api.write_refresh(request.args)
+    status = write_document(org_id, normalize_document(request.json), refresh)
+    return jsonify({"message": f"Organization {org_id} updated."}), status
 
 
 @app.route("/organizations/<org_id>", methods=["DELETE"])
 def delete_organization(org_id):
-    es_manager.delete_document(org_id, INDEX_NAME)
-    return jsonify({"message": f"Organization {org_id} deleted."})
+    status = write_document(org_id, None, api.write_refresh(request.args))
+    return jsonify({"message": f"Organization {org_id} deleted."}), status
 
 
 @app.route("/organizations/bulk", methods=["POST"])
 def bulk_add_organizations():
-    documents = request.json.get("organizations", [])
-    es_manager.bulk_add(documents, INDEX_NAME)
-    return jsonify({"message": f"{len(documents)} organizations added."})
+    report = es_manager.bulk_add(api.bulk_request(request.json), INDEX_NAME)
+    index_changed()
+    return jsonify(api.bulk_response(report))
 
 
-@app.route("/api/search", methods=["POST"])
 @app.route("/api/search", methods=["POST"])
 def search_organizations():
-    # Accepts a body with { query: { ... }, from, size }
-    body = request.get_json(silent=True) or {}
-    query_wrapper = body.get("query", {})
-    from_ = body.get("from", 0)
-    size = body.get("size", 10)
-
-    # Extract inner ES query correctly
-    es_query = query_wrapper.get("query", {"match_all": {}})
-
-    # Attach pagination at top-level
-    final_query = {"query": es_query, "from": from_, "size": size}
-
-    results = es_manager.search(final_query, INDEX_NAME)
-    return jsonify(results)
+    """Search with a raw query (see api.search_request)."""
+    search = api.search_request(request.get_json(silent=True), request.args)
+    if search.paged:
+        try:
+            page = es_manager.search_page(
+                search.query, INDEX_NAME, search.cursor, search.size
+            )
+        except ValueError as e:
+            return jsonify(api.error_body(e)), 400
+        return jsonify(api.page_response(page, search.fmt))
+    results = cached_search(search.query)
+    return jsonify(api.hits_response(results, search.fmt))
 
 
 @app.route("/api/survey", methods=["POST"])
 def survey_to_search():
     """Accept survey answers and return ES results based on derived query."""
-    answers = request.get_json(silent=True) or []
-    es_query = build_es_query_from_survey(answers)
-    results = es_manager.search(es_query, INDEX_NAME)
-    return jsonify({"query": es_query, "results": results})
+    query, body, fmt = api.survey_request(
+        request.get_json(silent=True), request.args, build_survey_query
+    )
+    return jsonify(api.survey_response(query, cached_search(body), fmt))
+
+
+@app.route("/api/survey/batch", methods=["POST"])
+def survey_batch():
+    """Run several survey answer sets in one _msearch, results in request order."""
+    queries, bodies, fmt = api.survey_batch_request(
+        request.get_json(silent=True), request.args, build_survey_query
+    )
+    return jsonify(api.survey_batch_response(queries, cached_msearch(bodies), fmt))
+
+
+@app.route("/api/facets", methods=["POST"])
+def survey_facets():
+    """Count the organizations per NTEE major group, asset code, ruling decade,
+    state and city that match a (partial) set of survey answers."""
+    query = api.facets_request(request.get_json(silent=True))
+    return jsonify(facet_response(cached_facets(query)))
+
+
+@app.route("/api/suggest", methods=["GET"])
+def suggest_names():
+    """Autocomplete: the ?size= (default 10) largest organizations whose name
+    starts with ?q=, as hits (or ?format=compact)."""
+    prefix, size, fmt = api.suggest_request(request.args)
+    if suggest_index is not None:
+        hits = suggest_index.top(prefix, size)
+    else:
+        hits = cached(
+            api.suggest_key(prefix, size),
+            lambda: es_manager.suggest(INDEX_NAME, prefix, size),
+        )
+    return jsonify(api.hits_response(hits, fmt))
+
+
+@app.route("/api/export", methods=["GET"])
+def export_organizations():
+    """Stream every organization as NDJSON."""
+
+    def generate():
+        for document in es_manager.iter_all_documents(INDEX_NAME):
+            yield json.dumps(document, ensure_ascii=False) + "\n"
+
+    return Response(stream_with_context(generate()), mimetype="application/x-ndjson")
+
+
+@app.route("/api/cache/stats", methods=["GET"])
+def cache_stats():
+    """Hit/miss/eviction counters for sizing the result cache."""
+    return jsonify(result_cache.stats())
+
+
+@app.route("/health", methods=["GET"])
+def health():
+    """Load balancer check: 503 while the circuit to Elasticsearch is open.
+    Reports state only; it never waits on the cluster."""
+    report = es_manager.health()
+    if write_buffer is not None:
+        report["write_buffer"] = write_buffer.stats()
+    return jsonify(report), 200 if report["status"] == "ok" else 503
+
+
+@app.route("/metrics", methods=["GET"])
+def metrics_endpoint():
+    """Prometheus scrape endpoint (per process)."""
+    return Response(metrics.REGISTRY.render(), content_type=metrics.CONTENT_TYPE)
 
 
 @app.route("/", methods=["GET"])
@@ -102,4 +438,5 @@ def root():
 
 
 if __name__ == "__main__":
+    check_index_schema()
     app.run(debug=True)
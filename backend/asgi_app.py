@@ -0,0 +1,476 @@
+# backend (async): same routes as app.py, served by an ASGI server, e.g.
+#   uvicorn asgi_app:app --workers 4 --host 0.0.0.0 --port 5000
+
+import asyncio
+import json
+import logging
+import time
+from os import getenv
+
+import api
+import metrics
+import orjson
+import responses
+from api import INDEX_NAME, SUGGEST_TRIE, SUGGEST_TRIE_REFRESH
+from async_es_manager import AsyncElasticManager
+from es_client import UNAVAILABLE_ERRORS
+from es_manager import CursorExpiredError, ElasticManager
+from facets import facet_response
+from quart import Quart, Response, g, jsonify, request
+from quart.json.provider import DefaultJSONProvider
+from quart.wrappers.response import DataBody
+from quart_cors import cors
+from schema import normalize_document, validate_index_fields
+from suggest import SUGGEST_FIELDS, SuggestIndex
+from write_buffer import WriteRejected
+
+
+class JSONProvider(DefaultJSONProvider):
+    """orjson-backed JSON provider that records how long serialization takes"""
+
+    def dumps(self, obj, **kwargs):
+        with metrics.SERIALIZE_SECONDS.time():
+            return responses.dumps(obj).decode("utf-8")
+
+    def loads(self, s, **kwargs):
+        return orjson.loads(s)
+
+    def response(self, *args, **kwargs):
+        obj = self._prepare_response_obj(args, kwargs)
+        with metrics.SERIALIZE_SECONDS.time():
+            data = responses.dumps(obj)
+        return self._app.response_class(data, mimetype="application/json")
+
+
+app = Quart(__name__)
+app.json = JSONProvider(app)
+app = cors(app)  # This allows cross-origin requests
+
+logging.basicConfig(level=getenv("LOG_LEVEL", "WARNING"))
+logger = logging.getLogger(__name__)
+
+# Settings and request handling are shared with app.py (see api.py); this
+# module only does the I/O, awaiting the async managers
+
+# The client is created per worker process; connections open lazily, to
+# any of the nodes listed in ELASTIC_HOST (see es_client.py).
+# SEARCH_BACKEND=local loads LOCAL_SEARCH_DATA into every worker instead
+elastic_user = getenv("ELASTIC_USERNAME", "elastic")
+elastic_password = getenv("ELASTIC_PASSWORD", "password")
+elastic_host = getenv("ELASTIC_HOST", "http://localhost:9200")
+if getenv("SEARCH_BACKEND", "elasticsearch") == "local":
+    from local_search import AsyncLocalSearchManager, LocalSearchManager
+
+    es_manager = AsyncLocalSearchManager(LocalSearchManager.from_env(INDEX_NAME))
+    sync_manager = es_manager.manager
+else:
+    es_manager = AsyncElasticManager(
+        host=elastic_host, credentials=(elastic_user, elastic_password)
+    )
+    # For the write buffer's worker thread; connects only once it sends
+    sync_manager = ElasticManager(
+        host=elastic_host, credentials=(elastic_user, elastic_password)
+    )
+
+# Search results cache; every write route below invalidates it
+result_cache = api.result_cache_from_env()
+
+
+async def index_changed():
+    """After a write to INDEX_NAME (see api.mark_index_changed)"""
+    result_cache.invalidate()
+    try:
+        await es_manager.mark_global_facets_stale(INDEX_NAME)
+    except UNAVAILABLE_ERRORS as e:
+        logger.warning("Could not mark the global facet counts stale: %s", e)
+
+
+# WRITE_BUFFER=1: single-organization writes go through a write-behind
+# buffer (see api.write_buffer_from_env). Its worker is a thread, so it
+# sends through the sync manager.
+def buffered_writes_sent():
+    api.mark_index_changed(result_cache, sync_manager)
+
+
+write_buffer = api.write_buffer_from_env(sync_manager, on_flush=buffered_writes_sent)
+
+# Built in the background with SUGGEST_TRIE=1 (see api.py)
+suggest_index: SuggestIndex | None = None
+
+
+async def refresh_suggest_index():
+    """Rebuild suggest_index from the live index, until shutdown"""
+    global suggest_index
+    while True:
+        try:
+            started = time.perf_counter()
+            building = SuggestIndex()
+            documents = es_manager.iter_all_documents(INDEX_NAME, source=SUGGEST_FIELDS)
+            async for document in documents:
+                building.add(document)
+            # Sorting millions of names would stall the event loop
+            suggest_index = await asyncio.to_thread(building.build)
+            logger.info(
+                "Suggest index: %d organizations in %.1fs",
+                len(suggest_index),
+                time.perf_counter() - started,
+            )
+        except Exception:
+            logger.exception("Building the suggest index failed")
+        await asyncio.sleep(SUGGEST_TRIE_REFRESH)
+
+
+build_survey_query, SURVEY_QUERY_FIELDS = api.survey_query(
+    isinstance(es_manager, AsyncElasticManager)
+)
+
+# Fail fast if the survey query would hit fields the live index doesn't map.
+# Checked before the first API request, so a worker starts without waiting
+# on the cluster (see app.py)
+schema_checked = False
+
+
+async def check_index_schema():
+    global schema_checked
+    try:
+        if await es_manager.index_exists(INDEX_NAME):
+            field_types = await es_manager.get_field_types(INDEX_NAME)
+            validate_index_fields(field_types, SURVEY_QUERY_FIELDS)
+        else:
+            logger.info(
+                "Index '%s' does not exist yet; skipping schema check.", INDEX_NAME
+            )
+    except UNAVAILABLE_ERRORS as e:
+        logger.warning("Schema check put off, Elasticsearch unavailable: %s", e)
+        return
+    schema_checked = True
+
+
+@app.before_serving
+async def startup():
+    if SUGGEST_TRIE and isinstance(es_manager, AsyncElasticManager):
+        app.suggest_task = asyncio.create_task(refresh_suggest_index())
+
+
+@app.after_serving
+async def shutdown():
+    task = getattr(app, "suggest_task", None)
+    if task is not None:
+        task.cancel()
+    await es_manager.close()
+
+
+async def cached(key: str, compute):
+    """The result cache entry for key, awaiting compute() on a miss; an
+    expired entry stands in while Elasticsearch is unavailable (see app.py)"""
+    generation = result_cache.generation
+    value = result_cache.get(key)
+    if value is None:
+        try:
+            value = await compute()
+        except UNAVAILABLE_ERRORS:
+            value = result_cache.get_stale(key)
+            if value is None:
+                raise
+            g.stale = True
+            return value
+        result_cache.set(key, value, generation)
+    return value
+
+
+async def cached_search(query: dict) -> list[dict]:
+    """Run a search through the result cache."""
+    return await cached(
+        api.search_key(query), lambda: es_manager.search(query, INDEX_NAME)
+    )
+
+
+async def cached_msearch(queries: list[dict]) -> list[dict]:
+    """Run several searches through the result cache, one _msearch for the misses."""
+    plan = api.MsearchPlan(result_cache, queries)
+    if not plan.missing:
+        return plan.fetched([])
+    try:
+        results = await es_manager.msearch(list(plan.missing.values()), INDEX_NAME)
+    except UNAVAILABLE_ERRORS as e:
+        items = plan.unavailable(e)
+        g.stale = g.get("stale") or plan.stale
+        return items
+    return plan.fetched(results)
+
+
+async def cached_facets(query: dict | None) -> dict:
+    """Facet counts through the result cache; query None means the whole index,
+    whose counts bulk_add.py publishes in the index _meta."""
+
+    async def compute():
+        payload = None
+        if query is None:
+            payload = await es_manager.get_global_facets(INDEX_NAME)
+        return payload or await es_manager.facets(INDEX_NAME, query)
+
+    return await cached(api.facets_key(query), compute)
+
+
+@app.before_request
+async def start_request_timer():
+    g.started = time.perf_counter()
+    g.route = request.url_rule.rule if request.url_rule else "unmatched"
+    metrics.REQUESTS_IN_FLIGHT.inc(route=g.route)
+
+
+@app.before_request
+async def check_schema_once():
+    if not schema_checked and request.path.startswith("/api/"):
+        await check_index_schema()
+
+
+@app.before_request
+async def check_index_version():
+    """Drop cached results once another process reloads or swaps the index"""
+    if request.path.startswith("/api/") and result_cache.version_check_due():
+        try:
+            result_cache.note_version(await es_manager.index_version(INDEX_NAME))
+        except UNAVAILABLE_ERRORS:
+            pass  # the route itself answers from the stale cache or 503s
+
+
+@app.after_request
+async def remember_status(response):
+    g.status = response.status_code
+    return response
+
+
+@app.after_request
+async def mark_stale(response):
+    if g.get("stale"):
+        response.headers["Warning"] = api.STALE_WARNING
+    return response
+
+
+async def cluster_unavailable(e):
+    """503 when Elasticsearch can't be reached and no cached result stands in"""
+    body, headers = api.unavailable_body(e)
+    return jsonify(body), 503, headers
+
+
+for error in UNAVAILABLE_ERRORS:
+    app.register_error_handler(error, cluster_unavailable)
+
+
+@app.errorhandler(api.BadRequest)
+async def bad_request(e):
+    return jsonify(api.error_body(e)), 400
+
+
+@app.errorhandler(CursorExpiredError)
+async def cursor_expired(e):
+    return jsonify(api.error_body(e)), 410
+
+
+@app.errorhandler(WriteRejected)
+async def write_rejected(e):
+    body, status = api.rejected_response(e)
+    return jsonify(body), status
+
+
+@app.after_request
+async def compress_response(response):
+    """gzip/br-compress JSON bodies for clients that accept it (not streams)"""
+    if not isinstance(response.response, DataBody) or (
+        "Content-Encoding" in response.headers
+    ):
+        return response
+    encoding = responses.choose_encoding(request.headers.get("Accept-Encoding", ""))
+    data = await response.get_data()
+    if encoding and responses.should_compress(response.mimetype, len(data)):
+        response.set_data(responses.compress(data, encoding))
+        response.headers["Content-Encoding"] = encoding
+        response.vary.add("Accept-Encoding")
+    return response
+
+
+@app.teardown_request
+async def record_request(exc):
+    if "started" not in g:
+        return
+    metrics.REQUESTS_IN_FLIGHT.dec(route=g.route)
+    metrics.REQUEST_SECONDS.observe(
+        time.perf_counter() - g.started,
+        route=g.route,
+        method=request.method,
+        status=g.get("status", 500),
+    )
+
+
+@app.route("/indices/<index_name>", methods=["POST"])
+async def create_index(index_name):
+    mappings, settings = api.index_request(await request.get_json())
+    await es_manager.create_index(index_name, mappings, settings)
+    result_cache.invalidate()
+    return jsonify({"message": f"Index {index_name} created."})
+
+
+@app.route("/indices/<index_name>", methods=["DELETE"])
+async def delete_index(index_name):
+    await es_manager.delete_index(index_name)
+    result_cache.invalidate()
+    return jsonify({"message": f"Index {index_name} deleted."})
+
+
+async def write_document(
+    doc_id: str, document: dict | None, refresh: str | None
+) -> int:
+    """Index (or, with document None, delete) one organization, through the
+    write buffer when it is on; return the response status (see app.py)"""
+    if write_buffer is not None:
+        # Off the event loop: the spool write, and a wait_for write blocks
+        # until its batch is searchable
+        if document is None:
+            await asyncio.to_thread(write_buffer.delete, doc_id, INDEX_NAME, refresh)
+        else:
+            await asyncio.to_thread(
+                write_buffer.index, doc_id, document, INDEX_NAME, refresh
+            )
+        return api.write_status(True, refresh)
+    if document is None:
+        await es_manager.delete_document(doc_id, INDEX_NAME, refresh)
+    else:
+        await es_manager.add_document(doc_id, document, INDEX_NAME, refresh)
+    await index_changed()
+    return api.write_status(False, refresh)
+
+
+@app.route("/organizations", methods=["POST"])
+async def add_organization():
+    refresh = api.write_refresh(request.args)
+    doc_id, org_data = api.organization_request(await request.get_json())
+    if not doc_id:
+        # Nothing to coalesce on, and a resend would duplicate it: direct
+        await es_manager.bulk_add([org_data], INDEX_NAME, refresh=refresh)
+        await index_changed()
+        return jsonify({"message": "Organization added/updated."})
+    status = await write_document(doc_id, org_data, refresh)
+    return jsonify({"message": "Organization added/updated."}), status
+
+
+@app.route("/organizations/<org_id>", methods=["PUT"])
+async def update_organization(org_id):
+    refresh = api.write_refresh(request.args)
+    data = normalize_document(await request.get_json())
+    status = await write_document(org_id, data, refresh)
+    return jsonify({"message": f"Organization {org_id} updated."}), status
+
+
+@app.route("/organizations/<org_id>", methods=["DELETE"])
+async def delete_organization(org_id):
+    status = await write_document(org_id, None, api.write_refresh(request.args))
+    return jsonify({"message": f"Organization {org_id} deleted."}), status
+
+
+@app.route("/organizations/bulk", methods=["POST"])
+async def bulk_add_organizations():
+    documents = api.bulk_request(await request.get_json())
+    report = await es_manager.bulk_add(documents, INDEX_NAME)
+    await index_changed()
+    return jsonify(api.bulk_response(report))
+
+
+@app.route("/api/search", methods=["POST"])
+async def search_organizations():
+    """Search with a raw query (see api.search_request)."""
+    search = api.search_request(await request.get_json(silent=True), request.args)
+    if search.paged:
+        try:
+            page = await es_manager.search_page(
+                search.query, INDEX_NAME, search.cursor, search.size
+            )
+        except ValueError as e:
+            return jsonify(api.error_body(e)), 400
+        return jsonify(api.page_response(page, search.fmt))
+    results = await cached_search(search.query)
+    return jsonify(api.hits_response(results, search.fmt))
+
+
+@app.route("/api/survey", methods=["POST"])
+async def survey_to_search():
+    """Accept survey answers and return ES results based on derived query."""
+    query, body, fmt = api.survey_request(
+        await request.get_json(silent=True), request.args, build_survey_query
+    )
+    return jsonify(api.survey_response(query, await cached_search(body), fmt))
+
+
+@app.route("/api/survey/batch", methods=["POST"])
+async def survey_batch():
+    """Run several survey answer sets in one _msearch, results in request order."""
+    queries, bodies, fmt = api.survey_batch_request(
+        await request.get_json(silent=True), request.args, build_survey_query
+    )
+    items = await cached_msearch(bodies)
+    return jsonify(api.survey_batch_response(queries, items, fmt))
+
+
+@app.route("/api/facets", methods=["POST"])
+async def survey_facets():
+    """Count the organizations per NTEE major group, asset code, ruling decade,
+    state and city that match a (partial) set of survey answers."""
+    query = api.facets_request(await request.get_json(silent=True))
+    return jsonify(facet_response(await cached_facets(query)))
+
+
+@app.route("/api/suggest", methods=["GET"])
+async def suggest_names():
+    """Autocomplete: the ?size= (default 10) largest organizations whose name
+    starts with ?q=, as hits (or ?format=compact)."""
+    prefix, size, fmt = api.suggest_request(request.args)
+    if suggest_index is not None:
+        hits = suggest_index.top(prefix, size)
+    else:
+        hits = await cached(
+            api.suggest_key(prefix, size),
+            lambda: es_manager.suggest(INDEX_NAME, prefix, size),
+        )
+    return jsonify(api.hits_response(hits, fmt))
+
+
+@app.route("/api/export", methods=["GET"])
+async def export_organizations():
+    """Stream every organization as NDJSON."""
+
+    async def generate():
+        async for document in es_manager.iter_all_documents(INDEX_NAME):
+            yield (json.dumps(document, ensure_ascii=False) + "\n").encode("utf-8")
+
+    return generate(), 200, {"Content-Type": "application/x-ndjson"}
+
+
+@app.route("/api/cache/stats", methods=["GET"])
+async def cache_stats():
+    """Hit/miss/eviction counters for sizing the result cache."""
+    return jsonify(result_cache.stats())
+
+
+@app.route("/health", methods=["GET"])
+async def health():
+    """Load balancer check: 503 while the circuit to Elasticsearch is open.
+    Reports state only; it never waits on the cluster."""
+    report = es_manager.health()
+    if write_buffer is not None:
+        report["write_buffer"] = write_buffer.stats()
+    return jsonify(report), 200 if report["status"] == "ok" else 503
+
+
+@app.route("/metrics", methods=["GET"])
+async def metrics_endpoint():
+    """Prometheus scrape endpoint (per process)."""
+    return Response(metrics.REGISTRY.render(), content_type=metrics.CONTENT_TYPE)
+
+
+@app.route("/", methods=["GET"])
+async def root():
+    return jsonify({"message": "Backend is running."})
+
+
+if __name__ == "__main__":
+    app.run(debug=True)
@@ -0,0 +1,352 @@
+import time
+from os import getenv
+from typing import Any, AsyncIterator, Iterable
+
+import metrics
+from dotenv import load_dotenv
+from elasticsearch import ApiError, NotFoundError
+from elasticsearch.helpers import async_streaming_bulk
+from es_client import (
+    BULK_TIMEOUT,
+    SEARCH_TIMEOUT,
+    CircuitBreaker,
+    GuardedAsyncElasticsearch,
+    create_client,
+    node_urls,
+)
+from es_manager import (
+    BULK_CHUNK_SIZE,
+    BULK_INITIAL_BACKOFF,
+    BULK_MAX_BACKOFF,
+    BULK_MAX_CHUNK_BYTES,
+    BULK_MAX_RETRIES,
+    PIT_KEEP_ALIVE,
+    CursorExpiredError,
+    decode_cursor,
+    encode_cursor,
+    mapping_version,
+    note_index_version,
+    note_stale_mark,
+    page_body,
+    stale_mark_current,
+)
+import facets
+from facets import aggregations, parse_aggregations
+from metrics import instrumented, record_search
+from schema import NAME_SUGGEST
+from suggest import SUGGEST_SOURCE, normalize
+
+load_dotenv()
+
+# Connections kept alive per Elasticsearch node, shared by every request
+# handled in this worker process
+CONNECTIONS_PER_NODE = int(getenv("ELASTIC_CONNECTIONS_PER_NODE", "32"))
+
+
+class AsyncElasticManager:
+    """asyncio counterpart of ElasticManager for the ASGI app (asgi_app.py)"""
+
+    def __init__(
+        self,
+        host: str = "http://localhost:9200",
+        credentials: tuple[str, str] = ("elastic", "elastic"),
+        breaker: CircuitBreaker | None = None,
+    ):
+        self.host = host
+        self.breaker = breaker or CircuitBreaker()
+        self.es = create_client(
+            host,
+            credentials,
+            self.breaker,
+            GuardedAsyncElasticsearch,
+            connections_per_node=CONNECTIONS_PER_NODE,
+        )
+        # A timed-out search isn't sent again, so it fails within SEARCH_TIMEOUT
+        self.es_search = self.es.options(
+            request_timeout=SEARCH_TIMEOUT, retry_on_timeout=False
+        )
+        self.es_bulk = self.es.options(request_timeout=BULK_TIMEOUT)
+
+    async def connect(self):
+        """Check the cluster is reachable (call once the event loop is running)"""
+        if not await self.es.ping():
+            raise ValueError(f"Elasticsearch is not running at {self.host}")
+
+    def health(self) -> dict[str, Any]:
+        """Circuit breaker state and node pool, without a request"""
+        circuit = self.breaker.stats()
+        closed = circuit["state"] == CircuitBreaker.CLOSED
+        return {
+            "status": "ok" if closed else "unavailable",
+            "circuit": circuit,
+            "nodes": node_urls(self.es),
+        }
+
+    async def close(self):
+        """Close the pooled connections"""
+        await self.es.close()
+
+    @instrumented("create_index")
+    async def create_index(
+        self,
+        index_name: str,
+        mappings: dict[str, Any] = None,
+        settings: dict[str, Any] = None,
+    ):
+        """Create index with optional mappings and settings"""
+        if not await self.es.indices.exists(index=index_name):
+            body = {}
+            if mappings:
+                body["mappings"] = mappings
+            if settings:
+                body["settings"] = settings
+            await self.es.indices.create(index=index_name, body=body)
+
+    async def index_exists(self, index_name: str) -> bool:
+        """Return whether an index (or alias) exists"""
+        return bool(await self.es.indices.exists(index=index_name))
+
+    async def get_field_types(self, index_name: str) -> dict[str, str]:
+        """Return {field: type} for an index, with sub-fields as FIELD.sub"""
+        response = await self.es.indices.get_mapping(index=index_name)
+        field_types: dict[str, str] = {}
+
+        def collect(properties: dict[str, Any], prefix: str = ""):
+            for field, mapping in properties.items():
+                if "type" in mapping:
+                    field_types[prefix + field] = mapping["type"]
+                collect(mapping.get("properties", {}), f"{prefix}{field}.")
+                collect(mapping.get("fields", {}), f"{prefix}{field}.")
+
+        for index_mapping in response.values():
+            collect(index_mapping["mappings"].get("properties", {}))
+        return field_types
+
+    @instrumented("add_document")
+    async def add_document(
+        self,
+        doc_id: str,
+        document: dict[str, Any],
+        index_name: str,
+        refresh: str | None = None,
+    ):
+        """Add or update a document by id (refresh="wait_for" returns once
+        it is searchable)"""
+        await self.es.index(
+            index=index_name, id=doc_id, document=document, refresh=refresh
+        )
+
+    @instrumented("bulk_add")
+    async def bulk_add(
+        self,
+        documents: Iterable[dict[str, Any]],
+        index_name: str,
+        refresh: str | None = None,
+    ) -> dict[str, Any]:
+        """Add documents through the _bulk API (auto assigns IDs)"""
+        actions = ({"_index": index_name, "_source": doc} for doc in documents)
+        success = 0
+        errors = []
+        async for ok, item in async_streaming_bulk(
+            self.es_bulk,
+            actions,
+            chunk_size=BULK_CHUNK_SIZE,
+            max_chunk_bytes=BULK_MAX_CHUNK_BYTES,
+            max_retries=BULK_MAX_RETRIES,
+            initial_backoff=BULK_INITIAL_BACKOFF,
+            max_backoff=BULK_MAX_BACKOFF,
+            raise_on_error=False,
+            refresh=refresh,
+        ):
+            if ok:
+                success += 1
+            else:
+                errors.append(item)
+        metrics.BULK_DOCUMENTS.inc(success, result="success")
+        metrics.BULK_DOCUMENTS.inc(len(errors), result="failed")
+        return {"success": success, "failed": len(errors), "errors": errors}
+
+    @instrumented("search")
+    async def search(
+        self, query: dict[str, Any], index_name: str
+    ) -> list[dict[str, Any]]:
+        """Run a search query"""
+        started = time.perf_counter()
+        response = await self.es_search.search(index=index_name, body=query)
+        record_search("search", index_name, query, response, started)
+        return response["hits"]["hits"]
+
+    @instrumented("msearch")
+    async def msearch(
+        self, queries: list[dict[str, Any]], index_name: str
+    ) -> list[dict[str, Any]]:
+        """Run several searches in one _msearch round-trip (see ElasticManager)"""
+        if not queries:
+            return []
+        searches: list[dict[str, Any]] = []
+        for query in queries:
+            searches.extend(({}, query))
+        started = time.perf_counter()
+        try:
+            response = await self.es_search.msearch(index=index_name, searches=searches)
+        except ApiError as e:
+            return [{"error": str(e), "status": e.status_code} for _ in queries]
+        record_search("msearch", index_name, queries, response, started)
+        return [
+            (
+                {"hits": item["hits"]["hits"]}
+                if "error" not in item
+                else {"error": item["error"], "status": item.get("status", 500)}
+            )
+            for item in response["responses"]
+        ]
+
+    @instrumented("facets")
+    async def facets(
+        self, index_name: str, query: dict[str, Any] | None = None
+    ) -> dict[str, Any]:
+        """Facet counts of the documents matching query, or all (see ElasticManager)"""
+        body: dict[str, Any] = {
+            "size": 0,
+            "track_total_hits": True,
+            "aggs": aggregations(),
+        }
+        if query is not None:
+            body["query"] = query
+        started = time.perf_counter()
+        response = await self.es_search.search(index=index_name, body=body)
+        record_search("facets", index_name, body, response, started)
+        return parse_aggregations(
+            response["hits"]["total"]["value"], response["aggregations"]
+        )
+
+    @instrumented("suggest")
+    async def suggest(
+        self, index_name: str, prefix: str, size: int = 10
+    ) -> list[dict[str, Any]]:
+        """Organizations whose name starts with prefix, as hits (see ElasticManager)"""
+        prefix = normalize(prefix)
+        if not prefix:
+            return []
+        body = {
+            "_source": SUGGEST_SOURCE,
+            "suggest": {
+                "name": {
+                    "prefix": prefix,
+                    "completion": {"field": NAME_SUGGEST, "size": size},
+                }
+            },
+        }
+        started = time.perf_counter()
+        response = await self.es_search.search(index=index_name, body=body)
+        record_search("suggest", index_name, body, response, started)
+        return [
+            {
+                "_id": option["_id"],
+                "_score": option["_score"],
+                "_source": option["_source"],
+            }
+            for option in response["suggest"]["name"][0]["options"]
+        ]
+
+    async def get_global_facets(self, index_name: str) -> dict[str, Any] | None:
+        """Facet counts of the whole index, as published in its mapping _meta"""
+        response = await self.es.indices.get_mapping(index=index_name)
+        for index_mapping in response.values():
+            return facets.published(index_mapping["mappings"].get("_meta", {}))
+        return None
+
+    async def mark_global_facets_stale(self, index_name: str):
+        """See ElasticManager.mark_global_facets_stale"""
+        if stale_mark_current(index_name):
+            return
+        response = await self.es.indices.get_mapping(index=index_name)
+        for name, index_mapping in response.items():
+            meta = facets.mark_stale(index_mapping["mappings"].get("_meta", {}))
+            if meta is not None:
+                await self.es.indices.put_mapping(index=name, meta=meta)
+        note_stale_mark(index_name, response)
+
+    async def index_version(self, index_name: str) -> str | None:
+        """See es_manager.mapping_version; None if there is no such index"""
+        try:
+            response = await self.es.indices.get_mapping(index=index_name)
+        except NotFoundError:
+            version = None
+        else:
+            version = mapping_version(response)
+        note_index_version(index_name, version)
+        return version
+
+    @instrumented("search_page")
+    async def search_page(
+        self,
+        query: dict[str, Any],
+        index_name: str,
+        cursor: str | None = None,
+        size: int = 10,
+    ) -> dict[str, Any]:
+        """Return one page of hits and a cursor for the next one"""
+        if cursor:
+            pit_id, search_after = decode_cursor(cursor)
+        else:
+            response = await self.es_search.open_point_in_time(
+                index=index_name, keep_alive=PIT_KEEP_ALIVE
+            )
+            pit_id, search_after = response["id"], None
+        body = page_body(query, pit_id, search_after, size)
+        started = time.perf_counter()
+        try:
+            response = await self.es_search.search(body=body)
+        except NotFoundError:
+            if not cursor:
+                raise
+            raise CursorExpiredError() from None
+        record_search("search_page", index_name, body, response, started)
+        hits = response["hits"]["hits"]
+        pit_id = response.get("pit_id", pit_id)
+        if len(hits) < size:
+            await self.es.close_point_in_time(id=pit_id)
+            return {"hits": hits, "cursor": None}
+        return {"hits": hits, "cursor": encode_cursor(pit_id, hits[-1]["sort"])}
+
+    async def iter_all_documents(
+        self,
+        index_name: str,
+        batch_size: int = 1000,
+        source: list[str] | bool = True,
+    ) -> AsyncIterator[dict[str, Any]]:
+        """Stream the _source of every document at constant memory"""
+        response = await self.es.open_point_in_time(
+            index=index_name, keep_alive=PIT_KEEP_ALIVE
+        )
+        pit_id, search_after = response["id"], None
+        try:
+            while True:
+                body = {"query": {"match_all": {}}, "_source": source, "sort": []}
+                response = await self.es.search(
+                    body=page_body(body, pit_id, search_after, batch_size)
+                )
+                pit_id = response.get("pit_id", pit_id)
+                hits = response["hits"]["hits"]
+                for hit in hits:
+                    yield hit["_source"]
+                if len(hits) < batch_size:
+                    break
+                search_after = hits[-1]["sort"]
+        finally:
+            await self.es.close_point_in_time(id=pit_id)
+
+    @instrumented("delete_document")
+    async def delete_document(
+        self, doc_id: str, index_name: str, refresh: str | None = None
+    ):
+        """Delete a document by ID"""
+        await self.es.options(ignore_status=404).delete(
+            index=index_name, id=doc_id, refresh=refresh
+        )
+
+    @instrumented("delete_index")
+    async def delete_index(self, index_name: str):
+        """Delete the entire index"""
+        await self.es.options(ignore_status=[400, 404]).indices.delete(index=index_name)
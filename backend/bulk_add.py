@@ -1,54 +1,193 @@
-import json
+import argparse
+import logging
 import os
+import sys
+from contextlib import nullcontext
 from os import getenv
+from typing import Iterable, Iterator
 
 from dotenv import load_dotenv
 from es_manager import ElasticManager
+from mappings import (
+    BULK_LOAD_SETTINGS,
+    NONPROFITS_MAPPINGS,
+    NONPROFITS_SETTINGS,
+    TEMPLATE_NAME,
+    index_template,
+)
+from schema import EIN, normalize_document
+from search_builder import knn_warm_queries, warm_queries
+from sync import MANIFEST_PATH, SyncManifest, sync_documents
+
+# The CSV enrichment pipeline lives next to the data it reads
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "data"))
+from csv_to_json import csv_path, iter_documents, read_ndjson  # noqa: E402
 
 load_dotenv()
 
 
-def load_json_files(directory: str) -> list[dict]:
-    """Load all JSON files from a directory into a list of dicts."""
-    documents = []
-    for filename in os.listdir(directory):
-        if filename.endswith(".json"):
-            filepath = os.path.join(directory, filename)
-            with open(filepath, "r", encoding="utf-8") as f:
-                try:
-                    data = json.load(f)
-                    documents.append(data)
-                except json.JSONDecodeError as e:
-                    print(f"⚠️ Skipping {filename}, invalid JSON: {e}")
-    return documents
+def load_documents(paths: Iterable[str]) -> Iterator[dict]:
+    """Stream documents from BMF CSVs and/or (gzipped) NDJSON files.
+
+    Everything is a generator, so memory stays flat no matter how many
+    state files are loaded in one run.
+    """
+    for path in paths:
+        if path.endswith((".ndjson", ".ndjson.gz", ".jsonl", ".jsonl.gz")):
+            yield from read_ndjson(path)
+        else:
+            yield from iter_documents([path])
 
 
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Stream IRS EO BMF files into Elasticsearch."
+    )
+    parser.add_argument(
+        "paths",
+        nargs="*",
+        default=[csv_path],
+        help="BMF CSVs (eo_oh.csv, eo_ca.csv, ...) or NDJSON from csv_to_json.py",
+    )
+    parser.add_argument(
+        "--sync",
+        action="store_true",
+        help="only send new, changed and removed organizations since the last sync",
+    )
+    parser.add_argument(
+        "--manifest",
+        default=getenv("SYNC_MANIFEST", MANIFEST_PATH),
+        help="SQLite file holding per-EIN content hashes for --sync",
+    )
+    parser.add_argument(
+        "--reindex",
+        action="store_true",
+        help="build a new index version and swap the read alias onto it",
+    )
+    parser.add_argument(
+        "--keep",
+        type=int,
+        default=1,
+        help="old index versions to keep for rollback after --reindex",
+    )
+    args = parser.parse_args()
+    logging.basicConfig(format="%(message)s")
+    logging.getLogger("es_manager").setLevel(logging.INFO)
+
     # ElasticSearch connection config
     elastic_user = getenv("ELASTIC_USERNAME", "elastic")
     elastic_password = getenv("ELASTIC_PASSWORD", "password")
     elastic_host = getenv("ELASTIC_HOST", "http://localhost:9200")
     index_name = getenv("ELASTIC_INDEX", "nonprofits")
+    bulk_threads = int(getenv("ELASTIC_BULK_THREADS", "4"))
 
     # Initialize manager
     ESManager = ElasticManager(
         host=elastic_host,
         credentials=(elastic_user, elastic_password),
     )
+    ESManager.connect()
+
+    # Template first, so every nonprofits* index gets the mappings
+    ESManager.put_index_template(TEMPLATE_NAME, index_template())
+    documents = map(normalize_document, load_documents(args.paths))
+
+    if not args.reindex:
+        # Ensure index exists (won’t overwrite if already there)
+        ESManager.create_index(
+            index_name=index_name,
+            mappings=NONPROFITS_MAPPINGS,
+            settings=NONPROFITS_SETTINGS,
+        )
+        # Write to (and key the manifest by) the index behind the alias
+        index_name = ESManager.resolve_index(index_name)
 
-    # Ensure index exists (won’t overwrite if already there)
-    ESManager.create_index(index_name=index_name)
+    if args.reindex:
+        # Build a new versioned index behind the read alias. Loading goes
+        # through sync_documents so the new index starts with an exact
+        # manifest for the next --sync.
+        manifest = SyncManifest(args.manifest)
 
-    # Load JSON docs
-    directory = "./data/json_output"  # change this path to your JSON directory
-    documents = load_json_files(directory)
+        def load(new_index: str) -> dict:
+            report = sync_documents(
+                ESManager, documents, new_index, manifest, thread_count=bulk_threads
+            )
+            facets = manifest.facet_counts(new_index).payload()
+            ESManager.put_global_facets(new_index, facets)
+            return report
 
-    # Append docs into index
-    if documents:
-        ESManager.bulk_add(documents, index_name=index_name)
+        report = ESManager.reindex(
+            index_name,
+            load,
+            mappings=NONPROFITS_MAPPINGS,
+            settings=NONPROFITS_SETTINGS,
+            load_settings=BULK_LOAD_SETTINGS,
+            warm_queries=warm_queries() + knn_warm_queries(),
+            keep=args.keep,
+        )
+        for name in manifest.indices():
+            if not ESManager.es.indices.exists(index=name):
+                manifest.clear(name)
+        manifest.close()
+        print(
+            f"Built '{report['index']}': {report['docs']} documents in "
+            f"{report['build_seconds']}s ({report['docs_per_second']} docs/s), "
+            f"merged in {report['merge_seconds']}s, "
+            f"{report['size_in_bytes'] / 1024 / 1024:.1f} MB."
+        )
+        print(
+            f"Warm queries: p50 {report['warm']['p50_ms']} ms, "
+            f"p99 {report['warm']['p99_ms']} ms over {report['warm']['queries']} queries."
+        )
+        print(
+            f"Alias '{index_name}' moved from {report['previous'] or 'nothing'}; "
+            f"removed {report['removed'] or 'nothing'}."
+        )
+        chunks = report["load"]["bulk"]["chunks"]
+    elif args.sync:
+        manifest = SyncManifest(args.manifest)
+        if ESManager.index_stats(index_name)["docs"] == 0:
+            manifest.clear(index_name)  # index was recreated; resend everything
+        # A first sync is a full load; later ones are small enough to leave
+        # refresh and replicas alone on the live index
+        loading = (
+            ESManager.bulk_loading(index_name, BULK_LOAD_SETTINGS)
+            if manifest.count(index_name) == 0
+            else nullcontext()
+        )
+        with loading:
+            report = sync_documents(
+                ESManager, documents, index_name, manifest, thread_count=bulk_threads
+            )
+        # Global facet counts, kept current by the manifest from the changes sent
+        facets = manifest.facet_counts(index_name).payload()
+        ESManager.put_global_facets(index_name, facets)
+        manifest.close()
+        print(
+            f"{report['inserted']} inserted, {report['updated']} updated, "
+            f"{report['deleted']} deleted, {report['unchanged']} unchanged, "
+            f"{report['failed']} failed in {report['seconds']}s."
+        )
+        chunks = report["bulk"]["chunks"]
     else:
-        print("No JSON files found to load.")
+        # Stream docs into index with refresh and replicas off while loading.
+        # EIN is the _id, so reloading a file updates organizations in place.
+        with ESManager.bulk_loading(index_name, BULK_LOAD_SETTINGS):
+            report = ESManager.bulk_add(
+                documents,
+                index_name=index_name,
+                id_field=EIN,
+                thread_count=bulk_threads,
+            )
+        # No manifest to count from: aggregate the loaded index once instead
+        ESManager.es.indices.refresh(index=index_name)
+        ESManager.put_global_facets(index_name, ESManager.facets(index_name))
+        print(
+            f"{report['success']} documents added, {report['failed']} failed "
+            f"in {report['seconds']}s ({report['docs_per_second']} docs/s)."
+        )
+        chunks = report["chunks"]
 
-    # Verify that it worked
-    docs = ESManager.get_all_documents(index_name)
-    print(docs)
+    for chunk in chunks:
+        for error in chunk["errors"][:5]:
+            print(f"⚠️ Chunk {chunk['chunk']}: {error}")
@@ -0,0 +1,248 @@
+"""Elasticsearch client construction and the circuit breaker around it.
+
+ELASTIC_HOST may list several nodes, comma separated
+(http://es1:9200,http://es2:9200). The client keeps a pool with one set of
+connections per node, sends each request to the next live node and on a
+connection error or timeout retries it on another one; the failing node is
+taken out of rotation with an exponential backoff (ELASTIC_DEAD_NODE_BACKOFF
+doubling up to ELASTIC_MAX_DEAD_NODE_BACKOFF seconds) before it is tried
+again. With ELASTIC_SNIFF=1 the pool is also refreshed from the cluster's
+own node list, at most every ELASTIC_SNIFF_INTERVAL seconds and whenever a
+node fails. Sniffing reports the addresses nodes publish, so leave it off
+behind a load balancer or Docker port mapping.
+
+Nothing is sent when a client is created: the first request opens the
+first connection.
+
+Every request goes through a CircuitBreaker shared by the manager. After
+ELASTIC_BREAKER_FAILURES requests in a row failed at the cluster (no node
+reachable, timed out, or 502/503/504), requests fail at once with
+CircuitOpenError for ELASTIC_BREAKER_RESET seconds, instead of each one
+waiting out connection attempts and timeouts. Then one trial request is let
+through; if it succeeds the circuit closes again. The apps answer from
+expired result cache entries while the cluster is unavailable (see
+ResultCache.get_stale).
+"""
+
+import threading
+import time
+from os import getenv
+from typing import Any
+
+import metrics
+from elastic_transport import ConnectionError, ConnectionTimeout, TransportError
+from elasticsearch import ApiError, AsyncElasticsearch, Elasticsearch
+
+# Request timeouts in seconds: the default for admin calls, a shorter one
+# for the search routes and a longer one per _bulk chunk
+REQUEST_TIMEOUT = float(getenv("ELASTIC_REQUEST_TIMEOUT", "10"))
+SEARCH_TIMEOUT = float(getenv("ELASTIC_SEARCH_TIMEOUT", "5"))
+BULK_TIMEOUT = float(getenv("ELASTIC_BULK_TIMEOUT", "60"))
+
+# Node pool health: a failed node sits out DEAD_NODE_BACKOFF * 2^(n-1)
+# seconds after its n-th failure in a row, up to MAX_DEAD_NODE_BACKOFF
+DEAD_NODE_BACKOFF = float(getenv("ELASTIC_DEAD_NODE_BACKOFF", "1"))
+MAX_DEAD_NODE_BACKOFF = float(getenv("ELASTIC_MAX_DEAD_NODE_BACKOFF", "30"))
+SNIFF = getenv("ELASTIC_SNIFF", "0") == "1"
+SNIFF_INTERVAL = float(getenv("ELASTIC_SNIFF_INTERVAL", "60"))
+
+BREAKER_FAILURES = int(getenv("ELASTIC_BREAKER_FAILURES", "5"))
+BREAKER_RESET = float(getenv("ELASTIC_BREAKER_RESET", "30"))
+
+# Statuses meaning the cluster (or a proxy in front of it) can't serve now
+UNAVAILABLE_STATUSES = (502, 503, 504)
+
+
+class CircuitOpenError(ConnectionError):
+    """Raised instead of sending a request while the circuit is open"""
+
+    def __init__(self, retry_after: float):
+        super().__init__(f"Elasticsearch unavailable, retry in {retry_after:.0f}s")
+        self.retry_after = retry_after
+
+
+# What the apps treat as "the cluster is unavailable" (CircuitOpenError
+# is a ConnectionError, so it is included)
+UNAVAILABLE_ERRORS = (ConnectionError, ConnectionTimeout)
+
+
+def is_outage(error: BaseException) -> bool:
+    """Whether a failed request counts against the circuit breaker.
+
+    Client errors (a bad query, a missing index) say nothing about the
+    cluster's health, so only transport failures and 502/503/504 count.
+    """
+    if isinstance(error, ApiError):
+        return error.status_code in UNAVAILABLE_STATUSES
+    return isinstance(error, TransportError)
+
+
+class CircuitBreaker:
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half_open"
+
+    def __init__(
+        self,
+        failure_threshold: int = BREAKER_FAILURES,
+        reset_timeout: float = BREAKER_RESET,
+    ):
+        """Fail fast after failure_threshold outages in a row, for reset_timeout"""
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.state = self.CLOSED
+        self.failures = 0
+        self.opened_at = 0.0
+        self.trial_started = 0.0
+        self.rejected = 0
+        self._lock = threading.Lock()
+
+    def before_request(self):
+        """Raise CircuitOpenError unless a request may be sent now"""
+        with self._lock:
+            if self.state == self.CLOSED:
+                return
+            now = time.monotonic()
+            if self.state == self.OPEN:
+                retry_after = self.opened_at + self.reset_timeout - now
+                if retry_after <= 0:
+                    self._transition(self.HALF_OPEN)
+                    self.trial_started = now
+                    return
+            # One trial at a time; a trial that never reported back (its
+            # task was cancelled) stops blocking others after reset_timeout
+            elif now - self.trial_started >= self.reset_timeout:
+                self.trial_started = now
+                return
+            else:
+                retry_after = self.trial_started + self.reset_timeout - now
+            self.rejected += 1
+        metrics.ES_BREAKER_REJECTED.inc()
+        raise CircuitOpenError(max(retry_after, 0.0))
+
+    def record_success(self):
+        with self._lock:
+            self.failures = 0
+            if self.state != self.CLOSED:
+                self._transition(self.CLOSED)
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            if self.state == self.HALF_OPEN or (
+                self.state == self.CLOSED and self.failures >= self.failure_threshold
+            ):
+                self._transition(self.OPEN)
+                self.opened_at = time.monotonic()
+
+    def stats(self) -> dict[str, Any]:
+        """State and counters, for the /health route"""
+        with self._lock:
+            return {
+                "state": self.state,
+                "consecutive_failures": self.failures,
+                "rejected": self.rejected,
+            }
+
+    def _transition(self, state: str):
+        self.state = state
+        metrics.ES_BREAKER_TRANSITIONS.inc(state=state)
+
+
+class GuardedElasticsearch(Elasticsearch):
+    """Elasticsearch client whose requests go through a CircuitBreaker.
+
+    Namespaced APIs (indices, cluster), the bulk helpers and clients made
+    with options() all end up in perform_request, so they are guarded too.
+    """
+
+    breaker: CircuitBreaker
+
+    def perform_request(self, *args, **kwargs):
+        self.breaker.before_request()
+        try:
+            response = super().perform_request(*args, **kwargs)
+        except Exception as e:
+            if is_outage(e):
+                self.breaker.record_failure()
+            else:
+                self.breaker.record_success()
+            raise
+        self.breaker.record_success()
+        return response
+
+    def options(self, **kwargs):
+        client = super().options(**kwargs)
+        client.breaker = self.breaker
+        return client
+
+
+class GuardedAsyncElasticsearch(AsyncElasticsearch):
+    """AsyncElasticsearch counterpart of GuardedElasticsearch"""
+
+    breaker: CircuitBreaker
+
+    async def perform_request(self, *args, **kwargs):
+        self.breaker.before_request()
+        try:
+            response = await super().perform_request(*args, **kwargs)
+        except Exception as e:
+            if is_outage(e):
+                self.breaker.record_failure()
+            else:
+                self.breaker.record_success()
+            raise
+        self.breaker.record_success()
+        return response
+
+    def options(self, **kwargs):
+        client = super().options(**kwargs)
+        client.breaker = self.breaker
+        return client
+
+
+def parse_hosts(host: str | list[str]) -> list[str]:
+    """Node URLs from ELASTIC_HOST ("http://es1:9200,http://es2:9200")"""
+    if isinstance(host, str):
+        host = host.split(",")
+    hosts = [url.strip() for url in host if url.strip()]
+    if not hosts:
+        raise ValueError("No Elasticsearch host given")
+    return hosts
+
+
+def client_options(**overrides: Any) -> dict[str, Any]:
+    """Client keyword arguments for the node pool, timeouts and sniffing"""
+    options: dict[str, Any] = {
+        "request_timeout": REQUEST_TIMEOUT,
+        "retry_on_timeout": True,
+        "dead_node_backoff_factor": DEAD_NODE_BACKOFF,
+        "max_dead_node_backoff": MAX_DEAD_NODE_BACKOFF,
+    }
+    if SNIFF:
+        # Before the first request rather than on start, which would connect
+        options["sniff_before_requests"] = True
+        options["sniff_on_node_failure"] = True
+        options["min_delay_between_sniffing"] = SNIFF_INTERVAL
+    options.update(overrides)
+    return options
+
+
+def create_client(
+    host: str | list[str],
+    credentials: tuple[str, str],
+    breaker: CircuitBreaker,
+    client_class: type = GuardedElasticsearch,
+    **overrides: Any,
+):
+    """A guarded client for every node in host; sends nothing until used"""
+    client = client_class(
+        parse_hosts(host), basic_auth=credentials, **client_options(**overrides)
+    )
+    client.breaker = breaker
+    return client
+
+
+def node_urls(client: Elasticsearch | AsyncElasticsearch) -> list[str]:
+    """Base URLs of the nodes currently in a client's pool"""
+    return [node.base_url for node in client.transport.node_pool.all()]
@@ -1,67 +1,780 @@
+import base64
+import json
+import logging
+import time
+from contextlib import contextmanager
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from itertools import islice
 from os import getenv
-from typing import Any
+from typing import Any, Callable, Iterable, Iterator
 
+import metrics
 from dotenv import load_dotenv
-from elasticsearch import Elasticsearch
+from elastic_transport import TransportError
+from elasticsearch import ApiError, NotFoundError
+from es_client import (
+    BULK_TIMEOUT,
+    SEARCH_TIMEOUT,
+    CircuitBreaker,
+    create_client,
+    node_urls,
+)
+import facets
+from facets import aggregations, parse_aggregations
+from metrics import instrumented, record_search
+from schema import NAME_SUGGEST
+from suggest import SUGGEST_SOURCE, normalize
 
 load_dotenv()
 
+logger = logging.getLogger(__name__)
+
+# Bulk defaults: ~5-15 MB per _bulk request is the sweet spot Elastic recommends
+BULK_CHUNK_SIZE = 1000
+BULK_MAX_CHUNK_BYTES = 10 * 1024 * 1024
+BULK_THREAD_COUNT = 4
+BULK_MAX_RETRIES = 3
+BULK_INITIAL_BACKOFF = 1.0
+BULK_MAX_BACKOFF = 30.0
+
+# How long a point-in-time stays open between two cursor pages
+PIT_KEEP_ALIVE = "2m"
+
+
+def _serialize_action(action: dict[str, Any]) -> list[str]:
+    """Turn a bulk action dict into its NDJSON lines.
+
+    Actions use the same shape as elasticsearch.helpers:
+    {"_op_type": "index", "_index": ..., "_id": ..., "_source": {...}}
+    """
+    op_type = action.get("_op_type", "index")
+    meta = {"_index": action["_index"]}
+    if action.get("_id") is not None:
+        meta["_id"] = action["_id"]
+    lines = [json.dumps({op_type: meta}, separators=(",", ":"))]
+    if op_type != "delete":
+        lines.append(
+            json.dumps(action["_source"], separators=(",", ":"), ensure_ascii=False)
+        )
+    return lines
+
+
+def mapping_version(response: dict[str, Any]) -> str | None:
+    """Index version from a get_mapping response: the concrete index and when
+    its _meta was last published. An alias swap or a bulk_add.py load changes
+    it (see result_cache.py)."""
+    for name, index_mapping in response.items():
+        meta = index_mapping["mappings"].get("_meta", {})
+        return f"{name}/{meta.get('published')}/{bool(meta.get('facets_stale'))}"
+    return None
+
+
+# Index -> version this process left it in when it marked its global facet
+# counts stale. Later writes skip the mapping round-trip until a version
+# check sees the index move on (a publish, an alias swap). Shared by the
+# sync and async managers, which mark the same index.
+_stale_marks: dict[str, str] = {}
+
+
+def stale_mark_current(index_name: str) -> bool:
+    """Whether this process already marked the index's facet counts stale"""
+    return index_name in _stale_marks
+
+
+def note_stale_mark(index_name: str, response: dict[str, Any]):
+    """Remember the mark, from the get_mapping response it was based on"""
+    for name, index_mapping in response.items():
+        meta = index_mapping["mappings"].get("_meta", {})
+        _stale_marks[index_name] = f"{name}/{meta.get('published')}/True"
+
+
+def note_index_version(index_name: str, version: str | None):
+    """Forget a mark once the index's version is no longer the marked one"""
+    if _stale_marks.get(index_name, version) != version:
+        del _stale_marks[index_name]
+
+
+def encode_cursor(pit_id: str, search_after: list[Any]) -> str:
+    """Pack a point-in-time id and search_after values into an opaque token"""
+    payload = json.dumps({"pit": pit_id, "after": search_after}, separators=(",", ":"))
+    return base64.urlsafe_b64encode(payload.encode("utf-8")).decode("ascii")
+
+
+class CursorExpiredError(LookupError):
+    """The point-in-time a cursor pages through has expired or was closed"""
+
+    def __init__(self):
+        super().__init__(
+            'Expired cursor: start again from the first page with "cursor": null'
+        )
+
+
+def decode_cursor(cursor: str) -> tuple[str, list[Any]]:
+    """Unpack a token from encode_cursor, raising ValueError if it is malformed"""
+    if not isinstance(cursor, str):
+        raise ValueError("Invalid cursor: expected a string from a previous page")
+    try:
+        state = json.loads(base64.urlsafe_b64decode(cursor.encode("ascii")))
+        pit_id, search_after = state["pit"], state["after"]
+    except (ValueError, TypeError, KeyError) as e:
+        raise ValueError(f"Invalid cursor: {e}") from e
+    if not isinstance(pit_id, str) or not isinstance(search_after, list):
+        raise ValueError("Invalid cursor: not from a previous page")
+    return pit_id, search_after
+
+
+def page_body(
+    query: dict[str, Any], pit_id: str, search_after: list[Any] | None, size: int
+) -> dict[str, Any]:
+    """Build a point-in-time search body for one page after search_after"""
+    body = {k: v for k, v in query.items() if k not in ("from", "size", "sort")}
+    body["size"] = size
+    body["pit"] = {"id": pit_id, "keep_alive": PIT_KEEP_ALIVE}
+    # _shard_doc breaks ties so search_after never skips or repeats hits
+    body["sort"] = list(query.get("sort", ["_score"])) + [{"_shard_doc": "asc"}]
+    if search_after:
+        body["search_after"] = search_after
+    return body
+
+
+def _chunk_actions(
+    actions: Iterable[dict[str, Any]], chunk_size: int, max_chunk_bytes: int
+) -> Iterator[list[list[str]]]:
+    """Group serialized actions into chunks bounded by count and bytes"""
+    chunk: list[list[str]] = []
+    chunk_bytes = 0
+    for action in actions:
+        lines = _serialize_action(action)
+        size = sum(len(line.encode("utf-8")) + 1 for line in lines)
+        if chunk and (len(chunk) >= chunk_size or chunk_bytes + size > max_chunk_bytes):
+            yield chunk
+            chunk, chunk_bytes = [], 0
+        chunk.append(lines)
+        chunk_bytes += size
+    if chunk:
+        yield chunk
+
 
 class ElasticManager:
     def __init__(
         self,
         host: str = "http://localhost:9200",
         credentials: tuple[str, str] = ("elastic", "elastic"),
+        breaker: CircuitBreaker | None = None,
     ):
-        self.es = Elasticsearch(host, basic_auth=credentials)
+        """Client for the nodes in host (comma separated); nothing is sent
+        until the first call, see es_client.py"""
+        self.host = host
+        self.breaker = breaker or CircuitBreaker()
+        self.es = create_client(host, credentials, self.breaker)
+        # Same connections, with the timeouts of the search routes and _bulk
+        # A timed-out search isn't sent again, so it fails within SEARCH_TIMEOUT
+        self.es_search = self.es.options(
+            request_timeout=SEARCH_TIMEOUT, retry_on_timeout=False
+        )
+        self.es_bulk = self.es.options(request_timeout=BULK_TIMEOUT)
+        # Force merges and health waits take as long as they take; a retry
+        # would only start the same merge again
+        self.es_admin = self.es.options(request_timeout=None, max_retries=0)
+
+    def connect(self):
+        """Check the cluster is reachable (for scripts that should stop early)"""
         if not self.es.ping():
-            raise ValueError(f"Elasticsearch is not running at {host}")
+            raise ValueError(f"Elasticsearch is not running at {self.host}")
+
+    def health(self) -> dict[str, Any]:
+        """Circuit breaker state and node pool, without a request"""
+        circuit = self.breaker.stats()
+        closed = circuit["state"] == CircuitBreaker.CLOSED
+        return {
+            "status": "ok" if closed else "unavailable",
+            "circuit": circuit,
+            "nodes": node_urls(self.es),
+        }
 
     def get_info(self):
         """Gets the settings for the cluster connected"""
         return self.es.info()
 
-    def create_index(self, index_name: str, mappings: list[dict[str, Any]] = None):
-        """Create index with optional mappings"""
+    @instrumented("create_index")
+    def create_index(
+        self,
+        index_name: str,
+        mappings: dict[str, Any] = None,
+        settings: dict[str, Any] = None,
+    ):
+        """Create index with optional mappings and settings"""
         if not self.es.indices.exists(index=index_name):
-            body = {"mappings": mappings} if mappings else {}
+            body = {}
+            if mappings:
+                body["mappings"] = mappings
+            if settings:
+                body["settings"] = settings
             self.es.indices.create(index=index_name, body=body)
-            print(f"Index '{index_name}' created.")
+            logger.info("Index '%s' created.", index_name)
         else:
-            print(f"Index '{index_name}' already exists.")
+            logger.info("Index '%s' already exists.", index_name)
+
+    def put_index_template(self, name: str, template: dict[str, Any]):
+        """Create or replace a composable index template"""
+        self.es.indices.put_index_template(name=name, body=template)
+        logger.info(
+            "Index template '%s' (version %s) stored.", name, template.get("version")
+        )
+
+    def index_stats(self, index_name: str) -> dict[str, int]:
+        """Return the document count and primary store size of an index"""
+        stats = self.es.indices.stats(index=index_name, metric=["docs", "store"])
+        primaries = stats["_all"]["primaries"]
+        return {
+            "docs": primaries["docs"]["count"],
+            "size_in_bytes": primaries["store"]["size_in_bytes"],
+        }
+
+    def index_exists(self, index_name: str) -> bool:
+        """Return whether an index (or alias) exists"""
+        return bool(self.es.indices.exists(index=index_name))
+
+    def get_field_types(self, index_name: str) -> dict[str, str]:
+        """Return {field: type} for an index, with sub-fields as FIELD.sub"""
+        response = self.es.indices.get_mapping(index=index_name)
+        field_types: dict[str, str] = {}
+
+        def collect(properties: dict[str, Any], prefix: str = ""):
+            for field, mapping in properties.items():
+                if "type" in mapping:
+                    field_types[prefix + field] = mapping["type"]
+                collect(mapping.get("properties", {}), f"{prefix}{field}.")
+                collect(mapping.get("fields", {}), f"{prefix}{field}.")
+
+        for index_mapping in response.values():
+            collect(index_mapping["mappings"].get("properties", {}))
+        return field_types
+
+    @contextmanager
+    def bulk_loading(self, index_name: str, settings: dict[str, Any]):
+        """Apply bulk-load settings (e.g. no refresh/replicas), restore them after"""
+        if not settings:
+            yield
+            return
+        # Keyed by the concrete index, which differs when index_name is an alias
+        (current,) = self.es.indices.get_settings(
+            index=index_name, flat_settings=True, include_defaults=True
+        ).values()
+        previous = {
+            key: current["settings"].get(
+                f"index.{key}", current["defaults"].get(f"index.{key}")
+            )
+            for key in settings
+        }
+        self.es.indices.put_settings(index=index_name, settings=settings)
+        try:
+            yield
+        finally:
+            self.es.indices.put_settings(index=index_name, settings=previous)
+            self.es.indices.refresh(index=index_name)
+
+    def alias_indices(self, alias: str) -> list[str]:
+        """Return the indices an alias points to ([] if there is no such alias)"""
+        if not self.es.indices.exists_alias(name=alias):
+            return []
+        return sorted(self.es.indices.get_alias(name=alias))
+
+    def resolve_index(self, name: str) -> str:
+        """Return the concrete index behind an alias, or name if it isn't one"""
+        indices = self.alias_indices(name)
+        return indices[0] if len(indices) == 1 else name
 
-    def add_document(self, doc_id: str, document: dict[str, Any], index_name: str):
-        """Add or update a document by id"""
-        self.es.index(index=index_name, id=doc_id, document=document)
-        print(f"Document {doc_id} added/updated.")
+    def swap_alias(self, alias: str, index_name: str) -> list[str]:
+        """Atomically point alias at index_name alone; return the indices it left.
 
-    def bulk_add(self, documents: list[dict[str, Any]], index_name: str):
-        """Add a list of documents (auto assigns IDs)"""
-        for doc in documents:
-            self.es.index(index=index_name, document=doc)
-        print(f"{len(documents)} documents added.")
+        If a concrete index still holds the alias name (the layout before
+        aliases were used), it is deleted in the same atomic update.
+        """
+        previous = self.alias_indices(alias)
+        actions: list[dict[str, Any]] = [
+            {"remove": {"index": old, "alias": alias}}
+            for old in previous
+            if old != index_name
+        ]
+        if not previous and self.es.indices.exists(index=alias):
+            actions.append({"remove_index": {"index": alias}})
+            previous = [alias]
+        actions.append(
+            {"add": {"index": index_name, "alias": alias, "is_write_index": True}}
+        )
+        self.es.indices.update_aliases(actions=actions)
+        logger.info("Alias '%s' now points to '%s'.", alias, index_name)
+        return [old for old in previous if old != index_name]
 
+    def drop_old_versions(self, alias: str, keep: int = 1) -> list[str]:
+        """Delete versioned {alias}-* indices the alias no longer uses.
+
+        The newest `keep` of them are kept so a swap can be rolled back.
+        """
+        indices = self.es.indices.get(index=f"{alias}-*", expand_wildcards="open")
+        live = set(self.alias_indices(alias))
+        old = sorted(
+            (name for name in indices if name not in live),
+            key=lambda name: int(indices[name]["settings"]["index"]["creation_date"]),
+            reverse=True,
+        )
+        removed = old[keep:]
+        for name in removed:
+            self.delete_index(name)
+        return removed
+
+    def warm(
+        self, index_name: str, queries: Iterable[dict[str, Any]], runs: int = 3
+    ) -> dict[str, Any]:
+        """Run queries against an index to load its caches; report the latency.
+
+        The first pass only warms. Later passes are timed with the request
+        cache off, so the numbers reflect the merged segments themselves.
+        """
+        queries = list(queries)
+        timings = []
+        for run in range(runs):
+            for query in queries:
+                started = time.perf_counter()
+                self.es.search(index=index_name, body=query, request_cache=False)
+                if run:
+                    timings.append((time.perf_counter() - started) * 1000)
+        timings.sort()
+        return {
+            "queries": len(queries),
+            "p50_ms": round(timings[len(timings) // 2], 2) if timings else 0.0,
+            "p99_ms": round(timings[int(len(timings) * 0.99)], 2) if timings else 0.0,
+        }
+
+    def reindex(
+        self,
+        alias: str,
+        load: Callable[[str], dict[str, Any]],
+        mappings: dict[str, Any] = None,
+        settings: dict[str, Any] = None,
+        load_settings: dict[str, Any] = None,
+        warm_queries: Iterable[dict[str, Any]] = (),
+        keep: int = 1,
+    ) -> dict[str, Any]:
+        """Blue/green rebuild of the index behind a read alias.
+
+        Creates a new versioned index, calls load(index_name) to fill it
+        (with load_settings, e.g. no refresh/replicas, applied meanwhile),
+        force-merges and warms it, then atomically moves the alias. Searches
+        keep hitting the old index until the swap. Old versions beyond
+        `keep` are deleted afterwards.
+        """
+        index_name = f"{alias}-{time.strftime('%Y%m%d-%H%M%S')}"
+        self.create_index(index_name, mappings, settings)
+        try:
+            started = time.perf_counter()
+            with self.bulk_loading(index_name, load_settings or {}):
+                load_report = load(index_name)
+            build_seconds = time.perf_counter() - started
+
+            started = time.perf_counter()
+            self.es_admin.indices.forcemerge(index=index_name, max_num_segments=1)
+            self.es.indices.refresh(index=index_name)
+            merge_seconds = time.perf_counter() - started
+
+            warm = self.warm(index_name, warm_queries)
+            # Primaries must be allocated before the alias can serve from it
+            self.es_admin.cluster.health(index=index_name, wait_for_status="yellow")
+        except Exception:
+            self.delete_index(index_name)
+            raise
+
+        stats = self.index_stats(index_name)
+        previous = self.swap_alias(alias, index_name)
+        return {
+            "index": index_name,
+            "previous": previous,
+            "removed": self.drop_old_versions(alias, keep),
+            **stats,
+            "build_seconds": round(build_seconds, 3),
+            "docs_per_second": (
+                round(stats["docs"] / build_seconds, 1) if build_seconds else 0.0
+            ),
+            "merge_seconds": round(merge_seconds, 3),
+            "warm": warm,
+            "load": load_report,
+        }
+
+    @instrumented("add_document")
+    def add_document(
+        self,
+        doc_id: str,
+        document: dict[str, Any],
+        index_name: str,
+        refresh: str | None = None,
+    ):
+        """Add or update a document by id (refresh="wait_for" returns once
+        it is searchable)"""
+        self.es.index(index=index_name, id=doc_id, document=document, refresh=refresh)
+        logger.debug("Document %s added/updated.", doc_id)
+
+    def bulk_add(
+        self,
+        documents: Iterable[dict[str, Any]],
+        index_name: str,
+        id_field: str | None = None,
+        **bulk_options: Any,
+    ) -> dict[str, Any]:
+        """Add documents through the _bulk API.
+
+        IDs are taken from id_field when given (so reloading overwrites
+        instead of duplicating), otherwise Elasticsearch assigns them.
+        """
+        actions = (
+            {
+                "_index": index_name,
+                "_id": doc.get(id_field) if id_field else None,
+                "_source": doc,
+            }
+            for doc in documents
+        )
+        return self.bulk(actions, **bulk_options)
+
+    @instrumented("bulk")
+    def bulk(
+        self,
+        actions: Iterable[dict[str, Any]],
+        chunk_size: int = BULK_CHUNK_SIZE,
+        max_chunk_bytes: int = BULK_MAX_CHUNK_BYTES,
+        thread_count: int = BULK_THREAD_COUNT,
+        max_retries: int = BULK_MAX_RETRIES,
+        initial_backoff: float = BULK_INITIAL_BACKOFF,
+        max_backoff: float = BULK_MAX_BACKOFF,
+        refresh: str | None = None,
+    ) -> dict[str, Any]:
+        """Stream bulk actions to Elasticsearch in parallel, bounded chunks.
+
+        Actions are consumed lazily, so generators of any length can be
+        indexed; at most two chunks per worker are held in memory. Items
+        rejected with 429 are retried with exponential backoff. Returns a
+        report with overall counts and one entry per chunk. refresh is
+        passed on to every _bulk request (e.g. "wait_for").
+        """
+        started = time.perf_counter()
+        reports = []
+        with ThreadPoolExecutor(max_workers=thread_count) as pool:
+            pending = set()
+            for number, chunk in enumerate(
+                _chunk_actions(actions, chunk_size, max_chunk_bytes)
+            ):
+                if len(pending) >= thread_count * 2:
+                    done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                    reports.extend(future.result() for future in done)
+                pending.add(
+                    pool.submit(
+                        self._send_chunk,
+                        number,
+                        chunk,
+                        max_retries,
+                        initial_backoff,
+                        max_backoff,
+                        refresh,
+                    )
+                )
+            done, _ = wait(pending)
+            reports.extend(future.result() for future in done)
+
+        reports.sort(key=lambda report: report["chunk"])
+        elapsed = time.perf_counter() - started
+        metrics.BULK_SECONDS.inc(elapsed)
+        success = sum(report["success"] for report in reports)
+        return {
+            "success": success,
+            "failed": sum(report["failed"] for report in reports),
+            "seconds": round(elapsed, 3),
+            "docs_per_second": round(success / elapsed, 1) if elapsed else 0.0,
+            "chunks": reports,
+        }
+
+    def _send_chunk(
+        self,
+        number: int,
+        chunk: list[list[str]],
+        max_retries: int,
+        initial_backoff: float,
+        max_backoff: float,
+        refresh: str | None = None,
+    ) -> dict[str, Any]:
+        """Send one chunk, retrying 429-rejected items with backoff, and the
+        whole chunk when the request didn't get through (status None)"""
+        success = 0
+        errors: list[dict[str, Any]] = []
+        attempt = 0
+        while chunk:
+            retry: list[list[str]] = []
+            try:
+                response = self.es_bulk.bulk(
+                    operations=[line for lines in chunk for line in lines],
+                    refresh=refresh,
+                )
+            except ApiError as e:
+                if e.status_code == 429 and attempt < max_retries:
+                    retry = chunk
+                else:
+                    errors.extend(
+                        {"status": e.status_code, "error": str(e)} for _ in chunk
+                    )
+            except TransportError as e:
+                # Timed out, connection lost or circuit open: nothing tells
+                # which items landed, and sending them again is harmless
+                if attempt < max_retries:
+                    retry = chunk
+                else:
+                    errors.extend({"status": None, "error": str(e)} for _ in chunk)
+            else:
+                for lines, item in zip(chunk, response["items"]):
+                    op_type, result = next(iter(item.items()))
+                    status = result.get("status", 500)
+                    if status < 300 or (op_type == "delete" and status == 404):
+                        success += 1
+                    elif status == 429 and attempt < max_retries:
+                        retry.append(lines)
+                    else:
+                        # The index as sent (an alias comes back resolved)
+                        (meta,) = json.loads(lines[0]).values()
+                        errors.append(
+                            {
+                                "_index": meta["_index"],
+                                "_id": result.get("_id"),
+                                "status": status,
+                                "error": result.get("error"),
+                            }
+                        )
+            chunk = retry
+            if chunk:
+                time.sleep(min(max_backoff, initial_backoff * 2**attempt))
+                attempt += 1
+        # Per chunk, so bulk_documents_total moves while a long load runs
+        metrics.BULK_DOCUMENTS.inc(success, result="success")
+        metrics.BULK_DOCUMENTS.inc(len(errors), result="failed")
+        metrics.BULK_RETRIES.inc(attempt)
+        return {
+            "chunk": number,
+            "success": success,
+            "failed": len(errors),
+            "retries": attempt,
+            "errors": errors,
+        }
+
+    @instrumented("search")
     def search(self, query: dict[str, Any], index_name: str) -> list[dict[str, Any]]:
         """Run a search query"""
-        response = self.es.search(index=index_name, body=query)
+        started = time.perf_counter()
+        response = self.es_search.search(index=index_name, body=query)
+        record_search("search", index_name, query, response, started)
         return response["hits"]["hits"]
 
-    def delete_document(self, doc_id: str, index_name: str):
+    @instrumented("msearch")
+    def msearch(
+        self, queries: list[dict[str, Any]], index_name: str
+    ) -> list[dict[str, Any]]:
+        """Run several searches in one _msearch round-trip.
+
+        Returns one entry per query, in order: {"hits": [...]} on success or
+        {"error": ..., "status": ...} when that search failed.
+        """
+        if not queries:
+            return []
+        searches: list[dict[str, Any]] = []
+        for query in queries:
+            searches.extend(({}, query))
+        started = time.perf_counter()
+        try:
+            response = self.es_search.msearch(index=index_name, searches=searches)
+        except ApiError as e:
+            return [{"error": str(e), "status": e.status_code} for _ in queries]
+        record_search("msearch", index_name, queries, response, started)
+        return [
+            (
+                {"hits": item["hits"]["hits"]}
+                if "error" not in item
+                else {"error": item["error"], "status": item.get("status", 500)}
+            )
+            for item in response["responses"]
+        ]
+
+    @instrumented("facets")
+    def facets(
+        self, index_name: str, query: dict[str, Any] | None = None
+    ) -> dict[str, Any]:
+        """Facet counts (see facets.py) of the documents matching query, or all"""
+        body: dict[str, Any] = {
+            "size": 0,
+            "track_total_hits": True,
+            "aggs": aggregations(),
+        }
+        if query is not None:
+            body["query"] = query
+        started = time.perf_counter()
+        response = self.es_search.search(index=index_name, body=body)
+        record_search("facets", index_name, body, response, started)
+        return parse_aggregations(
+            response["hits"]["total"]["value"], response["aggregations"]
+        )
+
+    @instrumented("suggest")
+    def suggest(
+        self, index_name: str, prefix: str, size: int = 10
+    ) -> list[dict[str, Any]]:
+        """Organizations whose name starts with prefix, highest NAME_SUGGEST
+        weight first, as hits"""
+        prefix = normalize(prefix)
+        if not prefix:
+            return []
+        body = {
+            "_source": SUGGEST_SOURCE,
+            "suggest": {
+                "name": {
+                    "prefix": prefix,
+                    "completion": {"field": NAME_SUGGEST, "size": size},
+                }
+            },
+        }
+        started = time.perf_counter()
+        response = self.es_search.search(index=index_name, body=body)
+        record_search("suggest", index_name, body, response, started)
+        return [
+            {
+                "_id": option["_id"],
+                "_score": option["_score"],
+                "_source": option["_source"],
+            }
+            for option in response["suggest"]["name"][0]["options"]
+        ]
+
+    def get_global_facets(self, index_name: str) -> dict[str, Any] | None:
+        """Facet counts of the whole index, as published in its mapping _meta"""
+        response = self.es.indices.get_mapping(index=index_name)
+        for index_mapping in response.values():
+            return facets.published(index_mapping["mappings"].get("_meta", {}))
+        return None
+
+    def put_global_facets(self, index_name: str, payload: dict[str, Any]):
+        """Publish facet counts of the whole index in its mapping _meta"""
+        response = self.es.indices.get_mapping(index=index_name)
+        for name, index_mapping in response.items():
+            meta = facets.publish(index_mapping["mappings"].get("_meta", {}), payload)
+            self.es.indices.put_mapping(index=name, meta=meta)
+        _stale_marks.pop(index_name, None)
+
+    def mark_global_facets_stale(self, index_name: str):
+        """After a write: get_global_facets returns None until the next
+        put_global_facets (one mapping update per publish, and no request
+        at all while this process's last mark is current)"""
+        if stale_mark_current(index_name):
+            return
+        response = self.es.indices.get_mapping(index=index_name)
+        for name, index_mapping in response.items():
+            meta = facets.mark_stale(index_mapping["mappings"].get("_meta", {}))
+            if meta is not None:
+                self.es.indices.put_mapping(index=name, meta=meta)
+        note_stale_mark(index_name, response)
+
+    def index_version(self, index_name: str) -> str | None:
+        """See mapping_version; None if there is no such index"""
+        try:
+            version = mapping_version(self.es.indices.get_mapping(index=index_name))
+        except NotFoundError:
+            version = None
+        note_index_version(index_name, version)
+        return version
+
+    @instrumented("delete_document")
+    def delete_document(
+        self, doc_id: str, index_name: str, refresh: str | None = None
+    ):
         """Delete a document by ID"""
-        self.es.delete(index=index_name, id=doc_id, ignore=[404])
-        print(f"Document {doc_id} deleted (if existed).")
+        self.es.delete(index=index_name, id=doc_id, refresh=refresh, ignore=[404])
+        logger.debug("Document %s deleted (if existed).", doc_id)
 
+    @instrumented("delete_index")
     def delete_index(self, index_name: str):
         """Delete the entire index"""
         self.es.indices.delete(index=index_name, ignore=[400, 404])
-        print(f"Index '{index_name}' deleted (if existed).")
+        logger.info("Index '%s' deleted (if existed).", index_name)
+
+    @instrumented("search_page")
+    def search_page(
+        self,
+        query: dict[str, Any],
+        index_name: str,
+        cursor: str | None = None,
+        size: int = 10,
+    ) -> dict[str, Any]:
+        """Return one page of hits and a cursor for the next one.
+
+        Pages are read from a point-in-time with search_after, so every page
+        costs the same no matter how deep it is. The cursor is None once the
+        last page has been returned (the point-in-time is closed then).
+        Raises CursorExpiredError once the point-in-time has expired.
+        """
+        if cursor:
+            pit_id, search_after = decode_cursor(cursor)
+        else:
+            pit_id = self.es_search.open_point_in_time(
+                index=index_name, keep_alive=PIT_KEEP_ALIVE
+            )["id"]
+            search_after = None
+        body = page_body(query, pit_id, search_after, size)
+        started = time.perf_counter()
+        try:
+            response = self.es_search.search(body=body)
+        except NotFoundError:
+            if not cursor:
+                raise
+            raise CursorExpiredError() from None
+        record_search("search_page", index_name, body, response, started)
+        hits = response["hits"]["hits"]
+        pit_id = response.get("pit_id", pit_id)
+        if len(hits) < size:
+            self.es.close_point_in_time(id=pit_id)
+            return {"hits": hits, "cursor": None}
+        return {"hits": hits, "cursor": encode_cursor(pit_id, hits[-1]["sort"])}
+
+    def iter_all_documents(
+        self,
+        index_name: str,
+        query: dict[str, Any] | None = None,
+        batch_size: int = 1000,
+        source: list[str] | bool = True,
+    ) -> Iterator[dict[str, Any]]:
+        """Stream the _source of every matching document at constant memory"""
+        pit_id = self.es.open_point_in_time(
+            index=index_name, keep_alive=PIT_KEEP_ALIVE
+        )["id"]
+        search_after = None
+        try:
+            while True:
+                body = {
+                    "query": query or {"match_all": {}},
+                    "_source": source,
+                    "sort": [],
+                }
+                response = self.es.search(
+                    body=page_body(body, pit_id, search_after, batch_size)
+                )
+                pit_id = response.get("pit_id", pit_id)
+                hits = response["hits"]["hits"]
+                for hit in hits:
+                    yield hit["_source"]
+                if len(hits) < batch_size:
+                    break
+                search_after = hits[-1]["sort"]
+        finally:
+            self.es.close_point_in_time(id=pit_id)
 
     def get_all_documents(
         self, index_name: str, size: int = 1000
     ) -> list[dict[str, Any]]:
-        query = {"query": {"match_all": {}}, "size": size}
-        response = self.es.search(index=index_name, body=query)
-        return [hit["_source"] for hit in response["hits"]["hits"]]
+        """Return up to size documents (use iter_all_documents to stream)"""
+        documents = self.iter_all_documents(index_name, batch_size=min(size, 1000))
+        return list(islice(documents, size))
 
 
 # Example Usage
@@ -73,5 +786,6 @@ if __name__ == "__main__":
     ESManager = ElasticManager(
         host=elastic_host, credentials=(elastic_user, elastic_password)
     )
+    ESManager.connect()
     es_info = ESManager.get_info()
     print(es_info)
@@ -0,0 +1,202 @@
+"""Facet counts: how many organizations each survey choice would leave.
+
+    facet          field        bucket
+    ntee_major     NTEE_MAJOR   NTEE major group letter ("B" = Education)
+    asset_cd       ASSET_CD     BMF asset size code, "0" - "9"
+    ruling_decade  RULING       decade of the ruling year (199507 -> 1990)
+    state          STATE        two-letter state
+    city           CITY         city, the FACET_SIZES["city"] largest only
+
+The counts come from three places, all as the same payload
+({"total": n, "facets": {facet: [[key, count], ...]}}, largest first):
+
+  - a size 0 aggregation (ElasticManager.facets) for a filtered survey
+  - the sync manifest, which bulk_add.py keeps current per EIN as documents
+    are indexed and deleted (FacetCounts) and publishes in the mapping _meta
+    as the global counts
+  - LocalSearchManager.facets, which evaluates the same aggregations itself
+
+A write through the apps' /organizations routes marks the published counts
+stale (mark_stale); until bulk_add.py publishes again, the global counts
+come from the aggregation too.
+"""
+
+import json
+import time
+from collections import Counter
+from typing import Any, Iterable
+
+from schema import CITY, NTEE_MAJOR, RULING, STATE
+from search_builder import CODEBOOK
+
+def published(meta: dict[str, Any]) -> dict[str, Any] | None:
+    """The global counts in a mapping _meta, None if there are none or they
+    were marked stale"""
+    if meta.get("facets_stale"):
+        return None
+    return meta.get("facets")
+
+
+def mark_stale(meta: dict[str, Any]) -> dict[str, Any] | None:
+    """The _meta with its global counts marked stale, None if there is nothing
+    to mark (no counts, or already marked)"""
+    if "facets" not in meta or meta.get("facets_stale"):
+        return None
+    return {**meta, "facets_stale": True}
+
+
+def publish(meta: dict[str, Any], payload: dict[str, Any]) -> dict[str, Any]:
+    """The _meta with payload as its (fresh) global counts"""
+    meta = {k: v for k, v in meta.items() if k != "facets_stale"}
+    return {**meta, "facets": payload, "published": time.time()}
+
+
+# Fields aggregated with a terms aggregation, and how many buckets to return
+TERMS_FACETS: dict[str, str] = {
+    "ntee_major": NTEE_MAJOR,
+    "asset_cd": "ASSET_CD",
+    "state": STATE,
+    "city": CITY,
+}
+FACET_SIZES: dict[str, int] = {
+    "ntee_major": 30,
+    "asset_cd": 10,
+    "ruling_decade": 30,
+    "state": 70,
+    "city": 50,
+}
+FACETS = ["ntee_major", "asset_cd", "ruling_decade", "state", "city"]
+
+# RULING is YYYYMM, so a decade is 1000 wide; 0 (unknown) gets no bucket
+RULING_DECADE = 1000
+
+ASSET_RANGES = {
+    "0": "$0",
+    "1": "$1 - $9,999",
+    "2": "$10,000 - $24,999",
+    "3": "$25,000 - $99,999",
+    "4": "$100,000 - $499,999",
+    "5": "$500,000 - $999,999",
+    "6": "$1,000,000 - $4,999,999",
+    "7": "$5,000,000 - $9,999,999",
+    "8": "$10,000,000 - $49,999,999",
+    "9": "$50,000,000+",
+}
+LABELS: dict[str, dict[Any, str]] = {
+    "ntee_major": CODEBOOK.major_groups(),
+    "asset_cd": ASSET_RANGES,
+}
+
+
+def aggregations() -> dict[str, Any]:
+    """The aggs of a size 0 search returning every facet"""
+    aggs: dict[str, Any] = {
+        name: {"terms": {"field": field, "size": FACET_SIZES[name]}}
+        for name, field in TERMS_FACETS.items()
+    }
+    aggs["ruling_decade"] = {
+        "histogram": {"field": RULING, "interval": RULING_DECADE, "min_doc_count": 1}
+    }
+    return aggs
+
+
+def parse_aggregations(total: int, aggs: dict[str, Any]) -> dict[str, Any]:
+    """Facet payload from the aggregations of a search response"""
+    facets = {}
+    for name in FACETS:
+        buckets = aggs[name]["buckets"]
+        if name == "ruling_decade":
+            pairs = [
+                [decade_of(int(bucket["key"])), bucket["doc_count"]]
+                for bucket in buckets
+            ]
+            pairs = [pair for pair in pairs if pair[0] is not None]
+        else:
+            pairs = [[b["key"], b["doc_count"]] for b in buckets if b["key"] != ""]
+        facets[name] = _largest(pairs, FACET_SIZES[name])
+    return {"total": total, "facets": facets}
+
+
+def decade_of(ruling: Any) -> int | None:
+    """Decade year of a RULING (YYYYMM) value, None when unknown"""
+    if not isinstance(ruling, int) or ruling <= 0:
+        return None
+    return ruling // RULING_DECADE * 10
+
+
+def facet_query(es_query: dict[str, Any]) -> dict[str, Any] | None:
+    """The part of a survey query that decides the matches, None for all.
+
+    Should clauses only rank once there is a filter, so they are dropped
+    then and queries differing only in boosts share their facet counts.
+    """
+    query = es_query.get("query", {"match_all": {}})
+    if "match_all" in query:
+        return None
+    clauses = query.get("bool", {})
+    if clauses.get("filter") and set(clauses) <= {"filter", "should"}:
+        return {"bool": {"filter": clauses["filter"]}}
+    return query
+
+
+def document_facets(document: dict[str, Any]) -> dict[str, Any]:
+    """{facet: key} of one normalized document, None where it has no value"""
+    keys = {name: document.get(field) or None for name, field in TERMS_FACETS.items()}
+    keys["ruling_decade"] = decade_of(document.get(RULING))
+    return keys
+
+
+def _largest(pairs: Iterable[list], size: int) -> list[list]:
+    """The size largest [key, count] pairs, ordered like a terms aggregation"""
+    return sorted(pairs, key=lambda pair: (-pair[1], str(pair[0])))[:size]
+
+
+class FacetCounts:
+    def __init__(self):
+        """Exact counts for every facet key, for maintaining global facets"""
+        self.total = 0
+        self.counts: dict[str, Counter] = {name: Counter() for name in FACETS}
+
+    def add(self, keys: dict[str, Any], sign: int = 1):
+        """Count one document's facet keys (sign=-1 to uncount it)"""
+        self.total += sign
+        for name in FACETS:
+            key = keys.get(name)
+            if key is not None:
+                self.counts[name][key] += sign
+
+    def payload(self) -> dict[str, Any]:
+        """Facet payload of the largest buckets"""
+        return {
+            "total": self.total,
+            "facets": {
+                name: _largest(
+                    (
+                        [key, count]
+                        for key, count in self.counts[name].items()
+                        if count > 0
+                    ),
+                    FACET_SIZES[name],
+                )
+                for name in FACETS
+            },
+        }
+
+
+def encode_keys(keys: dict[str, Any]) -> str:
+    return json.dumps(keys, sort_keys=True, separators=(",", ":"), ensure_ascii=False)
+
+
+def facet_response(payload: dict[str, Any]) -> dict[str, Any]:
+    """Facet payload as returned by /api/facets, with labels where there are any"""
+    facets = {}
+    for name in FACETS:
+        labels = LABELS.get(name, {})
+        buckets = []
+        for key, count in payload["facets"].get(name, []):
+            bucket = {"key": key, "count": count}
+            if key in labels:
+                bucket["label"] = labels[key]
+            buckets.append(bucket)
+        facets[name] = buckets
+    return {"total": payload["total"], "facets": facets}
@@ -0,0 +1,2070 @@
+"""In-process search backend with the same interface as ElasticManager.
+
+For tests, CI and small deployments that don't want to run Elasticsearch:
+
+    SEARCH_BACKEND=local LOCAL_SEARCH_DATA=../data/eo_oh.csv python app.py
+
+loads the files into memory at startup (nothing is persisted) and serves
+the same routes. The query DSL covered is what the frontend and
+build_es_query_from_survey send: bool (must / filter / should / must_not,
+minimum_should_match), term, terms, ids, prefix, range, exists, match,
+multi_match, match_all, constant_score, geo_distance and query_string (plain
+terms and "*" only; operators and field syntax are not parsed), plus the
+terms and histogram aggregations of facets.py. Anything else, kNN search
+included, raises ValueError.
+
+Documents are kept as rows of field values. A field is indexed the first
+time a query touches it, following the index mappings (the nonprofits
+template applies to nonprofits* indices, as it does in Elasticsearch):
+
+  keyword  term -> sorted doc ids, plus a sorted term list for prefix
+  text     inverted index with per-document lengths, scored with BM25
+  numeric  values sorted once together with their doc ids; range is two
+           bisects into that column
+  geo      distinct points -> doc ids (documents share their ZIP centroid);
+           geo_distance bisects a latitude band of the points, then checks
+           their great-circle distance
+
+Sets of matching documents are Python ints used as bitmaps, so a whole
+survey filter costs a few big-int ANDs/ORs. Bitmaps of large postings,
+prefixes and ranges are cached until the next write.
+
+Hits are ranked by score, ties by index order. When a filter leaves only
+a small share of the index, every doc matched by a scoring clause is
+scored; otherwise the top hits are found by walking postings in impact
+order (shortest documents first) until no unseen document can beat them.
+Sorting by _geo_distance walks the distinct points nearest first, so a page
+of the nearest hits reads a few postings rather than every match.
+
+Name autocomplete is a suggest.SuggestIndex over the live documents,
+rebuilt by the first suggestion after a write.
+"""
+
+import fnmatch
+import functools
+import gc
+import heapq
+import logging
+import math
+import re
+import threading
+import time
+import uuid
+from array import array
+from bisect import bisect_left, bisect_right
+from collections import OrderedDict, defaultdict
+from itertools import chain, combinations, islice
+from os import getenv, pathsep
+from typing import Any, Callable, Iterable, Iterator
+
+import metrics
+from bulk_add import csv_path, load_documents
+from es_manager import (
+    BULK_CHUNK_SIZE,
+    decode_cursor,
+    encode_cursor,
+    mapping_version,
+)
+import facets
+from facets import aggregations, parse_aggregations
+from mappings import INDEX_PATTERNS, NONPROFITS_MAPPINGS, NONPROFITS_SETTINGS
+from metrics import instrumented, record_search
+from schema import EIN, normalize_document
+from search_builder import QUERY_FIELDS, warm_queries
+from suggest import SUGGEST_FIELDS, SuggestIndex
+
+logger = logging.getLogger(__name__)
+
+# Elasticsearch's BM25 defaults
+BM25_K1 = 1.2
+BM25_B = 0.75
+
+# Bitmaps for postings shorter than this are rebuilt per query, not cached
+CACHE_MIN_POSTING = 1024
+CACHE_MAX_BYTES = int(getenv("LOCAL_SEARCH_CACHE_MB", "256")) * 1024 * 1024
+# A field's string values are interned (shared between rows) until it has
+# this many distinct ones; past that the field is mostly unique values
+INTERN_MAX_VALUES = 65536
+# Numeric values added after a column was sorted are scanned linearly until
+# there are this many, then merged into the sorted column
+NUMERIC_TAIL_MAX = 4096
+# Bitmaps are walked this many bits at a time for the first few windows, so
+# a page of hits from the start of a huge bitmap never converts all of it
+ITER_WINDOW = 1 << 15
+ITER_WINDOW_MASK = (1 << ITER_WINDOW) - 1
+ITER_WINDOWS = 4
+# With more should/layer constants than this, hits are ranked by scoring
+# every candidate rather than splitting the matches per layer
+MAX_SPLIT_LAYERS = 4
+# Ranking scores every doc with a term score when there are at most this
+# many, and otherwise reads score classes, of at most MAX_CLASS_TERMS tokens
+ENUMERATE_MAX_DOCS = 256
+MAX_CLASS_TERMS = 6
+
+# Terms aggregations over at most this many terms AND each posting's bitmap
+# with the matches; above it they count the matching rows' values
+AGG_POSTING_TERMS = 256
+
+NUMERIC_MAPPING_TYPES = frozenset(
+    {"long", "integer", "short", "byte", "double", "float", "half_float", "date"}
+)
+KEYWORD_MAPPING_TYPES = frozenset({"keyword", "constant_keyword", "boolean"})
+TEXT_MAPPING_TYPES = frozenset({"text", "match_only_text"})
+GEO_MAPPING_TYPES = frozenset({"geo_point"})
+
+# Mean Earth radius, as Elasticsearch's arc distance uses
+EARTH_RADIUS_METERS = 6371008.7714
+METERS_PER_DEGREE = EARTH_RADIUS_METERS * math.pi / 180
+DISTANCE_UNITS = {
+    "mi": 1609.344, "miles": 1609.344, "yd": 0.9144, "yards": 0.9144,
+    "ft": 0.3048, "feet": 0.3048, "in": 0.0254, "inch": 0.0254,
+    "km": 1000.0, "kilometers": 1000.0, "m": 1.0, "meters": 1.0,
+    "cm": 0.01, "centimeters": 0.01, "mm": 0.001, "millimeters": 0.001,
+    "nmi": 1852.0, "NM": 1852.0, "nauticalmiles": 1852.0,
+}  # fmt: skip
+GEO_DISTANCE_PARAMS = frozenset(
+    {
+        "distance",
+        "distance_type",
+        "validation_method",
+        "ignore_unmapped",
+        "boost",
+        "_name",
+    }
+)
+GEO_SORT_PARAMS = frozenset(
+    {"order", "unit", "mode", "distance_type", "ignore_unmapped", "nested"}
+)
+# Distinct points sorted by distance are kept for this many recent origins
+NEAREST_CACHE_SIZE = 64
+
+TOKEN = re.compile(r"\w+")
+DISTANCE = re.compile(r"^\s*(\d+(?:\.\d+)?|\.\d+)\s*([A-Za-z]*)\s*$")
+NONZERO_BYTES = re.compile(rb"[^\x00]+")
+BYTE_BITS = [tuple(bit for bit in range(8) if byte >> bit & 1) for byte in range(256)]
+
+_MISSING = object()
+
+
+class IndexNotFoundError(ValueError):
+    """Raised for operations on an index that doesn't exist"""
+
+
+# Big-int &, | and ^ are fast; ~, shifts, bit_count and conversions from/to
+# bytes cost ~10x more on index-sized bitmaps, so the code below avoids them
+# on hot paths (a & ~b is written a ^ (a & b)).
+
+
+def _bitmap(doc_ids: Iterable[int], size: int) -> int:
+    """Return a bitmap (bit d set for each doc d) of doc ids below size"""
+    buf = bytearray((size >> 3) + 1)
+    for doc in doc_ids:
+        buf[doc >> 3] |= 1 << (doc & 7)
+    return int.from_bytes(buf, "little")
+
+
+def _posting_bitmap(posting: array) -> int:
+    """Bitmap of an ascending doc id array, built over its span only"""
+    if not posting:
+        return 0
+    first = posting[0] >> 3
+    buf = bytearray((posting[-1] >> 3) - first + 1)
+    for doc in posting:
+        buf[(doc >> 3) - first] |= 1 << (doc & 7)
+    return int.from_bytes(buf, "little") << (first << 3)
+
+
+def _iter_bytes(data: bytes, offset: int) -> Iterator[int]:
+    for run in NONZERO_BYTES.finditer(data):
+        for position, byte in enumerate(run.group(), run.start()):
+            base = offset + (position << 3)
+            for bit in BYTE_BITS[byte]:
+                yield base + bit
+
+
+def _iter_bits(bits: int) -> Iterator[int]:
+    """Yield the doc ids set in a bitmap, in ascending order"""
+    length = bits.bit_length()
+    start = 0
+    for _ in range(ITER_WINDOWS):
+        if start >= length:
+            return
+        window = (bits & (ITER_WINDOW_MASK << start)) >> start
+        yield from _iter_bytes(window.to_bytes(ITER_WINDOW >> 3, "little"), start)
+        start += ITER_WINDOW
+    if start < length:
+        rest = bits >> start
+        yield from _iter_bytes(
+            rest.to_bytes((length - start + 7) >> 3, "little"), start
+        )
+
+
+def _membership(bits: int) -> Callable[[int], bool]:
+    """Return a constant-time test for doc ids in a bitmap"""
+    data = bits.to_bytes((bits.bit_length() + 7) >> 3, "little")
+    size = len(data)
+    return lambda doc: (doc >> 3) < size and bool(data[doc >> 3] >> (doc & 7) & 1)
+
+
+def _at_least(required: int, bitmaps: list[int]) -> int:
+    """Docs set in at least `required` of bitmaps"""
+    # at_least[j]: docs seen in j or more of the bitmaps so far (-1 = every doc)
+    at_least = [-1] + [0] * required
+    for bits in bitmaps:
+        for j in range(required, 0, -1):
+            at_least[j] |= at_least[j - 1] & bits
+    return at_least[required]
+
+
+def _as_list(value: Any) -> list:
+    if value is None:
+        return []
+    return value if isinstance(value, list) else [value]
+
+
+def _minimum_should_match(spec: Any, clauses: int, default: int) -> int:
+    """Resolve minimum_should_match (int, "2", "-1", "75%") against a clause count"""
+    if spec is None:
+        return default
+    spec = str(spec).strip()
+    if spec.endswith("%"):
+        value = int(clauses * abs(int(spec[:-1])) / 100)
+        required = clauses - value if spec.startswith("-") else value
+    else:
+        value = int(spec)
+        required = clauses + value if value < 0 else value
+    return max(0, min(required, clauses))
+
+
+def _field_params(spec: dict[str, Any], value_key: str) -> tuple[str, Any, dict]:
+    """Split {field: value} / {field: {value_key: value, ...}} query params"""
+    params = {k: v for k, v in spec.items() if k in ("boost", "_name")}
+    fields = [k for k in spec if k not in params]
+    if len(fields) != 1:
+        raise ValueError(f"Expected exactly one field, got {fields}")
+    (field,) = fields
+    value = spec[field]
+    if isinstance(value, dict):
+        params = {**params, **value}
+        value = params.pop(value_key, None)
+    return field, value, params
+
+
+def _keyword_value(value: Any) -> str:
+    if isinstance(value, bool):
+        return "true" if value else "false"
+    return value if isinstance(value, str) else str(value)
+
+
+def _number(value: Any) -> float | None:
+    """Numeric value of a field or range bound (dates are YYYYMM numbers)"""
+    if isinstance(value, bool) or value is None:
+        return None
+    if isinstance(value, (int, float)):
+        return value
+    if not isinstance(value, str):
+        return None
+    try:
+        return float(value)
+    except ValueError:
+        pass
+    try:  # YYYY-MM style dates
+        return float(value.replace("-", ""))
+    except ValueError:
+        return None
+
+
+def _analyze(value: Any) -> list[str]:
+    """Standard-analyzer-like tokens: lower-cased runs of word characters"""
+    values = value if isinstance(value, (list, tuple)) else (value,)
+    return [
+        token
+        for item in values
+        if isinstance(item, str)
+        for token in TOKEN.findall(item.lower())
+    ]
+
+
+def _geo_point(value: Any) -> tuple[float, float] | None:
+    """(lat, lon) of a geo_point value: {"lat", "lon"}, "lat,lon" or [lon, lat]"""
+    try:
+        if isinstance(value, dict):
+            return float(value["lat"]), float(value["lon"])
+        if isinstance(value, str):
+            lat, lon = value.split(",")
+            return float(lat), float(lon)
+        if isinstance(value, (list, tuple)) and len(value) == 2:
+            return float(value[1]), float(value[0])
+    except (KeyError, TypeError, ValueError):
+        pass
+    return None
+
+
+def _geo_points(value: Any) -> list[tuple[float, float]]:
+    """Every point of a geo_point field value (a point or a list of them)"""
+    if isinstance(value, (list, tuple)) and not (
+        len(value) == 2 and all(_number(item) is not None for item in value)
+    ):
+        points = (_geo_point(item) for item in value)
+        return [point for point in points if point is not None]
+    point = _geo_point(value)
+    return [point] if point is not None else []
+
+
+def _meters(distance: Any) -> float:
+    """A geo distance ("15mi", "2.5km", 300) in meters; numbers are meters"""
+    if isinstance(distance, (int, float)) and not isinstance(distance, bool):
+        return float(distance)
+    match = DISTANCE.match(str(distance))
+    unit = match and (match.group(2) or "m")
+    if not match or unit not in DISTANCE_UNITS:
+        raise ValueError(f"failed to parse distance [{distance}]")
+    return float(match.group(1)) * DISTANCE_UNITS[unit]
+
+
+def _haversine(lat1: float, lon1: float, lat2: float, lon2: float) -> float:
+    """Great-circle distance in meters"""
+    phi1, phi2 = math.radians(lat1), math.radians(lat2)
+    h = (
+        math.sin((phi2 - phi1) / 2) ** 2
+        + math.cos(phi1) * math.cos(phi2) * math.sin(math.radians(lon2 - lon1) / 2) ** 2
+    )
+    return 2 * EARTH_RADIUS_METERS * math.asin(min(1.0, math.sqrt(h)))
+
+
+def _source_filter(source: Any) -> Callable[[str], bool] | None:
+    """Field predicate for a _source setting; None when everything is kept"""
+    if source is None or source is True:
+        return None
+    if source is False:
+        return lambda field: False
+    if isinstance(source, dict):
+        includes = _as_list(source.get("includes", source.get("include")))
+        excludes = _as_list(source.get("excludes", source.get("exclude")))
+    else:
+        includes, excludes = _as_list(source), []
+
+    @functools.cache  # one decision per field name, not per hit
+    def keep(field: str) -> bool:
+        if includes and not any(fnmatch.fnmatchcase(field, p) for p in includes):
+            return False
+        return not any(fnmatch.fnmatchcase(field, p) for p in excludes)
+
+    return keep
+
+
+class _Matches:
+    """Matching docs and their scores.
+
+    A doc in bits scores base, plus the constant of every layer whose
+    bitmap holds it, plus weight * BM25 impact for every (path, text field,
+    token, weight) in terms whose token it contains, plus its entry in
+    sparse. Layers and sparse only ever hold docs that are also in bits.
+
+    Terms are kept unexpanded: containing the token is enough for a doc in
+    bits to score it. pure marks matches whose bits are exactly the docs
+    containing one of the terms, so should clauses can pass terms up as is.
+    """
+
+    __slots__ = ("bits", "base", "layers", "terms", "sparse", "pure")
+
+    def __init__(
+        self,
+        bits: int,
+        base: float = 0.0,
+        layers: list[tuple[int, float]] | None = None,
+        terms: list[tuple[str, "_TextField", str, float]] | None = None,
+        sparse: dict[int, float] | None = None,
+        pure: bool = False,
+    ):
+        self.bits = bits
+        self.base = base
+        self.layers = layers or []
+        self.terms = terms or []
+        self.sparse = sparse or {}
+        self.pure = pure
+
+    def restrict(self, bits: int):
+        """Drop every doc not in bits"""
+        if self.bits & bits == self.bits:
+            return
+        self.bits &= bits
+        self.layers = [(layer & bits, c) for layer, c in self.layers if layer & bits]
+        if self.sparse:
+            contains = _membership(self.bits)
+            self.sparse = {d: s for d, s in self.sparse.items() if contains(d)}
+
+    def scale(self, boost: float) -> "_Matches":
+        if boost != 1.0:
+            self.base *= boost
+            self.layers = [(layer, c * boost) for layer, c in self.layers]
+            self.terms = [(p, f, token, w * boost) for p, f, token, w in self.terms]
+            self.sparse = {d: s * boost for d, s in self.sparse.items()}
+        return self
+
+    def expand_terms(self):
+        """Turn terms into sparse scores of the docs in bits"""
+        for _, field_index, token, weight in self.terms:
+            docs = _posting_bitmap(field_index.postings[token]) & self.bits
+            self.sparse = _add_scores(
+                self.sparse,
+                {
+                    doc: weight * field_index.impact(token, doc)
+                    for doc in _iter_bits(docs)
+                },
+            )
+        self.terms = []
+
+    def scored(self) -> dict[int, float]:
+        """Score above base of every doc that has one"""
+        scores: dict[int, float] = defaultdict(float)
+        for layer, constant in self.layers:
+            for doc in _iter_bits(layer):
+                scores[doc] += constant
+        for _, field_index, token, weight in self.terms:
+            docs = _posting_bitmap(field_index.postings[token]) & self.bits
+            for doc in _iter_bits(docs):
+                scores[doc] += weight * field_index.impact(token, doc)
+        for doc, score in self.sparse.items():
+            scores[doc] += score
+        return scores
+
+
+class _KeywordField:
+    def __init__(self, normalize: Callable[[str], str] | None):
+        """Exact-value postings: term -> ascending doc ids"""
+        self.normalize = normalize
+        self.postings: dict[str, array] = {}
+        self.present = array("I")
+        self._terms: list[str] | None = None
+
+    def term(self, value: Any) -> str:
+        term = _keyword_value(value)
+        return self.normalize(term) if self.normalize else term
+
+    def add(self, doc: int, value: Any):
+        found = False
+        for item in value if isinstance(value, (list, tuple)) else (value,):
+            if item is None:
+                continue
+            term = self.term(item)
+            posting = self.postings.get(term)
+            if posting is None:
+                posting = self.postings[term] = array("I")
+                self._terms = None
+            if not posting or posting[-1] != doc:
+                posting.append(doc)
+            found = True
+        if found:
+            self.present.append(doc)
+
+    def terms(self) -> list[str]:
+        """Every term, sorted (for prefix and range)"""
+        if self._terms is None:
+            self._terms = sorted(self.postings)
+        return self._terms
+
+
+class _TextField:
+    def __init__(self, normalize: Callable[[str], str] | None = None):
+        """Inverted index: token -> ascending doc ids, with term frequencies > 1
+        and the token count of every document"""
+        self.postings: dict[str, array] = {}
+        self.frequencies: dict[str, dict[int, int]] = {}
+        self.lengths = array("H")
+        self.present = array("I")
+        self.total_length = 0
+        self._by_length: dict[int, array] | None = None
+
+    def add(self, doc: int, value: Any):
+        tokens = _analyze(value)
+        if not tokens:
+            return
+        self._by_length = None
+        if len(self.lengths) < doc:
+            self.lengths.frombytes(bytes(2 * (doc - len(self.lengths))))
+        self.lengths.append(min(len(tokens), 0xFFFF))
+        self.present.append(doc)
+        self.total_length += len(tokens)
+        for token in tokens:
+            posting = self.postings.get(token)
+            if posting is None:
+                posting = self.postings[token] = array("I")
+            if posting and posting[-1] == doc:
+                frequencies = self.frequencies.setdefault(token, {})
+                frequencies[doc] = frequencies.get(doc, 1) + 1
+            else:
+                posting.append(doc)
+
+    def idf(self, token: str) -> float:
+        count = len(self.present)
+        document_frequency = len(self.postings[token])
+        return math.log(
+            1 + (count - document_frequency + 0.5) / (document_frequency + 0.5)
+        )
+
+    def norm(self, length: int) -> float:
+        """BM25 length normalization of a document with length tokens"""
+        relative_length = length * len(self.present) / self.total_length
+        return BM25_K1 * (1 - BM25_B + BM25_B * relative_length)
+
+    def impact(self, token: str, doc: int) -> float:
+        """BM25 of token in doc without the idf factor (doc must contain it)"""
+        frequencies = self.frequencies.get(token)
+        tf = frequencies.get(doc, 1) if frequencies else 1
+        return tf / (tf + self.norm(self.lengths[doc]))
+
+    def score(self, token: str, doc: int) -> float:
+        """impact() if doc contains token, else 0"""
+        posting = self.postings[token]
+        position = bisect_left(posting, doc)
+        if position == len(posting) or posting[position] != doc:
+            return 0.0
+        return self.impact(token, doc)
+
+    def docs_by_length(self) -> dict[int, array]:
+        """Length -> ascending ids of the docs with that many tokens"""
+        if self._by_length is None:
+            by_length = defaultdict(lambda: array("I"))
+            lengths = self.lengths
+            for doc in self.present:
+                by_length[lengths[doc]].append(doc)
+            self._by_length = dict(by_length)
+        return self._by_length
+
+
+class _NumericField:
+    def __init__(self, normalize: Callable[[str], str] | None = None):
+        """Column of (value, doc) sorted by value, plus an unsorted tail"""
+        self.values = array("d")
+        self.docs = array("I")
+        self.tail: list[tuple[float, int]] = []
+        self.present = array("I")
+        self.multi_valued = False
+
+    def add(self, doc: int, value: Any):
+        found = 0
+        for item in value if isinstance(value, (list, tuple)) else (value,):
+            number = _number(item)
+            if number is not None:
+                self.tail.append((number, doc))
+                found += 1
+        if found:
+            self.present.append(doc)
+            self.multi_valued = self.multi_valued or found > 1
+
+    def merge(self):
+        pairs = sorted(chain(zip(self.values, self.docs), self.tail))
+        self.values = array("d", (value for value, _ in pairs))
+        self.docs = array("I", (doc for _, doc in pairs))
+        self.tail = []
+
+    def select(
+        self, gte: float | None, gt: float | None, lte: float | None, lt: float | None
+    ) -> tuple[Iterable[int], int, Iterable[int], int]:
+        """Split the column for a range: (docs inside, count, docs outside, count).
+
+        Both sides are returned so the caller can build the cheaper bitmap.
+        """
+        if len(self.tail) > NUMERIC_TAIL_MAX or not self.values:
+            self.merge()
+        values = self.values
+        lo, hi = 0, len(values)
+        if gte is not None:
+            lo = max(lo, bisect_left(values, gte))
+        if gt is not None:
+            lo = max(lo, bisect_right(values, gt))
+        if lte is not None:
+            hi = min(hi, bisect_right(values, lte))
+        if lt is not None:
+            hi = min(hi, bisect_left(values, lt))
+        hi = max(lo, hi)
+        tail_inside, tail_outside = [], []
+        for value, doc in self.tail:
+            inside = (
+                (gte is None or value >= gte)
+                and (gt is None or value > gt)
+                and (lte is None or value <= lte)
+                and (lt is None or value < lt)
+            )
+            (tail_inside if inside else tail_outside).append(doc)
+        return (
+            chain(self.docs[lo:hi], tail_inside),
+            hi - lo + len(tail_inside),
+            chain(self.docs[:lo], self.docs[hi:], tail_outside),
+            len(values) - (hi - lo) + len(tail_outside),
+        )
+
+
+class _GeoField:
+    def __init__(self, normalize: Callable[[str], str] | None = None):
+        """Postings per distinct point, with the points sorted by latitude"""
+        self.postings: dict[tuple[float, float], array] = {}
+        self.present = array("I")
+        self.multi_valued = False
+        self._parsed: dict[str, tuple[float, float] | None] = {}
+        self._lats = array("d")
+        self._points: list[tuple[float, float]] | None = None
+        self._nearest: OrderedDict[tuple, list] = OrderedDict()
+
+    def add(self, doc: int, value: Any):
+        if type(value) is str:
+            # Interned "lat,lon" strings repeat across every doc of a ZIP
+            if value not in self._parsed:
+                self._parsed[value] = _geo_point(value)
+            point = self._parsed[value]
+            points = [point] if point is not None else []
+        else:
+            points = _geo_points(value)
+        for point in points:
+            posting = self.postings.get(point)
+            if posting is None:
+                posting = self.postings[point] = array("I")
+                self._points = None
+            posting.append(doc)
+        if points:
+            self.present.append(doc)
+            self.multi_valued = self.multi_valued or len(points) > 1
+            if self._nearest:
+                self._nearest.clear()
+
+    def by_latitude(self) -> list[tuple[float, float]]:
+        if self._points is None:
+            self._points = sorted(self.postings)
+            self._lats = array("d", (lat for lat, _ in self._points))
+        return self._points
+
+    def within(self, lat: float, lon: float, meters: float) -> Iterator[array]:
+        """Postings of the points at most meters from (lat, lon)"""
+        points = self.by_latitude()
+        band = meters / METERS_PER_DEGREE
+        lo = bisect_left(self._lats, lat - band)
+        hi = bisect_right(self._lats, lat + band)
+        for point in islice(points, lo, hi):
+            if _haversine(lat, lon, *point) <= meters:
+                yield self.postings[point]
+
+    def nearest(self, lat: float, lon: float) -> list[tuple[float, tuple]]:
+        """(meters, point) of every distinct point, nearest to (lat, lon) first"""
+        found = self._nearest.get((lat, lon))
+        if found is None:
+            found = sorted(
+                (_haversine(lat, lon, *point), point) for point in self.postings
+            )
+            self._nearest[lat, lon] = found
+            if len(self._nearest) > NEAREST_CACHE_SIZE:
+                self._nearest.popitem(last=False)
+        return found
+
+
+FIELD_KINDS = {
+    "keyword": _KeywordField,
+    "text": _TextField,
+    "numeric": _NumericField,
+    "geo": _GeoField,
+}
+
+
+def _normalizer(name: str | None, settings: dict[str, Any]) -> Callable | None:
+    """Function for a custom normalizer built from lowercase/uppercase filters"""
+    if not name:
+        return None
+    analysis = settings.get("analysis", settings.get("index", {}).get("analysis", {}))
+    filters = analysis.get("normalizer", {}).get(name, {}).get("filter", [])
+    if "uppercase" in filters:
+        return str.upper
+    if "lowercase" in filters:
+        return str.lower
+    return None
+
+
+def _field_kind(mapping: dict[str, Any]) -> str | None:
+    """keyword / text / numeric / geo for a field mapping (None if not searchable)"""
+    if mapping.get("index", True) is False:
+        return None
+    field_type = mapping.get("type")
+    if field_type in KEYWORD_MAPPING_TYPES:
+        return "keyword"
+    if field_type in TEXT_MAPPING_TYPES:
+        return "text"
+    if field_type in NUMERIC_MAPPING_TYPES:
+        return "numeric"
+    if field_type in GEO_MAPPING_TYPES:
+        return "geo"
+    return None
+
+
+class _LocalIndex:
+    def __init__(self, name: str, mappings: dict[str, Any], settings: dict[str, Any]):
+        """One index: rows of field values, ids and lazily built field indexes"""
+        self.name = name
+        self.mappings = {**mappings, "properties": dict(mappings.get("properties", {}))}
+        self.settings = settings
+        # field path -> (source field, kind, normalizer); kind None = not indexed
+        self.fields: dict[str, tuple[str, str | None, Callable | None]] = {}
+        for field, mapping in self.mappings["properties"].items():
+            self._map_field(field, mapping)
+        # Fields the mapping leaves out of _source (only plain names) are
+        # dropped: dense vectors aren't searchable here
+        self.source_excludes = frozenset(
+            mappings.get("_source", {}).get("excludes", ())
+        )
+
+        self.columns: list[str] = []
+        self.positions: dict[str, int] = {}
+        self.interned: list[dict | None] = []
+        self.rows: list[tuple] = []
+        self.ids: list[str] = []
+        self.doc_of: dict[str, int] = {}
+        self.deleted: set[int] = set()
+        self.indexed: dict[str, Any] = {}
+        self.lock = threading.RLock()
+        self._live: int | None = None
+        self._cache: OrderedDict[tuple, int] = OrderedDict()
+        self._cache_bytes = 0
+        self._layouts: dict[tuple[str, ...], list[int]] = {}
+        self._suggest: SuggestIndex | None = None
+
+    def _map_field(self, field: str, mapping: dict[str, Any]):
+        normalize = _normalizer(mapping.get("normalizer"), self.settings)
+        self.fields[field] = (field, _field_kind(mapping), normalize)
+        for sub, sub_mapping in mapping.get("fields", {}).items():
+            sub_normalize = _normalizer(sub_mapping.get("normalizer"), self.settings)
+            self.fields[f"{field}.{sub}"] = (
+                field,
+                _field_kind(sub_mapping),
+                sub_normalize,
+            )
+
+    def _map_dynamic(self, field: str, value: Any):
+        """Map a new field the way Elasticsearch's dynamic mapping would"""
+        sample = value[0] if isinstance(value, list) and value else value
+        if isinstance(sample, bool):
+            mapping = {"type": "boolean"}
+        elif isinstance(sample, (int, float)):
+            mapping = {"type": "long" if isinstance(sample, int) else "float"}
+        elif isinstance(sample, str):
+            mapping = {"type": "text", "fields": {"keyword": {"type": "keyword"}}}
+        else:
+            return
+        self.mappings["properties"][field] = mapping
+        self._map_field(field, mapping)
+
+    # --- writes -------------------------------------------------------------
+
+    def _column(self, field: str, value: Any) -> int:
+        position = self.positions.get(field)
+        if position is None:
+            position = self.positions[field] = len(self.columns)
+            self.columns.append(field)
+            self.interned.append({})
+            if field not in self.fields and self.mappings.get("dynamic", True) in (
+                True,
+                "true",
+            ):
+                self._map_dynamic(field, value)
+        return position
+
+    def _intern_list(self, position: int, value: list) -> Any:
+        if not all(type(item) is str for item in value):
+            return value
+        table = self.interned[position]
+        value = tuple(value)
+        return value if table is None else table.setdefault(value, value)
+
+    def put(self, doc_id: str, document: dict[str, Any]) -> str:
+        """Index a document under doc_id; returns "created" or "updated" """
+        if self.source_excludes:
+            document = {
+                field: value
+                for field, value in document.items()
+                if field not in self.source_excludes
+            }
+        # Documents of one source share their field order, so the column
+        # positions are looked up once per order rather than per field
+        fields = tuple(document)
+        layout = self._layouts.get(fields)
+        if layout is None:
+            layout = [self._column(field, document[field]) for field in fields]
+            self._layouts[fields] = layout
+        values = [_MISSING] * len(self.columns)
+        interned = self.interned
+        # Equal strings are shared between rows (codes repeat across most
+        # documents), per column until it has INTERN_MAX_VALUES of them
+        for position, value in zip(layout, document.values()):
+            if type(value) is str:
+                table = interned[position]
+                if table is not None:
+                    value = table.setdefault(value, value)
+            elif type(value) is list:
+                value = self._intern_list(position, value)
+            values[position] = value
+        row = tuple(values)
+
+        doc = len(self.rows)
+        previous = self.doc_of.get(doc_id)
+        if previous is not None:
+            self.deleted.add(previous)
+        self.rows.append(row)
+        self.ids.append(doc_id)
+        self.doc_of[doc_id] = doc
+        if not doc & 0xFFF:
+            for position, table in enumerate(interned):
+                if table is not None and len(table) > INTERN_MAX_VALUES:
+                    interned[position] = None
+        for path, field_index in self.indexed.items():
+            value = self.value(row, self.fields[path][0])
+            if value is not _MISSING:
+                field_index.add(doc, value)
+        self._invalidate()
+        return "created" if previous is None else "updated"
+
+    def delete(self, doc_id: str) -> bool:
+        doc = self.doc_of.pop(doc_id, None)
+        if doc is None:
+            return False
+        self.deleted.add(doc)
+        self._invalidate()
+        return True
+
+    def _invalidate(self):
+        self._live = None
+        self._suggest = None
+        if self._cache:
+            self._cache.clear()
+            self._cache_bytes = 0
+
+    # --- reads --------------------------------------------------------------
+
+    def __len__(self) -> int:
+        return len(self.doc_of)
+
+    def value(self, row: tuple, field: str) -> Any:
+        position = self.positions.get(field)
+        if position is None or position >= len(row):
+            return _MISSING
+        return row[position]
+
+    def source(self, doc: int, keep: Callable[[str], bool] | None) -> dict[str, Any]:
+        columns = self.columns
+        return {
+            columns[position]: list(value) if type(value) is tuple else value
+            for position, value in enumerate(self.rows[doc])
+            if value is not _MISSING and (keep is None or keep(columns[position]))
+        }
+
+    def live(self) -> int:
+        """Bitmap of every document that hasn't been deleted or replaced"""
+        if self._live is None:
+            everything = (1 << len(self.rows)) - 1
+            self._live = everything ^ _bitmap(self.deleted, len(self.rows))
+        return self._live
+
+    def _cached(self, key: tuple, build: Callable[[], int]) -> int:
+        bits = self._cache.get(key)
+        if bits is not None:
+            self._cache.move_to_end(key)
+            return bits
+        bits = build()
+        self._cache[key] = bits
+        self._cache_bytes += bits.bit_length() >> 3
+        while self._cache_bytes > CACHE_MAX_BYTES and len(self._cache) > 1:
+            _, evicted = self._cache.popitem(last=False)
+            self._cache_bytes -= evicted.bit_length() >> 3
+        return bits
+
+    def field_index(self, path: str) -> tuple[str, Any] | tuple[None, None]:
+        """(kind, index) for a searchable field, (None, None) if it isn't mapped"""
+        spec = self.fields.get(path)
+        if spec is None:
+            return None, None
+        source, kind, normalize = spec
+        if kind is None:
+            raise ValueError(f"Cannot search on field [{path}] since it is not indexed")
+        field_index = self.indexed.get(path)
+        if field_index is None:
+            started = time.perf_counter()
+            field_index = FIELD_KINDS[kind](normalize)
+            position = self.positions.get(source)
+            if position is not None:
+                for doc, row in enumerate(self.rows):
+                    if position < len(row) and row[position] is not _MISSING:
+                        field_index.add(doc, row[position])
+            if kind == "numeric":
+                field_index.merge()
+            elif kind == "text":
+                field_index.docs_by_length()
+            elif kind == "geo":
+                field_index.by_latitude()
+            self.indexed[path] = field_index
+            logger.info(
+                "Indexed %s (%s) of '%s' in %.2fs",
+                path,
+                kind,
+                self.name,
+                time.perf_counter() - started,
+            )
+        return kind, field_index
+
+    def suggest_index(self) -> SuggestIndex:
+        """Name autocomplete over the live documents, rebuilt after writes"""
+        if self._suggest is None:
+            keep = set(SUGGEST_FIELDS).__contains__
+            self._suggest = SuggestIndex.from_documents(
+                self.source(doc, keep) for doc in _iter_bits(self.live())
+            )
+        return self._suggest
+
+    def posting_bits(self, key: tuple, posting: array | None) -> int:
+        if not posting:
+            return 0
+        if len(posting) < CACHE_MIN_POSTING:
+            return _posting_bitmap(posting)
+        return self._cached(key, lambda: _posting_bitmap(posting))
+
+    def present_bits(self, path: str, field_index: Any) -> int:
+        return self._cached(
+            ("exists", path), lambda: _posting_bitmap(field_index.present)
+        )
+
+    # --- queries ------------------------------------------------------------
+
+    def query(self, clause: dict[str, Any], within: int, scoring: bool) -> _Matches:
+        """Evaluate a query clause over the docs in within"""
+        if not isinstance(clause, dict) or len(clause) != 1:
+            raise ValueError(f"Expected a single query clause, got {clause!r}")
+        ((kind, spec),) = clause.items()
+        handler = getattr(self, f"_query_{kind}", None)
+        if handler is None:
+            raise ValueError(f"Unsupported query type [{kind}] in local search")
+        return handler(spec or {}, within, scoring)
+
+    def _query_match_all(self, spec, within, scoring):
+        return _Matches(within, spec.get("boost", 1.0))
+
+    def _query_match_none(self, spec, within, scoring):
+        return _Matches(0)
+
+    def _query_constant_score(self, spec, within, scoring):
+        bits = self.query(spec["filter"], within, False).bits
+        return _Matches(bits, spec.get("boost", 1.0))
+
+    def _query_bool(self, spec, within, scoring):
+        bits = within
+        for clause in _as_list(spec.get("filter")):
+            bits = self.query(clause, bits, False).bits
+        for clause in _as_list(spec.get("must_not")):
+            bits ^= self.query(clause, bits, False).bits
+        musts = []
+        for clause in _as_list(spec.get("must")):
+            matches = self.query(clause, bits, scoring)
+            bits = matches.bits
+            musts.append(matches)
+        shoulds = [self.query(c, bits, scoring) for c in _as_list(spec.get("should"))]
+        required = _minimum_should_match(
+            spec.get("minimum_should_match"),
+            len(shoulds),
+            default=0 if musts or spec.get("filter") else 1,
+        )
+        if shoulds and required:
+            bits &= _at_least(required, [should.bits for should in shoulds])
+        if not scoring:
+            return _Matches(bits)
+        result = _Matches(within)
+        for must in musts:
+            result.base += must.base
+            result.layers += must.layers
+            result.terms += must.terms
+            result.sparse = _add_scores(result.sparse, must.sparse)
+        for should in shoulds:
+            if should.base:
+                result.layers.append((should.bits, should.base))
+            if should.terms and not should.pure:
+                should.expand_terms()
+            result.layers += should.layers
+            result.terms += should.terms
+            result.sparse = _add_scores(result.sparse, should.sparse)
+        result.restrict(bits)
+        return result.scale(spec.get("boost", 1.0))
+
+    def _query_ids(self, spec, within, scoring):
+        docs = (self.doc_of.get(str(doc_id)) for doc_id in spec.get("values", []))
+        bits = _bitmap((doc for doc in docs if doc is not None), len(self.rows))
+        return _Matches(bits & within, spec.get("boost", 1.0))
+
+    def _query_exists(self, spec, within, scoring):
+        kind, field_index = self.field_index(spec["field"])
+        if field_index is None:
+            return _Matches(0)
+        bits = self.present_bits(spec["field"], field_index)
+        return _Matches(bits & within, spec.get("boost", 1.0))
+
+    def _term_bits(self, path: str, kind: str, field_index: Any, value: Any) -> int:
+        if kind == "geo":
+            raise ValueError(
+                f"Field [{path}] of type [geo_point] does not support term"
+            )
+        if kind == "numeric":
+            number = _number(value)
+            return (
+                0
+                if number is None
+                else self._range_bits(path, field_index, {"gte": number, "lte": number})
+            )
+        if kind == "text":
+            term = _keyword_value(value)
+        else:
+            term = field_index.term(value)
+        posting = field_index.postings.get(term)
+        return self.posting_bits(("term", path, term), posting)
+
+    def _query_term(self, spec, within, scoring):
+        path, value, params = _field_params(spec, "value")
+        boost = params.get("boost", 1.0)
+        kind, field_index = self.field_index(path)
+        if field_index is None:
+            return _Matches(0)
+        bits = self._term_bits(path, kind, field_index, value) & within
+        if not scoring or not bits:
+            return _Matches(bits)
+        if kind == "text":
+            term = _keyword_value(value)
+            weight = boost * field_index.idf(term)
+            return _Matches(bits, terms=[(path, field_index, term, weight)], pure=True)
+        if kind == "keyword":
+            # BM25 with tf 1 and no length norms, as for an ES keyword field
+            count = len(field_index.present)
+            frequency = len(field_index.postings[field_index.term(value)])
+            idf = math.log(1 + (count - frequency + 0.5) / (frequency + 0.5))
+            return _Matches(bits, boost * idf / (1 + BM25_K1))
+        return _Matches(bits, boost)
+
+    def _query_terms(self, spec, within, scoring):
+        boost = spec.get("boost", 1.0)
+        (path,) = [k for k in spec if k not in ("boost", "_name")]
+        kind, field_index = self.field_index(path)
+        if field_index is None:
+            return _Matches(0)
+        bits = 0
+        for value in spec[path]:
+            bits |= self._term_bits(path, kind, field_index, value)
+        return _Matches(bits & within, boost)
+
+    def _query_prefix(self, spec, within, scoring):
+        path, value, params = _field_params(spec, "value")
+        kind, field_index = self.field_index(path)
+        if field_index is None or kind in ("numeric", "geo"):
+            return _Matches(0)
+        prefix = field_index.term(value) if kind == "keyword" else str(value)
+
+        def build() -> int:
+            terms = (
+                field_index.terms()
+                if kind == "keyword"
+                else sorted(field_index.postings)
+            )
+            start = bisect_left(terms, prefix)
+            matched = []
+            for term in islice(terms, start, None):
+                if not term.startswith(prefix):
+                    break
+                matched.append(field_index.postings[term])
+            return _bitmap(chain.from_iterable(matched), len(self.rows))
+
+        bits = self._cached(("prefix", path, prefix), build)
+        return _Matches(bits & within, params.get("boost", 1.0))
+
+    def _range_bits(self, path: str, field_index: Any, bounds: dict[str, Any]) -> int:
+        limits = {op: _number(bounds.get(op)) for op in ("gte", "gt", "lte", "lt")}
+
+        def build() -> int:
+            inside, inside_count, outside, outside_count = field_index.select(
+                limits["gte"], limits["gt"], limits["lte"], limits["lt"]
+            )
+            if inside_count <= outside_count or field_index.multi_valued:
+                return _bitmap(inside, len(self.rows))
+            # Cheaper to clear the fewer docs outside the range
+            present = self.present_bits(path, field_index)
+            return present ^ (present & _bitmap(outside, len(self.rows)))
+
+        return self._cached(("range", path, *limits.values()), build)
+
+    def _query_range(self, spec, within, scoring):
+        (path,) = [k for k in spec if k not in ("boost", "_name")]
+        bounds = spec[path]
+        kind, field_index = self.field_index(path)
+        if field_index is None:
+            return _Matches(0)
+        if kind == "geo":
+            raise ValueError(
+                f"Field [{path}] of type [geo_point] does not support range"
+            )
+        if kind == "numeric":
+            bits = self._range_bits(path, field_index, bounds)
+        else:
+            terms = (
+                field_index.terms()
+                if kind == "keyword"
+                else sorted(field_index.postings)
+            )
+            lo, hi = 0, len(terms)
+            if "gte" in bounds:
+                lo = bisect_left(terms, str(bounds["gte"]))
+            if "gt" in bounds:
+                lo = bisect_right(terms, str(bounds["gt"]))
+            if "lte" in bounds:
+                hi = bisect_right(terms, str(bounds["lte"]))
+            if "lt" in bounds:
+                hi = bisect_left(terms, str(bounds["lt"]))
+            postings = (field_index.postings[term] for term in terms[lo:hi])
+            bits = _bitmap(chain.from_iterable(postings), len(self.rows))
+        return _Matches(bits & within, bounds.get("boost", 1.0))
+
+    def _query_geo_distance(self, spec, within, scoring):
+        (path,) = [k for k in spec if k not in GEO_DISTANCE_PARAMS]
+        origin = _geo_point(spec[path])
+        if origin is None:
+            raise ValueError(f"failed to parse geo_distance origin {spec[path]!r}")
+        meters = _meters(spec.get("distance"))
+        kind, field_index = self.field_index(path)
+        if field_index is None:
+            return _Matches(0)
+        if kind != "geo":
+            raise ValueError(f"Field [{path}] is not a geo_point field")
+
+        def build() -> int:
+            postings = field_index.within(*origin, meters)
+            return _bitmap(chain.from_iterable(postings), len(self.rows))
+
+        bits = self._cached(("geo_distance", path, *origin, meters), build)
+        return _Matches(bits & within, spec.get("boost", 1.0))
+
+    def _query_match(self, spec, within, scoring):
+        path, value, params = _field_params(spec, "query")
+        boost = params.get("boost", 1.0)
+        kind, field_index = self.field_index(path)
+        if field_index is None or value is None:
+            return _Matches(0)
+        if kind != "text":
+            # keyword and numeric fields match the whole value, like term
+            return self._query_term(
+                {path: {"value": value, "boost": boost}}, within, scoring
+            )
+        analyzed = list(dict.fromkeys(_analyze(value)))
+        tokens = [token for token in analyzed if token in field_index.postings]
+        token_bits = [
+            self.posting_bits(("term", path, token), field_index.postings[token])
+            & within
+            for token in tokens
+        ]
+        bits = 0
+        for token_bit in token_bits:
+            bits |= token_bit
+        if str(params.get("operator", "or")).lower() == "and":
+            required = len(analyzed)
+        else:
+            required = _minimum_should_match(
+                params.get("minimum_should_match"), len(analyzed), default=1
+            )
+        if required > len(tokens):
+            return _Matches(0)
+        if required > 1:
+            bits &= _at_least(required, token_bits)
+        if not scoring or not bits:
+            return _Matches(bits)
+        terms = [
+            (path, field_index, token, boost * field_index.idf(token))
+            for token in tokens
+        ]
+        return _Matches(bits, terms=terms, pure=required <= 1)
+
+    def _query_multi_match(self, spec, within, scoring):
+        """best_fields: a doc scores its best field (fields may carry ^boost)"""
+        query = spec.get("query")
+        fields = spec.get("fields") or [
+            path for path, (_, kind, _) in self.fields.items() if kind == "text"
+        ]
+        bits = 0
+        best: dict[int, float] = {}
+        for field in fields:
+            path, _, field_boost = field.partition("^")
+            params = {"query": query, "boost": float(field_boost or 1.0)}
+            if "operator" in spec:
+                params["operator"] = spec["operator"]
+            matches = self.query({"match": {path: params}}, within, scoring)
+            bits |= matches.bits
+            if scoring and matches.bits:
+                scores = matches.scored()
+                for doc in _iter_bits(matches.bits):
+                    score = matches.base + scores.get(doc, 0.0)
+                    if score > best.get(doc, 0.0):
+                        best[doc] = score
+        return _Matches(bits, sparse=best).scale(spec.get("boost", 1.0))
+
+    def _query_query_string(self, spec, within, scoring):
+        query = str(spec.get("query", "")).strip()
+        if query in ("", "*"):
+            return _Matches(within, spec.get("boost", 1.0))
+        fields = spec.get("fields") or _as_list(spec.get("default_field")) or None
+        operator = spec.get("default_operator", "or")
+        multi_match = {"query": query, "fields": fields, "operator": operator}
+        return self._query_multi_match(multi_match, within, scoring)
+
+    # --- hits ---------------------------------------------------------------
+
+    def top(
+        self, matches: _Matches, start: int, size: int, sort: list | None
+    ) -> list[tuple[int, float | None, list | None]]:
+        """(doc, score, sort values) of hits start .. start + size"""
+        wanted = start + size
+        if size <= 0 or not matches.bits:
+            return []
+        if sort is not None and sort != ["_score"]:
+            return self._sorted(matches, sort, wanted)[start:]
+        ranked = []
+        if matches.layers or matches.terms or matches.sparse:
+            ranked = self._top_scored(matches, wanted)
+        if len(ranked) < wanted:
+            # Every other doc scores base; Elasticsearch orders ties by doc
+            taken = {doc for doc, _ in ranked}
+            rest = (doc for doc in _iter_bits(matches.bits) if doc not in taken)
+            ranked += [
+                (doc, matches.base) for doc in islice(rest, wanted - len(ranked))
+            ]
+        return [
+            (doc, score, [score] if sort else None) for doc, score in ranked[start:]
+        ]
+
+    def _top_scored(self, matches: _Matches, wanted: int) -> list[tuple[int, float]]:
+        """The best `wanted` (doc, score) among docs scoring above base.
+
+        Docs are split into groups by the layers they are in, so a group's
+        layer constant is fixed. Within a group, docs only in layers tie
+        (the first ones in doc order are taken). Small sets of docs with
+        term or sparse scores are scored one by one; large ones are ranked
+        by score class (see _score_classes) and only the best classes are
+        read.
+        """
+        if len(matches.layers) > MAX_SPLIT_LAYERS:
+            scores = matches.scored()
+            best = heapq.nsmallest(wanted, scores.items(), key=lambda i: (-i[1], i[0]))
+            return [(doc, matches.base + score) for doc, score in best]
+
+        base, terms, sparse = matches.base, matches.terms, matches.sparse
+        token_bits = {
+            (path, token): self.posting_bits(
+                ("term", path, token), field_index.postings[token]
+            )
+            for path, field_index, token, _ in terms
+        }
+        scored_bits = 0
+        for bits in token_bits.values():
+            scored_bits |= bits
+        scored_bits &= matches.bits
+        classes = self._score_classes(terms)
+
+        def extra(doc: int) -> float:
+            total = sparse.get(doc, 0.0)
+            for _, field_index, token, weight in terms:
+                total += weight * field_index.score(token, doc)
+            return total
+
+        best: list[tuple[float, int]] = []  # min-heap of (score, -doc)
+
+        def offer(doc: int, score: float):
+            entry = (score, -doc)
+            if len(best) < wanted:
+                heapq.heappush(best, entry)
+            elif entry > best[0]:
+                heapq.heapreplace(best, entry)
+
+        for group, constant in self._layer_groups(matches):
+            floor = base + constant
+            scored = group & scored_bits
+            if constant:
+                only_layers = (
+                    doc for doc in _iter_bits(group ^ scored) if doc not in sparse
+                )
+                for doc in islice(only_layers, wanted):
+                    offer(doc, floor)
+            if not scored and not sparse:
+                continue
+            in_group = _membership(group)
+            exact = {doc for doc in sparse if in_group(doc)}
+            if classes is None or scored.bit_count() <= ENUMERATE_MAX_DOCS:
+                exact.update(_iter_bits(scored))
+                for doc in exact:
+                    offer(doc, floor + extra(doc))
+                continue
+
+            for _, field_index, token, _ in terms:
+                repeated = field_index.frequencies.get(token, ())
+                exact.update(doc for doc in repeated if in_group(doc))
+            for doc in exact:
+                offer(doc, floor + extra(doc))
+            seen = set(exact)
+            path, field_index = terms[0][:2]
+            by_length: dict[int, int] = {}
+            for value, length, subset in classes:
+                if len(best) >= wanted and best[0][0] > floor + value:
+                    break
+                bits = by_length.get(length)
+                if bits is None:
+                    docs = field_index.docs_by_length()[length]
+                    key = ("length", path, length)
+                    bits = by_length[length] = scored & self.posting_bits(key, docs)
+                for token in subset:
+                    if not bits:
+                        break
+                    bits &= token_bits[path, token]
+                unseen = (doc for doc in _iter_bits(bits) if doc not in seen)
+                for doc in islice(unseen, wanted):
+                    seen.add(doc)
+                    offer(doc, floor + value)
+
+        return sorted(
+            ((-doc, score) for score, doc in best), key=lambda i: (-i[1], i[0])
+        )
+
+    def _score_classes(self, terms: list) -> list[tuple] | None:
+        """Score classes of a query's terms, best first.
+
+        With term frequency 1, a doc's BM25 impact only depends on its
+        length, so its score is impact(length) * (sum of the weights of the
+        terms it contains): all docs of one length containing the same terms
+        tie. Returns (score, length, tokens) for every length and subset of
+        the tokens, or None when the terms span several fields or are too
+        many to combine.
+        """
+        weights: dict[str, float] = defaultdict(float)
+        for _, _, token, weight in terms:
+            weights[token] += weight
+        if len({path for path, *_ in terms}) != 1 or len(weights) > MAX_CLASS_TERMS:
+            return None
+        field_index = terms[0][1]
+        subsets = [
+            (sum(weights[token] for token in subset), subset)
+            for size in range(1, len(weights) + 1)
+            for subset in combinations(weights, size)
+        ]
+        classes = [
+            (weight / (1 + field_index.norm(length)), length, subset)
+            for length in field_index.docs_by_length()
+            for weight, subset in subsets
+        ]
+        classes.sort(key=lambda item: -item[0])
+        return classes
+
+    def _layer_groups(self, matches: _Matches) -> list[tuple[int, float]]:
+        """Split matches.bits by layer membership: (docs, sum of their layers)"""
+        groups = [(matches.bits, 0.0)]
+        for layer, constant in matches.layers:
+            split = []
+            for bits, total in groups:
+                inside = bits & layer
+                if inside:
+                    split.append((inside, total + constant))
+                if inside != bits:
+                    split.append((bits ^ inside, total))
+            groups = split
+        return groups
+
+    def _sorted(self, matches: _Matches, sort: list, wanted: int) -> list[tuple]:
+        """The first `wanted` hits in sort order, missing values last.
+
+        With _score first, the docs scoring above base are sorted; the rest
+        tie on score and only as many of them as needed are ordered by the
+        remaining keys (see _ordered).
+        """
+        keys = []
+        for entry in _as_list(sort):
+            options: dict[str, Any] = {}
+            if isinstance(entry, str):
+                field, order = entry, "desc" if entry == "_score" else "asc"
+            else:
+                ((field, order),) = entry.items()
+                if isinstance(order, dict):
+                    options = order
+                    order = order.get("order", "desc" if field == "_score" else "asc")
+            keys.append((field, order == "desc", options))
+
+        has_score = any(field == "_score" for field, _, _ in keys)
+        score_first = keys[0][:2] == ("_score", True)
+        scores: dict[int, float] = {}
+        if score_first:
+            scores = self._scores_down_to(matches, wanted)
+        elif has_score:
+            scores = matches.scored()
+        values = [
+            self._sort_value(matches, scores, field, options)
+            for field, _, options in keys
+        ]
+        if score_first:
+            above = self._ordered(sorted(scores), keys, values)
+            hits = above[:wanted]
+            if len(hits) < wanted:
+                rest = matches.bits ^ _bitmap(scores, len(self.rows))
+                ordered = self._ordered(rest, keys[1:], values[1:])
+                hits += islice(ordered, wanted - len(hits))
+        else:
+            hits = list(islice(self._ordered(matches.bits, keys, values), wanted))
+        return [
+            (
+                doc,
+                matches.base + scores.get(doc, 0.0) if has_score else None,
+                [value(doc) for value in values],
+            )
+            for doc in hits
+        ]
+
+    def _scores_down_to(self, matches: _Matches, wanted: int) -> dict[int, float]:
+        """Scores above base of the best `wanted` docs and of every doc tying
+        with the last of them, so other sort keys can break those ties."""
+        if not (matches.layers or matches.terms or matches.sparse):
+            return {}
+        window = wanted
+        while True:
+            ranked = self._top_scored(matches, window)
+            # Complete once the window holds every doc above base, or ends
+            # below the score of the wanted-th doc
+            if len(ranked) < window or ranked[-1][1] < ranked[wanted - 1][1]:
+                break
+            window *= 8
+        cutoff = ranked[wanted - 1][1] if len(ranked) >= wanted else -math.inf
+        return {doc: score - matches.base for doc, score in ranked if score >= cutoff}
+
+    def _sort_value(
+        self, matches: _Matches, scores: dict, field: str, options: dict
+    ) -> Callable[[int], Any]:
+        """Function returning a doc's sort value for one key (None if missing)"""
+        if field == "_score":
+            return lambda doc: matches.base + scores.get(doc, 0.0)
+        if field in ("_doc", "_shard_doc"):
+            return lambda doc: doc
+        if field == "_geo_distance":
+            (path,) = [k for k in options if k not in GEO_SORT_PARAMS]
+            origin = _geo_point(options[path])
+            if origin is None:
+                raise ValueError(
+                    f"failed to parse _geo_distance origin {options[path]!r}"
+                )
+            unit = options.get("unit", "m")
+            if unit not in DISTANCE_UNITS:
+                raise ValueError(f"Unknown distance unit [{unit}]")
+            per_unit = DISTANCE_UNITS[unit]
+            source = self.fields.get(path, (path,))[0]
+            known: dict[str, float | None] = {}  # docs of a ZIP share its string
+
+            def distance(doc: int) -> float | None:
+                value = self.value(self.rows[doc], source)
+                if type(value) is str and value in known:
+                    return known[value]
+                points = [] if value is _MISSING else _geo_points(value)
+                found = None
+                if points:
+                    found = min(_haversine(*origin, *p) for p in points) / per_unit
+                if type(value) is str:
+                    known[value] = found
+                return found
+
+            return distance
+
+        def value(doc: int) -> Any:
+            found = self.value(self.rows[doc], field.removesuffix(".keyword"))
+            if isinstance(found, (list, tuple)):
+                found = min(found) if found else None
+            return None if found is _MISSING else found
+
+        return value
+
+    def _ordered(
+        self, docs: int | list[int], keys: list[tuple], values: list[Callable]
+    ) -> Iterator[int] | list[int]:
+        """docs (a bitmap, or a list in doc order) in the order of keys.
+
+        A bitmap sorted by ascending _geo_distance first is walked point by
+        point, nearest first, so taking a page of it reads a few postings.
+        """
+        if isinstance(docs, int):
+            if keys and keys[0][0] == "_geo_distance" and not keys[0][1]:
+                options = keys[0][2]
+                (path,) = [k for k in options if k not in GEO_SORT_PARAMS]
+                kind, field_index = self.field_index(path)
+                if kind == "geo":
+                    return self._nearest_first(docs, path, field_index, keys, values)
+            if not keys:
+                return _iter_bits(docs)
+            docs = list(_iter_bits(docs))
+        # Stable sorts from the last key to the first; missing values go last
+        for (_, descending, _), value in reversed(list(zip(keys, values))):
+
+            def key(doc: int, value: Callable = value, descending=descending) -> tuple:
+                found = value(doc)
+                present = found is not None
+                return (present, found) if descending else (not present, found)
+
+            docs.sort(key=key, reverse=descending)
+        return docs
+
+    def _nearest_first(
+        self,
+        bits: int,
+        path: str,
+        field_index: "_GeoField",
+        keys: list[tuple],
+        values: list[Callable],
+    ) -> Iterator[int]:
+        origin = _geo_point(keys[0][2][path])
+        remaining = bits
+        for i, (_, point) in enumerate(field_index.nearest(*origin)):
+            # Few docs left (or none at all): sort them by distance directly
+            if not i & 0xFF and remaining.bit_count() <= ENUMERATE_MAX_DOCS:
+                break
+            posting = field_index.postings[point]
+            docs = remaining & self.posting_bits(("geo", path, point), posting)
+            if docs:
+                remaining ^= docs
+                # Docs at one point tie on distance; the other keys break the tie
+                yield from self._ordered(list(_iter_bits(docs)), keys[1:], values[1:])
+        # Farther than every doc yielded so far, or without a location
+        yield from self._ordered(list(_iter_bits(remaining)), keys, values)
+
+    # --- aggregations -------------------------------------------------------
+
+    def aggregate(self, bits: int, aggs: dict[str, Any]) -> dict[str, Any]:
+        """Evaluate terms and histogram aggregations over the docs in bits"""
+        results = {}
+        for name, agg in aggs.items():
+            if not isinstance(agg, dict) or len(agg) != 1:
+                raise ValueError(f"Expected a single aggregation for [{name}]")
+            ((kind, spec),) = agg.items()
+            handler = getattr(self, f"_aggregate_{kind}", None)
+            if handler is None:
+                raise ValueError(f"Unsupported aggregation [{kind}]")
+            results[name] = {"buckets": handler(spec, bits)}
+        return results
+
+    def _aggregate_terms(self, spec, bits):
+        path = spec["field"]
+        kind, field_index = self.field_index(path)
+        if field_index is None:
+            return []
+        if kind != "keyword":
+            raise ValueError(f"Terms aggregation on [{path}] needs a keyword field")
+        counts: dict[str, int] = {}
+        if len(field_index.postings) <= AGG_POSTING_TERMS:
+            # Few terms: AND each posting's bitmap with the matches
+            for term, posting in field_index.postings.items():
+                count = (
+                    self.posting_bits(("term", path, term), posting) & bits
+                ).bit_count()
+                if count:
+                    counts[term] = count
+        else:
+            # Many terms (cities): count the raw values of the matching rows,
+            # then normalize each distinct value once
+            position = self.positions.get(self.fields[path][0])
+            raw: defaultdict[Any, int] = defaultdict(int)
+            if position is not None:
+                rows = self.rows
+                for doc in _iter_bits(bits):
+                    row = rows[doc]
+                    if position < len(row):
+                        value = row[position]
+                        raw[tuple(value) if type(value) is list else value] += 1
+            for value, count in raw.items():
+                items = value if isinstance(value, tuple) else (value,)
+                terms = {
+                    field_index.term(item)
+                    for item in items
+                    if item is not None and item is not _MISSING
+                }
+                for term in terms:
+                    counts[term] = counts.get(term, 0) + count
+        min_doc_count = spec.get("min_doc_count", 1)
+        buckets = sorted(
+            (-count, term) for term, count in counts.items() if count >= min_doc_count
+        )
+        return [
+            {"key": term, "doc_count": -count}
+            for count, term in buckets[: spec.get("size", 10)]
+        ]
+
+    def _aggregate_histogram(self, spec, bits):
+        path, interval = spec["field"], spec["interval"]
+        kind, field_index = self.field_index(path)
+        if field_index is None:
+            return []
+        if kind != "numeric" or not interval > 0:
+            raise ValueError(
+                f"Histogram on [{path}] needs a numeric field and interval"
+            )
+        # Each bucket is a range over the sorted column, so bisect from one
+        # bucket's lowest value to the next
+        keys = {math.floor(value / interval) for value, _ in field_index.tail}
+        values, i = field_index.values, 0
+        while i < len(values):
+            key = math.floor(values[i] / interval)
+            keys.add(key)
+            i = bisect_left(values, (key + 1) * interval, i)
+        counts = {}
+        for key in keys:
+            bounds = {"gte": key * interval, "lt": (key + 1) * interval}
+            count = (self._range_bits(path, field_index, bounds) & bits).bit_count()
+            if count:
+                counts[key] = count
+        min_doc_count = spec.get("min_doc_count", 0)
+        if counts and not min_doc_count:
+            # Elasticsearch fills the gaps between the first and last bucket
+            keys = range(min(counts), max(counts) + 1)
+        else:
+            keys = sorted(
+                key for key, count in counts.items() if count >= min_doc_count
+            )
+        return [
+            {"key": float(key * interval), "doc_count": counts.get(key, 0)}
+            for key in keys
+        ]
+
+
+def _add_scores(scores: dict[int, float], more: dict[int, float]) -> dict[int, float]:
+    if not more:
+        return scores
+    if not scores:
+        return dict(more)
+    for doc, score in more.items():
+        scores[doc] = scores.get(doc, 0.0) + score
+    return scores
+
+
+def _template_for(index_name: str) -> tuple[dict[str, Any], dict[str, Any]]:
+    """The nonprofits index template, for names it applies to (else dynamic)"""
+    if any(fnmatch.fnmatchcase(index_name, p) for p in INDEX_PATTERNS):
+        return NONPROFITS_MAPPINGS, NONPROFITS_SETTINGS
+    return {}, {}
+
+
+class LocalSearchManager:
+    """ElasticManager's interface over in-process indices (see module docstring)"""
+
+    def __init__(self):
+        self.indices: dict[str, _LocalIndex] = {}
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_env(cls, index_name: str) -> "LocalSearchManager":
+        """Manager holding LOCAL_SEARCH_DATA (os.pathsep-separated BMF CSVs or
+        NDJSON; defaults to the sample CSV) as index_name, warmed up"""
+        paths = [p for p in getenv("LOCAL_SEARCH_DATA", csv_path).split(pathsep) if p]
+        manager = cls()
+        manager.create_index(index_name)
+        report = manager.bulk_add(
+            map(normalize_document, load_documents(paths)), index_name, id_field=EIN
+        )
+        manager.index_fields(index_name, QUERY_FIELDS)
+        warm = manager.warm(index_name, warm_queries())
+        manager.put_global_facets(index_name, manager.facets(index_name))
+        manager.suggest(index_name, "")  # builds the autocomplete index
+        # The loaded rows live as long as the process: keep the cyclic garbage
+        # collector from rescanning them (a full pass takes seconds at BMF size)
+        gc.collect()
+        gc.freeze()
+        logger.info(
+            "Loaded %d documents into local index '%s' in %.1fs; warm p50 %.2fms",
+            report["success"],
+            index_name,
+            report["seconds"],
+            warm["p50_ms"],
+        )
+        return manager
+
+    def _index(self, index_name: str) -> _LocalIndex:
+        index = self.indices.get(index_name)
+        if index is None:
+            raise IndexNotFoundError(f"no such index [{index_name}]")
+        return index
+
+    def _index_for_write(self, index_name: str) -> _LocalIndex:
+        """The index, created from the template when missing (as ES does on write)"""
+        with self._lock:
+            if index_name not in self.indices:
+                self.indices[index_name] = _LocalIndex(
+                    index_name, *_template_for(index_name)
+                )
+            return self.indices[index_name]
+
+    def index_exists(self, index_name: str) -> bool:
+        return index_name in self.indices
+
+    def health(self) -> dict[str, Any]:
+        """Always ok: there is no cluster to lose"""
+        return {
+            "status": "ok",
+            "indices": {name: len(index) for name, index in self.indices.items()},
+        }
+
+    @instrumented("create_index")
+    def create_index(
+        self,
+        index_name: str,
+        mappings: dict[str, Any] = None,
+        settings: dict[str, Any] = None,
+    ):
+        """Create index with optional mappings and settings"""
+        with self._lock:
+            if index_name in self.indices:
+                logger.info("Index '%s' already exists.", index_name)
+                return
+            template_mappings, template_settings = _template_for(index_name)
+            self.indices[index_name] = _LocalIndex(
+                index_name, mappings or template_mappings, settings or template_settings
+            )
+        logger.info("Index '%s' created.", index_name)
+
+    def get_field_types(self, index_name: str) -> dict[str, str]:
+        """Return {field: type} for an index, with sub-fields as FIELD.sub"""
+        field_types: dict[str, str] = {}
+
+        def collect(properties: dict[str, Any], prefix: str = ""):
+            for field, mapping in properties.items():
+                if "type" in mapping:
+                    field_types[prefix + field] = mapping["type"]
+                collect(mapping.get("properties", {}), f"{prefix}{field}.")
+                collect(mapping.get("fields", {}), f"{prefix}{field}.")
+
+        collect(self._index(index_name).mappings.get("properties", {}))
+        return field_types
+
+    def warm(
+        self, index_name: str, queries: Iterable[dict[str, Any]], runs: int = 3
+    ) -> dict[str, Any]:
+        """Run queries to build the field indexes and bitmap caches they use.
+
+        The first pass only warms; the later ones are timed.
+        """
+        queries = list(queries)
+        timings = []
+        for run in range(runs):
+            for query in queries:
+                started = time.perf_counter()
+                self.search(query, index_name)
+                if run:
+                    timings.append((time.perf_counter() - started) * 1000)
+        timings.sort()
+        return {
+            "queries": len(queries),
+            "p50_ms": round(timings[len(timings) // 2], 2) if timings else 0.0,
+            "p99_ms": round(timings[int(len(timings) * 0.99)], 2) if timings else 0.0,
+        }
+
+    def index_fields(self, index_name: str, fields: Iterable[str]):
+        """Build the indexes of fields now rather than on their first query"""
+        index = self._index(index_name)
+        with index.lock:
+            for field in fields:
+                index.field_index(field)
+
+    @instrumented("add_document")
+    def add_document(
+        self,
+        doc_id: str,
+        document: dict[str, Any],
+        index_name: str,
+        refresh: str | None = None,
+    ):
+        """Add or update a document by id (searchable at once, so refresh
+        is ignored)"""
+        index = self._index_for_write(index_name)
+        with index.lock:
+            index.put(str(doc_id), document)
+        logger.debug("Document %s added/updated.", doc_id)
+
+    def bulk_add(
+        self,
+        documents: Iterable[dict[str, Any]],
+        index_name: str,
+        id_field: str | None = None,
+        **bulk_options: Any,
+    ) -> dict[str, Any]:
+        """Add documents; ids come from id_field when given, else are generated"""
+        actions = (
+            {
+                "_index": index_name,
+                "_id": doc.get(id_field) if id_field else None,
+                "_source": doc,
+            }
+            for doc in documents
+        )
+        return self.bulk(actions, **bulk_options)
+
+    @instrumented("bulk")
+    def bulk(
+        self,
+        actions: Iterable[dict[str, Any]],
+        chunk_size: int = BULK_CHUNK_SIZE,
+        **bulk_options: Any,
+    ) -> dict[str, Any]:
+        """Apply bulk actions (elasticsearch.helpers shape) chunk by chunk.
+
+        Returns the same report as ElasticManager.bulk. Its thread, byte,
+        retry and refresh options have nothing to tune in-process and are
+        ignored.
+        """
+        started = time.perf_counter()
+        reports = []
+        actions = iter(actions)
+        while chunk := list(islice(actions, chunk_size)):
+            success = 0
+            errors: list[dict[str, Any]] = []
+            for action in chunk:
+                op_type = action.get("_op_type", "index")
+                doc_id = action.get("_id")
+                index = self._index_for_write(action["_index"])
+                with index.lock:
+                    if op_type == "delete":
+                        index.delete(str(doc_id))
+                    elif op_type == "create" and str(doc_id) in index.doc_of:
+                        errors.append(
+                            {
+                                "_index": action["_index"],
+                                "_id": doc_id,
+                                "status": 409,
+                                "error": {
+                                    "type": "version_conflict_engine_exception",
+                                    "reason": f"[{doc_id}]: document already exists",
+                                },
+                            }
+                        )
+                        continue
+                    else:
+                        doc_id = uuid.uuid4().hex if doc_id is None else str(doc_id)
+                        index.put(doc_id, action["_source"])
+                success += 1
+            metrics.BULK_DOCUMENTS.inc(success, result="success")
+            metrics.BULK_DOCUMENTS.inc(len(errors), result="failed")
+            reports.append(
+                {
+                    "chunk": len(reports),
+                    "success": success,
+                    "failed": len(errors),
+                    "retries": 0,
+                    "errors": errors,
+                }
+            )
+
+        elapsed = time.perf_counter() - started
+        metrics.BULK_SECONDS.inc(elapsed)
+        success = sum(report["success"] for report in reports)
+        return {
+            "success": success,
+            "failed": sum(report["failed"] for report in reports),
+            "seconds": round(elapsed, 3),
+            "docs_per_second": round(success / elapsed, 1) if elapsed else 0.0,
+            "chunks": reports,
+        }
+
+    def _run(
+        self, query: dict[str, Any], index_name: str, start: int, size: int
+    ) -> list[dict[str, Any]]:
+        if "knn" in query:
+            raise ValueError("kNN search is not supported in local search")
+        index = self._index(index_name)
+        keep = _source_filter(query.get("_source"))
+        sort = query.get("sort")
+        with index.lock:
+            matches = index.query(
+                query.get("query", {"match_all": {}}), index.live(), scoring=True
+            )
+            hits = []
+            for doc, score, sort_values in index.top(matches, start, size, sort):
+                hit = {"_index": index_name, "_id": index.ids[doc], "_score": score}
+                if query.get("_source", True) is not False:
+                    hit["_source"] = index.source(doc, keep)
+                if sort_values is not None:
+                    hit["sort"] = sort_values
+                hits.append(hit)
+        return hits
+
+    @instrumented("search")
+    def search(self, query: dict[str, Any], index_name: str) -> list[dict[str, Any]]:
+        """Run a search query"""
+        started = time.perf_counter()
+        hits = self._run(query, index_name, query.get("from", 0), query.get("size", 10))
+        took = round((time.perf_counter() - started) * 1000)
+        record_search("search", index_name, query, {"took": took}, started)
+        return hits
+
+    @instrumented("msearch")
+    def msearch(
+        self, queries: list[dict[str, Any]], index_name: str
+    ) -> list[dict[str, Any]]:
+        """Run several searches; {"hits": [...]} or {"error", "status"} per query"""
+        results = []
+        for query in queries:
+            try:
+                results.append({"hits": self.search(query, index_name)})
+            except ValueError as e:
+                status = 404 if isinstance(e, IndexNotFoundError) else 400
+                results.append({"error": str(e), "status": status})
+        return results
+
+    @instrumented("facets")
+    def facets(
+        self, index_name: str, query: dict[str, Any] | None = None
+    ) -> dict[str, Any]:
+        """Facet counts (see facets.py) of the documents matching query, or all"""
+        index = self._index(index_name)
+        body = {"size": 0, "query": query or {"match_all": {}}, "aggs": aggregations()}
+        started = time.perf_counter()
+        with index.lock:
+            bits = index.query(body["query"], index.live(), scoring=False).bits
+            aggs = index.aggregate(bits, body["aggs"])
+        took = round((time.perf_counter() - started) * 1000)
+        record_search("facets", index_name, body, {"took": took}, started)
+        return parse_aggregations(bits.bit_count(), aggs)
+
+    @instrumented("suggest")
+    def suggest(
+        self, index_name: str, prefix: str, size: int = 10
+    ) -> list[dict[str, Any]]:
+        """Organizations whose name starts with prefix, highest NAME_SUGGEST
+        weight first, as hits (see suggest.py)"""
+        index = self._index(index_name)
+        with index.lock:
+            suggest_index = index.suggest_index()
+        return suggest_index.top(prefix, size)
+
+    def get_global_facets(self, index_name: str) -> dict[str, Any] | None:
+        """Facet counts of the whole index, as published in its mapping _meta"""
+        return facets.published(self._index(index_name).mappings.get("_meta", {}))
+
+    def put_global_facets(self, index_name: str, payload: dict[str, Any]):
+        """Publish facet counts of the whole index in its mapping _meta"""
+        index = self._index(index_name)
+        with index.lock:
+            index.mappings["_meta"] = facets.publish(
+                index.mappings.get("_meta", {}), payload
+            )
+
+    def mark_global_facets_stale(self, index_name: str):
+        """See ElasticManager.mark_global_facets_stale"""
+        index = self.indices.get(index_name)
+        if index is None:
+            return
+        with index.lock:
+            meta = facets.mark_stale(index.mappings.get("_meta", {}))
+            if meta is not None:
+                index.mappings["_meta"] = meta
+
+    def index_version(self, index_name: str) -> str | None:
+        """See es_manager.mapping_version; None if there is no such index"""
+        index = self.indices.get(index_name)
+        if index is None:
+            return None
+        return mapping_version({index_name: {"mappings": index.mappings}})
+
+    @instrumented("delete_document")
+    def delete_document(
+        self, doc_id: str, index_name: str, refresh: str | None = None
+    ):
+        """Delete a document by ID"""
+        index = self.indices.get(index_name)
+        if index is not None:
+            with index.lock:
+                index.delete(str(doc_id))
+        logger.debug("Document %s deleted (if existed).", doc_id)
+
+    @instrumented("delete_index")
+    def delete_index(self, index_name: str):
+        """Delete the entire index"""
+        with self._lock:
+            self.indices.pop(index_name, None)
+        logger.info("Index '%s' deleted (if existed).", index_name)
+
+    @instrumented("search_page")
+    def search_page(
+        self,
+        query: dict[str, Any],
+        index_name: str,
+        cursor: str | None = None,
+        size: int = 10,
+    ) -> dict[str, Any]:
+        """Return one page of hits and a cursor for the next one.
+
+        The cursor holds an offset: unlike a point-in-time, pages reflect
+        writes made between them.
+        """
+        start = 0
+        if cursor:
+            pit_id, search_after = decode_cursor(cursor)
+            if (
+                pit_id != f"local:{index_name}"
+                or len(search_after) != 1
+                or not isinstance(search_after[0], int)
+                or search_after[0] < 0
+            ):
+                raise ValueError("Invalid cursor: not from this local index")
+            (start,) = search_after
+        hits = self._run(query, index_name, start, size)
+        if len(hits) < size:
+            return {"hits": hits, "cursor": None}
+        return {
+            "hits": hits,
+            "cursor": encode_cursor(f"local:{index_name}", [start + len(hits)]),
+        }
+
+    def iter_all_documents(
+        self,
+        index_name: str,
+        query: dict[str, Any] | None = None,
+        batch_size: int = 1000,
+        source: list[str] | bool = True,
+    ) -> Iterator[dict[str, Any]]:
+        """Yield the _source of every matching document, in index order"""
+        index = self._index(index_name)
+        keep = _source_filter(source)
+        with index.lock:
+            bits = index.query(query or {"match_all": {}}, index.live(), False).bits
+        docs = _iter_bits(bits)
+        while batch := list(islice(docs, batch_size)):
+            with index.lock:
+                sources = [index.source(doc, keep) for doc in batch]
+            yield from sources
+
+    def get_all_documents(
+        self, index_name: str, size: int = 1000
+    ) -> list[dict[str, Any]]:
+        """Return up to size documents (use iter_all_documents to stream)"""
+        documents = self.iter_all_documents(index_name, batch_size=min(size, 1000))
+        return list(islice(documents, size))
+
+
+class AsyncLocalSearchManager:
+    """AsyncElasticManager's interface over a LocalSearchManager (asgi_app.py).
+
+    Searches run inline on the event loop; they take milliseconds.
+    """
+
+    def __init__(self, manager: LocalSearchManager):
+        self.manager = manager
+
+    async def connect(self):
+        pass
+
+    async def close(self):
+        pass
+
+    def health(self) -> dict[str, Any]:
+        return self.manager.health()
+
+    def __getattr__(self, name: str) -> Callable:
+        method = getattr(self.manager, name)
+
+        async def call(*args, **kwargs):
+            return method(*args, **kwargs)
+
+        return call
+
+    async def iter_all_documents(self, *args, **kwargs):
+        for document in self.manager.iter_all_documents(*args, **kwargs):
+            yield document
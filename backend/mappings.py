@@ -0,0 +1,189 @@
+"""Versioned mappings, settings and index template for the nonprofits index.
+
+Bump MAPPINGS_VERSION whenever a field type changes; the version is stored
+in the mapping _meta and on the index template.
+
+    python backend/mappings.py compare [BMF CSVs / NDJSON ...]
+
+loads the same documents into a dynamically mapped index and one using
+these mappings, then prints the index sizes and query latencies side by side.
+"""
+
+import argparse
+import logging
+import statistics
+import time
+from os import getenv
+from typing import Any
+
+from dotenv import load_dotenv
+from schema import (
+    CAUSE_VECTOR,
+    CAUSE_VECTOR_DIMS,
+    CITY,
+    FIELD_TYPES,
+    NAME,
+    STATE,
+    normalize_document,
+)
+
+load_dotenv()
+
+MAPPINGS_VERSION = 7
+TEMPLATE_NAME = "nonprofits"
+INDEX_PATTERNS = ["nonprofits*"]
+
+# Mapping for each schema type
+TYPE_MAPPINGS: dict[str, dict[str, Any]] = {
+    "keyword": {"type": "keyword"},
+    "text": {"type": "text"},
+    "long": {"type": "long", "ignore_malformed": True},
+    "integer": {"type": "integer", "ignore_malformed": True},
+    "date": {"type": "date", "format": "yyyyMM", "ignore_malformed": True},
+    "geo_point": {"type": "geo_point", "ignore_malformed": True},
+    # standard rather than the default simple analyzer, which drops digits
+    "completion": {"type": "completion", "analyzer": "standard"},
+    # cosine rather than dot_product: rounding leaves the stored vectors
+    # only close to unit length, which dot_product rejects
+    "dense_vector": {
+        "type": "dense_vector",
+        "dims": CAUSE_VECTOR_DIMS,
+        "index": True,
+        "similarity": "cosine",
+    },
+    "display": {"type": "keyword", "index": False, "doc_values": False},
+}
+
+# Per-field additions on top of the type mapping. City and state are stored
+# upper case by the BMF, so queries are normalized the same way.
+FIELD_OVERRIDES: dict[str, dict[str, Any]] = {
+    NAME: {"fields": {"keyword": {"type": "keyword"}}},
+    CITY: {"normalizer": "uppercase", "fields": {"text": {"type": "text"}}},
+    STATE: {"normalizer": "uppercase"},
+}
+
+NONPROFITS_MAPPINGS: dict[str, Any] = {
+    "_meta": {"version": MAPPINGS_VERSION},
+    # Vectors are only searched: left out of _source, they don't weigh on
+    # every hit, export page and stored document
+    "_source": {"excludes": [CAUSE_VECTOR]},
+    # Unknown fields are kept in _source but not indexed
+    "dynamic": False,
+    "properties": {
+        field: {**TYPE_MAPPINGS[field_type], **FIELD_OVERRIDES.get(field, {})}
+        for field, field_type in FIELD_TYPES.items()
+    },
+}
+
+NONPROFITS_SETTINGS: dict[str, Any] = {
+    "number_of_shards": 1,
+    "number_of_replicas": 1,
+    "refresh_interval": "1s",
+    "analysis": {
+        "normalizer": {"uppercase": {"type": "custom", "filter": ["uppercase"]}}
+    },
+}
+
+# Applied for the duration of a bulk load, then restored
+BULK_LOAD_SETTINGS: dict[str, Any] = {
+    "number_of_replicas": 0,
+    "refresh_interval": "-1",
+}
+
+
+def index_template() -> dict[str, Any]:
+    """Return the composable index template body for nonprofits* indices."""
+    return {
+        "index_patterns": INDEX_PATTERNS,
+        "version": MAPPINGS_VERSION,
+        "template": {"settings": NONPROFITS_SETTINGS, "mappings": NONPROFITS_MAPPINGS},
+    }
+
+
+# Representative queries, written against the field names the BMF uses
+COMPARE_QUERIES: dict[str, dict[str, Any]] = {
+    "state term": {"bool": {"filter": [{"term": {"STATE": "OH"}}]}},
+    "ntee prefix": {"bool": {"filter": [{"prefix": {"NTEE_CD": "B"}}]}},
+    "asset range": {
+        "bool": {"filter": [{"range": {"ASSET_AMT": {"gte": 100000, "lt": 1000000}}}]}
+    },
+    "ruling range": {"bool": {"filter": [{"range": {"RULING": {"gte": 201500}}}]}},
+    "name match": {"match": {"NAME": "community foundation"}},
+}
+
+
+def compare(es_manager, paths: list[str], runs: int = 50) -> None:
+    """Print index size and query latency for dynamic vs explicit mappings."""
+    from bulk_add import load_documents
+
+    # Names deliberately fall outside INDEX_PATTERNS so the template doesn't apply
+    indices = {
+        "dynamic": ("compare-dynamic", None, {}),
+        f"v{MAPPINGS_VERSION}": (
+            f"compare-v{MAPPINGS_VERSION}",
+            NONPROFITS_MAPPINGS,
+            NONPROFITS_SETTINGS,
+        ),
+    }
+    print(
+        f"{'mapping':>10} {'docs':>9} {'size KB':>10}  query latencies (median ms / hits)"
+    )
+    try:
+        for label, (index_name, mappings, settings) in indices.items():
+            es_manager.delete_index(index_name)
+            es_manager.create_index(
+                index_name, mappings, {**settings, "number_of_replicas": 0}
+            )
+            documents = load_documents(paths)
+            if mappings:
+                documents = map(normalize_document, documents)
+            es_manager.bulk_add(documents, index_name)
+            es_manager.es_admin.indices.forcemerge(index=index_name, max_num_segments=1)
+            es_manager.es.indices.refresh(index=index_name)
+            stats = es_manager.index_stats(index_name)
+
+            latencies = []
+            for name, query in COMPARE_QUERIES.items():
+                body = {"query": query, "size": 50}
+                timings = []
+                for _ in range(runs):
+                    started = time.perf_counter()
+                    response = es_manager.es.search(
+                        index=index_name, body=body, request_cache=False
+                    )
+                    timings.append((time.perf_counter() - started) * 1000)
+                hits = response["hits"]["total"]["value"]
+                latencies.append(f"{name} {statistics.median(timings):.2f}/{hits}")
+            print(
+                f"{label:>10} {stats['docs']:>9} {stats['size_in_bytes'] / 1024:>10.1f}  "
+                + ", ".join(latencies)
+            )
+    finally:
+        for index_name, _, _ in indices.values():
+            es_manager.delete_index(index_name)
+
+
+if __name__ == "__main__":
+    from bulk_add import csv_path
+    from es_manager import ElasticManager
+
+    parser = argparse.ArgumentParser(description="Nonprofits index mappings tools.")
+    subcommands = parser.add_subparsers(dest="command", required=True)
+    compare_parser = subcommands.add_parser(
+        "compare", help="compare dynamic vs explicit mappings"
+    )
+    compare_parser.add_argument("paths", nargs="*", default=[csv_path])
+    compare_parser.add_argument("--runs", type=int, default=50)
+    args = parser.parse_args()
+    logging.basicConfig(format="%(message)s")
+    logging.getLogger("es_manager").setLevel(logging.INFO)
+
+    ESManager = ElasticManager(
+        host=getenv("ELASTIC_HOST", "http://localhost:9200"),
+        credentials=(
+            getenv("ELASTIC_USERNAME", "elastic"),
+            getenv("ELASTIC_PASSWORD", "password"),
+        ),
+    )
+    ESManager.connect()
+    compare(ESManager, args.paths, args.runs)
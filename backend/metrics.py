@@ -0,0 +1,315 @@
+"""In-process metrics for the backend, rendered in Prometheus text format.
+
+Histograms, counters and gauges are plain lock-protected dicts keyed by
+label values, so recording one observation costs about a microsecond.
+Set METRICS_ENABLED=0 to turn every recording call into a no-op.
+
+Each process keeps its own numbers: with several uvicorn workers, scrape
+/metrics once per worker (or run one worker per port).
+
+Searches slower than SLOW_QUERY_MS are written to the "slow_query" logger
+together with the query body.
+"""
+
+import functools
+import inspect
+import json
+import logging
+import threading
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+from os import getenv
+from typing import Any, Callable, Iterator
+
+ENABLED = getenv("METRICS_ENABLED", "1") != "0"
+SLOW_QUERY_SECONDS = float(getenv("SLOW_QUERY_MS", "500")) / 1000
+
+# Upper bounds in seconds, from sub-millisecond query building to slow scans
+DEFAULT_BUCKETS = (
+    0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05,
+    0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0,
+)  # fmt: skip
+
+slow_query_log = logging.getLogger("slow_query")
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _format_labels(names: tuple[str, ...], values: tuple[str, ...], **extra) -> str:
+    pairs = list(zip(names, values)) + list(extra.items())
+    if not pairs:
+        return ""
+    return "{" + ",".join(f'{name}="{_escape(value)}"' for name, value in pairs) + "}"
+
+
+class _Metric:
+    kind = ""
+
+    def __init__(self, name: str, documentation: str, labelnames: tuple[str, ...] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values: dict[tuple[str, ...], Any] = {}
+        self._lock = threading.Lock()
+
+    def _key(self, labels: dict[str, Any]) -> tuple[str, ...]:
+        return tuple(str(labels.get(name, "")) for name in self.labelnames)
+
+    def render(self) -> list[str]:
+        lines = [
+            f"# HELP {self.name} {self.documentation}",
+            f"# TYPE {self.name} {self.kind}",
+        ]
+        with self._lock:
+            items = sorted(self._values.items())
+        for key, value in items:
+            lines.extend(self._render_value(key, value))
+        return lines
+
+    def _render_value(self, key: tuple[str, ...], value: Any) -> list[str]:
+        return [f"{self.name}{_format_labels(self.labelnames, key)} {value}"]
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def inc(self, amount: float = 1, **labels: Any):
+        if not ENABLED:
+            return
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+
+class Gauge(_Metric):
+    kind = "gauge"
+
+    def inc(self, amount: float = 1, **labels: Any):
+        if not ENABLED:
+            return
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def dec(self, amount: float = 1, **labels: Any):
+        self.inc(-amount, **labels)
+
+    def set(self, value: float, **labels: Any):
+        if not ENABLED:
+            return
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = value
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(
+        self,
+        name: str,
+        documentation: str,
+        labelnames: tuple[str, ...] = (),
+        buckets: tuple[float, ...] = DEFAULT_BUCKETS,
+    ):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(buckets)
+
+    def observe(self, value: float, **labels: Any):
+        if not ENABLED:
+            return
+        key = self._key(labels)
+        index = bisect_left(self.buckets, value)
+        with self._lock:
+            state = self._values.get(key)
+            if state is None:
+                # per-bucket (non-cumulative) counts + overflow, then sum
+                state = self._values[key] = [[0] * (len(self.buckets) + 1), 0.0]
+            state[0][index] += 1
+            state[1] += value
+
+    @contextmanager
+    def time(self, **labels: Any) -> Iterator[None]:
+        """Observe the wall-clock duration of the with-block"""
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - started, **labels)
+
+    def _render_value(self, key: tuple[str, ...], value: Any) -> list[str]:
+        counts, total = value
+        lines = []
+        cumulative = 0
+        for bound, count in zip(self.buckets + (float("inf"),), counts):
+            cumulative += count
+            le = "+Inf" if bound == float("inf") else repr(bound)
+            labels = _format_labels(self.labelnames, key, le=le)
+            lines.append(f"{self.name}_bucket{labels} {cumulative}")
+        labels = _format_labels(self.labelnames, key)
+        lines.append(f"{self.name}_sum{labels} {total}")
+        lines.append(f"{self.name}_count{labels} {cumulative}")
+        return lines
+
+
+class Registry:
+    def __init__(self):
+        """Collection of metrics rendered together on /metrics"""
+        self.metrics: list[_Metric] = []
+
+    def register(self, metric: _Metric) -> _Metric:
+        self.metrics.append(metric)
+        return metric
+
+    def render(self) -> str:
+        """Return every metric in Prometheus text exposition format"""
+        lines = []
+        for metric in self.metrics:
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = Registry()
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+REQUEST_SECONDS = REGISTRY.register(
+    Histogram(
+        "http_request_duration_seconds",
+        "Wall-clock time per HTTP request, including serialization.",
+        ("route", "method", "status"),
+    )
+)
+REQUESTS_IN_FLIGHT = REGISTRY.register(
+    Gauge("http_requests_in_flight", "Requests currently being handled.", ("route",))
+)
+QUERY_BUILD_SECONDS = REGISTRY.register(
+    Histogram("survey_query_build_seconds", "Time spent in build_es_query_from_survey.")
+)
+SERIALIZE_SECONDS = REGISTRY.register(
+    Histogram("json_serialize_seconds", "Time spent serializing JSON responses.")
+)
+ES_SECONDS = REGISTRY.register(
+    Histogram(
+        "es_operation_duration_seconds",
+        "Wall-clock time per Elasticsearch manager call, network included.",
+        ("operation",),
+    )
+)
+ES_TOOK_SECONDS = REGISTRY.register(
+    Histogram(
+        "es_took_seconds",
+        "Search time reported by Elasticsearch (took); the gap to "
+        "es_operation_duration_seconds is network and client overhead.",
+        ("operation",),
+    )
+)
+ES_ERRORS = REGISTRY.register(
+    Counter(
+        "es_operation_errors_total",
+        "Elasticsearch manager calls that raised.",
+        ("operation",),
+    )
+)
+ES_BREAKER_TRANSITIONS = REGISTRY.register(
+    Counter(
+        "es_circuit_breaker_transitions_total",
+        "Elasticsearch circuit breaker state changes, by the state entered.",
+        ("state",),
+    )
+)
+ES_BREAKER_REJECTED = REGISTRY.register(
+    Counter(
+        "es_circuit_breaker_rejected_total",
+        "Requests failed fast because the circuit was open.",
+    )
+)
+BULK_DOCUMENTS = REGISTRY.register(
+    Counter("bulk_documents_total", "Bulk-indexed documents.", ("result",))
+)
+BULK_RETRIES = REGISTRY.register(
+    Counter("bulk_retries_total", "Bulk chunk resends after 429 rejections.")
+)
+BULK_SECONDS = REGISTRY.register(
+    Counter("bulk_seconds_total", "Time spent in bulk loads.")
+)
+WRITE_BUFFER_PENDING = REGISTRY.register(
+    Gauge("write_buffer_pending", "Writes queued in the write buffer.")
+)
+WRITE_BUFFER_WRITES = REGISTRY.register(
+    Counter(
+        "write_buffer_writes_total",
+        "Writes taken by the write buffer; coalesced ones replaced a queued "
+        "write to the same id.",
+        ("result",),
+    )
+)
+WRITE_BUFFER_FLUSH_SECONDS = REGISTRY.register(
+    Histogram("write_buffer_flush_seconds", "Time per write buffer batch sent.")
+)
+
+
+def instrumented(operation: str) -> Callable:
+    """Decorate a (sync or async) manager method to time it under operation"""
+
+    def decorate(fn: Callable) -> Callable:
+        if inspect.iscoroutinefunction(fn):
+
+            @functools.wraps(fn)
+            async def async_wrapper(*args, **kwargs):
+                started = time.perf_counter()
+                try:
+                    return await fn(*args, **kwargs)
+                except Exception:
+                    ES_ERRORS.inc(operation=operation)
+                    raise
+                finally:
+                    ES_SECONDS.observe(
+                        time.perf_counter() - started, operation=operation
+                    )
+
+            return async_wrapper
+
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            started = time.perf_counter()
+            try:
+                return fn(*args, **kwargs)
+            except Exception:
+                ES_ERRORS.inc(operation=operation)
+                raise
+            finally:
+                ES_SECONDS.observe(time.perf_counter() - started, operation=operation)
+
+        return wrapper
+
+    return decorate
+
+
+def record_search(
+    operation: str,
+    index_name: str | None,
+    body: Any,
+    response: dict[str, Any],
+    started: float,
+):
+    """Record ES took time for a search response and log it if it was slow"""
+    took = response.get("took")
+    if took is not None:
+        ES_TOOK_SECONDS.observe(took / 1000, operation=operation)
+    wall = time.perf_counter() - started
+    if wall >= SLOW_QUERY_SECONDS and slow_query_log.isEnabledFor(logging.WARNING):
+        slow_query_log.warning(
+            json.dumps(
+                {
+                    "operation": operation,
+                    "index": index_name,
+                    "wall_ms": round(wall * 1000, 1),
+                    "took_ms": took,
+                    "body": body,
+                },
+                default=str,
+            )
+        )
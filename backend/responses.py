@@ -0,0 +1,127 @@
+"""Response shaping for the search endpoints.
+
+- projections: which _source fields Elasticsearch returns, chosen per
+  endpoint (ENDPOINT_FIELDS) or per request (?fields=A,B / ?exclude=C)
+- formats: the raw hits list, or ?format=compact, which sends field names
+  once and one value array per hit
+- serialization with orjson, and gzip (or br, when the brotli package is
+  installed) compression of large JSON bodies
+"""
+
+import gzip
+from typing import Any, Mapping
+
+import orjson
+from schema import ASSET_AMT, CITY, EIN, NAME, NTEE_CD, RULING, STATE
+
+try:
+    import brotli
+except ImportError:  # br is optional; gzip is always available
+    brotli = None
+
+# What the result cards in the frontend show
+CARD_FIELDS = [
+    EIN,
+    NAME,
+    CITY,
+    STATE,
+    NTEE_CD,
+    "NTEE_TITLE",
+    "NTEE_DESCRIPTION",
+    ASSET_AMT,
+    RULING,
+]
+
+# Default _source per endpoint; None returns the whole document
+ENDPOINT_FIELDS: dict[str, list[str] | None] = {
+    "search": None,
+    "survey": CARD_FIELDS,
+}
+
+FORMATS = ("hits", "compact")
+
+COMPRESS_MIN_BYTES = 1024
+COMPRESSIBLE_TYPES = ("application/json", "text/")
+# Both favour speed: on a 50-hit response gzip 6 saves ~5% more bytes than 3
+# for twice the CPU
+GZIP_LEVEL = 3
+BROTLI_QUALITY = 4
+
+
+def source_filter(args: Mapping[str, str], endpoint: str) -> Any:
+    """Return the _source setting for a request from its ?fields / ?exclude"""
+    includes = [f for f in args.get("fields", "").split(",") if f]
+    excludes = [f for f in args.get("exclude", "").split(",") if f]
+    if not includes and not excludes:
+        return ENDPOINT_FIELDS.get(endpoint)
+    if not excludes:
+        return includes
+    return {"includes": includes, "excludes": excludes}
+
+
+def with_source(query: dict[str, Any], source: Any) -> dict[str, Any]:
+    """Return query with its _source projection set (unchanged if None)"""
+    if source is None:
+        return query
+    return {**query, "_source": source}
+
+
+def response_format(args: Mapping[str, str]) -> str:
+    """Return the requested result format, raising ValueError if unknown"""
+    fmt = args.get("format", "hits")
+    if fmt not in FORMATS:
+        raise ValueError(f"Unknown format '{fmt}', expected one of {FORMATS}")
+    return fmt
+
+
+def compact_hits(hits: list[dict[str, Any]]) -> dict[str, Any]:
+    """Columnar form of hits: field names once, then one value row per hit"""
+    fields: dict[str, None] = {}
+    for hit in hits:
+        fields.update(dict.fromkeys(hit.get("_source", ())))
+    names = list(fields)
+    return {
+        "format": "compact",
+        "fields": names,
+        "ids": [hit.get("_id") for hit in hits],
+        "scores": [hit.get("_score") for hit in hits],
+        "rows": [[hit.get("_source", {}).get(name) for name in names] for hit in hits],
+    }
+
+
+def shape_hits(hits: list[dict[str, Any]], fmt: str) -> Any:
+    """Return hits in the requested format"""
+    return compact_hits(hits) if fmt == "compact" else hits
+
+
+def dumps(obj: Any) -> bytes:
+    """Serialize to JSON bytes with orjson"""
+    return orjson.dumps(obj, option=orjson.OPT_NON_STR_KEYS)
+
+
+def choose_encoding(accept_encoding: str) -> str | None:
+    """Pick br or gzip from an Accept-Encoding header, or None"""
+    accepted = {
+        part.split(";")[0].strip().lower()
+        for part in accept_encoding.split(",")
+        if not part.strip().endswith(";q=0")
+    }
+    if brotli is not None and "br" in accepted:
+        return "br"
+    if "gzip" in accepted:
+        return "gzip"
+    return None
+
+
+def should_compress(mimetype: str | None, length: int) -> bool:
+    """Whether a body of this type and size is worth compressing"""
+    return length >= COMPRESS_MIN_BYTES and (mimetype or "").startswith(
+        COMPRESSIBLE_TYPES
+    )
+
+
+def compress(data: bytes, encoding: str) -> bytes:
+    """Compress data with the encoding returned by choose_encoding"""
+    if encoding == "br":
+        return brotli.compress(data, quality=BROTLI_QUALITY)
+    return gzip.compress(data, compresslevel=GZIP_LEVEL, mtime=0)
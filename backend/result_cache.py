@@ -0,0 +1,176 @@
+"""Result cache for the search endpoints.
+
+Entries are keyed on a canonical hash of the Elasticsearch query body, so
+every survey answer set that produces the same query shares one entry.
+The in-process layer is an LRU with a TTL; an optional shared backend
+(anything with get/set/clear, e.g. a Redis wrapper) can sit behind it so
+several worker processes share results.
+
+Writes made through the app call invalidate(). A result computed before
+an invalidate() is not stored after it: callers pass the generation they
+read before computing to set(). Writes from other processes (bulk_add.py
+loads and --reindex alias swaps) change the index version, an id of the
+index and its last published _meta; the apps pass it to note_version()
+every version_check seconds, which invalidates when it changed.
+
+Expired entries stay in the local layer for another stale_ttl seconds
+(until evicted), so get_stale() can still answer while Elasticsearch is
+unavailable.
+"""
+
+import hashlib
+import json
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Callable
+
+
+def query_key(query: dict[str, Any], index_name: str) -> str:
+    """Return a stable hash for a query body against an index."""
+    canonical = json.dumps(
+        [index_name, query], sort_keys=True, separators=(",", ":"), ensure_ascii=False
+    )
+    return hashlib.sha256(canonical.encode("utf-8")).hexdigest()
+
+
+class ResultCache:
+    def __init__(
+        self,
+        maxsize: int = 1024,
+        ttl: float = 300.0,
+        shared: Any = None,
+        stale_ttl: float = 0.0,
+        version_check: float = 0.0,
+    ):
+        """LRU + TTL cache, optionally backed by a shared cache"""
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.stale_ttl = stale_ttl
+        self.shared = shared
+        self.version_check = version_check
+        self._entries: OrderedDict[str, tuple[Any, float]] = OrderedDict()
+        self._lock = threading.Lock()
+        self.generation = 0
+        self._version: str | None = None
+        self._next_version_check = 0.0
+        self.hits = 0
+        self.shared_hits = 0
+        self.misses = 0
+        self.stale_hits = 0
+        self.evictions = 0
+        self.invalidations = 0
+
+    def get(self, key: str) -> Any | None:
+        """Return the cached value for key, or None on a miss"""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                value, expires = entry
+                now = time.monotonic()
+                if expires >= now:
+                    self._entries.move_to_end(key)
+                    self.hits += 1
+                    return value
+                if expires + self.stale_ttl < now:
+                    del self._entries[key]
+        if self.shared is not None:
+            value = self.shared.get(key)
+            if value is not None:
+                self._store(key, value)
+                with self._lock:
+                    self.shared_hits += 1
+                return value
+        with self._lock:
+            self.misses += 1
+        return None
+
+    def get_stale(self, key: str) -> Any | None:
+        """Return the value for key even if it expired up to stale_ttl ago"""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or entry[1] + self.stale_ttl < time.monotonic():
+                return None
+            self.stale_hits += 1
+            return entry[0]
+
+    def set(self, key: str, value: Any, generation: int | None = None):
+        """Store value under key in the local cache and the shared backend,
+        unless the cache was invalidated since generation was read"""
+        if not self._store(key, value, generation):
+            return
+        if self.shared is not None:
+            self.shared.set(key, value, self.ttl)
+
+    def get_or_compute(self, key: str, compute: Callable[[], Any]) -> Any:
+        """Return the cached value for key, computing and storing it on a miss"""
+        generation = self.generation
+        value = self.get(key)
+        if value is None:
+            value = compute()
+            self.set(key, value, generation)
+        return value
+
+    def invalidate(self):
+        """Drop every entry (called whenever the index changes)"""
+        with self._lock:
+            self._entries.clear()
+            self.generation += 1
+            self.invalidations += 1
+        if self.shared is not None:
+            self.shared.clear()
+
+    def version_check_due(self) -> bool:
+        """True at most once every version_check seconds (never if it's 0)"""
+        if not self.version_check:
+            return False
+        now = time.monotonic()
+        with self._lock:
+            if now < self._next_version_check:
+                return False
+            self._next_version_check = now + self.version_check
+            return True
+
+    def note_version(self, version: str | None):
+        """Invalidate if the index version changed since the last one noted.
+        None (no such index) is ignored."""
+        if version is None:
+            return
+        with self._lock:
+            changed = self._version is not None and version != self._version
+            self._version = version
+        if changed:
+            self.invalidate()
+
+    def stats(self) -> dict[str, Any]:
+        """Return hit/miss/eviction counters for sizing the cache"""
+        with self._lock:
+            lookups = self.hits + self.shared_hits + self.misses
+            return {
+                "size": len(self._entries),
+                "maxsize": self.maxsize,
+                "ttl": self.ttl,
+                "stale_ttl": self.stale_ttl,
+                "hits": self.hits,
+                "shared_hits": self.shared_hits,
+                "misses": self.misses,
+                "stale_hits": self.stale_hits,
+                "evictions": self.evictions,
+                "invalidations": self.invalidations,
+                "hit_ratio": (
+                    round((self.hits + self.shared_hits) / lookups, 4)
+                    if lookups
+                    else 0.0
+                ),
+            }
+
+    def _store(self, key: str, value: Any, generation: int | None = None) -> bool:
+        with self._lock:
+            if generation is not None and generation != self.generation:
+                return False
+            self._entries[key] = (value, time.monotonic() + self.ttl)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+            return True
@@ -0,0 +1,152 @@
+"""Canonical field names and types for nonprofit documents.
+
+The BMF column names (upper case) are the canonical names everywhere: the
+ingest pipeline writes them, mappings.py maps them and search_builder.py
+queries them. Use the constants below rather than string literals.
+"""
+
+from typing import Any
+
+EIN = "EIN"
+NAME = "NAME"
+SORT_NAME = "SORT_NAME"
+NAME_SUGGEST = "NAME_SUGGEST"
+CITY = "CITY"
+STATE = "STATE"
+ZIP = "ZIP"
+ZIP5 = "ZIP5"
+LOCATION = "LOCATION"
+NTEE_CD = "NTEE_CD"
+NTEE_MAJOR = "NTEE_MAJOR"
+ASSET_AMT = "ASSET_AMT"
+INCOME_AMT = "INCOME_AMT"
+REVENUE_AMT = "REVENUE_AMT"
+RULING = "RULING"
+STATUS = "STATUS"
+TAX_PERIOD = "TAX_PERIOD"
+CAUSE_VECTOR = "CAUSE_VECTOR"
+
+# Length of CAUSE_VECTOR (data/cause_vectors.py DIMS)
+CAUSE_VECTOR_DIMS = 32
+
+# Field types:
+#   keyword  exact-match codes, normalized to upper case where noted in mappings
+#            (ZIP is the BMF's ZIP+4 as filed; ZIP5 its 5-digit ZIP, for search)
+#   text     analyzed full text
+#   long / integer / date  numeric and date values (RULING is an integer YYYYMM)
+#   geo_point  "lat,lon" string, the centroid of the organization's ZIP code
+#   completion  {"input": [names], "weight": rank} for name autocomplete
+#   dense_vector  CAUSE_VECTOR_DIMS floats of unit length, for kNN search
+#   display  returned to clients but never searched, sorted or aggregated on
+FIELD_TYPES: dict[str, str] = {
+    EIN: "keyword",
+    NAME: "text",
+    "ICO": "display",
+    "STREET": "display",
+    CITY: "keyword",
+    STATE: "keyword",
+    ZIP: "keyword",
+    ZIP5: "keyword",
+    LOCATION: "geo_point",
+    "GROUP": "keyword",
+    "SUBSECTION": "keyword",
+    "AFFILIATION": "keyword",
+    "CLASSIFICATION": "keyword",
+    RULING: "integer",
+    "DEDUCTIBILITY": "keyword",
+    "FOUNDATION": "keyword",
+    "ACTIVITY": "keyword",
+    "ORGANIZATION": "keyword",
+    STATUS: "keyword",
+    TAX_PERIOD: "date",
+    "ASSET_CD": "keyword",
+    "INCOME_CD": "keyword",
+    "FILING_REQ_CD": "keyword",
+    "PF_FILING_REQ_CD": "keyword",
+    "ACCT_PD": "keyword",
+    ASSET_AMT: "long",
+    INCOME_AMT: "long",
+    REVENUE_AMT: "long",
+    NTEE_CD: "keyword",
+    NTEE_MAJOR: "keyword",
+    SORT_NAME: "text",
+    NAME_SUGGEST: "completion",
+    CAUSE_VECTOR: "dense_vector",
+    "NTEE_TITLE": "text",
+    "NTEE_DESCRIPTION": "text",
+    "NTEE_KEYWORDS": "text",
+    "SUBSECTION_NAME": "display",
+    "AFFILIATION_NAME": "display",
+    "ORGANIZATION_NAME": "display",
+    "FOUNDATION_NAME": "display",
+    "DEDUCTIBILITY_NAME": "display",
+    "STATUS_NAME": "display",
+    "FILING_REQ_NAME": "display",
+    "PF_FILING_REQ_NAME": "display",
+    "ASSET_RANGE": "display",
+    "INCOME_RANGE": "display",
+}
+
+NUMERIC_TYPES = ("long", "integer")
+
+# Older clients (and the first query builder) used lower-case / short names
+FIELD_ALIASES: dict[str, str] = {
+    **{field.lower(): field for field in FIELD_TYPES},
+    "ntee": NTEE_CD,
+}
+
+
+def normalize_field_name(field: str) -> str:
+    """Return the canonical name for a field, leaving unknown fields untouched."""
+    if field in FIELD_TYPES:
+        return field
+    return FIELD_ALIASES.get(field.lower(), field)
+
+
+def normalize_document(document: dict[str, Any]) -> dict[str, Any]:
+    """Rename fields to their canonical names and coerce values to their types.
+
+    Empty strings become null for numeric and date fields (the BMF leaves
+    amounts blank), numeric strings become ints and dates stay YYYYMM strings.
+    """
+    normalized = {}
+    for field, value in document.items():
+        field = normalize_field_name(field)
+        field_type = FIELD_TYPES.get(field)
+        if isinstance(value, str):
+            if field_type in NUMERIC_TYPES:
+                value = value.strip()
+                value = int(value) if value.lstrip("-").isdigit() else None
+            elif field_type == "date" and value == "":
+                value = None
+        normalized[field] = value
+    return normalized
+
+
+def validate_index_fields(
+    index_fields: dict[str, str], required: dict[str, str]
+) -> None:
+    """Check that every required field exists in an index with a compatible type.
+
+    index_fields is the flattened {field: mapping type} of the live index
+    (see ElasticManager.get_field_types); required maps canonical field
+    names to schema types. Raises ValueError listing every problem found.
+    """
+    compatible = {
+        "keyword": {"keyword", "constant_keyword"},
+        "text": {"text", "match_only_text"},
+        "long": {"long"},
+        "integer": {"integer", "long"},
+        "date": {"date"},
+        "geo_point": {"geo_point"},
+        "completion": {"completion"},
+    }
+    problems = []
+    for field, field_type in required.items():
+        actual = index_fields.get(field)
+        if actual is None:
+            problems.append(f"{field} is not mapped")
+        elif actual not in compatible.get(field_type, {field_type}):
+            problems.append(f"{field} is mapped as {actual}, expected {field_type}")
+    if problems:
+        raise ValueError("Index mapping does not match schema: " + "; ".join(problems))
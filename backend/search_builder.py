@@ -1,115 +1,442 @@
-from typing import List, Dict
+import os
+import re
+import sys
+import time
+from functools import lru_cache
+from typing import List, Dict, Tuple
 from datetime import datetime
 
+# The NTEE codebook and ZIP centroids live with the rest of the data tooling
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "data"))
+from cause_vectors import CauseModel, as_list, unit  # noqa: E402
+from ntee_codebook import NTEECodebook  # noqa: E402
+from zip_centroids import ZipCentroids, zip5  # noqa: E402
+from schema import (  # noqa: E402
+    ASSET_AMT,
+    CAUSE_VECTOR,
+    CAUSE_VECTOR_DIMS,
+    CITY,
+    LOCATION,
+    NAME,
+    NTEE_CD,
+    RULING,
+    STATE,
+    ZIP5,
+)
 
-def build_es_query_from_survey(answers: List[Dict]) -> Dict:
-    """Translate survey answers into an Elasticsearch query.
-    
-    Survey Structure:
-    Q1 (index 0): Cause type - Maps to NTEE codes
-    Q2 (index 1): Location (city/state) - Maps to city or state field
-    Q3 (index 2): Organization size - Maps to asset_amt field
-    Q4 (index 3): Organization age - Maps to ruling date field
-    Q5 (index 4): Work environment - Used for keyword boosting
-    Q6 (index 5): Email - Not used in search
+# Every field the survey query touches, with the schema type it must have in
+# the live index (checked at app startup by schema.validate_index_fields)
+QUERY_FIELDS: Dict[str, str] = {
+    NTEE_CD: "keyword",
+    CITY: "keyword",
+    STATE: "keyword",
+    ASSET_AMT: "long",
+    RULING: "integer",
+    NAME: "text",
+    LOCATION: "geo_point",
+    ZIP5: "keyword",
+}
+# build_knn_query_from_survey also needs the cause vectors
+KNN_QUERY_FIELDS: Dict[str, str] = {**QUERY_FIELDS, CAUSE_VECTOR: "dense_vector"}
+
+CODEBOOK = NTEECodebook.load()
+ZIP_CENTROIDS = ZipCentroids.load()
+
+# Q1: Causes are defined by NTEE major-group titles and resolved to their
+# letter prefixes through the codebook, so they can't drift from the data
+CAUSE_TO_NTEE_GROUPS: Dict[str, List[str]] = {
+    "Education & Youth Development": ["Education", "Youth Development"],
+    "Environmental Conservation": ["Environment"],
+    "Health & Medical": ["Health Care", "Medical Research"],
+    "Poverty & Homelessness": [
+        "Food, Agriculture & Nutrition",
+        "Housing & Shelter",
+        "Human Services",
+    ],
+    "Arts & Culture": ["Arts, Culture & Humanities"],
+    "Animal Welfare": ["Animal-Related"],
+    "Community Development": ["Community Improvement & Capacity Building"],
+}
+
+
+def resolve_cause_prefixes(codebook: NTEECodebook) -> Dict[str, List[str]]:
+    """Map every survey cause to the NTEE major-group letters it covers."""
+    group_codes = {title: code for code, title in codebook.major_groups().items()}
+    prefixes: Dict[str, List[str]] = {}
+    for cause, titles in CAUSE_TO_NTEE_GROUPS.items():
+        missing = [title for title in titles if title not in group_codes]
+        if missing:
+            raise ValueError(f"NTEE major groups missing from codebook: {missing}")
+        prefixes[cause] = [group_codes[title] for title in titles]
+    return prefixes
+
+
+CAUSE_TO_NTEE_PREFIXES = resolve_cause_prefixes(CODEBOOK)
+
+# Q3: Map organization size to asset amount ranges
+ORG_SIZE_TO_ASSET_RANGE: Dict[str, Dict] = {
+    "Small (Less than $100K)": {"lt": 100000},
+    "Medium ($100K–$1M)": {"gte": 100000, "lt": 1000000},
+    "Large (More than $1M)": {"gte": 1000000},
+}
+
+# Q5: Map work environment to NTEE keywords for boosting
+ENVIRONMENT_KEYWORDS: Dict[str, List[str]] = {
+    "Office/Indoor setting": ["foundation", "association", "center"],
+    "Outdoor activities": ["park", "conservation", "environmental", "recreation"],
+    "Community centers": ["community", "neighborhood", "center"],
+    "Virtual/Online work": ["education", "research", "online"],
+}
+
+# Query fragments for the fixed answer choices, compiled once at import.
+# They are shared between queries, so treat them as read-only.
+CAUSE_FILTERS: Dict[str, Dict] = {
+    cause: {
+        "bool": {
+            "should": [{"prefix": {NTEE_CD: prefix}} for prefix in prefixes],
+            "minimum_should_match": 1,
+        }
+    }
+    for cause, prefixes in CAUSE_TO_NTEE_PREFIXES.items()
+}
+SIZE_FILTERS: Dict[str, Dict] = {
+    size: {"range": {ASSET_AMT: asset_range}}
+    for size, asset_range in ORG_SIZE_TO_ASSET_RANGE.items()
+}
+ENVIRONMENT_SHOULDS: Dict[str, List[Dict]] = {
+    environment: [
+        {"match": {NAME: {"query": keyword, "boost": 1.5}}} for keyword in keywords
+    ]
+    for environment, keywords in ENVIRONMENT_KEYWORDS.items()
+}
+
+# kNN survey queries: CAUSE_VECTOR neighbours of the cause (and work
+# environment) vector. Hits come from the KNN_CANDIDATES nearest per shard
+KNN_SIZE = 50
+KNN_CANDIDATES = 500
+# How far a work environment moves the cause vector
+ENVIRONMENT_WEIGHT = 0.5
+
+
+@lru_cache(maxsize=1)
+def cause_model() -> CauseModel:
+    """The cause vector model, loaded on first use (see data/cause_vectors.py)."""
+    model = CauseModel.load()
+    if model.dims != CAUSE_VECTOR_DIMS:
+        raise ValueError(
+            f"Cause vectors have {model.dims} dims, the mapping {CAUSE_VECTOR_DIMS}"
+        )
+    return model
+
+
+@lru_cache(maxsize=1)
+def survey_vectors() -> Dict[Tuple[str, str], List[float]]:
+    """Query vector for every (cause, work environment) choice pair, "" for
+    an unanswered question, computed once. Treat them as read-only."""
+    model = cause_model()
+    causes = {
+        cause: model.query_vector(prefixes, [cause])
+        for cause, prefixes in CAUSE_TO_NTEE_PREFIXES.items()
+    }
+    causes[""] = model.zero
+    environments = {
+        environment: model.text_vector(" ".join([environment, *keywords]))
+        for environment, keywords in ENVIRONMENT_KEYWORDS.items()
+    }
+    environments[""] = model.zero
+    vectors = {}
+    for cause, cause_vector in causes.items():
+        for environment, environment_vector in environments.items():
+            if cause or environment:
+                vector = cause_vector + ENVIRONMENT_WEIGHT * environment_vector
+                vectors[cause, environment] = as_list(unit(vector))
+    return vectors
+
+
+@lru_cache(maxsize=1024)
+def free_text_vector(cause: str) -> List[float] | None:
+    """Query vector of a cause answer that isn't one of the choices, None if
+    the model knows none of its words."""
+    vector = cause_model().text_vector(cause)
+    return as_list(vector) if vector.any() else None
+
+
+# Q4 cutoffs depend on the current year, so they are rebuilt when it changes
+_age_filters: Dict = {"expires": 0.0, "filters": {}}
+
+
+def age_filters() -> Dict[str, Dict]:
+    """Return the "new" and "established" RULING filters for the current year."""
+    if time.time() >= _age_filters["expires"]:
+        current_year = datetime.now().year
+        _age_filters["filters"] = {
+            # Organizations established in the last 5 years
+            "new": {"range": {RULING: {"gte": (current_year - 5) * 100}}},
+            # Organizations established 10+ years ago; RULING 000000 means
+            # unknown, so keep it out of "established"
+            "established": {
+                "range": {RULING: {"gt": 0, "lt": (current_year - 10) * 100}}
+            },
+        }
+        _age_filters["expires"] = datetime(current_year + 1, 1, 1).timestamp()
+    return _age_filters["filters"]
+
+
+@lru_cache(maxsize=64)
+def age_bucket(org_age_answer: str) -> str | None:
+    """Classify a free-form age answer as "new", "established" or neither."""
+    answer = org_age_answer.lower()
+    if "under 5" in answer or "newer" in answer:
+        return "new"
+    if "10+" in answer or "established" in answer:
+        return "established"
+    return None
+
+
+# Q2: A city or ZIP answer matches organizations within a radius of it
+DEFAULT_RADIUS = "15mi"
+MAX_RADIUS_MILES = 500
+RADIUS_UNITS: Dict[str, float] = {"mi": 1.0, "km": 1 / 1.609344}
+RADIUS = re.compile(r"^\s*(\d+(?:\.\d+)?)\s*(mi|km)?\s*$", re.IGNORECASE)
+
+
+def normalize_radius(radius) -> str:
+    """Validate a radius (miles, or a string like "10mi" / "25 km") as "<n><unit>".
+
+    Raises ValueError for anything else, or for radii beyond MAX_RADIUS_MILES.
+    """
+    if radius is None or radius == "":
+        return DEFAULT_RADIUS
+    if isinstance(radius, bool) or not isinstance(radius, (int, float, str)):
+        raise ValueError(f"Invalid radius: {radius!r}")
+    match = RADIUS.match(str(radius))
+    if not match:
+        raise ValueError(f"Invalid radius: {radius!r}")
+    value, unit = float(match.group(1)), (match.group(2) or "mi").lower()
+    if not 0 < value * RADIUS_UNITS[unit] <= MAX_RADIUS_MILES:
+        raise ValueError(f"Radius must be above 0 and at most {MAX_RADIUS_MILES}mi")
+    return f"{value:g}{unit}"
+
+
+@lru_cache(maxsize=1024)
+def geo_clauses(
+    location: str, radius: str = DEFAULT_RADIUS
+) -> Tuple[Dict, List] | None:
+    """Return (geo_distance filter, sort) for a ZIP or city, None if unknown.
+
+    radius must already be normalized (see normalize_radius). Results are
+    sorted by score, then by distance from the place.
+    """
+    place = ZIP_CENTROIDS.resolve(location)
+    if place is None:
+        return None
+    point = {"lat": place.lat, "lon": place.lon}
+    return (
+        {"geo_distance": {"distance": radius, LOCATION: point}},
+        ["_score", {"_geo_distance": {LOCATION: point, "order": "asc", "unit": "mi"}}],
+    )
+
+
+@lru_cache(maxsize=1024)
+def location_clauses(
+    location_answer: str, radius: str = DEFAULT_RADIUS
+) -> Tuple[Tuple[Dict, ...], Tuple[Dict, ...], List | None]:
+    """Return (filters, should clauses, sort) for a location answer."""
+    location_clean = location_answer.strip()
+    if not location_clean:
+        return (), (), None
+    # Try to match as state (2-letter code) or search in city/state fields
+    if len(location_clean) == 2:
+        # Likely a state code - exact match required
+        return ({"term": {STATE: location_clean.upper()}},), (), None
+    # A known city or ZIP: everything within the radius, nearest first
+    geo = geo_clauses(location_clean, radius)
+    if geo:
+        return (geo[0],), (), geo[1]
+    # A ZIP without a centroid: organizations filed under it (ZIP holds
+    # ZIP+4 codes, so only ZIP5 matches a 5-digit answer)
+    zip_code = zip5(location_clean)
+    if zip_code:
+        return ({"term": {ZIP5: zip_code}},), (), None
+    # Search in city field - boost matching cities but don't require them
+    # This way Columbus orgs rank higher, but other cities still show if needed
+    return (
+        (),
+        ({"term": {CITY: {"value": location_clean.upper(), "boost": 2.0}}},),
+        None,
+    )
+
+
+def near_location(es_query: Dict, location, radius=None) -> Tuple[Dict, List]:
+    """Restrict a search query to a radius around a ZIP or city.
+
+    Returns (query, sort) for /api/search. Raises ValueError for a location
+    that can't be resolved or an invalid radius.
+    """
+    if not isinstance(location, str):
+        raise ValueError(f"Invalid location: {location!r}")
+    geo = geo_clauses(location.strip(), normalize_radius(radius))
+    if geo is None:
+        raise ValueError(f"Unknown location: {location!r}")
+    return {"bool": {"must": [es_query], "filter": [geo[0]]}}, geo[1]
+
+
+def survey_clauses(
+    answers: List[Dict],
+) -> Tuple[str, str, List[Dict], List[Dict], List | None]:
+    """Return (cause, work environment, filters, should clauses, sort) for
+    survey answers, the clauses covering Q2-Q4 only.
+
+    Raises ValueError for an invalid radius.
     """
     # Extract answers
     cause_answer = answers[0].get("answer") if len(answers) > 0 else None
     location_answer = answers[1].get("answer") if len(answers) > 1 else None
+    radius = normalize_radius(answers[1].get("radius") if len(answers) > 1 else None)
     org_size_answer = answers[2].get("answer") if len(answers) > 2 else None
     org_age_answer = answers[3].get("answer") if len(answers) > 3 else None
     environment_answer = answers[4].get("answer") if len(answers) > 4 else None
     # email_answer = answers[5].get("answer") if len(answers) > 5 else None  # Not used
 
-    # Q1: Map cause to NTEE code prefixes
-    cause_to_ntee_prefixes: Dict[str, List[str]] = {
-        "Education & Youth Development": ["B", "O"],  # Education, Youth Dev
-        "Environmental Conservation": ["C"],  # Environment
-        "Health & Medical": ["E", "H"],  # Health, Hospitals
-        "Poverty & Homelessness": ["K", "L", "P"],  # Food/Clothing, Housing, Human Services
-        "Arts & Culture": ["A"],  # Arts
-        "Animal Welfare": ["D"],  # Animal-Related
-        "Community Development": ["S"],  # Community Improvement
-    }
-
-    # Q3: Map organization size to asset amount ranges
-    # Note: asset_amt field would need to be added to ES index
-    org_size_to_asset_range: Dict[str, Dict] = {
-        "Small (Less than $100K)": {"lt": 100000},
-        "Medium ($100K–$1M)": {"gte": 100000, "lt": 1000000},
-        "Large (More than $1M)": {"gte": 1000000},
-    }
-
-    # Q5: Map work environment to NTEE keywords for boosting
-    environment_keywords: Dict[str, List[str]] = {
-        "Office/Indoor setting": ["foundation", "association", "center"],
-        "Outdoor activities": ["park", "conservation", "environmental", "recreation"],
-        "Community centers": ["community", "neighborhood", "center"],
-        "Virtual/Online work": ["education", "research", "online"],
-    }
-
     # Build query filters
     filters = []
     should_clauses = []
-    
-    # Q1: Add NTEE prefix filter for cause
-    ntee_prefixes = cause_to_ntee_prefixes.get(str(cause_answer or ""), [])
-    if ntee_prefixes:
-        ntee_should = [{"prefix": {"ntee": prefix}} for prefix in ntee_prefixes]
-        filters.append({"bool": {"should": ntee_should, "minimum_should_match": 1}})
+    sort = None
 
     # Q2: Add location filter (search in both city and state)
-    if location_answer and location_answer.strip():
-        location_clean = location_answer.strip()
-        # Try to match as state (2-letter code) or search in city/state fields
-        if len(location_clean) == 2:
-            # Likely a state code - exact match required
-            filters.append({"term": {"state": location_clean.upper()}})
-        else:
-            # Search in city field - boost matching cities but don't require them
-            # This way Columbus orgs rank higher, but other cities still show if needed
-            should_clauses.append({"match": {"city": {"query": location_clean, "boost": 2.0}}})
+    if location_answer:
+        location_filters, location_shoulds, sort = location_clauses(
+            location_answer, radius
+        )
+        filters.extend(location_filters)
+        should_clauses.extend(location_shoulds)
 
     # Q3: Add organization size filter based on assets
-    # NOTE: This requires asset_amt field in ES index (from ASSET_AMT column in CSV)
     if org_size_answer:
-        asset_range = org_size_to_asset_range.get(org_size_answer)
-        if asset_range:
-            filters.append({"range": {"asset_amt": asset_range}})
-    
+        size_filter = SIZE_FILTERS.get(org_size_answer)
+        if size_filter:
+            filters.append(size_filter)
+
     # Q4: Add organization age filter based on ruling date
-    # NOTE: This requires ruling field in ES index (from RULING column in CSV, format: YYYYMM)
     if org_age_answer:
-        current_year = datetime.now().year
-        if "under 5" in org_age_answer.lower() or "newer" in org_age_answer.lower():
-            # Organizations established in the last 5 years
-            cutoff_year = current_year - 5
-            filters.append({"range": {"ruling": {"gte": cutoff_year * 100}}})
-        elif "10+" in org_age_answer.lower() or "established" in org_age_answer.lower():
-            # Organizations established 10+ years ago
-            cutoff_year = current_year - 10
-            filters.append({"range": {"ruling": {"lt": cutoff_year * 100}}})
-    
+        bucket = age_bucket(org_age_answer)
+        if bucket:
+            filters.append(age_filters()[bucket])
+
+    return (
+        str(cause_answer or ""),
+        str(environment_answer or ""),
+        filters,
+        should_clauses,
+        sort,
+    )
+
+
+def build_es_query_from_survey(answers: List[Dict]) -> Dict:
+    """Translate survey answers into an Elasticsearch query.
+
+    Survey Structure:
+    Q1 (index 0): Cause type - Maps to NTEE codes
+    Q2 (index 1): Location (state, city or ZIP) - Maps to STATE, or to a
+                  geo_distance filter on LOCATION ("radius", default 15mi)
+    Q3 (index 2): Organization size - Maps to ASSET_AMT field
+    Q4 (index 3): Organization age - Maps to RULING (YYYYMM) field
+    Q5 (index 4): Work environment - Used for keyword boosting
+    Q6 (index 5): Email - Not used in search
+
+    Each answer only selects precompiled fragments, so building a query is
+    a handful of dict lookups. Raises ValueError for an invalid radius.
+    """
+    cause, environment, filters, should_clauses, sort = survey_clauses(answers)
+
+    # Q1: Add NTEE prefix filter for cause
+    cause_filter = CAUSE_FILTERS.get(cause)
+    if cause_filter:
+        filters.insert(0, cause_filter)
+
     # Q5: Add name keyword boosting for work environment
-    if environment_answer:
-        keywords = environment_keywords.get(environment_answer, [])
-        for keyword in keywords:
-            should_clauses.append({"match": {"name": {"query": keyword, "boost": 1.5}}})
+    if environment:
+        should_clauses.extend(ENVIRONMENT_SHOULDS.get(environment, []))
 
     # Build final query
     if filters or should_clauses:
-        es_query = {
-            "query": {
-                "bool": {
-                    "filter": filters if filters else [],
-                    "should": should_clauses if should_clauses else []
-                }
-            },
+        query = {
+            "query": {"bool": {"filter": filters, "should": should_clauses}},
             "size": 50,
         }
+        if sort:
+            query["sort"] = sort
+        return query
+    return {"query": {"match_all": {}}, "size": 50}
+
+
+def build_knn_query_from_survey(answers: List[Dict]) -> Dict:
+    """Translate survey answers into a single kNN query over CAUSE_VECTOR.
+
+    Q1 and Q5 pick a precomputed query vector instead of name keyword
+    boosts, so organizations rank by how close their code and name are to
+    the cause. A cause from the choices keeps its NTEE prefix filter inside
+    the kNN clause, so every hit is in the cause; one that isn't a choice
+    is matched by its words alone. Q2-Q4 filter the nearest neighbours as
+    in build_es_query_from_survey; a city without a centroid joins its
+    matches to them, boosted. Without a cause or environment there is
+    nothing to rank by, and the query is build_es_query_from_survey's.
+    """
+    cause, environment, filters, should_clauses, sort = survey_clauses(answers)
+    if cause in CAUSE_FILTERS or not cause:
+        # An environment that isn't one of the choices doesn't move the vector
+        if environment not in ENVIRONMENT_KEYWORDS:
+            environment = ""
+        vector = survey_vectors().get((cause, environment))
     else:
-        es_query = {"query": {"match_all": {}}, "size": 50}
+        vector = free_text_vector(cause)
+    if vector is None:
+        return build_es_query_from_survey(answers)
+
+    # Q1: The vector alone ranks neighbouring groups above a cause's own
+    # organizations (see benchmarks/bench_cause_vectors.py)
+    cause_filter = CAUSE_FILTERS.get(cause)
+    if cause_filter:
+        filters.insert(0, cause_filter)
 
-    return es_query
+    knn = {
+        "field": CAUSE_VECTOR,
+        "query_vector": vector,
+        "k": KNN_SIZE,
+        "num_candidates": KNN_CANDIDATES,
+    }
+    if filters:
+        knn["filter"] = filters
+    query = {"knn": knn, "size": KNN_SIZE}
+    if should_clauses:
+        query["query"] = {
+            "bool": {
+                "filter": filters,
+                "should": should_clauses,
+                "minimum_should_match": 1,
+            }
+        }
+    if sort:
+        query["sort"] = sort
+    return query
+
+
+def warm_queries() -> List[Dict]:
+    """Representative survey queries (every cause x size, by state, city or not at all)
+
+    Used to warm a freshly built index before it starts serving traffic.
+    """
+    return [
+        build_es_query_from_survey(
+            [{"answer": cause}, {"answer": location}, {"answer": size}]
+        )
+        for cause in CAUSE_TO_NTEE_PREFIXES
+        for location in ("", "OH", "Columbus")
+        for size in ORG_SIZE_TO_ASSET_RANGE
+    ]
 
 
+def knn_warm_queries() -> List[Dict]:
+    """The kNN query of every cause, to load the vector index of a freshly
+    built index (see warm_queries)."""
+    return [build_knn_query_from_survey([{"answer": cause}]) for cause in CAUSE_FILTERS]
@@ -0,0 +1,215 @@
+"""Organization name autocomplete.
+
+Ingest fills the NAME_SUGGEST completion field from NAME and SORT_NAME
+(csv_to_json.name_suggest), weighted by the organization's assets or
+revenue on a log scale. Elasticsearch answers prefixes with a completion
+suggester over it (ElasticManager.suggest).
+
+SuggestIndex answers the same prefixes in-process, in tens of
+microseconds. Every normalized name is kept in one sorted byte string:
+a trie flattened into its leaves in order, so the names under a prefix
+are one contiguous run found with two bisects. Over that run sits a tree
+of precomputed "best SUGGEST_MAX_SIZE organizations" lists (one per
+LEAF_SIZE names, then per FANOUT children), so even a one-letter prefix
+only merges a few dozen short lists. LocalSearchManager uses it directly,
+and the app builds one from Elasticsearch when SUGGEST_TRIE=1.
+"""
+
+import heapq
+import re
+from array import array
+from bisect import bisect_left
+from functools import lru_cache
+from typing import Any, Iterable
+
+from schema import CITY, EIN, NAME, NAME_SUGGEST, SORT_NAME, STATE
+
+# Fields returned per suggestion, and what building a SuggestIndex reads
+SUGGEST_SOURCE = [EIN, NAME, CITY, STATE]
+SUGGEST_FIELDS = SUGGEST_SOURCE + [SORT_NAME, NAME_SUGGEST]
+SUGGEST_DEFAULT_SIZE = 10
+SUGGEST_MAX_SIZE = 20
+
+LEAF_SIZE = 64
+FANOUT = 16
+CACHED_PREFIXES = 4096
+# Elasticsearch caps completion weights at 2^31 - 1
+MAX_WEIGHT = (1 << 31) - 1
+
+# Close to the standard analyzer the completion field uses: lower case
+# words, punctuation between them dropped
+WORD = re.compile(r"\w+(?:'\w+)*")
+
+
+def normalize(text: str) -> str:
+    """Lower case words separated by single spaces ("St. Mary's" -> "st mary's")"""
+    return " ".join(WORD.findall(text.lower()))
+
+
+def suggest_size(value: Any) -> int:
+    """Validate a ?size= for suggestions; raises ValueError when out of range"""
+    if value is None or value == "":
+        return SUGGEST_DEFAULT_SIZE
+    try:
+        size = int(value)
+    except (TypeError, ValueError):
+        raise ValueError(f"Invalid size: {value!r}") from None
+    if not 1 <= size <= SUGGEST_MAX_SIZE:
+        raise ValueError(f"size must be between 1 and {SUGGEST_MAX_SIZE}")
+    return size
+
+
+def suggest_inputs(document: dict[str, Any]) -> tuple[list[str], int]:
+    """(names, weight) of a document's NAME_SUGGEST value.
+
+    Documents indexed without one suggest their NAME and SORT_NAME, weight 0.
+    """
+    value = document.get(NAME_SUGGEST)
+    weight = 0
+    if isinstance(value, dict):
+        weight = min(max(int(value.get("weight") or 0), 0), MAX_WEIGHT)
+        value = value.get("input")
+    if value is None:
+        value = [document.get(NAME), document.get(SORT_NAME)]
+    inputs = [value] if isinstance(value, str) else list(value)
+    return [name for name in inputs if isinstance(name, str)], weight
+
+
+class _Keys:
+    """The sorted keys as a read-only sequence over one bytes object"""
+
+    __slots__ = ("blob", "offsets")
+
+    def __init__(self, blob: bytes, offsets: array):
+        self.blob = blob
+        self.offsets = offsets
+
+    def __len__(self) -> int:
+        return len(self.offsets) - 1
+
+    def __getitem__(self, i: int) -> bytes:
+        return self.blob[self.offsets[i] : self.offsets[i + 1]]
+
+
+def _best(ranks: Iterable[int]) -> array:
+    """The first SUGGEST_MAX_SIZE distinct ranks of an ascending stream"""
+    best = array("Q")
+    for rank in ranks:
+        if not best or best[-1] != rank:
+            best.append(rank)
+            if len(best) == SUGGEST_MAX_SIZE:
+                break
+    return best
+
+
+class SuggestIndex:
+    def __init__(self):
+        """Empty index: add() documents, then build() it before top()"""
+        self._payloads = bytearray()
+        self._payload_offsets = array("I", [0])
+        self._weights = array("I")
+        self._pending: list[tuple[bytes, int]] = []
+        self._keys = _Keys(b"", array("I", [0]))
+        self._ranks = array("Q")
+        self._tops: list[list[array]] = []
+        self.top = lru_cache(maxsize=CACHED_PREFIXES)(self._top)
+
+    @classmethod
+    def from_documents(cls, documents: Iterable[dict[str, Any]]) -> "SuggestIndex":
+        index = cls()
+        for document in documents:
+            index.add(document)
+        return index.build()
+
+    def __len__(self) -> int:
+        return len(self._weights)
+
+    def add(self, document: dict[str, Any]):
+        """Queue one document's names; they become searchable on build()"""
+        inputs, weight = suggest_inputs(document)
+        keys = {normalize(name) for name in inputs} - {""}
+        if not keys:
+            return
+        doc = len(self._weights)
+        self._weights.append(weight)
+        payload = "\x1f".join(str(document.get(f) or "") for f in SUGGEST_SOURCE)
+        self._payloads += payload.encode("utf-8")
+        self._payload_offsets.append(len(self._payloads))
+        self._pending.extend((key.encode("utf-8"), doc) for key in keys)
+
+    def build(self) -> "SuggestIndex":
+        """Sort the queued names and precompute the best-of lists over them"""
+        pending = sorted(self._pending)
+        self._pending = []
+        offsets = array("I", [0])
+        for key, _ in pending:
+            offsets.append(offsets[-1] + len(key))
+        self._keys = _Keys(b"".join(key for key, _ in pending), offsets)
+        # Rank orders by weight (highest first), then by load order
+        weights = self._weights
+        self._ranks = array(
+            "Q", ((MAX_WEIGHT - weights[doc]) << 32 | doc for _, doc in pending)
+        )
+        del pending
+
+        ranks = self._ranks
+        level = [
+            _best(sorted(ranks[start : start + LEAF_SIZE]))
+            for start in range(0, len(ranks), LEAF_SIZE)
+        ]
+        self._tops = [level]
+        while len(level) > 1:
+            level = [
+                _best(heapq.merge(*level[start : start + FANOUT]))
+                for start in range(0, len(level), FANOUT)
+            ]
+            self._tops.append(level)
+        self.top.cache_clear()
+        return self
+
+    def _top(self, prefix: str, size: int = SUGGEST_DEFAULT_SIZE) -> list[dict]:
+        """The size highest-weighted organizations with a name starting with
+        prefix, as hits ({_id, _score, _source}) like Elasticsearch returns"""
+        key = normalize(prefix).encode("utf-8")
+        if not key:
+            return []
+        keys = self._keys
+        lo = bisect_left(keys, key)
+        # UTF-8 never contains 0xFF, so this sorts after every extension of key
+        hi = bisect_left(keys, key + b"\xff", lo)
+
+        runs = []
+        ranks = self._ranks
+        # Names in partial leaves at either end are ranked one by one...
+        first_leaf = -(-lo // LEAF_SIZE)
+        last_leaf = hi // LEAF_SIZE
+        if first_leaf >= last_leaf:
+            runs.append(sorted(ranks[lo:hi]))
+        else:
+            runs.append(sorted(ranks[lo : first_leaf * LEAF_SIZE]))
+            runs.append(sorted(ranks[last_leaf * LEAF_SIZE : hi]))
+            # ...and whole nodes use their best-of lists, as high up as they go
+            start, end = first_leaf, last_leaf
+            for level in self._tops:
+                if start >= end:
+                    break
+                while start < end and start % FANOUT:
+                    runs.append(level[start])
+                    start += 1
+                while start < end and end % FANOUT:
+                    end -= 1
+                    runs.append(level[end])
+                start //= FANOUT
+                end //= FANOUT
+
+        hits = []
+        for rank in _best(heapq.merge(*runs))[:size]:
+            doc = rank & 0xFFFFFFFF
+            payload = self._payloads[
+                self._payload_offsets[doc] : self._payload_offsets[doc + 1]
+            ]
+            source = dict(zip(SUGGEST_SOURCE, payload.decode("utf-8").split("\x1f")))
+            hits.append(
+                {"_id": source[EIN], "_score": self._weights[doc], "_source": source}
+            )
+        return hits
@@ -0,0 +1,303 @@
+"""Incremental sync of BMF releases into the nonprofits index, keyed by EIN.
+
+Every document is indexed with its EIN as the _id. A local SQLite manifest
+remembers a content hash per EIN from the last successful run, so a new
+monthly release only sends:
+
+  - organizations that are new or whose enriched document changed (index)
+  - organizations that disappeared from the release, or whose STATUS is
+    now revoked/terminated/merged (delete)
+
+Unchanged organizations are skipped entirely. The manifest is only updated
+for operations Elasticsearch acknowledged, so a failed run is simply
+retried by the next one.
+
+Deletions are scoped to the states present in the files being synced, so
+syncing eo_oh.csv alone never removes organizations loaded from eo_ca.csv.
+
+The manifest also keeps each EIN's facet keys (facets.document_facets) and
+exact per-index facet counts, updated by the difference every commit
+applies, so the global facets never need a full aggregation.
+
+    python backend/bulk_add.py --sync eo_oh.csv eo_ca.csv ...
+"""
+
+import hashlib
+import json
+import os
+import sqlite3
+import time
+from typing import Any, Iterable, Iterator
+
+from facets import FacetCounts, document_facets, encode_keys
+from schema import EIN, STATE, STATUS
+
+DATA_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "data")
+MANIFEST_PATH = os.path.join(DATA_DIR, "sync_manifest.sqlite")
+
+# BMF STATUS codes of organizations that should no longer be searchable:
+# terminated, revoked, merged, consolidated or fully liquidated
+REMOVED_STATUSES = frozenset({"12", "40", "41", "42", "43", "44"})
+
+
+def content_hash(document: dict[str, Any]) -> bytes:
+    """Return a stable 128-bit hash of a document's content"""
+    canonical = json.dumps(
+        document, sort_keys=True, separators=(",", ":"), ensure_ascii=False
+    )
+    return hashlib.blake2b(canonical.encode("utf-8"), digest_size=16).digest()
+
+
+class SyncManifest:
+    def __init__(self, path: str = MANIFEST_PATH):
+        """Per-index {EIN: content hash, facet keys} of what was last indexed"""
+        self.path = path
+        self.db = sqlite3.connect(path)
+        self.db.execute(
+            "CREATE TABLE IF NOT EXISTS manifest ("
+            " index_name TEXT NOT NULL, ein TEXT NOT NULL, state TEXT,"
+            " hash BLOB NOT NULL, facets TEXT,"
+            " PRIMARY KEY (index_name, ein)) WITHOUT ROWID"
+        )
+        columns = [row[1] for row in self.db.execute("PRAGMA table_info(manifest)")]
+        if "facets" not in columns:
+            # Manifests from before facets: the next sync fills the keys in
+            self.db.execute("ALTER TABLE manifest ADD COLUMN facets TEXT")
+        # Documents per facet key; facet "" holds the document total
+        self.db.execute(
+            "CREATE TABLE IF NOT EXISTS facet_counts ("
+            " index_name TEXT NOT NULL, facet TEXT NOT NULL, key TEXT NOT NULL,"
+            " count INTEGER NOT NULL,"
+            " PRIMARY KEY (index_name, facet, key)) WITHOUT ROWID"
+        )
+        self.db.commit()
+
+    def close(self):
+        self.db.close()
+
+    def count(self, index_name: str) -> int:
+        """Number of EINs recorded for an index"""
+        (count,) = self.db.execute(
+            "SELECT COUNT(*) FROM manifest WHERE index_name = ?", (index_name,)
+        ).fetchone()
+        return count
+
+    def indices(self) -> list[str]:
+        """Every index the manifest has entries for"""
+        rows = self.db.execute("SELECT DISTINCT index_name FROM manifest").fetchall()
+        return [index_name for (index_name,) in rows]
+
+    def clear(self, index_name: str):
+        """Forget everything recorded for an index (forces a full resend)"""
+        self.db.execute("DELETE FROM manifest WHERE index_name = ?", (index_name,))
+        self.db.execute("DELETE FROM facet_counts WHERE index_name = ?", (index_name,))
+        self.db.commit()
+
+    def begin(self):
+        """Start a run: fresh scratch tables for seen EINs and pending changes"""
+        self.db.execute("DROP TABLE IF EXISTS temp.seen")
+        self.db.execute("DROP TABLE IF EXISTS temp.pending")
+        self.db.execute("CREATE TEMP TABLE seen (ein TEXT PRIMARY KEY) WITHOUT ROWID")
+        # hash NULL marks a pending delete
+        self.db.execute(
+            "CREATE TEMP TABLE pending ("
+            " ein TEXT PRIMARY KEY, state TEXT, hash BLOB, facets TEXT) WITHOUT ROWID"
+        )
+
+    def lookup(self, index_name: str, ein: str) -> tuple[bytes, str | None] | None:
+        """(hash, facet keys) recorded for ein, None if it isn't recorded"""
+        return self.db.execute(
+            "SELECT hash, facets FROM manifest WHERE index_name = ? AND ein = ?",
+            (index_name, ein),
+        ).fetchone()
+
+    def mark_seen(self, ein: str) -> bool:
+        """Record ein as present in this release; False if already seen"""
+        cursor = self.db.execute("INSERT OR IGNORE INTO seen VALUES (?)", (ein,))
+        return cursor.rowcount == 1
+
+    def stage(
+        self,
+        ein: str,
+        state: str | None,
+        digest: bytes | None,
+        facets: str | None = None,
+    ):
+        """Queue a manifest change (digest None = delete) until the run commits"""
+        self.db.execute(
+            "INSERT OR REPLACE INTO pending VALUES (?, ?, ?, ?)",
+            (ein, state, digest, facets),
+        )
+
+    def unseen(self, index_name: str, states: Iterable[str]) -> Iterator[str]:
+        """EINs recorded in states for index_name that this release did not contain"""
+        states = sorted(states)
+        rows = self.db.execute(
+            "SELECT ein FROM manifest WHERE index_name = ?"
+            f" AND state IN ({','.join('?' * len(states))})"
+            " AND ein NOT IN (SELECT ein FROM seen)",
+            (index_name, *states),
+        ).fetchall()
+        return (ein for (ein,) in rows)
+
+    def commit(self, index_name: str, failed: Iterable[str] = ()):
+        """Apply the staged changes, except for EINs whose operation failed"""
+        self.db.executemany(
+            "DELETE FROM pending WHERE ein = ?", ((ein,) for ein in failed)
+        )
+        delta = self._facet_delta(index_name)
+        self.db.execute(
+            "INSERT OR REPLACE INTO manifest"
+            " SELECT ?, ein, state, hash, facets FROM pending WHERE hash IS NOT NULL",
+            (index_name,),
+        )
+        self.db.execute(
+            "DELETE FROM manifest WHERE index_name = ?"
+            " AND ein IN (SELECT ein FROM pending WHERE hash IS NULL)",
+            (index_name,),
+        )
+        self.db.execute("DELETE FROM pending")
+        if delta is None or not self._has_facet_counts(index_name):
+            self._recount_facets(index_name)
+        else:
+            self._apply_facet_delta(index_name, delta)
+        self.db.commit()
+
+    def _facet_delta(self, index_name: str) -> FacetCounts | None:
+        """Count changes the pending rows make; None if some old keys are unknown"""
+        delta = FacetCounts()
+        rows = self.db.execute(
+            "SELECT manifest.ein, manifest.facets, pending.hash, pending.facets"
+            " FROM pending LEFT JOIN manifest"
+            " ON manifest.index_name = ? AND manifest.ein = pending.ein",
+            (index_name,),
+        )
+        for recorded, old_keys, digest, new_keys in rows:
+            if recorded is not None:
+                if old_keys is None:
+                    return None
+                delta.add(json.loads(old_keys), -1)
+            if digest is not None:
+                delta.add(json.loads(new_keys))
+        return delta
+
+    def _has_facet_counts(self, index_name: str) -> bool:
+        return (
+            self.db.execute(
+                "SELECT 1 FROM facet_counts WHERE index_name = ? LIMIT 1",
+                (index_name,),
+            ).fetchone()
+            is not None
+        )
+
+    def _recount_facets(self, index_name: str):
+        """Rebuild the facet counts of an index from every recorded EIN"""
+        counts = FacetCounts()
+        rows = self.db.execute(
+            "SELECT facets FROM manifest WHERE index_name = ? AND facets IS NOT NULL",
+            (index_name,),
+        )
+        for (keys,) in rows:
+            counts.add(json.loads(keys))
+        self.db.execute("DELETE FROM facet_counts WHERE index_name = ?", (index_name,))
+        self._apply_facet_delta(index_name, counts)
+
+    def _apply_facet_delta(self, index_name: str, delta: FacetCounts):
+        changes = [("", "", delta.total)] + [
+            (facet, json.dumps(key), count)
+            for facet, counter in delta.counts.items()
+            for key, count in counter.items()
+            if count
+        ]
+        self.db.executemany(
+            "INSERT INTO facet_counts VALUES (?, ?, ?, ?)"
+            " ON CONFLICT (index_name, facet, key)"
+            " DO UPDATE SET count = count + excluded.count",
+            ((index_name, *change) for change in changes),
+        )
+        self.db.execute(
+            "DELETE FROM facet_counts"
+            " WHERE index_name = ? AND facet != '' AND count <= 0",
+            (index_name,),
+        )
+
+    def facet_counts(self, index_name: str) -> FacetCounts:
+        """Facet counts of everything recorded for an index"""
+        counts = FacetCounts()
+        rows = self.db.execute(
+            "SELECT facet, key, count FROM facet_counts WHERE index_name = ?",
+            (index_name,),
+        )
+        for facet, key, count in rows:
+            if facet:
+                counts.counts[facet][json.loads(key)] = count
+            else:
+                counts.total = count
+        return counts
+
+    def rollback(self):
+        """Drop the staged changes, leaving the manifest as it was"""
+        self.db.execute("DELETE FROM pending")
+        self.db.commit()
+
+
+def sync_documents(
+    es_manager: Any,
+    documents: Iterable[dict[str, Any]],
+    index_name: str,
+    manifest: SyncManifest,
+    **bulk_options: Any,
+) -> dict[str, Any]:
+    """Send only the inserts, updates and deletes between the manifest and documents.
+
+    documents must already be normalized (schema.normalize_document). Returns
+    the counts per operation, the bulk report and the total run time.
+    """
+    started = time.perf_counter()
+    counts = {"inserted": 0, "updated": 0, "deleted": 0, "unchanged": 0}
+    states: set[str] = set()
+    manifest.begin()
+
+    def changed_actions() -> Iterator[dict[str, Any]]:
+        for document in documents:
+            ein = document.get(EIN)
+            states.add(document.get(STATE))
+            if not ein or document.get(STATUS) in REMOVED_STATUSES:
+                continue
+            if not manifest.mark_seen(ein):
+                continue  # duplicate EIN across files: first occurrence wins
+            digest = content_hash(document)
+            keys = encode_keys(document_facets(document))
+            previous = manifest.lookup(index_name, ein)
+            if previous is not None and previous[0] == digest:
+                counts["unchanged"] += 1
+                if previous[1] is None:
+                    # Recorded before facet keys were: fill them in
+                    manifest.stage(ein, document.get(STATE), digest, keys)
+                continue
+            counts["inserted" if previous is None else "updated"] += 1
+            manifest.stage(ein, document.get(STATE), digest, keys)
+            yield {"_index": index_name, "_id": ein, "_source": document}
+
+        # Whatever the manifest has for these states that this release
+        # didn't contain is gone
+        for ein in manifest.unseen(index_name, states - {None}):
+            counts["deleted"] += 1
+            manifest.stage(ein, None, None)
+            yield {"_op_type": "delete", "_index": index_name, "_id": ein}
+
+    report = es_manager.bulk(changed_actions(), **bulk_options)
+    errors = [error for chunk in report["chunks"] for error in chunk["errors"]]
+    if any(error.get("_id") is None for error in errors):
+        # A whole request failed, so we can't tell which EINs made it;
+        # keep the old manifest and let the next run resend everything staged
+        manifest.rollback()
+    else:
+        manifest.commit(index_name, failed=(error["_id"] for error in errors))
+
+    return {
+        **counts,
+        "failed": report["failed"],
+        "seconds": round(time.perf_counter() - started, 3),
+        "bulk": report,
+    }
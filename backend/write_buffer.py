@@ -0,0 +1,390 @@
+"""Write-behind buffer for the single-document organization routes.
+
+Partner sync jobs send thousands of PUT/DELETE /organizations/<id> a
+minute, often for the same ids. With WRITE_BUFFER=1 those writes are
+queued here instead of each making its own index/delete request:
+
+  - writes to an id that is still queued replace the queued one, so only
+    the latest state of each organization is sent (coalescing)
+  - a background worker sends the queue through the manager's bulk()
+    once it holds max_batch writes or its oldest write is flush_interval
+    seconds old
+  - every write is first appended to a SQLite spool and only removed
+    once Elasticsearch acknowledged it, so writes queued when the process
+    dies are sent by the next one
+
+A caller that must read its own write passes refresh="wait_for": the
+batch holding it is sent at once with refresh=wait_for, and the call
+returns when it is searchable (or raises what made it fail).
+
+Writes the cluster rejected outright (4xx) are dropped and logged.
+Anything else (unavailable cluster, 429, 5xx) stays spooled and is
+retried with backoff.
+"""
+
+import fcntl
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+from concurrent.futures import Future
+from itertools import count
+from typing import Any, Callable
+
+import metrics
+
+logger = logging.getLogger(__name__)
+
+DATA_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "data")
+SPOOL_PATH = os.path.join(DATA_DIR, "write_spool.sqlite")
+
+# Backoff between retries of a batch the cluster couldn't take
+RETRY_INITIAL_BACKOFF = 0.5
+RETRY_MAX_BACKOFF = 30.0
+
+
+class WriteRejected(Exception):
+    """Elasticsearch refused a buffered write (e.g. a mapping error)"""
+
+    def __init__(self, doc_id: str, status: int, error: Any, **_: Any):
+        super().__init__(f"Write to {doc_id} rejected ({status}): {error}")
+        self.doc_id = doc_id
+        self.status = status
+        self.error = error
+
+
+class SpoolBusy(RuntimeError):
+    """Another live WriteSpool holds the spool file"""
+
+
+class WriteSpool:
+    def __init__(self, path: str = SPOOL_PATH):
+        """Durable log of writes not yet acknowledged, one row per id.
+
+        Holds an exclusive lock on path + ".lock" until closed or the
+        process exits, and raises SpoolBusy while another one holds it: two
+        buffers on one spool would replay and replace each other's writes.
+        """
+        self.path = path
+        self._lock_file = open(f"{path}.lock", "a")
+        try:
+            fcntl.flock(self._lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            self._lock_file.close()
+            raise SpoolBusy(f"Write spool {path} is in use") from None
+        self.db = sqlite3.connect(path, check_same_thread=False)
+        # WAL + NORMAL: a commit survives the process dying, and costs no fsync
+        self.db.execute("PRAGMA journal_mode=WAL")
+        self.db.execute("PRAGMA synchronous=NORMAL")
+        self.db.execute(
+            "CREATE TABLE IF NOT EXISTS spool ("
+            " seq INTEGER PRIMARY KEY, index_name TEXT NOT NULL,"
+            " doc_id TEXT NOT NULL, op TEXT NOT NULL, source TEXT)"
+        )
+        self.db.execute(
+            "CREATE UNIQUE INDEX IF NOT EXISTS spool_doc ON spool (index_name, doc_id)"
+        )
+        self.db.commit()
+        self._lock = threading.Lock()
+
+    def close(self):
+        with self._lock:
+            self.db.close()
+        self._lock_file.close()  # releases the spool
+
+    def pending(self) -> list[tuple[int, dict[str, Any]]]:
+        """Spooled (seq, action) pairs, oldest first"""
+        with self._lock:
+            rows = self.db.execute(
+                "SELECT seq, index_name, doc_id, op, source FROM spool ORDER BY seq"
+            ).fetchall()
+        return [
+            (seq, _action(op, index_name, doc_id, source and json.loads(source)))
+            for seq, index_name, doc_id, op, source in rows
+        ]
+
+    def put(self, action: dict[str, Any]) -> int:
+        """Spool an action in place of any earlier one for its id; return its seq"""
+        source = action.get("_source")
+        with self._lock:
+            cursor = self.db.execute(
+                "INSERT OR REPLACE INTO spool (index_name, doc_id, op, source)"
+                " VALUES (?, ?, ?, ?)",
+                (
+                    action["_index"],
+                    action["_id"],
+                    action["_op_type"],
+                    None if source is None else json.dumps(source, ensure_ascii=False),
+                ),
+            )
+            self.db.commit()
+            return cursor.lastrowid
+
+    def remove(self, seqs: list[int]):
+        """Forget acknowledged writes (rows replaced since keep their new seq)"""
+        with self._lock:
+            self.db.executemany("DELETE FROM spool WHERE seq = ?", [(s,) for s in seqs])
+            self.db.commit()
+
+
+def claim_spool(path: str = SPOOL_PATH) -> WriteSpool:
+    """The first of path, path.1, path.2, ... no live process holds, so
+    every worker of a multi-process server gets a spool of its own. A
+    restarted worker takes over the spool of the one it replaces."""
+    for n in count():
+        try:
+            return WriteSpool(f"{path}.{n}" if n else path)
+        except SpoolBusy:
+            continue
+
+
+def _action(
+    op_type: str, index_name: str, doc_id: str, source: dict[str, Any] | None
+) -> dict[str, Any]:
+    action = {"_op_type": op_type, "_index": index_name, "_id": doc_id}
+    if source is not None:
+        action["_source"] = source
+    return action
+
+
+class WriteBuffer:
+    def __init__(
+        self,
+        manager: Any,
+        spool: WriteSpool,
+        max_batch: int = 500,
+        flush_interval: float = 1.0,
+        on_flush: Callable[[], None] | None = None,
+    ):
+        """Coalescing write-behind queue in front of manager.bulk().
+
+        on_flush is called after every batch that changed the index (the
+        app invalidates its result cache there). Writes left in the spool
+        by an earlier process are queued right away.
+        """
+        self.manager = manager
+        self.spool = spool
+        self.max_batch = max_batch
+        self.flush_interval = flush_interval
+        self.on_flush = on_flush
+        # (index, id) -> (seq, action), in the order they were first queued
+        self._pending: dict[tuple[str, str], tuple[int, dict[str, Any]]] = {}
+        self._waiters: dict[int, list[Future]] = {}
+        self._oldest = 0.0
+        self._cond = threading.Condition()
+        self._stopping = False
+        self._sending = False
+        self.queued = 0
+        self.coalesced = 0
+        self.flushed = 0
+        self.batches = 0
+        self.rejected = 0
+        self.retries = 0
+        for seq, action in spool.pending():
+            self._pending[action["_index"], action["_id"]] = (seq, action)
+        if self._pending:
+            logger.info("Write buffer: %d spooled writes recovered", len(self._pending))
+            self._oldest = time.monotonic()
+        metrics.WRITE_BUFFER_PENDING.set(len(self._pending))
+        self._worker = threading.Thread(target=self._run, daemon=True)
+        self._worker.start()
+
+    def index(
+        self,
+        doc_id: str,
+        document: dict[str, Any],
+        index_name: str,
+        refresh: str | None = None,
+    ):
+        """Queue an add/update of a document by id"""
+        self._put(_action("index", index_name, str(doc_id), document), refresh)
+
+    def delete(self, doc_id: str, index_name: str, refresh: str | None = None):
+        """Queue a delete of a document by id"""
+        self._put(_action("delete", index_name, str(doc_id), None), refresh)
+
+    def _put(self, action: dict[str, Any], refresh: str | None):
+        key = action["_index"], action["_id"]
+        waiter = Future() if refresh == "wait_for" else None
+        with self._cond:
+            # Under the lock, so the spool and the queue agree on the latest
+            seq = self.spool.put(action)
+            previous = self._pending.pop(key, None)
+            if previous is not None:
+                # A waiter on the replaced write is answered by this one
+                moved = self._waiters.pop(previous[0], [])
+                if moved:
+                    self._waiters.setdefault(seq, []).extend(moved)
+                self.coalesced += 1
+                metrics.WRITE_BUFFER_WRITES.inc(result="coalesced")
+            else:
+                metrics.WRITE_BUFFER_WRITES.inc(result="queued")
+            if not self._pending:
+                self._oldest = time.monotonic()
+            self._pending[key] = (seq, action)
+            self.queued += 1
+            if waiter is not None:
+                self._waiters.setdefault(seq, []).append(waiter)
+            metrics.WRITE_BUFFER_PENDING.set(len(self._pending))
+            if waiter is not None or len(self._pending) >= self.max_batch:
+                self._cond.notify()
+        if waiter is not None:
+            waiter.result()
+
+    def flush(self, timeout: float | None = None) -> bool:
+        """Block until every write queued so far was sent; False on timeout"""
+        deadline = None if timeout is None else time.monotonic() + timeout
+        with self._cond:
+            self._cond.notify()
+            while self._pending or self._sending:
+                remaining = None if deadline is None else deadline - time.monotonic()
+                if remaining is not None and remaining <= 0:
+                    return False
+                self._cond.wait(remaining)
+        return True
+
+    def close(self, timeout: float | None = 10.0):
+        """Send what is queued (up to timeout) and stop the worker; anything
+        left stays in the spool for the next process"""
+        self.flush(timeout)
+        with self._cond:
+            self._stopping = True
+            self._cond.notify_all()
+        self._worker.join(timeout)
+        self.spool.close()
+
+    def stats(self) -> dict[str, Any]:
+        """Queue depth and counters"""
+        with self._cond:
+            return {
+                "pending": len(self._pending),
+                "max_batch": self.max_batch,
+                "flush_interval": self.flush_interval,
+                "queued": self.queued,
+                "coalesced": self.coalesced,
+                "flushed": self.flushed,
+                "batches": self.batches,
+                "rejected": self.rejected,
+                "retries": self.retries,
+            }
+
+    def _due(self) -> bool:
+        if not self._pending:
+            return False
+        return (
+            len(self._pending) >= self.max_batch
+            or bool(self._waiters)
+            or time.monotonic() - self._oldest >= self.flush_interval
+        )
+
+    def _run(self):
+        attempt = 0
+        while True:
+            with self._cond:
+                while not self._stopping and not self._due():
+                    wait = None
+                    if self._pending:
+                        wait = self._oldest + self.flush_interval - time.monotonic()
+                    self._cond.wait(wait)
+                if self._stopping:
+                    return
+                keys = list(self._pending)[: self.max_batch]
+                batch = [self._pending.pop(key) for key in keys]
+                waiters = {seq: self._waiters.pop(seq, []) for seq, _ in batch}
+                if self._pending:
+                    self._oldest = time.monotonic()
+                self._sending = True
+            retry = self._send(batch, waiters)
+            with self._cond:
+                for seq, action in retry:
+                    # Unless a newer write for the id was queued meanwhile
+                    key = action["_index"], action["_id"]
+                    self._pending.setdefault(key, (seq, action))
+                self._sending = False
+                metrics.WRITE_BUFFER_PENDING.set(len(self._pending))
+                self._cond.notify_all()
+            if retry:
+                self.retries += 1
+                time.sleep(min(RETRY_MAX_BACKOFF, RETRY_INITIAL_BACKOFF * 2**attempt))
+                attempt += 1
+            else:
+                attempt = 0
+
+    def _send(
+        self,
+        batch: list[tuple[int, dict[str, Any]]],
+        waiters: dict[int, list[Future]],
+    ) -> list[tuple[int, dict[str, Any]]]:
+        """Send one batch; return the writes to retry"""
+        refresh = "wait_for" if any(waiters.values()) else None
+        started = time.perf_counter()
+        try:
+            report = self.manager.bulk(
+                (action for _, action in batch),
+                chunk_size=len(batch),
+                refresh=refresh,
+            )
+        except Exception as e:
+            logger.warning("Write buffer: batch of %d failed: %s", len(batch), e)
+            _fail(waiters.values(), e)
+            return batch
+        metrics.WRITE_BUFFER_FLUSH_SECONDS.observe(time.perf_counter() - started)
+
+        # Keyed like _pending: the same id may be queued for two indices
+        errors = [error for chunk in report["chunks"] for error in chunk["errors"]]
+        by_key = {
+            (error["_index"], error["_id"]): error
+            for error in errors
+            if error.get("_id")
+        }
+        for error in errors:
+            if not error.get("_id"):
+                # A whole request failed: nothing tells which writes landed.
+                # They are all idempotent, so the batch can be sent again
+                by_key = {(a["_index"], a["_id"]): error for _, a in batch}
+                break
+
+        done, retry, sent, failed = [], [], [], []
+        for seq, action in batch:
+            error = by_key.get((action["_index"], action["_id"]))
+            if error is None:
+                sent.extend(waiters[seq])
+                done.append(seq)
+                continue
+            failed.append((waiters[seq], WriteRejected(action["_id"], **error)))
+            if _retryable(error["status"]):
+                retry.append((seq, action))
+            else:
+                logger.error(
+                    "Write buffer: %s %s rejected (%s): %s",
+                    action["_op_type"], action["_id"], error["status"], error["error"],
+                )  # fmt: skip
+                self.rejected += 1
+                done.append(seq)
+        self.spool.remove(done)
+        self.flushed += len(done)
+        self.batches += 1
+        # Before answering the wait_for writers, so their next read misses
+        # the result cache (and sees this batch in stats())
+        if self.on_flush is not None:
+            try:
+                self.on_flush()
+            except Exception:
+                logger.exception("Write buffer: on_flush failed")
+        for waiter in sent:
+            waiter.set_result(None)
+        for waiter_list, error in failed:
+            _fail([waiter_list], error)
+        return retry
+
+
+def _retryable(status: int | None) -> bool:
+    return status is None or status == 429 or status >= 500
+
+
+def _fail(waiter_lists, error: Exception):
+    for waiters in waiter_lists:
+        for waiter in waiters:
+            waiter.set_exception(error)
@@ -0,0 +1,174 @@
+"""kNN over CAUSE_VECTOR vs NTEE prefix filters: agreement and latency.
+
+    python benchmarks/bench_cause_vectors.py --rows 100000
+    python benchmarks/bench_cause_vectors.py --rows 100000 --live
+
+Enriches a synthetic BMF of --rows rows (common.synthetic_csv) and, for
+every survey cause, compares the exact KNN_SIZE nearest CAUSE_VECTORs with
+the organizations build_es_query_from_survey's prefix filter matches:
+
+  matches    organizations the prefix filter matches
+  unfiltered share of the nearest vectors, without the prefix filter, that
+             the filter matches too (the kNN query keeps the filter)
+  no code    those nearest without an NTEE code, which the filter can't match
+  recall     share of min(KNN_SIZE, matches) the filtered kNN query returns
+
+and times building both queries over every answer combination.
+
+With --live it loads the rows into a throwaway index at ELASTIC_HOST and
+also reports, per cause, the recall of Elasticsearch's approximate kNN
+against the exact neighbours, and p50/p99 latency of both queries over
+every answer combination (request cache off).
+"""
+
+import argparse
+import os
+import statistics
+import time
+from os import getenv
+
+import numpy as np
+from bench_query_builder import answer_sets
+from common import synthetic_csv, timed
+from csv_to_json import iter_documents
+from schema import CAUSE_VECTOR, CAUSE_VECTOR_DIMS, EIN, NTEE_CD, normalize_document
+from search_builder import (
+    CAUSE_TO_NTEE_PREFIXES,
+    KNN_SIZE,
+    build_es_query_from_survey,
+    build_knn_query_from_survey,
+    survey_vectors,
+)
+
+BENCH_INDEX = "nonprofits-bench-vectors"
+
+
+def exact_neighbours(
+    matrix: np.ndarray, vector: list[float], k: int, rows: np.ndarray | None = None
+) -> np.ndarray:
+    """Rows of the k vectors with the highest cosine similarity, best first,
+    among rows when given (a kNN filter)"""
+    scores = matrix @ np.asarray(vector, dtype=np.float32)
+    if rows is None:
+        rows = np.arange(len(scores))
+    if not len(rows):
+        return rows
+    scores = scores[rows]
+    k = min(k, len(rows))
+    best = np.argpartition(-scores, k - 1)[:k]
+    return rows[best[np.argsort(-scores[best])]]
+
+
+def cause_rows(documents: list[dict]) -> dict[str, np.ndarray]:
+    """Rows each cause's prefix filter matches"""
+    codes = [str(doc.get(NTEE_CD) or "").upper() for doc in documents]
+    return {
+        cause: np.array(
+            [i for i, code in enumerate(codes) if code.startswith(tuple(prefixes))],
+            dtype=np.int64,
+        )
+        for cause, prefixes in CAUSE_TO_NTEE_PREFIXES.items()
+    }
+
+
+def agreement(documents: list[dict], matrix: np.ndarray) -> None:
+    codes = [doc.get(NTEE_CD) for doc in documents]
+    print(
+        f"{'cause':>40} {'matches':>8} {'unfiltered':>10} {'no code':>8}"
+        f" {'recall':>7} {'ms':>6}"
+    )
+    for cause, rows in cause_rows(documents).items():
+        vector = survey_vectors()[cause, ""]
+        nearest = exact_neighbours(matrix, vector, KNN_SIZE)
+        matches = set(rows.tolist())
+        unfiltered = sum(1 for i in nearest if i in matches) / len(nearest)
+        no_code = sum(1 for i in nearest if not codes[i])
+        hits, seconds = timed(exact_neighbours, matrix, vector, KNN_SIZE, rows)
+        recall = len(hits) / min(KNN_SIZE, len(rows)) if len(rows) else 1.0
+        print(
+            f"{cause[:40]:>40} {len(rows):>8,} {unfiltered:>10.0%} {no_code:>8}"
+            f" {recall:>7.0%} {seconds * 1000:>6.1f}"
+        )
+
+
+def build_latency(surveys: list[list[dict]], rounds: int) -> None:
+    for builder in (build_es_query_from_survey, build_knn_query_from_survey):
+        _, seconds = timed(
+            lambda: [builder(answers) for _ in range(rounds) for answers in surveys]
+        )
+        per_query = seconds / (len(surveys) * rounds)
+        print(f"{builder.__name__}: {per_query * 1e6:.2f} us/query")
+
+
+def live(documents: list[dict], matrix: np.ndarray, surveys: list[list[dict]]):
+    from es_manager import ElasticManager
+    from mappings import NONPROFITS_MAPPINGS, NONPROFITS_SETTINGS
+
+    es_manager = ElasticManager(
+        host=getenv("ELASTIC_HOST", "http://localhost:9200"),
+        credentials=(
+            getenv("ELASTIC_USERNAME", "elastic"),
+            getenv("ELASTIC_PASSWORD", "password"),
+        ),
+    )
+    es_manager.delete_index(BENCH_INDEX)
+    es_manager.create_index(BENCH_INDEX, NONPROFITS_MAPPINGS, NONPROFITS_SETTINGS)
+    try:
+        es_manager.bulk_add(documents, BENCH_INDEX, id_field=EIN)
+        es_manager.es.indices.refresh(index=BENCH_INDEX)
+
+        print(f"\n{'cause':>40} {'kNN recall@' + str(KNN_SIZE):>14}")
+        for cause, rows in cause_rows(documents).items():
+            vector = survey_vectors()[cause, ""]
+            nearest = exact_neighbours(matrix, vector, KNN_SIZE, rows)
+            exact = {documents[i][EIN] for i in nearest}
+            query = build_knn_query_from_survey([{"answer": cause}])
+            hits = es_manager.es.search(
+                index=BENCH_INDEX, body=query, request_cache=False
+            )["hits"]["hits"]
+            recall = len(exact & {hit["_id"] for hit in hits}) / max(len(exact), 1)
+            print(f"{cause[:40]:>40} {recall:>14.0%}")
+
+        print(f"\n{'query':>28} {'p50 ms':>8} {'p99 ms':>8}")
+        for builder in (build_es_query_from_survey, build_knn_query_from_survey):
+            latencies = []
+            for answers in surveys:
+                body = builder(answers)
+                started = time.perf_counter()
+                es_manager.es.search(index=BENCH_INDEX, body=body, request_cache=False)
+                latencies.append((time.perf_counter() - started) * 1000)
+            p99 = statistics.quantiles(latencies, n=100)[98]
+            print(
+                f"{builder.__name__:>28}"
+                f" {statistics.median(latencies):>8.2f} {p99:>8.2f}"
+            )
+    finally:
+        es_manager.delete_index(BENCH_INDEX)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--rows", type=int, default=100_000)
+    parser.add_argument("--rounds", type=int, default=5)
+    parser.add_argument("--live", action="store_true", help="use ELASTIC_HOST")
+    args = parser.parse_args()
+
+    path = synthetic_csv(args.rows)
+    try:
+        documents, seconds = timed(
+            lambda: list(map(normalize_document, iter_documents([path])))
+        )
+    finally:
+        os.remove(path)
+    print(f"Enriched {len(documents):,} rows in {seconds:.2f}s")
+    # Organizations without a vector never match a kNN query
+    matrix = np.array(
+        [doc.get(CAUSE_VECTOR) or [0.0] * CAUSE_VECTOR_DIMS for doc in documents],
+        dtype=np.float32,
+    )
+
+    agreement(documents, matrix)
+    surveys = answer_sets()
+    build_latency(surveys, args.rounds)
+    if args.live:
+        live(documents, matrix, surveys)
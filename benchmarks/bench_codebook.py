@@ -0,0 +1,60 @@
+"""Load time, RSS and lookup speed: ntee_codes.json vs the compiled codebook.
+
+    python benchmarks/bench_codebook.py
+
+Each loader runs in a fresh interpreter so RSS growth is measured cleanly.
+"""
+
+import json
+import subprocess
+import sys
+
+from common import ROOT
+from ntee_codebook import compile_codebook
+
+LOADERS = {
+    "json.load": "import json; book = json.load(open(ntee_path, encoding='utf-8'))",
+    "mmap codebook": "from ntee_codebook import NTEECodebook; book = NTEECodebook.load()",
+}
+
+CHILD = """
+import os, sys, time
+sys.path.insert(0, os.path.join({root!r}, "data"))
+from ntee_codebook import ntee_path
+
+def rss_kb():
+    with open("/proc/self/status") as f:
+        for line in f:
+            if line.startswith("VmRSS:"):
+                return int(line.split()[1])
+
+before = rss_kb()
+started = time.perf_counter()
+{loader}
+load_ms = (time.perf_counter() - started) * 1000
+rss = rss_kb() - before
+
+codes = sorted(json.load(open(ntee_path, encoding="utf-8")))
+get = book.get if isinstance(book, dict) else book.get_entry
+started = time.perf_counter()
+for _ in range(100):
+    for code in codes:
+        get(code)
+lookup_us = (time.perf_counter() - started) * 1e6 / (100 * len(codes))
+print(json.dumps({{"load_ms": load_ms, "rss_kb": rss, "lookup_us": lookup_us}}))
+"""
+
+
+if __name__ == "__main__":
+    compile_codebook()
+    print(f"{'loader':>14} {'load ms':>9} {'RSS +KB':>9} {'lookup us':>10}")
+    for label, loader in LOADERS.items():
+        code = "import json\n" + CHILD.format(root=ROOT, loader=loader)
+        output = subprocess.run(
+            [sys.executable, "-c", code], capture_output=True, text=True, check=True
+        ).stdout
+        result = json.loads(output)
+        print(
+            f"{label:>14} {result['load_ms']:>9.2f} {result['rss_kb']:>9} "
+            f"{result['lookup_us']:>10.2f}"
+        )
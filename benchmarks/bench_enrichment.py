@@ -0,0 +1,76 @@
+"""Row-by-row vs columnar enrichment throughput on a scaled-up eo_oh_1k.csv.
+
+    python benchmarks/bench_enrichment.py --rows 1000000
+
+Reports the codebook lookups on their own (lookup_codes and
+lookup_code_columns, on rows already parsed) and the full CSV -> enriched
+document stream that bulk_add.py consumes. Rows are streamed a chunk at a
+time, so memory stays flat at any --rows.
+"""
+
+import argparse
+import os
+import time
+from collections import deque
+
+from common import scale_csv, timed
+from csv_to_json import (
+    ENRICH_COLUMNS,
+    NTEEManager,
+    fields,
+    iter_documents,
+    lookup_code_columns,
+    lookup_codes,
+    ntee_path,
+    read_row_chunks,
+)
+
+
+def drain(documents) -> None:
+    deque(documents, maxlen=0)
+
+
+def lookups(path: str, ntee: NTEEManager, columnar: bool) -> float:
+    """Seconds spent in the codebook lookups alone, excluding CSV parsing"""
+    positions = [fields.index(field) for field in ENRICH_COLUMNS]
+    seconds = 0.0
+    for chunk in read_row_chunks([path]):
+        if columnar:
+            columns = {
+                field: [row[i] for row in chunk]
+                for field, i in zip(ENRICH_COLUMNS, positions)
+            }
+            started = time.perf_counter()
+            lookup_code_columns(columns, ntee)
+        else:
+            rows = [dict(zip(fields, row)) for row in chunk]
+            started = time.perf_counter()
+            for row in rows:
+                lookup_codes(row, ntee)
+        seconds += time.perf_counter() - started
+    return seconds
+
+
+def report(label: str, rows: int, seconds: float) -> None:
+    print(f"{label:>28}: {rows / seconds:>12,.0f} rows/s ({seconds:.2f}s)")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--rows", type=int, default=1_000_000)
+    args = parser.parse_args()
+
+    path = scale_csv(args.rows)
+    ntee = NTEEManager(ntee_path)
+    try:
+        report("code lookups, row-by-row", args.rows, lookups(path, ntee, False))
+        report("code lookups, columnar", args.rows, lookups(path, ntee, True))
+
+        for label, columnar in (
+            ("csv -> docs, row-by-row", False),
+            ("csv -> docs, columnar", True),
+        ):
+            _, seconds = timed(drain, iter_documents([path], ntee, columnar=columnar))
+            report(label, args.rows, seconds)
+    finally:
+        os.remove(path)
@@ -0,0 +1,70 @@
+"""Survey query latency of the in-process search backend at BMF scale.
+
+    python benchmarks/bench_local_search.py --rows 1900000
+
+Loads a synthetic BMF of --rows rows (eo_oh_1k.csv repeated with fresh
+EINs, so every filter matches a large share of the index) into a
+LocalSearchManager, warms it with search_builder.warm_queries() and then
+times every survey answer combination. Prints load time, peak memory and
+p50/p99 latency.
+"""
+
+import argparse
+import gc
+import os
+import resource
+import statistics
+import time
+
+from common import scale_csv, timed  # noqa: I001 (puts backend/ and data/ on sys.path)
+from bench_query_builder import answer_sets
+from bulk_add import load_documents
+from local_search import LocalSearchManager
+from schema import EIN, normalize_document
+from search_builder import QUERY_FIELDS, build_es_query_from_survey, warm_queries
+
+INDEX_NAME = "nonprofits-bench"
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--rows", type=int, default=200_000)
+    parser.add_argument("--rounds", type=int, default=3)
+    args = parser.parse_args()
+
+    path = scale_csv(args.rows)
+    try:
+        manager = LocalSearchManager()
+        manager.create_index(INDEX_NAME)
+        report, seconds = timed(
+            manager.bulk_add,
+            map(normalize_document, load_documents([path])),
+            INDEX_NAME,
+            id_field=EIN,
+        )
+    finally:
+        os.remove(path)
+    peak_mb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+    print(
+        f"loaded {report['success']:,} rows in {seconds:.1f}s "
+        f"({report['success'] / seconds:,.0f} rows/s), peak RSS {peak_mb:,.0f} MB"
+    )
+
+    _, seconds = timed(manager.index_fields, INDEX_NAME, QUERY_FIELDS)
+    print(f"indexed {len(QUERY_FIELDS)} survey fields in {seconds:.1f}s")
+    warm, seconds = timed(manager.warm, INDEX_NAME, warm_queries(), runs=1)
+    print(f"warm-up ({warm['queries']} queries): {seconds:.1f}s")
+    gc.collect()
+    gc.freeze()  # as LocalSearchManager.from_env does
+
+    queries = [build_es_query_from_survey(answers) for answers in answer_sets()]
+    latencies = []
+    for _ in range(args.rounds):
+        for query in queries:
+            started = time.perf_counter()
+            manager.search(query, INDEX_NAME)
+            latencies.append((time.perf_counter() - started) * 1000)
+    cuts = statistics.quantiles(latencies, n=100)
+    print(
+        f"{len(latencies)} survey queries: p50 {cuts[49]:.2f} ms, "
+        f"p99 {cuts[98]:.2f} ms, max {max(latencies):.2f} ms"
+    )
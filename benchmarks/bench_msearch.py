@@ -0,0 +1,66 @@
+"""N sequential survey searches vs one _msearch round-trip.
+
+    python benchmarks/bench_msearch.py --batch 5 10 25 50 --runs 20
+
+Uses the Elasticsearch at ELASTIC_HOST with --live, otherwise an in-process
+stand-in (benchmarks/stand_in_es.py) with --latency-ms per request, which
+models the network round-trip the batch endpoint saves.
+"""
+
+import argparse
+import random
+import statistics
+import threading
+from os import getenv
+
+from bench_query_builder import answer_sets
+from common import timed
+from es_manager import ElasticManager
+from search_builder import build_es_query_from_survey
+from stand_in_es import serve
+
+
+def sequential(es_manager, queries: list[dict], index_name: str) -> None:
+    for query in queries:
+        es_manager.search(query, index_name)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--batch", type=int, nargs="+", default=[5, 10, 25, 50])
+    parser.add_argument("--runs", type=int, default=20)
+    parser.add_argument("--index", default=getenv("ELASTIC_INDEX", "nonprofits"))
+    parser.add_argument("--live", action="store_true", help="use ELASTIC_HOST")
+    parser.add_argument("--latency-ms", type=float, default=2.0)
+    args = parser.parse_args()
+
+    if args.live:
+        host = getenv("ELASTIC_HOST", "http://localhost:9200")
+    else:
+        server = serve(0, args.latency_ms)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        host = f"http://127.0.0.1:{server.server_address[1]}"
+    es_manager = ElasticManager(
+        host=host,
+        credentials=(
+            getenv("ELASTIC_USERNAME", "elastic"),
+            getenv("ELASTIC_PASSWORD", "password"),
+        ),
+    )
+
+    surveys = answer_sets()
+    print(f"{'batch':>6} {'sequential ms':>14} {'msearch ms':>11} {'speedup':>8}")
+    for batch in args.batch:
+        seq_times, multi_times = [], []
+        for _ in range(args.runs):
+            queries = [
+                build_es_query_from_survey(answers)
+                for answers in random.sample(surveys, batch)
+            ]
+            seq_times.append(timed(sequential, es_manager, queries, args.index)[1])
+            multi_times.append(timed(es_manager.msearch, queries, args.index)[1])
+        seq_ms = statistics.median(seq_times) * 1000
+        multi_ms = statistics.median(multi_times) * 1000
+        print(
+            f"{batch:>6} {seq_ms:>14.2f} {multi_ms:>11.2f} {seq_ms / multi_ms:>7.1f}x"
+        )
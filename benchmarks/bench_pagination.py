@@ -0,0 +1,101 @@
+"""from/size vs point-in-time + search_after latency at pages 1, 100 and 1000.
+
+    python benchmarks/bench_pagination.py --index nonprofits --size 10
+
+Needs a running Elasticsearch (ELASTIC_HOST etc.) and an index holding at
+least size * 1000 documents; --load ROWS first fills a scratch index with a
+synthetic BMF of that many rows. Also times a full iter_all_documents scan.
+"""
+
+import argparse
+import os
+import statistics
+import time
+from os import getenv
+
+from common import scale_csv, timed  # noqa: I001 (puts backend/ and data/ on sys.path)
+from bulk_add import load_documents
+from es_manager import ElasticManager, decode_cursor
+from mappings import NONPROFITS_MAPPINGS, NONPROFITS_SETTINGS
+from schema import normalize_document
+
+PAGES = [1, 100, 1000]
+
+
+def from_size_latency(es_manager, index_name: str, page: int, size: int) -> float:
+    """Milliseconds to fetch one page with from/size."""
+    body = {"query": {"match_all": {}}, "from": (page - 1) * size, "size": size}
+    started = time.perf_counter()
+    es_manager.es.search(index=index_name, body=body, request_cache=False)
+    return (time.perf_counter() - started) * 1000
+
+
+def cursor_latency(es_manager, index_name: str, page: int, size: int) -> float:
+    """Milliseconds to fetch the given page when walking forward with cursors."""
+    cursor = None
+    for _ in range(page - 1):
+        cursor = es_manager.search_page(
+            {"query": {"match_all": {}}}, index_name, cursor, size
+        )["cursor"]
+    started = time.perf_counter()
+    page_result = es_manager.search_page(
+        {"query": {"match_all": {}}}, index_name, cursor, size
+    )
+    elapsed = (time.perf_counter() - started) * 1000
+    if page_result["cursor"]:
+        # Walk abandoned before the last page: release the point-in-time
+        es_manager.es.close_point_in_time(id=decode_cursor(page_result["cursor"])[0])
+    return elapsed
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--index", default="bench-pagination")
+    parser.add_argument("--size", type=int, default=10)
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--load", type=int, default=0, help="synthetic rows to load")
+    args = parser.parse_args()
+
+    es_manager = ElasticManager(
+        host=getenv("ELASTIC_HOST", "http://localhost:9200"),
+        credentials=(
+            getenv("ELASTIC_USERNAME", "elastic"),
+            getenv("ELASTIC_PASSWORD", "password"),
+        ),
+    )
+    if args.load:
+        path = scale_csv(args.load)
+        try:
+            es_manager.delete_index(args.index)
+            es_manager.create_index(
+                args.index, NONPROFITS_MAPPINGS, NONPROFITS_SETTINGS
+            )
+            es_manager.bulk_add(
+                map(normalize_document, load_documents([path])), args.index
+            )
+            es_manager.es.indices.refresh(index=args.index)
+        finally:
+            os.remove(path)
+
+    print(f"{'page':>6} {'from/size ms':>14} {'cursor ms':>11}")
+    for page in PAGES:
+        if (page - 1) * args.size + args.size > 10000:
+            from_size = "over max_result_window"
+        else:
+            from_size = statistics.median(
+                from_size_latency(es_manager, args.index, page, args.size)
+                for _ in range(args.runs)
+            )
+            from_size = f"{from_size:.2f}"
+        cursor = statistics.median(
+            cursor_latency(es_manager, args.index, page, args.size)
+            for _ in range(args.runs)
+        )
+        print(f"{page:>6} {from_size:>14} {cursor:>11.2f}")
+
+    count, seconds = timed(
+        lambda: sum(1 for _ in es_manager.iter_all_documents(args.index))
+    )
+    print(
+        f"iter_all_documents: {count} docs in {seconds:.2f}s ({count / seconds:,.0f} docs/s)"
+    )
@@ -0,0 +1,50 @@
+"""Queries per second for build_es_query_from_survey over every answer combination.
+
+python benchmarks/bench_query_builder.py --rounds 20
+"""
+
+import argparse
+import itertools
+
+from common import timed
+from search_builder import (
+    CAUSE_TO_NTEE_GROUPS,
+    ENVIRONMENT_KEYWORDS,
+    ORG_SIZE_TO_ASSET_RANGE,
+    build_es_query_from_survey,
+)
+
+LOCATIONS = ["", "OH", "Columbus", "Cincinnati"]
+AGES = ["", "Newer (Under 5 years)", "Established (10+ years)"]
+
+
+def answer_sets() -> list[list[dict]]:
+    """Every survey combination, including unanswered questions."""
+    combinations = itertools.product(
+        [""] + list(CAUSE_TO_NTEE_GROUPS),
+        LOCATIONS,
+        [""] + list(ORG_SIZE_TO_ASSET_RANGE),
+        AGES,
+        [""] + list(ENVIRONMENT_KEYWORDS),
+    )
+    return [[{"answer": answer} for answer in combo] for combo in combinations]
+
+
+def build_all(surveys: list[list[dict]], rounds: int) -> None:
+    for _ in range(rounds):
+        for answers in surveys:
+            build_es_query_from_survey(answers)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--rounds", type=int, default=20)
+    args = parser.parse_args()
+
+    surveys = answer_sets()
+    _, seconds = timed(build_all, surveys, args.rounds)
+    queries = len(surveys) * args.rounds
+    print(
+        f"{queries} queries in {seconds:.2f}s: {queries / seconds:,.0f} queries/s "
+        f"({seconds / queries * 1e6:.2f} us/query)"
+    )
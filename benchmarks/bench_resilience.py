@@ -0,0 +1,145 @@
+"""App startup time and behaviour while Elasticsearch is down or slow.
+
+    python benchmarks/bench_resilience.py --requests 50
+
+Runs /api/survey through the Flask app's test client against an in-process
+stand-in (benchmarks/stand_in_es.py) and reports, per phase, the status
+codes returned and the latency:
+
+  startup   importing app.py in a fresh interpreter with nothing listening
+            at ELASTIC_HOST (it must not wait on the cluster)
+  healthy   the stand-in answering; fills the result cache
+  down      the stand-in dropping every request: the first calls fail at
+            the cluster until the circuit opens, the rest fail fast
+  stale     the same outage for answer sets seen while healthy: served
+            from expired result cache entries
+  slow      the stand-in answering slower than ELASTIC_SEARCH_TIMEOUT
+  recovery  the stand-in back: seconds until /health reports ok again
+  failover  two nodes in ELASTIC_HOST, one of them down
+
+The result cache TTL is 0, so every request reaches the manager and only
+the stale phase is answered from the cache.
+"""
+
+import argparse
+import logging
+import os
+import statistics
+import subprocess
+import sys
+import threading
+import time
+from collections import Counter
+
+from bench_query_builder import answer_sets
+from common import ROOT
+from load_test import free_port
+from stand_in_es import StandInHandler, serve
+
+BREAKER_RESET = 1.0
+SEARCH_TIMEOUT = 0.2
+
+
+def report(phase: str, statuses: Counter, latencies: list[float]):
+    """One line per phase: status counts and p50/max latency in ms"""
+    codes = " ".join(f"{code}x{count}" for code, count in sorted(statuses.items()))
+    print(
+        f"{phase:>10}  {codes:<22} p50 {statistics.median(latencies):>8.2f} ms"
+        f"  max {max(latencies):>8.2f} ms"
+    )
+
+
+def run_phase(client, phase: str, surveys: list, stale: bool = False) -> Counter:
+    statuses: Counter = Counter()
+    latencies = []
+    for answers in surveys:
+        started = time.perf_counter()
+        response = client.post("/api/survey", json=answers)
+        latencies.append((time.perf_counter() - started) * 1000)
+        statuses[response.status_code] += 1
+        if stale and response.status_code == 200:
+            assert "Warning" in response.headers, "stale result not flagged"
+    report(phase, statuses, latencies)
+    return statuses
+
+
+def bench_startup(host: str) -> float:
+    """Seconds to import app.py with host unreachable"""
+    code = "import time; t = time.perf_counter(); import app; "
+    code += "print(time.perf_counter() - t)"
+    env = {**os.environ, "ELASTIC_HOST": host}
+    output = subprocess.run(
+        [sys.executable, "-c", code],
+        cwd=os.path.join(ROOT, "backend"), env=env,
+        capture_output=True, text=True, check=True,
+    ).stdout  # fmt: skip
+    return float(output.strip().splitlines()[-1])
+
+
+def bench_failover(dead_host: str, live_host: str, surveys: list):
+    from es_manager import ElasticManager
+    from search_builder import build_es_query_from_survey
+
+    manager = ElasticManager(host=f"{dead_host},{live_host}")
+    statuses: Counter = Counter()
+    latencies = []
+    for answers in surveys:
+        started = time.perf_counter()
+        try:
+            manager.search(build_es_query_from_survey(answers), "nonprofits")
+            statuses[200] += 1
+        except Exception as e:
+            statuses[type(e).__name__] += 1
+        latencies.append((time.perf_counter() - started) * 1000)
+    report("failover", statuses, latencies)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--requests", type=int, default=50)
+    parser.add_argument("--latency-ms", type=float, default=2.0)
+    args = parser.parse_args()
+
+    port = free_port()
+    host = f"http://127.0.0.1:{port}"
+    os.environ.update(
+        ELASTIC_HOST=host,
+        RESULT_CACHE_TTL="0",
+        ELASTIC_BREAKER_RESET=str(BREAKER_RESET),
+        ELASTIC_SEARCH_TIMEOUT=str(SEARCH_TIMEOUT),
+    )
+    print(f"{'startup':>10}  {bench_startup(host) * 1000:.0f} ms to import app.py")
+
+    server = serve(port, args.latency_ms)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    import app as flask_app
+
+    # The client logs every failed attempt with a traceback
+    logging.getLogger("elastic_transport").setLevel(logging.ERROR)
+    client = flask_app.app.test_client()
+    surveys = answer_sets()
+    seen, unseen = surveys[: args.requests], surveys[args.requests :]
+    unseen = unseen[: args.requests]
+
+    run_phase(client, "healthy", seen)
+
+    StandInHandler.available = False
+    run_phase(client, "down", unseen)
+    run_phase(client, "stale", seen, stale=True)
+    StandInHandler.available = True
+
+    # The circuit may still be open from the outage
+    time.sleep(BREAKER_RESET)
+    StandInHandler.latency = SEARCH_TIMEOUT * 2
+    run_phase(client, "slow", unseen[:10])
+    StandInHandler.latency = args.latency_ms / 1000
+
+    started = time.perf_counter()
+    while client.get("/health").status_code != 200:
+        client.post("/api/survey", json=unseen[0])
+        time.sleep(0.05)
+    recovered = time.perf_counter() - started
+    print(f"{'recovery':>10}  {recovered * 1000:.0f} ms until /health is ok")
+    run_phase(client, "healthy", unseen)
+
+    bench_failover(f"http://127.0.0.1:{free_port()}", host, unseen)
@@ -0,0 +1,90 @@
+"""Payload size and serialization time of a 50-hit /api/survey response.
+
+    python benchmarks/bench_response.py --rounds 2000
+
+Compares the full _source hits serialized with the stdlib json module (the
+old jsonify path) against orjson, the card-field projection, the compact
+columnar format, and gzip / br compression of each.
+"""
+
+import argparse
+import json
+from itertools import islice
+
+from common import SAMPLE_CSV, timed  # noqa: I001 (puts backend/ and data/ on sys.path)
+import responses
+from csv_to_json import iter_documents
+from schema import normalize_document
+from search_builder import build_es_query_from_survey
+
+
+def survey_response(fields: list[str] | None, fmt: str) -> dict:
+    """A /api/survey body for 50 hits from the sample BMF."""
+    documents = islice(map(normalize_document, iter_documents([SAMPLE_CSV])), 50)
+    hits = [
+        {
+            "_index": "nonprofits",
+            "_id": doc["EIN"],
+            "_score": 1.0,
+            "_source": {k: doc.get(k) for k in fields} if fields else doc,
+        }
+        for doc in documents
+    ]
+    query = build_es_query_from_survey([{"answer": "Health"}, {"answer": "OH"}])
+    return {"query": query, "results": responses.shape_hits(hits, fmt)}
+
+
+def stdlib_dumps(obj) -> bytes:
+    return json.dumps(obj).encode("utf-8")
+
+
+def serialize(dumps, obj, rounds: int) -> None:
+    for _ in range(rounds):
+        dumps(obj)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--rounds", type=int, default=2000)
+    args = parser.parse_args()
+
+    variants = [
+        ("full, json", stdlib_dumps, survey_response(None, "hits")),
+        ("full, orjson", responses.dumps, survey_response(None, "hits")),
+        (
+            "cards, orjson",
+            responses.dumps,
+            survey_response(responses.CARD_FIELDS, "hits"),
+        ),
+        (
+            "cards compact",
+            responses.dumps,
+            survey_response(responses.CARD_FIELDS, "compact"),
+        ),
+    ]
+    encodings = ["gzip"] + (["br"] if responses.brotli is not None else [])
+    print(
+        f"{'variant':>14} {'bytes':>8} "
+        + " ".join(f"{e + ' bytes':>11}" for e in encodings)
+        + f" {'serialize us':>13} "
+        + " ".join(f"{'+' + e + ' us':>10}" for e in encodings)
+    )
+    for label, dumps, body in variants:
+        data = dumps(body)
+        _, seconds = timed(serialize, dumps, body, args.rounds)
+        sizes, costs = [], []
+        for encoding in encodings:
+            sizes.append(len(responses.compress(data, encoding)))
+            _, compress_seconds = timed(
+                serialize,
+                lambda d: responses.compress(d, encoding),
+                data,
+                args.rounds // 10,
+            )
+            costs.append(compress_seconds / (args.rounds // 10) * 1e6)
+        print(
+            f"{label:>14} {len(data):>8} "
+            + " ".join(f"{size:>11}" for size in sizes)
+            + f" {seconds / args.rounds * 1e6:>13.1f} "
+            + " ".join(f"{cost:>10.1f}" for cost in costs)
+        )
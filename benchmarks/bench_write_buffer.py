@@ -0,0 +1,145 @@
+"""One request per write vs the coalescing write buffer (write_buffer.py).
+
+    python benchmarks/bench_write_buffer.py --writes 5000 --ids 500 --clients 8
+
+Replays a partner-sync-like stream of single-organization writes (90%
+updates, 10% deletes, over --ids distinct EINs) from --clients threads:
+
+  direct     add_document/delete_document per write, as the routes do
+             without WRITE_BUFFER
+  buffered   WriteBuffer.index/delete, timed until the last batch is
+             acknowledged
+  wait_for   WriteBuffer with refresh="wait_for" on every write, i.e. each
+             client blocks until its write is sent
+
+Uses the Elasticsearch at ELASTIC_HOST with --live (in a throwaway
+index), otherwise an in-process stand-in (benchmarks/stand_in_es.py) with
+--latency-ms per request. The spool lives in a temporary directory.
+"""
+
+import argparse
+import os
+import random
+import tempfile
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from itertools import islice
+from os import getenv
+
+from common import SAMPLE_CSV, timed
+from csv_to_json import iter_documents
+from es_manager import ElasticManager
+from schema import normalize_document
+from stand_in_es import serve
+from write_buffer import WriteBuffer, WriteSpool
+
+BENCH_INDEX = "nonprofits-bench-writes"
+
+
+def workload(writes: int, ids: int, seed: int = 0) -> list[tuple[str, dict | None]]:
+    """(EIN, document or None for a delete) pairs over ids distinct EINs"""
+    rng = random.Random(seed)
+    documents = list(map(normalize_document, islice(iter_documents([SAMPLE_CSV]), 200)))
+    return [
+        (
+            f"{rng.randrange(ids):09d}",
+            None if rng.random() < 0.1 else rng.choice(documents),
+        )
+        for _ in range(writes)
+    ]
+
+
+def replay(write, stream: list[tuple[str, dict | None]], clients: int):
+    with ThreadPoolExecutor(max_workers=clients) as pool:
+        list(pool.map(lambda item: write(*item), stream))
+
+
+def direct(es_manager, stream, clients: int, index_name: str) -> dict:
+    def write(doc_id, document):
+        if document is None:
+            es_manager.delete_document(doc_id, index_name)
+        else:
+            es_manager.add_document(doc_id, document, index_name)
+
+    _, seconds = timed(replay, write, stream, clients)
+    return {"seconds": seconds, "requests": len(stream)}
+
+
+def buffered(
+    es_manager, stream, clients: int, index_name: str, refresh: str | None, args
+) -> dict:
+    with tempfile.TemporaryDirectory() as spool_dir:
+        buffer = WriteBuffer(
+            es_manager,
+            WriteSpool(os.path.join(spool_dir, "spool.sqlite")),
+            max_batch=args.batch,
+            flush_interval=args.interval,
+        )
+
+        def write(doc_id, document):
+            if document is None:
+                buffer.delete(doc_id, index_name, refresh)
+            else:
+                buffer.index(doc_id, document, index_name, refresh)
+
+        def run():
+            replay(write, stream, clients)
+            buffer.flush()
+
+        _, seconds = timed(run)
+        stats = buffer.stats()
+        buffer.close()
+    return {"seconds": seconds, "requests": stats["batches"] + stats["retries"]}
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--writes", type=int, default=5000)
+    parser.add_argument("--ids", type=int, default=500)
+    parser.add_argument("--clients", type=int, default=8)
+    parser.add_argument("--batch", type=int, default=500)
+    parser.add_argument("--interval", type=float, default=0.05)
+    parser.add_argument("--live", action="store_true", help="use ELASTIC_HOST")
+    parser.add_argument("--latency-ms", type=float, default=2.0)
+    args = parser.parse_args()
+
+    if args.live:
+        host = getenv("ELASTIC_HOST", "http://localhost:9200")
+    else:
+        server = serve(0, args.latency_ms)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        host = f"http://127.0.0.1:{server.server_address[1]}"
+    es_manager = ElasticManager(
+        host=host,
+        credentials=(
+            getenv("ELASTIC_USERNAME", "elastic"),
+            getenv("ELASTIC_PASSWORD", "password"),
+        ),
+    )
+    if args.live:
+        from mappings import NONPROFITS_MAPPINGS, NONPROFITS_SETTINGS
+
+        es_manager.create_index(BENCH_INDEX, NONPROFITS_MAPPINGS, NONPROFITS_SETTINGS)
+
+    stream = workload(args.writes, args.ids)
+    try:
+        results = {
+            "direct": direct(es_manager, stream, args.clients, BENCH_INDEX),
+            "buffered": buffered(
+                es_manager, stream, args.clients, BENCH_INDEX, None, args
+            ),
+            "wait_for": buffered(
+                es_manager, stream, args.clients, BENCH_INDEX, "wait_for", args
+            ),
+        }
+    finally:
+        if args.live:
+            es_manager.delete_index(BENCH_INDEX)
+
+    print(f"{'mode':>10} {'writes/s':>10} {'ES requests':>12} {'speedup':>8}")
+    baseline = results["direct"]["seconds"]
+    for mode, result in results.items():
+        print(
+            f"{mode:>10} {len(stream) / result['seconds']:>10,.0f}"
+            f" {result['requests']:>12,} {baseline / result['seconds']:>7.1f}x"
+        )
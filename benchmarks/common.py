@@ -0,0 +1,95 @@
+"""Shared helpers for the benchmark scripts in this directory."""
+
+import csv
+import os
+import sys
+import tempfile
+import time
+from random import Random
+from typing import Any, Callable
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path[:0] = [os.path.join(ROOT, "backend"), os.path.join(ROOT, "data")]
+
+SAMPLE_CSV = os.path.join(ROOT, "data", "eo_oh_1k.csv")
+
+
+def scale_csv(rows: int, path: str | None = None) -> str:
+    """Write a synthetic BMF CSV by repeating eo_oh_1k.csv with fresh EINs."""
+    with open(SAMPLE_CSV, newline="", encoding="utf-8") as f:
+        reader = csv.reader(f)
+        header = next(reader)
+        sample = list(reader)
+    ein = header.index("EIN")
+    if path is None:
+        fd, path = tempfile.mkstemp(prefix=f"bmf_{rows}_", suffix=".csv")
+        os.close(fd)
+    with open(path, "w", newline="", encoding="utf-8") as f:
+        writer = csv.writer(f)
+        writer.writerow(header)
+        for i in range(rows):
+            row = list(sample[i % len(sample)])
+            row[ein] = f"{i:09d}"
+            writer.writerow(row)
+    return path
+
+
+SIZE_SUFFIXES = {"k": 1_000, "m": 1_000_000}
+
+# Columns describing who/where an organization is; the rest (codes, dates
+# and amounts) describe what it is and how big, and are drawn together
+IDENTITY_COLUMNS = ("NAME", "ICO", "STREET", "CITY", "STATE", "ZIP", "SORT_NAME")
+
+
+def parse_size(size: str) -> int:
+    """Row count from "10k", "1M", "2m" or a plain number."""
+    size = size.strip().lower()
+    if size[-1:] in SIZE_SUFFIXES:
+        return int(float(size[:-1]) * SIZE_SUFFIXES[size[-1]])
+    return int(size)
+
+
+def synthetic_csv(rows: int, path: str | None = None, seed: int = 0) -> str:
+    """Write a synthetic BMF CSV of rows organizations drawn from eo_oh_1k.csv.
+
+    Unlike scale_csv, rows don't repeat every 1,000: each one takes its
+    identity columns from one sample row and its codes, dates and amounts
+    from another, so every column keeps the sample's distribution (and
+    codes keep their correlations, e.g. SUBSECTION with FOUNDATION) while
+    most combinations are distinct. Names also swap their first word with
+    another sample name's, so the text index grows like a real one.
+    Seeded, so a size always produces the same file.
+    """
+    with open(SAMPLE_CSV, newline="", encoding="utf-8") as f:
+        reader = csv.reader(f)
+        header = next(reader)
+        sample = list(reader)
+    random = Random(seed)
+    ein = header.index("EIN")
+    name = header.index("NAME")
+    identity = [header.index(column) for column in IDENTITY_COLUMNS]
+    first_words = [row[name].split(" ", 1)[0] for row in sample]
+    if path is None:
+        fd, path = tempfile.mkstemp(prefix=f"bmf_{rows}_", suffix=".csv")
+        os.close(fd)
+    with open(path, "w", newline="", encoding="utf-8") as f:
+        writer = csv.writer(f)
+        writer.writerow(header)
+        for i in range(rows):
+            row = list(random.choice(sample))
+            who = random.choice(sample)
+            for column in identity:
+                row[column] = who[column]
+            words = row[name].split(" ", 1)
+            if len(words) == 2:
+                row[name] = f"{random.choice(first_words)} {words[1]}"
+            row[ein] = f"{i:09d}"
+            writer.writerow(row)
+    return path
+
+
+def timed(fn: Callable[..., Any], *args: Any, **kwargs: Any) -> tuple[Any, float]:
+    """Run fn once and return (result, seconds)."""
+    started = time.perf_counter()
+    result = fn(*args, **kwargs)
+    return result, time.perf_counter() - started
@@ -0,0 +1,145 @@
+"""Load test the sync (Flask) and async (ASGI) backends against a stand-in ES.
+
+    python benchmarks/load_test.py --concurrency 1 16 64 --duration 10
+
+Starts benchmarks/stand_in_es.py, then each backend pointed at it, and
+fires random survey POSTs from concurrent clients for --duration seconds
+per concurrency level. Prints requests/second and p50/p99 latency. The
+result cache is disabled unless --cache is given, so every request
+reaches the (stand-in) cluster.
+"""
+
+import argparse
+import asyncio
+import os
+import random
+import socket
+import statistics
+import subprocess
+import sys
+import time
+import urllib.request
+
+import aiohttp
+from bench_query_builder import answer_sets
+from common import ROOT
+
+BACKEND_DIR = os.path.join(ROOT, "backend")
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def wait_until_up(url: str, timeout: float = 30.0):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            urllib.request.urlopen(url, timeout=1)
+            return
+        except OSError:
+            time.sleep(0.2)
+    raise RuntimeError(f"{url} did not come up within {timeout}s")
+
+
+def server_commands(port: int, workers: int) -> dict[str, list[str]]:
+    """How each backend is served: the Flask server app.py uses vs uvicorn."""
+    return {
+        "sync (flask)": [
+            sys.executable, "-m", "flask", "--app", "app", "run",
+            "--port", str(port), "--with-threads",
+        ],
+        "async (uvicorn)": [
+            sys.executable, "-m", "uvicorn", "asgi_app:app", "--port", str(port),
+            "--workers", str(workers), "--log-level", "warning",
+        ],
+    }  # fmt: skip
+
+
+async def run_clients(
+    url: str, concurrency: int, duration: float, surveys: list
+) -> tuple[list[float], int]:
+    """Hammer url from concurrent clients; return latencies (ms) and errors."""
+    latencies: list[float] = []
+    errors = 0
+    deadline = time.monotonic() + duration
+    connector = aiohttp.TCPConnector(limit=concurrency)
+
+    async with aiohttp.ClientSession(connector=connector) as session:
+
+        async def client():
+            nonlocal errors
+            while time.monotonic() < deadline:
+                started = time.perf_counter()
+                try:
+                    async with session.post(url, json=random.choice(surveys)) as resp:
+                        await resp.read()
+                        if resp.status != 200:
+                            errors += 1
+                            continue
+                except aiohttp.ClientError:
+                    errors += 1
+                    continue
+                latencies.append((time.perf_counter() - started) * 1000)
+
+        await asyncio.gather(*(client() for _ in range(concurrency)))
+    return latencies, errors
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 16, 64])
+    parser.add_argument("--duration", type=float, default=10.0)
+    parser.add_argument("--workers", type=int, default=4)
+    parser.add_argument("--latency-ms", type=float, default=5.0)
+    parser.add_argument("--cache", action="store_true", help="keep the result cache")
+    args = parser.parse_args()
+
+    es_port = free_port()
+    stand_in = subprocess.Popen(
+        [sys.executable, "stand_in_es.py", "--port", str(es_port),
+         "--latency-ms", str(args.latency_ms)],
+        cwd=BENCH_DIR,
+    )  # fmt: skip
+    env = {
+        **os.environ,
+        "ELASTIC_HOST": f"http://127.0.0.1:{es_port}",
+        "RESULT_CACHE_SIZE": (
+            os.environ.get("RESULT_CACHE_SIZE", "1024") if args.cache else "0"
+        ),
+    }
+    surveys = answer_sets()
+    print(
+        f"{'backend':>16} {'conc':>5} {'requests':>9} {'req/s':>9} "
+        f"{'p50 ms':>8} {'p99 ms':>8} {'errors':>7}"
+    )
+    try:
+        wait_until_up(f"http://127.0.0.1:{es_port}/")
+        for label, command in server_commands(free_port(), args.workers).items():
+            port = command[command.index("--port") + 1]
+            server = subprocess.Popen(
+                command, cwd=BACKEND_DIR, env=env, stderr=subprocess.DEVNULL
+            )
+            try:
+                wait_until_up(f"http://127.0.0.1:{port}/")
+                url = f"http://127.0.0.1:{port}/api/survey"
+                for concurrency in args.concurrency:
+                    latencies, errors = asyncio.run(
+                        run_clients(url, concurrency, args.duration, surveys)
+                    )
+                    cuts = statistics.quantiles(latencies, n=100) if latencies else []
+                    print(
+                        f"{label:>16} {concurrency:>5} {len(latencies):>9} "
+                        f"{len(latencies) / args.duration:>9.0f} "
+                        f"{cuts[49] if cuts else 0:>8.2f} "
+                        f"{cuts[98] if cuts else 0:>8.2f} {errors:>7}"
+                    )
+            finally:
+                server.terminate()
+                server.wait()
+    finally:
+        stand_in.terminate()
+        stand_in.wait()
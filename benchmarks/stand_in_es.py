@@ -0,0 +1,199 @@
+"""Minimal stand-in for an Elasticsearch node, for load tests without a cluster.
+
+    python benchmarks/stand_in_es.py --port 9299 --latency-ms 5
+
+Answers ping/info, index exists, _mapping (the nonprofits mappings),
+_search and _msearch (canned hits built from eo_oh_1k.csv) and _bulk,
+after a fixed simulated latency per request. Point-in-time searches page
+through the same hits; clearing StandInHandler.pits expires every open
+point-in-time. Everything else gets an empty 200. Setting
+StandInHandler.available to False simulates a node that went away: every
+request is dropped unanswered.
+"""
+
+import argparse
+import json
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from itertools import count, islice
+
+from common import SAMPLE_CSV
+from csv_to_json import iter_documents
+from mappings import NONPROFITS_MAPPINGS
+from schema import normalize_document
+
+HEADERS = {
+    "X-Elastic-Product": "Elasticsearch",
+    "Content-Type": "application/json",
+}
+
+
+class StandInHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    # Headers and body are separate writes; with Nagle on, keep-alive
+    # clients wait out a delayed ACK (~40 ms) on every request
+    disable_nagle_algorithm = True
+    latency = 0.005
+    available = True
+    hits: list[dict] = []
+    pits: set[str] = set()
+    pit_ids = count()
+
+    def log_message(self, format, *args):
+        pass
+
+    def parse_request(self) -> bool:
+        # Checked per request, so kept-alive connections are dropped too
+        if not super().parse_request():
+            return False
+        if not self.available:
+            self.close_connection = True
+            return False
+        return True
+
+    def _reply(self, status: int, body: dict | None = None):
+        payload = json.dumps(body).encode("utf-8") if body is not None else b""
+        self.send_response(status)
+        for name, value in HEADERS.items():
+            self.send_header(name, value)
+        self.send_header("Content-Length", str(len(payload)))
+        self.end_headers()
+        if self.command != "HEAD":
+            self.wfile.write(payload)
+
+    def _read_body(self) -> bytes:
+        length = int(self.headers.get("Content-Length") or 0)
+        return self.rfile.read(length) if length else b""
+
+    def do_HEAD(self):
+        self._reply(200)
+
+    def do_GET(self):
+        self._read_body()
+        path = self.path.split("?")[0]
+        if path == "/":
+            self._reply(
+                200,
+                {
+                    "name": "stand-in",
+                    "version": {"number": "8.15.0", "build_flavor": "default"},
+                    "tagline": "You Know, for Search",
+                },
+            )
+        elif path.endswith("/_mapping"):
+            index_name = path.strip("/").split("/")[0]
+            self._reply(200, {index_name: {"mappings": NONPROFITS_MAPPINGS}})
+        else:
+            self._reply(200, {})
+
+    def do_POST(self):
+        body = self._read_body()
+        path = self.path.split("?")[0]
+        time.sleep(self.latency)
+        if path.endswith("/_pit"):
+            pit_id = f"stand-in-pit-{next(self.pit_ids)}"
+            self.pits.add(pit_id)
+            self._reply(200, {"id": pit_id})
+        elif path.endswith("/_search"):
+            search = json.loads(body or b"{}")
+            pit_id = search.get("pit", {}).get("id")
+            if pit_id is not None and pit_id not in self.pits:
+                self._reply(404, missing_pit(pit_id))
+            else:
+                self._reply(200, self._search_response(search))
+        elif path.endswith("/_msearch"):
+            lines = [json.loads(line) for line in body.splitlines() if line.strip()]
+            responses = [
+                {**self._search_response(search), "status": 200}
+                for search in lines[1::2]
+            ]
+            self._reply(200, {"took": 1, "responses": responses})
+        elif path.endswith("/_bulk"):
+            actions = [line for line in body.splitlines() if line.strip()]
+            items = [
+                (
+                    {"delete": {"status": 200, "_id": str(i)}}
+                    if line.startswith(b'{"delete"')
+                    else {"index": {"status": 201, "_id": str(i)}}
+                )
+                for i, line in enumerate(actions)
+                if line.startswith((b'{"index"', b'{"create"', b'{"delete"'))
+            ]
+            self._reply(200, {"took": 1, "errors": False, "items": items})
+        else:
+            self._reply(200, {})
+
+    do_PUT = do_POST
+
+    def do_DELETE(self):
+        body = self._read_body()
+        time.sleep(self.latency)
+        if self.path.split("?")[0] == "/_pit":
+            self.pits.discard(json.loads(body)["id"])
+            self._reply(200, {"succeeded": True, "num_freed": 1})
+            return
+        self._reply(200, {"acknowledged": True})
+
+    def _search_response(self, search: dict) -> dict:
+        start = 0
+        if "pit" in search:
+            # Page by position: sort is [score, position]
+            start = search["search_after"][-1] + 1 if "search_after" in search else 0
+        hits = self.hits[start : start + search.get("size", 10)]
+        if "pit" in search:
+            hits = [
+                {**hit, "sort": [hit["_score"], start + i]}
+                for i, hit in enumerate(hits)
+            ]
+        includes = search.get("_source")
+        if isinstance(includes, list):  # only the plain includes form
+            hits = [
+                {**hit, "_source": {k: hit["_source"].get(k) for k in includes}}
+                for hit in hits
+            ]
+        return {
+            "took": int(self.latency * 1000),
+            "timed_out": False,
+            "hits": {
+                "total": {"value": len(self.hits), "relation": "eq"},
+                "max_score": 1.0,
+                "hits": hits,
+            },
+        }
+
+
+def missing_pit(pit_id: str) -> dict:
+    """Elasticsearch's 404 for a point-in-time that expired or was closed"""
+    cause = {
+        "type": "search_context_missing_exception",
+        "reason": f"No search context found for id [{pit_id}]",
+    }
+    return {
+        "error": {
+            "root_cause": [cause],
+            "type": "search_phase_execution_exception",
+            "reason": "all shards failed",
+        },
+        "status": 404,
+    }
+
+
+def serve(port: int, latency_ms: float) -> ThreadingHTTPServer:
+    """Build a stand-in server on port (call serve_forever on the result)."""
+    StandInHandler.latency = latency_ms / 1000
+    documents = islice(iter_documents([SAMPLE_CSV]), 100)
+    StandInHandler.hits = [
+        {"_index": "nonprofits", "_id": doc["EIN"], "_score": 1.0, "_source": doc}
+        for doc in map(normalize_document, documents)
+    ]
+    server = ThreadingHTTPServer(("127.0.0.1", port), StandInHandler)
+    server.daemon_threads = True
+    return server
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--port", type=int, default=9299)
+    parser.add_argument("--latency-ms", type=float, default=5.0)
+    args = parser.parse_args()
+    serve(args.port, args.latency_ms).serve_forever()
@@ -0,0 +1,279 @@
+"""Benchmark suite: enrichment, ingest, query building and end-to-end search.
+
+    python benchmarks/suite.py run --sizes 10k 100k 1M --backend stand-in
+    python benchmarks/suite.py compare               # last run vs the one before
+    python benchmarks/suite.py compare 0 -1 --threshold 0.05
+
+`run` writes synthetic BMF files of each size (common.synthetic_csv), then
+measures
+  - enrichment   CSV -> enriched documents (csv_to_json.iter_documents)
+  - ingest       CSV -> documents indexed through the manager's bulk_add
+  - query build  build_es_query_from_survey over every answer combination
+  - end-to-end   POST /api/survey and /api/search through the Flask app,
+                 result cache off, on the largest size's data
+and appends the results to the history file (benchmarks/history.json).
+
+--backend picks what ingest and end-to-end run against:
+  stand-in  benchmarks/stand_in_es.py in-process (client-side cost only)
+  local     the in-process search backend (SEARCH_BACKEND=local)
+  live      the Elasticsearch at ELASTIC_HOST, in a throwaway index
+
+`compare` diffs two runs of the history by position and exits with status
+1 when any metric got worse by more than --threshold, so CI can gate on it.
+"""
+
+import argparse
+import json
+import os
+import platform
+import random
+import statistics
+import subprocess
+import threading
+from datetime import datetime, timezone
+from typing import Any
+
+from common import ROOT, parse_size, synthetic_csv, timed  # noqa: I001
+from bench_query_builder import answer_sets, build_all
+from bulk_add import load_documents
+from csv_to_json import iter_documents
+from schema import EIN, normalize_document
+
+HISTORY_PATH = os.path.join(ROOT, "benchmarks", "history.json")
+BENCH_INDEX = "nonprofits-bench"
+SEARCH_TERMS = ["foundation", "church", "school", "community center", "park"]
+
+
+def record(results: dict, name: str, value: float, unit: str, better: str):
+    """Store one metric; better is "higher" or "lower"."""
+    results[name] = {"value": round(value, 3), "unit": unit, "better": better}
+    print(f"{name:>40}: {value:>14,.2f} {unit}")
+
+
+def ingest_manager(backend: str, stand_in_host: str | None):
+    """A fresh manager for one ingest measurement."""
+    if backend == "local":
+        from local_search import LocalSearchManager
+
+        return LocalSearchManager()
+    from es_manager import ElasticManager
+
+    host = stand_in_host or os.getenv("ELASTIC_HOST", "http://localhost:9200")
+    return ElasticManager(
+        host=host,
+        credentials=(
+            os.getenv("ELASTIC_USERNAME", "elastic"),
+            os.getenv("ELASTIC_PASSWORD", "password"),
+        ),
+    )
+
+
+def bench_enrichment(results: dict, path: str, label: str):
+    rows, seconds = timed(lambda: sum(1 for _ in iter_documents([path])))
+    record(
+        results, f"enrichment.rows_per_s@{label}", rows / seconds, "rows/s", "higher"
+    )
+
+
+def bench_ingest(results: dict, manager, backend: str, path: str, label: str):
+    from mappings import NONPROFITS_MAPPINGS, NONPROFITS_SETTINGS
+
+    if manager.index_exists(BENCH_INDEX):
+        manager.delete_index(BENCH_INDEX)
+    manager.create_index(BENCH_INDEX, NONPROFITS_MAPPINGS, NONPROFITS_SETTINGS)
+    documents = map(normalize_document, load_documents([path]))
+    report = manager.bulk_add(documents, BENCH_INDEX, id_field=EIN)
+    record(
+        results,
+        f"ingest.{backend}.docs_per_s@{label}",
+        report["docs_per_second"],
+        "docs/s",
+        "higher",
+    )
+    if report["failed"]:
+        print(f"{'':>40}  ({report['failed']} documents failed)")
+
+
+def bench_query_build(results: dict, rounds: int = 20, repeats: int = 5):
+    surveys = answer_sets()
+    # Best of several passes, as timeit does: microsecond timings are noisy
+    seconds = min(timed(build_all, surveys, rounds)[1] for _ in range(repeats))
+    per_query = seconds / (len(surveys) * rounds) * 1e6
+    record(results, "query_build.us_per_query", per_query, "us", "lower")
+
+
+def bench_end_to_end(results: dict, backend: str, requests: int):
+    """Time /api/survey and /api/search through the app's test client.
+
+    The environment must point app.py at the backend before this imports it.
+    """
+    import app as flask_app
+
+    client = flask_app.app.test_client()
+    surveys = answer_sets()
+    rng = random.Random(0)
+    routes = {
+        "survey": lambda: client.post("/api/survey", json=rng.choice(surveys)),
+        "search": lambda: client.post(
+            "/api/search",
+            json={
+                "query": {"query": {"match": {"NAME": rng.choice(SEARCH_TERMS)}}},
+                "size": 20,
+            },
+        ),
+    }
+    for route, call in routes.items():
+        latencies = []
+        for _ in range(requests):
+            response, seconds = timed(call)
+            if response.status_code != 200:
+                raise RuntimeError(f"/api/{route} returned {response.status_code}")
+            latencies.append(seconds * 1000)
+        cuts = statistics.quantiles(latencies, n=100)
+        prefix = f"e2e.{backend}.{route}"
+        record(results, f"{prefix}.p50_ms", cuts[49], "ms", "lower")
+        record(results, f"{prefix}.p99_ms", cuts[98], "ms", "lower")
+        record(
+            results, f"{prefix}.req_per_s", 1000 / statistics.mean(latencies),
+            "req/s", "higher",
+        )  # fmt: skip
+
+
+def git_commit() -> str | None:
+    try:
+        commit = subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            cwd=ROOT, capture_output=True, text=True, check=True,
+        ).stdout.strip()  # fmt: skip
+        dirty = subprocess.run(
+            ["git", "status", "--porcelain", "--untracked-files=no"],
+            cwd=ROOT, capture_output=True, text=True, check=True,
+        ).stdout.strip()  # fmt: skip
+    except (OSError, subprocess.CalledProcessError):
+        return None
+    return f"{commit}-dirty" if dirty else commit
+
+
+def load_history(path: str) -> list[dict[str, Any]]:
+    if not os.path.exists(path):
+        return []
+    with open(path, encoding="utf-8") as f:
+        return json.load(f)
+
+
+def run(args: argparse.Namespace):
+    stand_in_host = None
+    if args.backend == "stand-in":
+        from stand_in_es import serve
+
+        server = serve(0, args.latency_ms)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        stand_in_host = f"http://127.0.0.1:{server.server_address[1]}"
+
+    results: dict[str, Any] = {}
+    bench_query_build(results)
+    path = None
+    try:
+        for size in sorted(args.sizes, key=parse_size):
+            if path:
+                os.remove(path)
+            path = synthetic_csv(parse_size(size), seed=args.seed)
+            bench_enrichment(results, path, size)
+            manager = ingest_manager(args.backend, stand_in_host)
+            bench_ingest(results, manager, args.backend, path, size)
+            if args.backend == "live":
+                manager.es.indices.refresh(index=BENCH_INDEX)
+            del manager
+
+        if args.requests:
+            os.environ["RESULT_CACHE_SIZE"] = "0"
+            if args.backend == "stand-in":
+                os.environ["ELASTIC_HOST"] = stand_in_host
+            elif args.backend == "local":
+                os.environ["SEARCH_BACKEND"] = "local"
+                os.environ["LOCAL_SEARCH_DATA"] = path
+            else:
+                os.environ["ELASTIC_INDEX"] = BENCH_INDEX
+            bench_end_to_end(results, args.backend, args.requests)
+    finally:
+        if path:
+            os.remove(path)
+        if args.backend == "live":
+            ingest_manager("live", None).delete_index(BENCH_INDEX)
+
+    history = load_history(args.history)
+    history.append(
+        {
+            "timestamp": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+            "commit": git_commit(),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "cpus": os.cpu_count(),
+            "backend": args.backend,
+            "sizes": args.sizes,
+            "results": results,
+        }
+    )
+    with open(args.history, "w", encoding="utf-8") as f:
+        json.dump(history, f, indent=1)
+    print(f"Run {len(history) - 1} appended to {args.history}")
+
+
+def compare(args: argparse.Namespace) -> int:
+    """Print old vs new for every shared metric; return the regression count."""
+    history = load_history(args.history)
+    try:
+        old, new = history[args.old], history[args.new]
+    except IndexError:
+        raise SystemExit(f"{args.history} has {len(history)} runs") from None
+    print(
+        f"old: {old['timestamp']} {old['commit']}  new: {new['timestamp']} {new['commit']}"
+    )
+    print(f"{'metric':>40} {'old':>12} {'new':>12} {'change':>8}")
+    regressions = 0
+    for name, metric in new["results"].items():
+        before = old["results"].get(name)
+        if before is None or not before["value"]:
+            continue
+        change = metric["value"] / before["value"] - 1
+        worse = -change if metric["better"] == "higher" else change
+        flag = ""
+        if worse > args.threshold:
+            flag = "  REGRESSION"
+            regressions += 1
+        elif -worse > args.threshold:
+            flag = "  improved"
+        print(
+            f"{name:>40} {before['value']:>12,.2f} {metric['value']:>12,.2f} "
+            f"{change:>+8.1%}{flag}"
+        )
+    print(f"{regressions} regression(s) beyond {args.threshold:.0%}")
+    return regressions
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--history", default=HISTORY_PATH)
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    run_parser = commands.add_parser("run", help="run the suite and record it")
+    run_parser.add_argument("--sizes", nargs="+", default=["10k", "100k"])
+    run_parser.add_argument(
+        "--backend", choices=["stand-in", "local", "live"], default="stand-in"
+    )
+    run_parser.add_argument(
+        "--requests", type=int, default=1000, help="per route; 0 skips end-to-end"
+    )
+    run_parser.add_argument("--latency-ms", type=float, default=0.0)
+    run_parser.add_argument("--seed", type=int, default=0)
+
+    compare_parser = commands.add_parser("compare", help="diff two recorded runs")
+    compare_parser.add_argument("old", type=int, nargs="?", default=-2)
+    compare_parser.add_argument("new", type=int, nargs="?", default=-1)
+    compare_parser.add_argument("--threshold", type=float, default=0.10)
+
+    args = parser.parse_args()
+    if args.command == "run":
+        run(args)
+    else:
+        raise SystemExit(1 if compare(args) else 0)
@@ -0,0 +1,277 @@
+"""Dense cause vectors for organizations and survey answers, computed offline.
+
+A small latent semantic model is fitted to the NTEE codebook: every code's
+title, description and keywords (plus those of its major group) form one
+document, weighted with TF-IDF (sublinear tf), and a truncated SVD of that
+code x term matrix keeps the DIMS strongest directions. Everything is
+NumPy on local files, so building it needs no network or model download.
+
+    python data/cause_vectors.py            # (re)build cause_vectors.npz
+    python data/cause_vectors.py "food pantry" "youth soccer league"
+
+The model maps any text into the same space, so:
+
+  - an organization's CAUSE_VECTOR (added at enrichment) is its NTEE
+    code's vector plus NAME_WEIGHT times the vector of its name, so
+    organizations without a code still get one from their name
+  - a survey cause is the mean of its NTEE major groups' vectors plus the
+    vector of its label, and a work environment adds its keywords
+
+All vectors are unit length, so cosine similarity is a dot product.
+cause_vectors.npz is rebuilt whenever ntee_codes.json is newer or
+MODEL_VERSION changes; rebuilding changes every CAUSE_VECTOR, so reindex
+(or --sync, which then resends every organization) afterwards.
+"""
+
+import argparse
+import json
+import os
+import re
+from functools import lru_cache
+from typing import Iterable
+
+import numpy as np
+
+DATA_DIR = os.path.dirname(os.path.abspath(__file__))
+ntee_path = os.path.join(DATA_DIR, "ntee_codes.json")
+
+MODEL_VERSION = 1
+# Must match schema.CAUSE_VECTOR_DIMS, which the index mapping uses
+DIMS = 32
+# How much an organization's name moves it away from its NTEE code
+NAME_WEIGHT = 0.5
+# Stored vectors are rounded to this many decimals (bulk payload size)
+DECIMALS = 4
+# Words of organization names remembered between document_vectors calls
+# (about 100 bytes each); the memo starts over once it holds this many
+WORD_MEMO_SIZE = 200_000
+
+TOKEN = re.compile(r"[a-z][a-z0-9]+")
+STOPWORDS = frozenset(
+    """
+    and are for from has have inc its not of other that the their these this
+    those through which who whose with within without such including include
+    includes organizations organization primary purpose nonprofit nonprofits
+    private public provide provides services service activities programs
+    program support supports all also any etc may related general
+    """.split()
+)
+
+
+def model_path(json_path: str) -> str:
+    """Return where the model for a codes JSON file lives."""
+    return os.path.join(os.path.dirname(json_path), "cause_vectors.npz")
+
+
+def stem(word: str) -> str | None:
+    """Term of a lower-case word, None for a stopword."""
+    if word in STOPWORDS:
+        return None
+    # Fold plurals so "churches" and "church" share a term
+    if word.endswith("ies") and len(word) > 4:
+        return word[:-3] + "y"
+    if word.endswith("es") and word[-3:-2] in ("s", "x", "h"):
+        return word[:-2]
+    if word.endswith("s") and not word.endswith("ss") and len(word) > 3:
+        return word[:-1]
+    return word
+
+
+def tokenize(text: str) -> list[str]:
+    """Lower-cased word stems of text, without stopwords."""
+    return [term for term in map(stem, TOKEN.findall(text.lower())) if term]
+
+
+def _code_text(codebook: dict[str, dict], code: str) -> str:
+    entry = codebook[code]
+    return " ".join(
+        [entry.get("title", ""), entry.get("description", "")]
+        + entry.get("keywords", [])
+    )
+
+
+def build(json_path: str = ntee_path, out_path: str | None = None) -> str:
+    """Fit the model to the codes JSON and save it; return its path."""
+    out_path = out_path or model_path(json_path)
+    with open(json_path, "r", encoding="utf-8") as f:
+        codebook: dict[str, dict] = json.load(f)
+    codes = sorted(codebook, key=str.upper)
+    # A code's document includes its major group's, so codes of one group
+    # stay close even when their own descriptions are short
+    documents = []
+    for code in codes:
+        text = _code_text(codebook, code)
+        major = code[:1]
+        if major != code and major in codebook:
+            text += " " + codebook[major].get("title", "")
+        documents.append(tokenize(text))
+
+    vocabulary = sorted({token for tokens in documents for token in tokens})
+    term_ids = {term: i for i, term in enumerate(vocabulary)}
+    counts = np.zeros((len(codes), len(vocabulary)), dtype=np.float64)
+    for row, tokens in enumerate(documents):
+        for token in tokens:
+            counts[row, term_ids[token]] += 1
+    document_frequency = np.count_nonzero(counts, axis=0)
+    idf = np.log((1 + len(codes)) / (1 + document_frequency)) + 1
+    weights = np.zeros_like(counts)
+    nonzero = counts > 0
+    weights[nonzero] = 1 + np.log(counts[nonzero])
+    weights *= idf
+    weights /= np.maximum(np.linalg.norm(weights, axis=1, keepdims=True), 1e-12)
+
+    _, _, vt = np.linalg.svd(weights, full_matrices=False)
+    projection = vt[:DIMS].T
+    code_vectors = unit(weights @ projection)
+
+    tmp_path = f"{out_path}.{os.getpid()}.tmp.npz"
+    np.savez(
+        tmp_path,
+        version=np.array(MODEL_VERSION),
+        vocabulary=np.array(vocabulary),
+        idf=idf.astype(np.float32),
+        projection=projection.astype(np.float32),
+        codes=np.array([code.upper() for code in codes]),
+        code_vectors=code_vectors.astype(np.float32),
+    )
+    os.replace(tmp_path, out_path)
+    return out_path
+
+
+def unit(vectors: np.ndarray) -> np.ndarray:
+    """Rows scaled to unit length (all-zero rows stay zero)."""
+    norms = np.linalg.norm(vectors, axis=-1, keepdims=True)
+    return np.divide(vectors, norms, out=np.zeros_like(vectors), where=norms > 0)
+
+
+class CauseModel:
+    def __init__(self, path: str):
+        """Load a model written by build()."""
+        with np.load(path, allow_pickle=False) as model:
+            self.version = int(model["version"])
+            self.term_ids = {term: i for i, term in enumerate(model["vocabulary"])}
+            # Each term's contribution to a text vector: idf times its projection
+            self.term_vectors = model["projection"] * model["idf"][:, None]
+            self.code_ids = {code: i for i, code in enumerate(model["codes"])}
+            self.code_vectors = model["code_vectors"]
+        self.dims = self.code_vectors.shape[1]
+        self.zero = np.zeros(self.dims, dtype=np.float32)
+        self._word_ids: dict[str, int] = {}
+
+    @classmethod
+    @lru_cache(maxsize=None)
+    def load(cls, json_path: str = ntee_path) -> "CauseModel":
+        """Open (once per process) the model for json_path, rebuilding it if stale."""
+        path = model_path(json_path)
+        if not os.path.exists(path) or os.path.getmtime(path) < os.path.getmtime(
+            json_path
+        ):
+            build(json_path, path)
+        model = cls(path)
+        if model.version != MODEL_VERSION or model.dims != DIMS:
+            model = cls(build(json_path, path))
+        return model
+
+    def term_indices(
+        self, text: str, word_ids: dict[str, int] | None = None
+    ) -> list[int]:
+        """Rows of term_vectors for the known words of text, memoized per
+        word in word_ids when given."""
+        ids = []
+        for word in TOKEN.findall(text.lower()):
+            index = None if word_ids is None else word_ids.get(word)
+            if index is None:
+                term = stem(word)
+                index = self.term_ids.get(term, -1) if term else -1
+                if word_ids is not None:
+                    word_ids[word] = index
+            if index >= 0:
+                ids.append(index)
+        return ids
+
+    def text_vector(self, text: str) -> np.ndarray:
+        """Unit vector of a text (zero if none of its words are known).
+
+        Not memoized: query texts come from requests, and every new word
+        would stay in memory."""
+        ids = self.term_indices(text)
+        if not ids:
+            return self.zero
+        return unit(self.term_vectors[ids].sum(axis=0))
+
+    def code_vector(self, code: str) -> np.ndarray:
+        """Unit vector of an NTEE code, falling back to shorter prefixes
+        ("B2Z" -> "B2" -> "B"); zero for an unknown code."""
+        code = code.strip().upper()
+        while code:
+            index = self.code_ids.get(code)
+            if index is not None:
+                return self.code_vectors[index]
+            code = code[:-1]
+        return self.zero
+
+    def query_vector(
+        self, codes: Iterable[str] = (), texts: Iterable[str] = ()
+    ) -> np.ndarray:
+        """Unit vector of the mean of some codes' vectors and texts' vectors."""
+        vectors = [self.code_vector(code) for code in codes]
+        vectors += [self.text_vector(text) for text in texts]
+        if not vectors:
+            return self.zero
+        return unit(np.mean(vectors, axis=0))
+
+    def document_vectors(
+        self, codes: list[str], names: list[str]
+    ) -> list[list[float] | None]:
+        """CAUSE_VECTOR of each (NTEE code, name) pair, None (null, which the
+        index treats as missing) when the model knows neither."""
+        if not codes:
+            return []
+        # One gather for the codes and one scatter-add for every name term
+        distinct = {code: self.code_vector(code) for code in set(codes)}
+        vectors = np.stack([distinct[code] for code in codes])
+        # Names share most of their words, so each is stemmed once
+        if len(self._word_ids) > WORD_MEMO_SIZE:
+            self._word_ids = {}
+        ids: list[int] = []
+        lengths = np.empty(len(names), dtype=np.int64)
+        for row, name in enumerate(names):
+            terms = self.term_indices(name, self._word_ids)
+            ids.extend(terms)
+            lengths[row] = len(terms)
+        name_vectors = np.zeros((len(names), self.dims), dtype=np.float32)
+        named = lengths > 0
+        if ids:
+            starts = (np.cumsum(lengths) - lengths)[named]
+            name_vectors[named] = np.add.reduceat(self.term_vectors[ids], starts)
+        vectors = unit(vectors + NAME_WEIGHT * unit(name_vectors))
+        # In float64, so the rounded values print as short decimals
+        vectors = np.round(vectors.astype(np.float64), DECIMALS)
+        known = np.any(vectors != 0, axis=1)
+        return [
+            vector if ok else None for vector, ok in zip(vectors.tolist(), known)
+        ]
+
+
+def as_list(vector: np.ndarray) -> list[float]:
+    """A query vector as JSON-ready floats."""
+    return [round(value, DECIMALS) for value in vector.tolist()]
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Cause vector model.")
+    parser.add_argument("texts", nargs="*", help="texts to match against NTEE codes")
+    parser.add_argument("--top", type=int, default=5)
+    args = parser.parse_args()
+    path = build()
+    model = CauseModel(path)
+    print(
+        f"Built {len(model.code_ids)} code vectors x {model.dims} dims,"
+        f" {len(model.term_ids)} terms, into {path}"
+    )
+    codes = list(model.code_ids)
+    for text in args.texts:
+        scores = model.code_vectors @ model.text_vector(text)
+        best = np.argsort(-scores)[: args.top]
+        matches = ", ".join(f"{codes[i]} {scores[i]:.2f}" for i in best)
+        print(f"{text}: {matches}")
@@ -1,10 +1,21 @@
+import argparse
 import csv
+import gzip
 import json
+import math
 import os
+from itertools import islice
+from operator import itemgetter
+from typing import IO, Iterable, Iterator
 
-csv_path = "eo_oh_1k.csv"
-output_dir = "json_output"
-os.makedirs(output_dir, exist_ok=True)
+from cause_vectors import CauseModel
+from ntee_codebook import NTEECodebook
+from zip_centroids import ZipCentroids, zip5
+
+DATA_DIR = os.path.dirname(os.path.abspath(__file__))
+csv_path = os.path.join(DATA_DIR, "eo_oh_1k.csv")
+ntee_path = os.path.join(DATA_DIR, "ntee_codes.json")
+output_path = os.path.join(DATA_DIR, "eo_bmf.ndjson.gz")
 
 fields = [
     "EIN","NAME","ICO","STREET","CITY","STATE","ZIP","GROUP","SUBSECTION","AFFILIATION",
@@ -156,16 +167,38 @@ INCOME_CD = {
     "9": "50,000,000+",
 }
 
+# (code column, enriched name column, lookup table) for the columnar path
+CODE_COLUMNS = [
+    ("SUBSECTION", "SUBSECTION_NAME", SUBSECTION),
+    ("AFFILIATION", "AFFILIATION_NAME", AFFILIATION),
+    ("ORGANIZATION", "ORGANIZATION_NAME", ORGANIZATION),
+    ("FOUNDATION", "FOUNDATION_NAME", FOUNDATION),
+    ("DEDUCTIBILITY", "DEDUCTIBILITY_NAME", DEDUCTIBILITY),
+    ("STATUS", "STATUS_NAME", STATUS),
+    ("FILING_REQ_CD", "FILING_REQ_NAME", FILING_REQ_CD),
+    ("PF_FILING_REQ_CD", "PF_FILING_REQ_NAME", PF_FILING_REQ_CD),
+    ("ASSET_CD", "ASSET_RANGE", ASSET_CD),
+    ("INCOME_CD", "INCOME_RANGE", INCOME_CD),
+]
+# Every input column enrich_columns reads
+ENRICH_COLUMNS = ["NTEE_CD", "ZIP", "NAME", "SORT_NAME", "ASSET_AMT", "REVENUE_AMT"] + [
+    code for code, _, _ in CODE_COLUMNS
+]
+COLUMN_CHUNK_SIZE = 50_000
+
 
 class NTEEManager:
     def __init__(self, filepath: str):
-        """Load the NTEE codebook JSON file into memory."""
-        with open(filepath, "r", encoding="utf-8") as f:
-            self.codebook: dict[str, dict] = json.load(f)
+        """Open the compiled, memory-mapped codebook for an NTEE codes JSON file."""
+        self.codebook = NTEECodebook.load(filepath)
+        # Decoded entries for the codes actually seen (bounded by the codebook size)
+        self._entries: dict[str, dict | None] = {}
 
     def get_entry(self, code: str) -> dict | None:
         """Return the full entry for a given code, or None if not found."""
-        return self.codebook.get(code.upper())
+        if code not in self._entries:
+            self._entries[code] = self.codebook.get_entry(code.upper())
+        return self._entries[code]
 
     def get_title(self, code: str) -> str:
         """Return the title for a given code."""
@@ -184,47 +217,274 @@ class NTEEManager:
 
     def list_codes(self) -> list[str]:
         """Return a sorted list of all codes in the codebook."""
-        return sorted(self.codebook.keys())
+        return self.codebook.list_codes()
     
 
-ntee = NTEEManager("ntee_codes.json")
-with open(csv_path, newline='', encoding='utf-8') as csvfile:
-    reader = csv.DictReader(csvfile)
-    for row in reader:
-        # Only include specified fields
-        json_obj = {field: row.get(field, "") for field in fields}
-        if "NTEE_CD" in json_obj:
-            ntee_code = json_obj["NTEE_CD"]
-            if (len(ntee_code)==4):
-                ntee_code=ntee_code[:3]
-            json_obj["NTEE_TITLE"] = ntee.get_title(ntee_code)
-            json_obj["NTEE_DESCRIPTION"] = ntee.get_description(ntee_code)
-            json_obj["NTEE_KEYWORDS"] = ntee.get_keywords(ntee_code)
-        if "SUBSECTION" in json_obj:
-            json_obj["SUBSECTION_NAME"]=SUBSECTION.get(json_obj["SUBSECTION"], json_obj["SUBSECTION"])
-        if "AFFILIATION" in json_obj:
-            json_obj["AFFILIATION_NAME"]=AFFILIATION.get(json_obj["AFFILIATION"], json_obj["AFFILIATION"])
-        if "ORGANIZATION" in json_obj:
-            json_obj["ORGANIZATION_NAME"]=ORGANIZATION.get(json_obj["ORGANIZATION"], json_obj["ORGANIZATION"])
-        if "FOUNDATION" in json_obj:
-            json_obj["FOUNDATION_NAME"]=FOUNDATION.get(json_obj["FOUNDATION"], json_obj["FOUNDATION"])
-        if "DEDUCTIBILITY" in json_obj:
-            json_obj["DEDUCTIBILITY_NAME"]=DEDUCTIBILITY.get(json_obj["DEDUCTIBILITY"], json_obj["DEDUCTIBILITY"])
-        if "STATUS" in json_obj:
-            json_obj["STATUS_NAME"]=STATUS.get(json_obj["STATUS"], json_obj["STATUS"])
-        if "FILING_REQ_CD" in json_obj:
-            json_obj["FILING_REQ_NAME"]=FILING_REQ_CD.get(json_obj["FILING_REQ_CD"], json_obj["FILING_REQ_CD"])
-        if "PF_FILING_REQ_CD" in json_obj:
-            json_obj["PF_FILING_REQ_NAME"]=PF_FILING_REQ_CD.get(json_obj["PF_FILING_REQ_CD"], json_obj["PF_FILING_REQ_CD"])
-        if "ASSET_CD" in json_obj:
-            json_obj["ASSET_RANGE"]=ASSET_CD.get(json_obj["ASSET_CD"], json_obj["ASSET_CD"])
-        if "INCOME_CD" in json_obj:
-            json_obj["INCOME_RANGE"]=INCOME_CD.get(json_obj["INCOME_CD"], json_obj["INCOME_CD"])    
-        # Get the EIN value for this row (used as a unique identifier)
-        ein = json_obj.get("EIN", "unknown")
-        # Build the output file path, naming the JSON file after the EIN
-        json_path = os.path.join(output_dir, f"{ein}.json")
-        with open(json_path, "w", encoding="utf-8") as jsonfile:
-            json.dump(json_obj, jsonfile, indent=2)
+def read_rows(csv_paths: Iterable[str]) -> Iterator[dict[str, str]]:
+    """Yield the selected fields of every row across one or more BMF CSVs."""
+    for path in csv_paths:
+        with open(path, newline="", encoding="utf-8") as csvfile:
+            for row in csv.DictReader(csvfile):
+                # Only include specified fields
+                yield {field: row.get(field, "") for field in fields}
+
+
+def ntee_major(code: str) -> str:
+    """The major group letter of an NTEE code ("B20" -> "B"), "" if there is none."""
+    letter = code[:1].upper()
+    return letter if letter.isalpha() else ""
+
+
+def suggest_weight(asset_amt: str, revenue_amt: str) -> int:
+    """Autocomplete rank of an organization: 100 * log10(1 + the larger of its
+    assets and revenue), so $1M ranks 600 and an empty BMF row 0."""
+    amounts = [int(a) for a in (asset_amt, revenue_amt) if a.strip().isdigit()]
+    return round(100 * math.log10(1 + max(amounts, default=0)))
+
+
+def name_suggest(name: str, sort_name: str, weight: int) -> dict | None:
+    """Completion field value: the name, the secondary (sort) name and the
+    name without a leading "THE", all with the organization's weight."""
+    inputs = [name, sort_name]
+    if name.upper().startswith("THE "):
+        inputs.append(name[4:])
+    inputs = list(dict.fromkeys(i.strip() for i in inputs if i.strip()))
+    return {"input": inputs, "weight": weight} if inputs else None
+
+
+def lookup_codes(json_obj: dict[str, str], ntee: NTEEManager) -> dict:
+    """The codebook and code table lookups of enrich_row."""
+    if "NTEE_CD" in json_obj:
+        ntee_code = json_obj["NTEE_CD"]
+        if (len(ntee_code)==4):
+            ntee_code=ntee_code[:3]
+        json_obj["NTEE_TITLE"] = ntee.get_title(ntee_code)
+        json_obj["NTEE_DESCRIPTION"] = ntee.get_description(ntee_code)
+        json_obj["NTEE_KEYWORDS"] = ntee.get_keywords(ntee_code)
+        json_obj["NTEE_MAJOR"] = ntee_major(ntee_code)
+    if "SUBSECTION" in json_obj:
+        json_obj["SUBSECTION_NAME"]=SUBSECTION.get(json_obj["SUBSECTION"], json_obj["SUBSECTION"])
+    if "AFFILIATION" in json_obj:
+        json_obj["AFFILIATION_NAME"]=AFFILIATION.get(json_obj["AFFILIATION"], json_obj["AFFILIATION"])
+    if "ORGANIZATION" in json_obj:
+        json_obj["ORGANIZATION_NAME"]=ORGANIZATION.get(json_obj["ORGANIZATION"], json_obj["ORGANIZATION"])
+    if "FOUNDATION" in json_obj:
+        json_obj["FOUNDATION_NAME"]=FOUNDATION.get(json_obj["FOUNDATION"], json_obj["FOUNDATION"])
+    if "DEDUCTIBILITY" in json_obj:
+        json_obj["DEDUCTIBILITY_NAME"]=DEDUCTIBILITY.get(json_obj["DEDUCTIBILITY"], json_obj["DEDUCTIBILITY"])
+    if "STATUS" in json_obj:
+        json_obj["STATUS_NAME"]=STATUS.get(json_obj["STATUS"], json_obj["STATUS"])
+    if "FILING_REQ_CD" in json_obj:
+        json_obj["FILING_REQ_NAME"]=FILING_REQ_CD.get(json_obj["FILING_REQ_CD"], json_obj["FILING_REQ_CD"])
+    if "PF_FILING_REQ_CD" in json_obj:
+        json_obj["PF_FILING_REQ_NAME"]=PF_FILING_REQ_CD.get(json_obj["PF_FILING_REQ_CD"], json_obj["PF_FILING_REQ_CD"])
+    if "ASSET_CD" in json_obj:
+        json_obj["ASSET_RANGE"]=ASSET_CD.get(json_obj["ASSET_CD"], json_obj["ASSET_CD"])
+    if "INCOME_CD" in json_obj:
+        json_obj["INCOME_RANGE"]=INCOME_CD.get(json_obj["INCOME_CD"], json_obj["INCOME_CD"])
+    return json_obj
+
+
+def enrich_row(
+    json_obj: dict[str, str], ntee: NTEEManager, vectors: bool = True
+) -> dict:
+    """Attach the human readable names for the coded fields of one row.
+
+    With vectors=False CAUSE_VECTOR is left None for the caller to fill in
+    (enrich_rows computes a whole batch in one call).
+    """
+    lookup_codes(json_obj, ntee)
+    if "ZIP" in json_obj:
+        json_obj["ZIP5"] = zip5(json_obj["ZIP"])
+        json_obj["LOCATION"] = ZipCentroids.load().geo_point(json_obj["ZIP"])
+    if "NTEE_CD" in json_obj or "NAME" in json_obj:
+        json_obj["CAUSE_VECTOR"] = None
+        if vectors:
+            (json_obj["CAUSE_VECTOR"],) = CauseModel.load().document_vectors(
+                [json_obj.get("NTEE_CD", "")], [json_obj.get("NAME", "")]
+            )
+    if "NAME" in json_obj:
+        json_obj["NAME_SUGGEST"] = name_suggest(
+            json_obj["NAME"],
+            json_obj.get("SORT_NAME", ""),
+            suggest_weight(
+                json_obj.get("ASSET_AMT", ""), json_obj.get("REVENUE_AMT", "")
+            ),
+        )
+    return json_obj
+
+
+def enrich_rows(rows: list[dict[str, str]], ntee: NTEEManager) -> list[dict]:
+    """enrich_row for a batch of rows, with one document_vectors call for the
+    CAUSE_VECTORs of all of them."""
+    documents = [enrich_row(row, ntee, vectors=False) for row in rows]
+    vectored = [doc for doc in documents if "CAUSE_VECTOR" in doc]
+    vectors = CauseModel.load().document_vectors(
+        [doc.get("NTEE_CD", "") for doc in vectored],
+        [doc.get("NAME", "") for doc in vectored],
+    )
+    for doc, vector in zip(vectored, vectors):
+        doc["CAUSE_VECTOR"] = vector
+    return documents
+
+
+def read_row_chunks(
+    csv_paths: Iterable[str], chunk_size: int = COLUMN_CHUNK_SIZE
+) -> Iterator[list[tuple[str, ...]]]:
+    """Yield chunks of rows as tuples of the selected fields (in fields order)."""
+    for path in csv_paths:
+        with open(path, newline="", encoding="utf-8") as csvfile:
+            reader = csv.reader(csvfile)
+            header = next(reader, []) + [""]
+            # Missing columns point at the padding cell appended to every row
+            getter = itemgetter(
+                *(header.index(field) if field in header else -1 for field in fields)
+            )
+            while True:
+                rows = [getter(row + [""]) for row in islice(reader, chunk_size)]
+                if not rows:
+                    break
+                yield rows
+
+
+def lookup_code_columns(
+    columns: dict[str, list], ntee: NTEEManager
+) -> dict[str, list]:
+    """The codebook and code table lookups of enrich_columns: every distinct
+    code is resolved once per chunk."""
+    enriched = {}
+    codes = columns["NTEE_CD"]
+    entries = {}
+    for code in set(codes):
+        entry = ntee.get_entry(code[:3] if len(code) == 4 else code)
+        entries[code] = (
+            (entry.get("title"), entry.get("description"), entry.get("keywords", []))
+            if entry
+            else ("Unknown code", "Unknown code", [])
+        )
+    resolved = [entries[code] for code in codes]
+    enriched["NTEE_TITLE"] = [entry[0] for entry in resolved]
+    enriched["NTEE_DESCRIPTION"] = [entry[1] for entry in resolved]
+    enriched["NTEE_KEYWORDS"] = [entry[2] for entry in resolved]
+    majors = {code: ntee_major(code) for code in entries}
+    enriched["NTEE_MAJOR"] = [majors[code] for code in codes]
+
+    for code_field, name_field, table in CODE_COLUMNS:
+        values = columns[code_field]
+        names = {value: table.get(value, value) for value in set(values)}
+        enriched[name_field] = [names[value] for value in values]
+    return enriched
+
+
+def enrich_columns(columns: dict[str, list], ntee: NTEEManager) -> dict[str, list]:
+    """Columnar version of enrich_row.
+
+    Takes {field: values} for the ENRICH_COLUMNS and returns {enriched field: values}.
+    """
+    enriched = lookup_code_columns(columns, ntee)
+
+    if "ZIP" in columns:
+        zip_centroids = ZipCentroids.load()
+        distinct = set(columns["ZIP"])
+        zips = {value: zip5(value) for value in distinct}
+        enriched["ZIP5"] = [zips[value] for value in columns["ZIP"]]
+        points = {value: zip_centroids.geo_point(value) for value in distinct}
+        enriched["LOCATION"] = [points[value] for value in columns["ZIP"]]
+
+    enriched["CAUSE_VECTOR"] = CauseModel.load().document_vectors(
+        columns["NTEE_CD"], columns["NAME"]
+    )
+
+    if "NAME" in columns:
+        enriched["NAME_SUGGEST"] = [
+            name_suggest(name, sort_name, suggest_weight(assets, revenue))
+            for name, sort_name, assets, revenue in zip(
+                columns["NAME"],
+                columns["SORT_NAME"],
+                columns["ASSET_AMT"],
+                columns["REVENUE_AMT"],
+            )
+        ]
+    return enriched
+
+
+def enrich_chunk(rows: list[tuple[str, ...]], ntee: NTEEManager) -> Iterator[dict]:
+    """Enrich a chunk of field tuples column-wise and yield one document per row."""
+    positions = {field: i for i, field in enumerate(fields)}
+    columns = {
+        field: [row[positions[field]] for row in rows]
+        for field in ENRICH_COLUMNS
+    }
+    enriched = enrich_columns(columns, ntee)
+    names = fields + list(enriched)
+    for row, extra in zip(rows, zip(*enriched.values())):
+        yield dict(zip(names, row + extra))
+
+
+def iter_documents(
+    csv_paths: Iterable[str],
+    ntee: NTEEManager | None = None,
+    columnar: bool = True,
+    chunk_size: int = COLUMN_CHUNK_SIZE,
+) -> Iterator[dict]:
+    """Stream enriched documents from BMF CSVs.
+
+    The columnar mode enriches chunk_size rows at a time; columnar=False
+    keeps the original row-by-row loop, buffering chunk_size rows so their
+    CAUSE_VECTORs take one call (enrich_rows). Both produce identical
+    documents.
+    """
+    ntee = ntee or NTEEManager(ntee_path)
+    if not columnar:
+        rows = read_rows(csv_paths)
+        while chunk := list(islice(rows, chunk_size)):
+            yield from enrich_rows(chunk, ntee)
+        return
+    for rows in read_row_chunks(csv_paths, chunk_size):
+        yield from enrich_chunk(rows, ntee)
+
+
+def _open_text(path: str, mode: str) -> IO[str]:
+    """Open a text file, transparently (de)compressing *.gz paths."""
+    if path.endswith(".gz"):
+        return gzip.open(path, mode + "t", encoding="utf-8")
+    return open(path, mode, encoding="utf-8")
+
+
+def write_ndjson(documents: Iterable[dict], path: str) -> int:
+    """Write documents as newline-delimited JSON (gzip if path ends in .gz)."""
+    count = 0
+    with _open_text(path, "w") as f:
+        for doc in documents:
+            f.write(json.dumps(doc, ensure_ascii=False))
+            f.write("\n")
+            count += 1
+    return count
+
+
+def read_ndjson(path: str) -> Iterator[dict]:
+    """Stream documents back out of a (optionally gzipped) NDJSON file."""
+    with _open_text(path, "r") as f:
+        for line in f:
+            if line.strip():
+                yield json.loads(line)
+
 
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Enrich IRS EO BMF CSVs and write them out as NDJSON."
+    )
+    parser.add_argument(
+        "csv_paths", nargs="*", default=[csv_path], help="BMF CSVs (eo_oh, eo_ca, ...)"
+    )
+    parser.add_argument(
+        "-o", "--output", default=output_path, help="*.ndjson or *.ndjson.gz"
+    )
+    parser.add_argument(
+        "--row-by-row", action="store_true", help="use the per-row enrichment loop"
+    )
+    args = parser.parse_args()
 
+    documents = iter_documents(args.csv_paths, columnar=not args.row_by_row)
+    count = write_ndjson(documents, args.output)
+    print(f"Wrote {count} documents to {args.output}")
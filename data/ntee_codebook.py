@@ -0,0 +1,186 @@
+"""Compact, memory-mapped NTEE codebook.
+
+ntee_codes.json is compiled once into ntee_codes.bin:
+
+    header      magic, record count, keyword ref count, string count
+    records     (code, title, description, first keyword ref, keyword count)
+                as string ids, sorted by code
+    keyword refs string ids
+    offsets     start of every string in the string table (+ end sentinel)
+    strings     interned UTF-8 strings, each distinct string stored once
+
+The file is opened with mmap, so any number of worker processes share a
+single copy through the page cache. Exact lookups are a binary search over
+the sorted code keys and prefix enumeration ("all codes under K") is a
+range scan from the lower bound.
+"""
+
+import json
+import mmap
+import os
+import struct
+import sys
+from bisect import bisect_left
+
+DATA_DIR = os.path.dirname(os.path.abspath(__file__))
+ntee_path = os.path.join(DATA_DIR, "ntee_codes.json")
+
+MAGIC = b"NTEECB01"
+HEADER = struct.Struct("<8sIII")
+RECORD = struct.Struct("<IIIII")
+UINT = struct.Struct("<I")
+
+
+def compiled_path(json_path: str) -> str:
+    """Return where the compiled codebook for a codes JSON file lives."""
+    return os.path.splitext(json_path)[0] + ".bin"
+
+
+def compile_codebook(json_path: str = ntee_path, out_path: str | None = None) -> str:
+    """Compile the codes JSON into the binary codebook format and return its path."""
+    out_path = out_path or compiled_path(json_path)
+    with open(json_path, "r", encoding="utf-8") as f:
+        codebook: dict[str, dict] = json.load(f)
+
+    string_ids: dict[str, int] = {}
+    strings: list[bytes] = []
+
+    def intern(value: str) -> int:
+        if value not in string_ids:
+            string_ids[value] = len(strings)
+            strings.append(value.encode("utf-8"))
+        return string_ids[value]
+
+    records = []
+    keyword_refs: list[int] = []
+    for code in sorted(codebook, key=lambda c: c.upper().encode("utf-8")):
+        entry = codebook[code]
+        keywords = entry.get("keywords", [])
+        records.append(
+            RECORD.pack(
+                intern(code.upper()),
+                intern(entry.get("title", "")),
+                intern(entry.get("description", "")),
+                len(keyword_refs),
+                len(keywords),
+            )
+        )
+        keyword_refs.extend(intern(keyword) for keyword in keywords)
+
+    offsets = [0]
+    for value in strings:
+        offsets.append(offsets[-1] + len(value))
+
+    # Write to a temp file and swap it in so concurrent readers never see a partial file
+    tmp_path = f"{out_path}.{os.getpid()}.tmp"
+    with open(tmp_path, "wb") as f:
+        f.write(HEADER.pack(MAGIC, len(records), len(keyword_refs), len(strings)))
+        f.write(b"".join(records))
+        f.write(b"".join(UINT.pack(ref) for ref in keyword_refs))
+        f.write(b"".join(UINT.pack(offset) for offset in offsets))
+        f.write(b"".join(strings))
+    os.replace(tmp_path, out_path)
+    return out_path
+
+
+class NTEECodebook:
+    def __init__(self, path: str):
+        """Memory-map a compiled codebook file."""
+        with open(path, "rb") as f:
+            self._buf = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, self._count, keyword_count, string_count = HEADER.unpack_from(
+            self._buf, 0
+        )
+        if magic != MAGIC:
+            raise ValueError(f"{path} is not a compiled NTEE codebook")
+        self._records_at = HEADER.size
+        self._keywords_at = self._records_at + self._count * RECORD.size
+        self._offsets_at = self._keywords_at + keyword_count * UINT.size
+        self._strings_at = self._offsets_at + (string_count + 1) * UINT.size
+        # The sorted code keys are tiny (a few KB), so keep them decoded for bisect
+        self._codes = [self._code(i) for i in range(self._count)]
+
+    @classmethod
+    def load(cls, json_path: str = ntee_path) -> "NTEECodebook":
+        """Open the compiled codebook for json_path, (re)compiling it if stale."""
+        path = compiled_path(json_path)
+        if not os.path.exists(path) or os.path.getmtime(path) < os.path.getmtime(
+            json_path
+        ):
+            compile_codebook(json_path, path)
+        return cls(path)
+
+    def __len__(self) -> int:
+        return self._count
+
+    def _bytes(self, string_id: int) -> bytes:
+        start, end = struct.unpack_from(
+            "<II", self._buf, self._offsets_at + string_id * UINT.size
+        )
+        return self._buf[self._strings_at + start : self._strings_at + end]
+
+    def _record(self, index: int) -> tuple[int, int, int, int, int]:
+        return RECORD.unpack_from(self._buf, self._records_at + index * RECORD.size)
+
+    def _code(self, index: int) -> bytes:
+        return self._bytes(
+            UINT.unpack_from(self._buf, self._records_at + index * RECORD.size)[0]
+        )
+
+    def _index(self, code: str) -> int | None:
+        key = code.encode("utf-8")
+        index = bisect_left(self._codes, key)
+        if index < self._count and self._codes[index] == key:
+            return index
+        return None
+
+    def get_entry(self, code: str) -> dict | None:
+        """Return the entry for an (upper-case) code, or None if not found."""
+        index = self._index(code)
+        if index is None:
+            return None
+        _, title, description, first_keyword, keyword_count = self._record(index)
+        keyword_ids = struct.unpack_from(
+            f"<{keyword_count}I",
+            self._buf,
+            self._keywords_at + first_keyword * UINT.size,
+        )
+        keywords = [self._bytes(i).decode("utf-8") for i in keyword_ids]
+        return {
+            "title": self._bytes(title).decode("utf-8"),
+            "description": self._bytes(description).decode("utf-8"),
+            "keywords": keywords,
+        }
+
+    def codes_with_prefix(self, prefix: str) -> list[str]:
+        """Return every code starting with prefix, e.g. all codes under "K"."""
+        key = prefix.encode("utf-8")
+        codes = []
+        index = bisect_left(self._codes, key)
+        while index < self._count:
+            code = self._codes[index]
+            if not code.startswith(key):
+                break
+            codes.append(code.decode("utf-8"))
+            index += 1
+        return codes
+
+    def list_codes(self) -> list[str]:
+        """Return a sorted list of all codes in the codebook."""
+        return [code.decode("utf-8") for code in self._codes]
+
+    def major_groups(self) -> dict[str, str]:
+        """Return the single-letter major groups mapped to their titles."""
+        groups = {}
+        for index, code in enumerate(self._codes):
+            if len(code) == 1:
+                groups[code.decode("utf-8")] = self._bytes(
+                    self._record(index)[1]
+                ).decode("utf-8")
+        return groups
+
+
+if __name__ == "__main__":
+    json_path = sys.argv[1] if len(sys.argv) > 1 else ntee_path
+    out_path = compile_codebook(json_path)
+    print(f"Compiled {len(NTEECodebook(out_path))} codes into {out_path}")
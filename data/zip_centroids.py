@@ -0,0 +1,160 @@
+"""Offline ZIP code centroids, for geo points at ingest and location search.
+
+zip_centroids.csv.gz has one row per US ZIP code:
+
+    ZIP, STATE, CITY, LAT, LON, ALIASES
+
+where CITY is the USPS preferred place name and ALIASES the other names
+USPS accepts for the ZIP (";"-separated, e.g. 43221 is COLUMBUS with the
+alias UPPER ARLINGTON). It was generated from the dataset bundled with the
+zipcodes package (MIT licensed) by
+
+    pip install zipcodes && python data/zip_centroids.py --build
+
+ZipCentroids loads it into dicts once per process (~43k rows, a quarter
+of a second): a ZIP resolves to its centroid and a city to the mean of the
+centroids of every ZIP carrying its name, so "Columbus" covers Upper
+Arlington's ZIPs too.
+"""
+
+import argparse
+import csv
+import gzip
+import io
+import os
+import re
+from collections import defaultdict
+from functools import lru_cache
+from typing import NamedTuple
+
+DATA_DIR = os.path.dirname(os.path.abspath(__file__))
+zip_centroids_path = os.path.join(DATA_DIR, "zip_centroids.csv.gz")
+
+COLUMNS = ["ZIP", "STATE", "CITY", "LAT", "LON", "ALIASES"]
+ZIP_CODE = re.compile(r"^(\d{5})(?:-?\d{4})?$")
+CITY_STATE = re.compile(r"^(.+?)[,\s]+([A-Za-z]{2})$")
+
+
+class Place(NamedTuple):
+    label: str
+    lat: float
+    lon: float
+
+
+# USPS spells these out ("SAINT LOUIS"); answers often don't ("St. Louis")
+CITY_ABBREVIATIONS = {"ST": "SAINT", "STE": "SAINTE", "FT": "FORT", "MT": "MOUNT"}
+
+
+def zip5(zip_code: str) -> str | None:
+    """The 5-digit ZIP of a 5-digit or ZIP+4 code ("44141-1361" -> "44141"),
+    None for anything else."""
+    match = ZIP_CODE.match(zip_code.strip())
+    return match.group(1) if match else None
+
+
+def _city_key(name: str) -> str:
+    words = name.replace(".", " ").upper().split()
+    return " ".join(CITY_ABBREVIATIONS.get(word, word) for word in words)
+
+
+class ZipCentroids:
+    def __init__(self, rows: list[dict[str, str]]):
+        """In-memory ZIP and city lookups over the rows of the centroid table."""
+        self.zips: dict[str, tuple[float, float]] = {}
+        self.states: set[str] = set()
+        points: dict[tuple[str, str], list[tuple[float, float]]] = defaultdict(list)
+        for row in rows:
+            point = (float(row["LAT"]), float(row["LON"]))
+            self.zips[row["ZIP"]] = point
+            self.states.add(row["STATE"])
+            names = [row["CITY"]] + [a for a in row["ALIASES"].split(";") if a]
+            for name in names:
+                points[_city_key(name), row["STATE"]].append(point)
+
+        # (CITY, STATE) -> mean of its ZIP centroids, and CITY -> the states
+        # having one, most ZIPs first (what an answer without a state means)
+        self.cities: dict[tuple[str, str], tuple[float, float]] = {}
+        by_name: dict[str, list[tuple[int, str]]] = defaultdict(list)
+        for (city, state), city_points in points.items():
+            self.cities[city, state] = (
+                round(sum(lat for lat, _ in city_points) / len(city_points), 4),
+                round(sum(lon for _, lon in city_points) / len(city_points), 4),
+            )
+            by_name[city].append((len(city_points), state))
+        self.city_states = {
+            city: [state for _, state in sorted(found, key=lambda f: (-f[0], f[1]))]
+            for city, found in by_name.items()
+        }
+
+    @classmethod
+    @lru_cache(maxsize=None)
+    def load(cls, path: str = zip_centroids_path) -> "ZipCentroids":
+        """Read (once per process) the centroid table at path."""
+        with gzip.open(path, "rt", encoding="utf-8", newline="") as f:
+            return cls(list(csv.DictReader(f)))
+
+    def centroid(self, zip_code: str) -> tuple[float, float] | None:
+        """(lat, lon) of a 5-digit or ZIP+4 code, None if unknown."""
+        return self.zips.get(zip_code.strip()[:5])
+
+    def geo_point(self, zip_code: str) -> str | None:
+        """Elasticsearch geo_point ("lat,lon") for a BMF ZIP field."""
+        point = self.centroid(zip_code)
+        return f"{point[0]},{point[1]}" if point else None
+
+    def resolve(self, location: str) -> Place | None:
+        """Resolve "43221", "Columbus", "Columbus, OH" or "Upper Arlington OH"."""
+        location = location.strip()
+        match = ZIP_CODE.match(location)
+        if match:
+            point = self.zips.get(match.group(1))
+            return Place(match.group(1), *point) if point else None
+        match = CITY_STATE.match(location)
+        if match and match.group(2).upper() in self.states:
+            city, states = _city_key(match.group(1)), [match.group(2).upper()]
+        else:
+            city = _city_key(location)
+            states = self.city_states.get(city, [])
+        for state in states:
+            point = self.cities.get((city, state))
+            if point:
+                return Place(f"{city}, {state}", *point)
+        return None
+
+
+def build(path: str = zip_centroids_path) -> int:
+    """Write the centroid table from the zipcodes package; returns the row count."""
+    import zipcodes
+
+    rows = [
+        [
+            entry["zip_code"],
+            entry["state"],
+            entry["city"].upper(),
+            entry["lat"],
+            entry["long"],
+            ";".join(sorted({alias.upper() for alias in entry["acceptable_cities"]})),
+        ]
+        for entry in sorted(zipcodes.list_all(), key=lambda e: e["zip_code"])
+        if entry["lat"] and entry["long"]
+    ]
+    # mtime=0 so rebuilding from the same zipcodes release is byte-identical
+    with gzip.GzipFile(path, "wb", mtime=0) as raw, io.TextIOWrapper(
+        raw, encoding="utf-8", newline=""
+    ) as f:
+        writer = csv.writer(f)
+        writer.writerow(COLUMNS)
+        writer.writerows(rows)
+    return len(rows)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="ZIP centroid table.")
+    parser.add_argument("--build", action="store_true", help="regenerate the table")
+    parser.add_argument("location", nargs="*", help="locations to resolve")
+    args = parser.parse_args()
+    if args.build:
+        print(f"Wrote {build()} ZIP codes to {zip_centroids_path}")
+    table = ZipCentroids.load()
+    for location in args.location:
+        print(f"{location!r}: {table.resolve(location)}")
@@ -48,7 +48,8 @@ function Explore() {
             filter: [
               ...(city ? [{ match: { CITY: city } }] : []),
               ...(stateFilter ? [{ match: { STATE: stateFilter } }] : []),
-              ...(zip ? [{ match: { ZIP: zip } }] : [])
+              // ZIP holds ZIP+4 codes; ZIP5 is the 5-digit ZIP
+              ...(zip ? [{ term: { ZIP5: zip.trim().slice(0, 5) } }] : [])
             ]
           }
         }
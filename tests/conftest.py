@@ -0,0 +1,61 @@
+"""Shared setup: backend/ and data/ on sys.path, as the apps put them."""
+
+import importlib
+import os
+import sys
+import threading
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path[:0] = [os.path.join(ROOT, "backend"), os.path.join(ROOT, "data")]
+sys.path.append(os.path.join(ROOT, "benchmarks"))  # stand_in_es
+
+SAMPLE_CSV = os.path.join(ROOT, "data", "eo_oh_1k.csv")
+
+# Modules that read their settings at import (see load_app)
+APP_MODULES = (
+    "api",
+    "app",
+    "asgi_app",
+    "async_es_manager",
+    "es_client",
+    "es_manager",
+    "local_search",
+    "write_buffer",
+)
+
+
+@pytest.fixture
+def load_app(monkeypatch):
+    """load_app("app" or "asgi_app", SETTING=value, ...): the app module,
+    imported afresh with those environment settings"""
+
+    def load(name: str, **env: str):
+        for key, value in env.items():
+            monkeypatch.setenv(key, value)
+        for module in APP_MODULES:
+            sys.modules.pop(module, None)
+        return importlib.import_module(name)
+
+    yield load
+    for module in APP_MODULES:
+        sys.modules.pop(module, None)
+
+
+@pytest.fixture
+def stand_in():
+    """A stand-in Elasticsearch node (benchmarks/stand_in_es.py) on a free
+    port: yields its handler class, with host set to the node's URL"""
+    from load_test import free_port
+    from stand_in_es import StandInHandler, serve
+
+    port = free_port()
+    server = serve(port, latency_ms=0)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    StandInHandler.host = f"http://127.0.0.1:{port}"
+    yield StandInHandler
+    server.shutdown()
+    server.server_close()
+    StandInHandler.available = True
+    StandInHandler.pits.clear()
@@ -0,0 +1,88 @@
+import cause_vectors
+import numpy as np
+import pytest
+from bench_cause_vectors import exact_neighbours
+from conftest import SAMPLE_CSV
+from csv_to_json import iter_documents
+from local_search import LocalSearchManager
+from schema import CAUSE_VECTOR, CAUSE_VECTOR_DIMS, EIN, normalize_document
+from search_builder import (
+    CAUSE_FILTERS,
+    KNN_SIZE,
+    build_es_query_from_survey,
+    build_knn_query_from_survey,
+    survey_vectors,
+)
+
+INDEX_NAME = "nonprofits-test"
+# Share of min(KNN_SIZE, prefix matches) every cause's kNN query must return
+RECALL_FLOOR = 0.9
+
+
+@pytest.fixture(scope="module")
+def organizations():
+    documents = [normalize_document(doc) for doc in iter_documents([SAMPLE_CSV])]
+    manager = LocalSearchManager()
+    manager.create_index(INDEX_NAME)
+    manager.bulk_add(documents, INDEX_NAME, id_field=EIN)
+    return documents, manager
+
+
+def matching(manager, query: dict) -> set:
+    """EINs of every organization the query's filters match"""
+    query = {**query, "size": 10_000, "_source": [EIN]}
+    return {hit["_id"] for hit in manager.search(query, INDEX_NAME)}
+
+
+@pytest.mark.parametrize("cause", list(CAUSE_FILTERS))
+def test_knn_hits_stay_in_cause(organizations, cause):
+    documents, manager = organizations
+    knn = build_knn_query_from_survey([{"answer": cause}])["knn"]
+    assert CAUSE_FILTERS[cause] in knn["filter"]
+
+    # What Elasticsearch keeps of the nearest neighbours: the filter's matches
+    allowed = matching(manager, {"query": {"bool": {"filter": knn["filter"]}}})
+    in_cause = matching(manager, build_es_query_from_survey([{"answer": cause}]))
+    assert allowed == in_cause
+    rows = np.array(
+        [i for i, doc in enumerate(documents) if doc[EIN] in allowed], dtype=np.int64
+    )
+    matrix = np.array(
+        [doc.get(CAUSE_VECTOR) or [0.0] * CAUSE_VECTOR_DIMS for doc in documents],
+        dtype=np.float32,
+    )
+    hits = exact_neighbours(matrix, knn["query_vector"], knn["k"], rows)
+
+    assert all(documents[i][EIN] in in_cause for i in hits)
+    if in_cause:
+        assert len(hits) / min(KNN_SIZE, len(in_cause)) >= RECALL_FLOOR
+
+
+def test_free_text_cause_is_not_filtered():
+    knn = build_knn_query_from_survey([{"answer": "food pantry"}])["knn"]
+    assert "filter" not in knn
+
+
+def test_knn_filter_keeps_the_other_answers():
+    answers = [{"answer": "Arts & Culture"}, {"answer": "OH"}]
+    knn = build_knn_query_from_survey(answers)["knn"]
+    assert knn["filter"][0] == CAUSE_FILTERS["Arts & Culture"]
+    assert len(knn["filter"]) == 2
+
+
+def test_unknown_environment_keeps_the_knn_query():
+    answers = [{"answer": "Arts & Culture"}, {}, {}, {}, {"answer": "Hybrid"}]
+    query = build_knn_query_from_survey(answers)
+    assert query["knn"]["query_vector"] == survey_vectors()["Arts & Culture", ""]
+
+
+def test_query_text_is_not_memoized(monkeypatch):
+    model = cause_vectors.CauseModel.load()
+    before = len(model._word_ids)
+    model.text_vector("zyzzyva quokka habitat")
+    assert len(model._word_ids) == before
+
+    monkeypatch.setattr(cause_vectors, "WORD_MEMO_SIZE", 2)
+    model.document_vectors(["C32", "C32"], ["Quokka Habitat Fund", "Zyzzyva Trust"])
+    model.document_vectors(["C32"], ["Habitat"])
+    assert len(model._word_ids) == 1  # started over
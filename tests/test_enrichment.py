@@ -0,0 +1,35 @@
+from itertools import islice
+
+import cause_vectors
+from conftest import SAMPLE_CSV
+from csv_to_json import NTEEManager, enrich_row, iter_documents, ntee_path, read_rows
+from schema import CAUSE_VECTOR
+
+
+def test_row_and_columnar_documents_are_identical():
+    rows = list(iter_documents([SAMPLE_CSV], columnar=False, chunk_size=64))
+    columns = list(iter_documents([SAMPLE_CSV], columnar=True))
+    assert rows == columns
+    assert [list(doc) for doc in rows[:3]] == [list(doc) for doc in columns[:3]]
+
+
+def test_row_path_batches_cause_vectors(monkeypatch):
+    model = cause_vectors.CauseModel.load()
+    calls = []
+    document_vectors = model.document_vectors
+
+    def counted(codes, names):
+        calls.append(len(codes))
+        return document_vectors(codes, names)
+
+    monkeypatch.setattr(model, "document_vectors", counted)
+    documents = list(
+        islice(iter_documents([SAMPLE_CSV], columnar=False, chunk_size=100), 250)
+    )
+    assert calls[:3] == [100, 100, 100]
+    # The same vectors as one call per row
+    ntee = NTEEManager(ntee_path)
+    single = [enrich_row(row, ntee) for row in islice(read_rows([SAMPLE_CSV]), 3)]
+    assert [doc[CAUSE_VECTOR] for doc in documents[:3]] == [
+        doc[CAUSE_VECTOR] for doc in single
+    ]
@@ -0,0 +1,65 @@
+import asyncio
+
+from facets import facet_response
+from schema import EIN, NAME, STATE
+
+NEW_ORGANIZATION = {"id": "999999999", EIN: "999999999", NAME: "NEW", STATE: "WY"}
+
+
+def states(response: dict) -> dict:
+    return {bucket["key"]: bucket["count"] for bucket in response["facets"]["state"]}
+
+
+def test_global_facets_fall_back_to_the_aggregation_after_a_write(load_app):
+    app = load_app("app", SEARCH_BACKEND="local")
+    manager, client = app.es_manager, app.app.test_client()
+    published = manager.get_global_facets(app.INDEX_NAME)
+    response = client.post("/api/facets", json=[]).get_json()
+    assert response == facet_response(published)
+
+    assert client.post("/organizations", json=NEW_ORGANIZATION).status_code == 200
+    assert manager.get_global_facets(app.INDEX_NAME) is None
+    counts = client.post("/api/facets", json=[]).get_json()
+    assert counts["total"] == published["total"] + 1
+    assert states(counts)["WY"] == 1
+
+    # The next publish (bulk_add.py) is served from _meta again
+    manager.put_global_facets(app.INDEX_NAME, manager.facets(app.INDEX_NAME))
+    assert facet_response(manager.get_global_facets(app.INDEX_NAME)) == counts
+
+
+def test_global_facets_fall_back_after_a_write_asgi(load_app):
+    app = load_app("asgi_app", SEARCH_BACKEND="local")
+
+    async def write_then_count():
+        client = app.app.test_client()
+        before = await (await client.post("/api/facets", json=[])).get_json()
+        await client.post("/organizations", json=NEW_ORGANIZATION)
+        after = await (await client.post("/api/facets", json=[])).get_json()
+        return before, after
+
+    before, after = asyncio.run(write_then_count())
+    assert after["total"] == before["total"] + 1
+    assert states(after)["WY"] == 1
+
+
+def test_facets_are_marked_stale_once_per_index_version(load_app, stand_in):
+    app = load_app("app", ELASTIC_HOST=stand_in.host, RESULT_CACHE_TTL="0")
+    manager, client = app.es_manager, app.app.test_client()
+    indices = manager.es.indices
+    lookups = []
+
+    def get_mapping(**kwargs):
+        lookups.append(kwargs["index"])
+        return type(indices).get_mapping(indices, **kwargs)
+
+    indices.get_mapping = get_mapping
+    url = f"/organizations/{NEW_ORGANIZATION['id']}"
+    for name in ("A", "B", "C"):
+        assert client.put(url, json={**NEW_ORGANIZATION, NAME: name}).status_code == 200
+    assert len(lookups) == 1
+
+    # The stand-in keeps no _meta: a version check sees the mark is gone
+    manager.index_version(app.INDEX_NAME)
+    assert client.delete(url).status_code == 200
+    assert len(lookups) == 3
@@ -0,0 +1,66 @@
+import asyncio
+
+import pytest
+
+CURSOR_SEARCH = {"query": {"query": {"match_all": {}}}, "size": 5}
+
+
+@pytest.mark.parametrize("cursor", [123, ["a"], {"pit": "x"}])
+def test_non_string_cursor_is_a_bad_request(load_app, cursor):
+    app = load_app("app", SEARCH_BACKEND="local")
+    response = app.app.test_client().post(
+        "/api/search", json={**CURSOR_SEARCH, "cursor": cursor}
+    )
+    assert response.status_code == 400
+    assert "Invalid cursor" in response.get_json()["error"]
+
+
+def test_malformed_cursor_is_a_bad_request(load_app):
+    app = load_app("app", SEARCH_BACKEND="local")
+    response = app.app.test_client().post(
+        "/api/search", json={**CURSOR_SEARCH, "cursor": "not-a-cursor"}
+    )
+    assert response.status_code == 400
+
+
+def test_decode_cursor_rejects_non_strings(load_app):
+    load_app("app", SEARCH_BACKEND="local")
+    from es_manager import decode_cursor
+
+    with pytest.raises(ValueError, match="Invalid cursor"):
+        decode_cursor(123)
+
+
+def test_expired_cursor_is_gone(load_app, stand_in):
+    app = load_app("app", ELASTIC_HOST=stand_in.host)
+    client = app.app.test_client()
+    first = client.post("/api/search", json={**CURSOR_SEARCH, "cursor": None})
+    assert first.status_code == 200
+    cursor = first.get_json()["cursor"]
+    second = client.post("/api/search", json={**CURSOR_SEARCH, "cursor": cursor})
+    assert second.status_code == 200
+
+    stand_in.pits.clear()  # the point-in-time expires between pages
+    expired = client.post("/api/search", json={**CURSOR_SEARCH, "cursor": cursor})
+    assert expired.status_code == 410
+    assert "Expired cursor" in expired.get_json()["error"]
+
+
+def test_expired_cursor_is_gone_asgi(load_app, stand_in):
+    app = load_app("asgi_app", ELASTIC_HOST=stand_in.host)
+
+    async def pages():
+        client = app.app.test_client()
+        bad = await client.post("/api/search", json={**CURSOR_SEARCH, "cursor": 123})
+        first = await client.post(
+            "/api/search", json={**CURSOR_SEARCH, "cursor": None}
+        )
+        cursor = (await first.get_json())["cursor"]
+        stand_in.pits.clear()
+        expired = await client.post(
+            "/api/search", json={**CURSOR_SEARCH, "cursor": cursor}
+        )
+        await app.es_manager.close()
+        return bad.status_code, first.status_code, expired.status_code
+
+    assert asyncio.run(pages()) == (400, 200, 410)
@@ -0,0 +1,166 @@
+"""The apps against a stand-in node that goes away, comes back or is slow."""
+
+import asyncio
+import logging
+import threading
+import time
+
+import pytest
+from load_test import free_port
+
+ANSWERS = [{"answer": "Environmental"}]
+OTHER_ANSWERS = [{"answer": "Arts & Culture"}]
+
+BREAKER_RESET = 0.3
+SEARCH_TIMEOUT = 0.2
+SETTINGS = {
+    "ELASTIC_BREAKER_FAILURES": "2",
+    "ELASTIC_BREAKER_RESET": str(BREAKER_RESET),
+    "ELASTIC_SEARCH_TIMEOUT": str(SEARCH_TIMEOUT),
+    # Every request reaches the manager; expired entries still stand in
+    "RESULT_CACHE_TTL": "0",
+    "RESULT_CACHE_VERSION_CHECK": "0",
+}
+
+
+@pytest.fixture(autouse=True)
+def quiet_transport():
+    # The client logs every failed attempt with a traceback
+    logging.getLogger("elastic_transport").setLevel(logging.ERROR)
+
+
+def open_circuit(client) -> list:
+    """Survey requests until the breaker opens; return their responses"""
+    responses = [client.post("/api/survey", json=OTHER_ANSWERS) for _ in range(3)]
+    assert [r.status_code for r in responses] == [503, 503, 503]
+    return responses
+
+
+@pytest.mark.parametrize("name", ["app", "asgi_app"])
+def test_import_without_a_cluster(load_app, name):
+    host = f"http://127.0.0.1:{free_port()}"  # nothing listening
+    started = time.perf_counter()
+    load_app(name, ELASTIC_HOST=host, **SETTINGS)
+    assert time.perf_counter() - started < 2
+
+
+def test_unreachable_cluster_is_503_with_retry_after(load_app, stand_in):
+    app = load_app("app", ELASTIC_HOST=stand_in.host, **SETTINGS)
+    client = app.app.test_client()
+    stand_in.available = False
+
+    responses = open_circuit(client)
+    assert app.es_manager.breaker.state == "open"
+    # Failing fast: the client is told when to come back
+    retry_after = responses[-1].headers["Retry-After"]
+    assert 1 <= int(retry_after) <= 1 + BREAKER_RESET
+    assert "temporarily unavailable" in responses[-1].get_json()["error"]
+    assert client.get("/health").status_code == 503
+
+
+def test_stale_result_is_served_with_a_warning(load_app, stand_in):
+    app = load_app("app", ELASTIC_HOST=stand_in.host, **SETTINGS)
+    client = app.app.test_client()
+    fresh = client.post("/api/survey", json=ANSWERS)
+    assert fresh.status_code == 200
+    assert "Warning" not in fresh.headers
+
+    stand_in.available = False
+    stale = client.post("/api/survey", json=ANSWERS)
+    assert stale.status_code == 200
+    assert stale.headers["Warning"] == '110 - "Response is Stale"'
+    assert stale.get_json() == fresh.get_json()
+    # Nothing cached for these answers
+    assert client.post("/api/survey", json=OTHER_ANSWERS).status_code == 503
+
+
+def test_half_open_trial_closes_the_circuit(load_app, stand_in):
+    app = load_app("app", ELASTIC_HOST=stand_in.host, **SETTINGS)
+    client = app.app.test_client()
+    breaker = app.es_manager.breaker
+    stand_in.available = False
+    open_circuit(client)
+
+    # A failed trial opens it again
+    time.sleep(BREAKER_RESET)
+    assert client.post("/api/survey", json=OTHER_ANSWERS).status_code == 503
+    assert breaker.state == "open"
+
+    stand_in.available = True
+    assert client.post("/api/survey", json=ANSWERS).status_code == 503  # still open
+    time.sleep(BREAKER_RESET)
+    assert client.post("/api/survey", json=ANSWERS).status_code == 200
+    assert breaker.state == "closed"
+    assert client.get("/health").status_code == 200
+
+
+def test_slow_search_times_out(load_app, stand_in):
+    app = load_app("app", ELASTIC_HOST=stand_in.host, **SETTINGS)
+    client = app.app.test_client()
+    assert client.post("/api/survey", json=OTHER_ANSWERS).status_code == 200
+    stand_in.latency = 2.0
+    try:
+        started = time.perf_counter()
+        response = client.post("/api/survey", json=ANSWERS)
+        elapsed = time.perf_counter() - started
+    finally:
+        stand_in.latency = 0
+    assert response.status_code == 503
+    # One timeout, not retried: well before the node answers
+    assert elapsed < SEARCH_TIMEOUT * 1.5
+
+
+def test_asgi_app_is_503_then_stale(load_app, stand_in):
+    app = load_app("asgi_app", ELASTIC_HOST=stand_in.host, **SETTINGS)
+
+    async def outage():
+        client = app.app.test_client()
+        fresh = await client.post("/api/survey", json=ANSWERS)
+        stand_in.available = False
+        statuses = [
+            (await client.post("/api/survey", json=OTHER_ANSWERS)).status_code
+            for _ in range(3)
+        ]
+        failing_fast = await client.post("/api/survey", json=OTHER_ANSWERS)
+        stale = await client.post("/api/survey", json=ANSWERS)
+        await app.es_manager.close()
+        return fresh, statuses, failing_fast, stale
+
+    fresh, statuses, failing_fast, stale = asyncio.run(outage())
+    assert fresh.status_code == 200
+    assert statuses == [503, 503, 503]
+    assert failing_fast.status_code == 503
+    assert "Retry-After" in failing_fast.headers
+    assert stale.status_code == 200
+    assert stale.headers["Warning"] == '110 - "Response is Stale"'
+
+
+def test_force_merge_outlasts_the_request_timeout(load_app, stand_in):
+    app = load_app("app", ELASTIC_HOST=stand_in.host, ELASTIC_REQUEST_TIMEOUT="0.2")
+    stand_in.latency = 0.5  # a merge that takes longer than any other call
+    try:
+        app.es_manager.es_admin.indices.forcemerge(
+            index="nonprofits", max_num_segments=1
+        )
+    finally:
+        stand_in.latency = 0
+
+
+def test_bulk_reports_and_retries_unsent_chunks(load_app, stand_in):
+    app = load_app("app", ELASTIC_HOST=stand_in.host, **SETTINGS)
+    manager = app.es_manager
+    documents = [{"EIN": str(i), "NAME": f"Org {i}"} for i in range(4)]
+    stand_in.available = False
+    report = manager.bulk_add(
+        documents, "nonprofits", id_field="EIN", chunk_size=2, max_retries=0
+    )
+    assert report["failed"] == 4
+    errors = [error for chunk in report["chunks"] for error in chunk["errors"]]
+    assert {error["status"] for error in errors} == {None}
+
+    # Back before the retry: every chunk lands
+    threading.Timer(0.1, setattr, (stand_in, "available", True)).start()
+    report = manager.bulk_add(
+        documents, "nonprofits", id_field="EIN", chunk_size=2, initial_backoff=0.5
+    )
+    assert (report["success"], report["failed"]) == (4, 0)
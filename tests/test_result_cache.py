@@ -0,0 +1,53 @@
+from local_search import LocalSearchManager
+from result_cache import ResultCache
+
+INDEX_NAME = "nonprofits-test"
+
+
+def test_result_computed_before_invalidate_is_not_cached():
+    cache = ResultCache()
+    generation = cache.generation
+    cache.invalidate()  # a write lands while the search runs
+    cache.set("key", ["old hits"], generation)
+    assert cache.get("key") is None
+    cache.set("key", ["new hits"], cache.generation)
+    assert cache.get("key") == ["new hits"]
+
+
+def test_get_or_compute_drops_result_of_invalidated_generation():
+    cache = ResultCache()
+
+    def compute():
+        cache.invalidate()
+        return ["hits"]
+
+    assert cache.get_or_compute("key", compute) == ["hits"]
+    assert cache.get("key") is None
+
+
+def test_version_check_is_throttled():
+    cache = ResultCache(version_check=60)
+    assert cache.version_check_due()
+    assert not cache.version_check_due()
+    assert not ResultCache().version_check_due()
+
+
+def test_new_index_version_invalidates():
+    manager = LocalSearchManager()
+    manager.create_index(INDEX_NAME)
+    cache = ResultCache()
+    cache.note_version(manager.index_version(INDEX_NAME))
+    cache.set("key", ["hits"])
+
+    cache.note_version(manager.index_version(INDEX_NAME))
+    assert cache.get("key") == ["hits"]
+
+    # What bulk_add.py does after every load
+    manager.put_global_facets(INDEX_NAME, manager.facets(INDEX_NAME))
+    cache.note_version(manager.index_version(INDEX_NAME))
+    assert cache.get("key") is None
+    assert cache.stats()["invalidations"] == 1
+
+
+def test_missing_index_has_no_version():
+    assert LocalSearchManager().index_version(INDEX_NAME) is None
@@ -0,0 +1,34 @@
+import asyncio
+
+import pytest
+
+SURVEYS = [
+    [{"answer": "Arts & Culture"}],
+    [{"answer": "Arts & Culture"}, {"answer": "Columbus", "radius": "abc"}],
+    [{"answer": "Animal Welfare"}, {"answer": "OH"}],
+]
+
+
+def check(body: dict):
+    valid, invalid, other = body["results"]
+    assert "results" in valid and "results" in other
+    assert invalid == {"error": "Invalid radius: 'abc'", "status": 400}
+
+
+@pytest.mark.parametrize("name", ["app", "asgi_app"])
+def test_invalid_answer_set_fails_only_its_own_slot(load_app, name):
+    app = load_app(name, SEARCH_BACKEND="local")
+    client = app.app.test_client()
+    if name == "app":
+        response = client.post("/api/survey/batch", json={"surveys": SURVEYS})
+        assert response.status_code == 200
+        check(response.get_json())
+        return
+
+    async def batch():
+        response = await client.post("/api/survey/batch", json={"surveys": SURVEYS})
+        return response.status_code, await response.get_json()
+
+    status, body = asyncio.run(batch())
+    assert status == 200
+    check(body)
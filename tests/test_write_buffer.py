@@ -0,0 +1,151 @@
+import asyncio
+
+import pytest
+from write_buffer import (
+    SpoolBusy,
+    WriteBuffer,
+    WriteRejected,
+    WriteSpool,
+    claim_spool,
+)
+
+
+class RejectingManager:
+    """manager.bulk() stand-in that rejects the writes to some (index, id)"""
+
+    def __init__(self, *rejected: tuple[str, str]):
+        self.rejected = set(rejected)
+
+    def bulk(self, actions, **_):
+        errors = [
+            {
+                "_index": action["_index"],
+                "_id": action["_id"],
+                "status": 400,
+                "error": {"type": "mapper_parsing_exception"},
+            }
+            for action in actions
+            if (action["_index"], action["_id"]) in self.rejected
+        ]
+        return {"chunks": [{"errors": errors}]}
+
+
+@pytest.fixture
+def spool(tmp_path):
+    return WriteSpool(str(tmp_path / "spool.sqlite"))
+
+
+def test_rejection_is_matched_on_index_and_id(spool):
+    manager = RejectingManager(("nonprofits-b", "1"))
+    buffer = WriteBuffer(manager, spool, flush_interval=60)
+    buffer.index("1", {"NAME": "A"}, "nonprofits-a")
+    with pytest.raises(WriteRejected):
+        buffer.index("1", {"NAME": "B"}, "nonprofits-b", refresh="wait_for")
+    stats = buffer.stats()
+    buffer.close()
+    # Only the write to nonprofits-b was rejected; both left the queue
+    assert stats["rejected"] == 1
+    assert stats["flushed"] == 2
+    assert stats["pending"] == 0
+
+
+def test_every_buffer_claims_its_own_spool(spool):
+    with pytest.raises(SpoolBusy):
+        WriteSpool(spool.path)
+    second = claim_spool(spool.path)
+    third = claim_spool(spool.path)
+    assert [second.path, third.path] == [f"{spool.path}.1", f"{spool.path}.2"]
+    second.put({"_op_type": "index", "_index": "nonprofits", "_id": "1"})
+
+    # A restarted process takes over a spool nobody holds, writes and all
+    second.close()
+    replacement = claim_spool(spool.path)
+    assert replacement.path == f"{spool.path}.1"
+    assert [action["_id"] for _, action in replacement.pending()] == ["1"]
+    for held in (spool, third, replacement):
+        held.close()
+
+
+NEW_EIN = "999999999"
+EIN_SEARCH = {"query": {"query": {"term": {"EIN": NEW_EIN}}}}
+
+
+def buffered(tmp_path) -> dict:
+    return {
+        "SEARCH_BACKEND": "local",
+        "WRITE_BUFFER": "1",
+        "WRITE_BUFFER_SPOOL": str(tmp_path / "spool.sqlite"),
+        "WRITE_BUFFER_INTERVAL": "60",  # only wait_for sends in the test
+    }
+
+
+def test_flask_writes_go_through_the_buffer(load_app, tmp_path):
+    app = load_app("app", **buffered(tmp_path))
+    client = app.app.test_client()
+    url = f"/organizations/{NEW_EIN}"
+    assert client.post("/api/search", json=EIN_SEARCH).get_json() == []  # cached
+
+    assert client.put(url, json={"EIN": NEW_EIN, "NAME": "A"}).status_code == 202
+    assert client.post("/api/search", json=EIN_SEARCH).get_json() == []
+    sent = client.put(f"{url}?refresh=wait_for", json={"EIN": NEW_EIN, "NAME": "B"})
+    assert sent.status_code == 200
+    hits = client.post("/api/search", json=EIN_SEARCH).get_json()
+    assert [hit["_source"]["NAME"] for hit in hits] == ["B"]
+
+    assert client.delete(f"{url}?refresh=nope").status_code == 400
+    assert client.delete(f"{url}?refresh=wait_for").status_code == 200
+    assert client.post("/api/search", json=EIN_SEARCH).get_json() == []
+    stats = app.write_buffer.stats()
+    assert stats["coalesced"] == 1 and stats["flushed"] == 2
+    app.write_buffer.close()
+
+
+def test_asgi_writes_go_through_the_buffer(load_app, tmp_path):
+    app = load_app("asgi_app", **buffered(tmp_path))
+    url = f"/organizations/{NEW_EIN}"
+
+    async def writes():
+        client = app.app.test_client()
+
+        async def search():
+            response = await client.post("/api/search", json=EIN_SEARCH)
+            return [hit["_source"]["NAME"] for hit in await response.get_json()]
+
+        before = await search()
+        queued = await client.put(url, json={"EIN": NEW_EIN, "NAME": "A"})
+        still = await search()
+        sent = await client.put(
+            f"{url}?refresh=wait_for", json={"EIN": NEW_EIN, "NAME": "B"}
+        )
+        after = await search()
+        bad = await client.delete(f"{url}?refresh=nope")
+        deleted = await client.delete(f"{url}?refresh=wait_for")
+        gone = await search()
+        return (
+            before,
+            queued.status_code,
+            still,
+            sent.status_code,
+            after,
+            bad.status_code,
+            deleted.status_code,
+            gone,
+        )
+
+    assert asyncio.run(writes()) == ([], 202, [], 200, ["B"], 400, 200, [])
+    assert app.write_buffer.stats()["flushed"] == 2
+    app.write_buffer.close()
+
+
+def test_asgi_direct_writes_take_refresh(load_app):
+    app = load_app("asgi_app", SEARCH_BACKEND="local", WRITE_BUFFER="0")
+
+    async def write():
+        client = app.app.test_client()
+        url = f"/organizations/{NEW_EIN}?refresh=wait_for"
+        put = await client.put(url, json={"EIN": NEW_EIN, "NAME": "A"})
+        hits = await (await client.post("/api/search", json=EIN_SEARCH)).get_json()
+        bad = await client.put(f"{url}x", json={"EIN": NEW_EIN})
+        return put.status_code, len(hits), bad.status_code
+
+    assert asyncio.run(write()) == (200, 1, 400)
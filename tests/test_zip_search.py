@@ -0,0 +1,50 @@
+from itertools import islice
+
+import pytest
+from conftest import SAMPLE_CSV
+from csv_to_json import iter_documents
+from local_search import LocalSearchManager
+from schema import EIN, ZIP, ZIP5, normalize_document
+from search_builder import build_es_query_from_survey, location_clauses
+
+INDEX_NAME = "nonprofits-test"
+# First row of the sample: BRECKSVILLE, OH 44141-1361
+EIN_44141 = "010414466"
+
+
+def sample_documents(rows: int = 50, columnar: bool = True) -> list[dict]:
+    documents = iter_documents([SAMPLE_CSV], columnar=columnar)
+    return [normalize_document(doc) for doc in islice(documents, rows)]
+
+
+@pytest.mark.parametrize("columnar", [True, False])
+def test_enrichment_fills_zip5_from_zip4(columnar):
+    document = sample_documents(1, columnar)[0]
+    assert document[ZIP] == "44141-1361"
+    assert document[ZIP5] == "44141"
+
+
+@pytest.fixture(scope="module")
+def manager():
+    manager = LocalSearchManager()
+    manager.create_index(INDEX_NAME)
+    manager.bulk_add(sample_documents(), INDEX_NAME, id_field=EIN)
+    return manager
+
+
+def test_five_digit_query_matches_zip4_document(manager):
+    query = {"query": {"bool": {"filter": [{"term": {ZIP5: "44141"}}]}}}
+    hits = manager.search(query, INDEX_NAME)
+    assert EIN_44141 in {hit["_id"] for hit in hits}
+    assert all(hit["_source"][ZIP].startswith("44141") for hit in hits)
+
+
+def test_survey_zip_falls_back_to_zip5_without_centroid(manager):
+    # 00001 isn't in the centroid table, 44141 is
+    assert location_clauses("00001") == (({"term": {ZIP5: "00001"}},), (), None)
+    assert location_clauses("00001-2345")[0] == ({"term": {ZIP5: "00001"}},)
+    assert "geo_distance" in location_clauses("44141")[0][0]
+
+    query = build_es_query_from_survey([{"answer": ""}, {"answer": "44141"}])
+    hits = manager.search(query, INDEX_NAME)
+    assert EIN_44141 in {hit["_id"] for hit in hits}